@@ -1,16 +1,60 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import inspect
 import logging
+import math
+import os
+import time
+from enum import Enum
 from pathlib import Path
-from typing import (TYPE_CHECKING, Any, Callable, Dict, List, Literal,
-                    Optional, Tuple, Type, TypeVar)
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Hashable, List,
+                    Literal, NamedTuple, Optional, Set, Tuple, Type, TypeVar,
+                    Union)
 
 from paradox.output import Script
 
 from bifrostrpc.typing import Advanced  # pylint: disable=cyclic-import
-from bifrostrpc.typing import FuncSpec
+from bifrostrpc.batch import (BATCH_PATH, ITEM_HEADERS, BatchError,
+                              SharedAuth, encodeBatch, encodeItem, parseBatch)
+from bifrostrpc.cachebackends import CacheBackend
+from bifrostrpc.caching import CachedAuthFactory
+from bifrostrpc.deadlines import (DEADLINE_HEADER, Deadline,
+                                  DeadlineExceededError, parseDeadline,
+                                  runUntilDeadline)
+from bifrostrpc.etags import etagMatches, makeETag
+from bifrostrpc.execution import (INLINE, ExecutionPool, ExecutionPoolStats,
+                                  PoolFullError, PoolKind)
+from bifrostrpc.idempotency import (IDEMPOTENCY_HEADER, REPLAYED_HEADER,
+                                    IdempotencyKeyError, IdempotencyPolicy,
+                                    IdempotencyStats, IdempotencyStore)
+from bifrostrpc.lifetimes import (ContextProvider, Lifetime, ObjectPoolStats,
+                                  PoolTimeoutError, RequestScope, makeProvider,
+                                  resolveKwargs)
+from bifrostrpc.limits import (ConcurrencyLimiter, ConcurrencyLimiterStats,
+                               ConcurrencyLimitPolicy, OverloadedError)
+from bifrostrpc.loaders import BatchHandler, BatchLoader, BatchLoaderStats
+from bifrostrpc.priority import (PRIORITIES, PRIORITY_HEADER, Priority,
+                                 getPriority)
+from bifrostrpc.ratelimits import (MemoryRateLimitBackend, RateLimitBackend,
+                                   RateLimitedError, RateLimiter,
+                                   RateLimiterStats, RateLimitPolicy)
+from bifrostrpc.resultcache import (ResultCache, ResultCacheArg,
+                                    ResultCacheKey, ResultCacheStats,
+                                    getResultCachePolicy)
+from bifrostrpc.singleflight import (CALLER_ERRORS, SingleFlight,
+                                     SingleFlightStats)
+from bifrostrpc.typing import (EnumEncoding, FieldProjection, FuncSpec,
+                               TemporalEncoding)
+from bifrostrpc.validation import (ReturnValidationArg, ReturnValidationStats,
+                                   ReturnValidator, getPolicy)
 
 if TYPE_CHECKING:
     import flask
 
+    from bifrostrpc.asgi import ASGIApp
+    from bifrostrpc.wsgi import WSGIApp
+
 Flavour = Literal['requests', 'abstract']
 
 log = logging.getLogger()
@@ -41,14 +85,135 @@ class AuthFailure(Exception):
     """Raised inside an Auth Type factory to send a specific message back to the client."""
 
 
+# returns the value of a request header, or None if it wasn't sent
+GetHeader = Callable[[str], Optional[str]]
+
+# what addAuthType(identity=...) functions return to identify a caller
+AuthIdentity = Union[str, int, float, None]
+
+
+class _Response(NamedTuple):
+    status: int
+    body: Union[str, bytes]
+    contentType: str = 'text/html; charset=utf-8'
+    headers: Tuple[Tuple[str, str], ...] = ()
+
+    def getBytes(self) -> bytes:
+        return self.body if isinstance(self.body, bytes) else self.body.encode('utf-8')
+
+
+class BodyTooLargeError(Exception):
+    """Raised while reading a request body which turns out to be larger than max_body_size."""
+
+
+class _PreparedCall:
+    """A call which is built up as the request is authorized and its body is imported."""
+
+    def __init__(self, fn: Callable[..., Any], spec: FuncSpec) -> None:
+        self.fn = fn
+        self.spec = spec
+        self.kwargs: Dict[str, Any] = {}
+        self.showdc = False
+        self.fields: Optional[FieldProjection] = None
+        self.scope = RequestScope()
+        # the method's ResultCache, and a copy of the request body to derive the cache key from
+        self.resultCache: Optional[ResultCache] = None
+        self.body: Dict[str, Any] = {}
+        self.cacheKey: Optional[ResultCacheKey] = None
+        self.singleFlight: Optional[SingleFlight] = None
+        # the caller's Idempotency-Key (scoped to the method and caller once the body has been
+        # imported), and the fingerprint of the request body it was sent with
+        self.idempotencyKey: Optional[str] = None
+        self.fingerprint = ''
+        # set for calls which are part of a batch
+        self.sharedAuth: Optional[SharedAuth] = None
+        self.limiter: Optional[ConcurrencyLimiter] = None
+        self.rateLimiter: Optional[RateLimiter] = None
+        # decides the order in which queued calls are started
+        self.priority: Priority = 'normal'
+        self.deadline = Deadline(None)
+        # set for idempotent methods, which support conditional requests
+        self.conditional = False
+        self.ifNoneMatch: Optional[str] = None
+        self.version: Optional[Callable[..., str]] = None
+        self.etag: Optional[str] = None
+
+
 class BifrostRPCService:
     _targets: Dict[str, Callable[..., Any]]
 
-    def __init__(self, targets: List[Callable[..., Any]] = None):
+    def __init__(
+        self,
+        targets: List[Callable[..., Any]] = None,
+        *,
+        temporal_encoding: TemporalEncoding = 'iso',
+        return_validation: ReturnValidationArg = 'full',
+        max_body_size: Optional[int] = None,
+        cache_backend: CacheBackend = None,
+        max_batch_size: int = 100,
+        batch_workers: int = 8,
+        concurrency_limit: ConcurrencyLimitPolicy = None,
+        rate_limit: RateLimitPolicy = None,
+        rate_limit_backend: RateLimitBackend = None,
+        idempotency: IdempotencyPolicy = None,
+    ):
         self._targets = {fn.__name__: fn for fn in (targets or [])}
-        self._adv: Advanced = Advanced()
+        # return_validation is the default ReturnValidationPolicy for all methods - it can be
+        # overridden for individual methods using rpcmethod(return_validation=...)
+        self._returnValidation = getPolicy(return_validation)
+        self._methodReturnValidation: Dict[str, ReturnValidationArg] = {}
+        self._validators: Dict[str, ReturnValidator] = {}
+        self._pools: Dict[str, ExecutionPool] = {}
+        # {methodName: poolName} for methods which aren't executed inline
+        self._methodPools: Dict[str, str] = {}
+        self._resultCaches: Dict[str, ResultCache] = {}
+        # {methodName: version function} for idempotent methods
+        self._conditionalMethods: Dict[str, Optional[Callable[..., str]]] = {}
+        self._singleFlights: Dict[str, SingleFlight] = {}
+        self._batchLoaders: Dict[str, BatchLoader] = {}
+        # where rpcmethod(cache=...) responses are stored unless the method's policy says otherwise
+        self._cacheBackend = cache_backend
+        # requests with a larger body (in bytes) are rejected without reading the body
+        self._maxBodySize = max_body_size
+        # the most calls allowed in one /api.v1/batch request, and the most threads used to run
+        # a concurrent batch
+        self._maxBatchSize = max_batch_size
+        self._batchWorkers = batch_workers
+        # limits the number of calls running at once, for all methods which don't have their own
+        # rpcmethod(concurrency_limit=...)
+        self._limiter = (
+            ConcurrencyLimiter('*', concurrency_limit) if concurrency_limit is not None else None
+        )
+        self._methodLimiters: Dict[str, ConcurrencyLimiter] = {}
+        # token buckets for each caller, shared by all methods which don't have their own
+        # rpcmethod(rate_limit=...)
+        self._rateLimitBackend = rate_limit_backend or MemoryRateLimitBackend()
+        self._rateLimiter = (
+            RateLimiter('*', rate_limit, self._rateLimitBackend)
+            if rate_limit is not None else None
+        )
+        self._methodRateLimiters: Dict[str, RateLimiter] = {}
+        self._methodPriorities: Dict[str, Priority] = {}
+        # responses of calls sent with an Idempotency-Key, which are replayed to retries of the
+        # same call - the header is ignored unless this is turned on
+        self._idempotency = (
+            IdempotencyStore(idempotency) if idempotency is not None else None
+        )
+        # temporal_encoding decides how all datetime/date/timedelta values used by this service's
+        # methods are sent over the wire - see TemporalEncoding for details
+        self._adv: Advanced = Advanced(temporalEncoding=temporal_encoding)
         self._spec: Dict[str, FuncSpec] = {}
         self._factory: Dict[Type[Any], Callable[[], Any]] = {}
+        # {authType: identity function} - see addAuthType()
+        self._authIdentity: Dict[Type[Any], Callable[[Any], AuthIdentity]] = {}
+        # auth types whose factories can't run until the request body has been read
+        self._bodyAuthTypes: Set[Type[Any]] = set()
+        # auth types whose factories are plain functions, which may block (e.g. looking up a
+        # session) and so are called in a worker thread by async servers
+        self._blockingAuthTypes: Set[Type[Any]] = set()
+        self._contextProviders: Dict[Type[Any], ContextProvider] = {}
+        # methods can take a Deadline arg to find out how long the caller is willing to wait
+        self.addInternalType(Deadline, lambda: Deadline(None), lifetime='request')
 
         # TODO: when we're dealing with a NewType in typescript, we have the choice of using the
         # matching primitive type (string/int/bool) or generating a type alias in typescript
@@ -60,13 +225,221 @@ class BifrostRPCService:
         # The nice thing about (A) is that typescript programmer can have his own set of classes
         # that match the interface (maybe even one class that matches multiple interfaces?)
 
-    def rpcmethod(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+    def rpcmethod(
+        self,
+        fn: Callable[..., Any] = None,
+        *,
+        return_validation: ReturnValidationArg = None,
+        execution: str = INLINE,
+        cache: ResultCacheArg = None,
+        idempotent: bool = False,
+        version: Callable[..., str] = None,
+        single_flight: bool = False,
+        concurrency_limit: ConcurrencyLimitPolicy = None,
+        priority: Priority = 'normal',
+        rate_limit: RateLimitPolicy = None,
+    ) -> Any:
+        """Add a method to the service.
+
+        Can be used as a plain decorator, or called with options: e.g.
+        @service.rpcmethod(return_validation='shallow')
+
+        `execution` is the name of an execution pool (see addExecutionPool()) which should run the
+        method, or 'inline' to run it directly on the request thread.
+
+        `cache` turns on caching of the method's encoded responses - either a ResultCachePolicy
+        or just a TTL in seconds. Only use this for methods whose result depends on nothing but
+        their args (and the caller's identity, with ResultCachePolicy(perIdentity=True)). A cache
+        hit skips the context factories, the method itself and encoding of the result.
+
+        Responses of `idempotent` methods have an ETag, and a client which sends it back in an
+        If-None-Match header gets an empty 304 response if the result hasn't changed. By default
+        the ETag is a hash of the encoded response. `version` can instead be a (cheap) function
+        which takes the same args as the method and returns a string that changes whenever its
+        result would change; then a 304 doesn't require calling the method at all.
+
+        With `single_flight`, concurrent calls with identical args from the same caller (i.e.
+        with the same auth values) share a single execution of the method and its encoded
+        response, e.g. so that an expired cache entry doesn't cause a stampede of identical calls.
+        Only the call which runs the method takes a concurrency limit slot and context values.
+
+        `concurrency_limit` gives the method its own adaptive limit on the number of calls running
+        at once, instead of sharing the service's concurrency_limit with the other methods. Calls
+        which can't run soon enough get a 503 response with a Retry-After header.
+
+        `priority` ('high', 'normal' or 'low') decides which calls are started first when they
+        are waiting for a concurrency limit or an execution pool. A caller can lower (but not
+        raise) the priority of a call with an X-Bifrost-Priority header, e.g. for background
+        syncing.
+
+        `rate_limit` gives each caller (identified by the method's auth args) its own token bucket
+        for this method, instead of sharing the service's rate_limit bucket with the other
+        methods. Calls which find their bucket empty get a 429 response with a Retry-After header
+        before the request body is read.
+        """
+        if fn is None:
+            return lambda fn: self.rpcmethod(
+                fn,
+                return_validation=return_validation,
+                execution=execution,
+                cache=cache,
+                idempotent=idempotent,
+                version=version,
+                single_flight=single_flight,
+                concurrency_limit=concurrency_limit,
+                priority=priority,
+                rate_limit=rate_limit,
+            )
+
         name = fn.__name__
         if name in self._targets:
             raise Exception(f"A target named {name} already exists")
         self._targets[name] = fn
+        if return_validation is not None:
+            self._methodReturnValidation[name] = getPolicy(return_validation)
+        if execution != INLINE:
+            self._methodPools[name] = execution
+        if version is not None:
+            if cache is not None:
+                # cached responses would be given a different ETag
+                raise Exception(f"{name}: rpcmethod(version=...) can't be combined with cache")
+            idempotent = True
+        if idempotent:
+            self._conditionalMethods[name] = version
+        if cache is not None:
+            self._resultCaches[name] = ResultCache(
+                name,
+                getResultCachePolicy(cache),
+                self._cacheBackend,
+            )
+        if single_flight:
+            self._singleFlights[name] = SingleFlight(name)
+        if concurrency_limit is not None:
+            self._methodLimiters[name] = ConcurrencyLimiter(name, concurrency_limit)
+        if priority not in PRIORITIES:
+            raise Exception(f'{name}: unexpected priority {priority!r}')
+        self._methodPriorities[name] = priority
+        if rate_limit is not None:
+            self._methodRateLimiters[name] = RateLimiter(name, rate_limit, self._rateLimitBackend)
         return fn
 
+    def getResultCacheStats(self) -> Dict[str, ResultCacheStats]:
+        """Get a snapshot of hit/miss counts for each method with a result cache."""
+        return {name: cache.getStats() for name, cache in self._resultCaches.items()}
+
+    def getSingleFlightStats(self) -> Dict[str, SingleFlightStats]:
+        """Get the number of executed and coalesced calls for each single_flight method."""
+        return {name: flight.getStats() for name, flight in self._singleFlights.items()}
+
+    def getConcurrencyLimitStats(self) -> Dict[str, ConcurrencyLimiterStats]:
+        """Get the current limit, queue depth and counters of each concurrency limiter.
+
+        The service's own limiter is called '*'.
+        """
+        limiters = list(self._methodLimiters.values())
+        if self._limiter is not None:
+            limiters.append(self._limiter)
+        return {limiter.name: limiter.getStats() for limiter in limiters}
+
+    def getRateLimitStats(self) -> Dict[str, RateLimiterStats]:
+        """Get the number of allowed and rate limited calls for each rate limit.
+
+        The service's own rate limit is called '*'.
+        """
+        limiters = list(self._methodRateLimiters.values())
+        if self._rateLimiter is not None:
+            limiters.append(self._rateLimiter)
+        return {limiter.name: limiter.getStats() for limiter in limiters}
+
+    def getIdempotencyStats(self) -> Optional[IdempotencyStats]:
+        """Get the number of stored and replayed responses, or None if idempotency is off."""
+        return self._idempotency.getStats() if self._idempotency is not None else None
+
+    def addBatchHandler(
+        self,
+        method: str,
+        handler: BatchHandler,
+        *,
+        max_size: int = 100,
+        window: float = 0.002,
+    ) -> None:
+        """Answer concurrent calls of `method` together using `handler`.
+
+        Calls are collected for up to `window` seconds, or until there are `max_size` of them,
+        and then `handler` is called once with a list of the kwargs (including auth and context
+        values) each call would have passed to the method. It must return a list with a result
+        (or an Exception instance, to make only that call fail) for each call, in the same order.
+        The method itself is then only used for its signature.
+
+        NOTE: this can't be combined with a 'process' or 'interpreter' execution pool.
+        """
+        if method not in self._targets:
+            raise Exception(f'Method {method!r} does not exist')
+        self._batchLoaders[method] = BatchLoader(method, handler, maxSize=max_size, window=window)
+
+    def getBatchHandlerStats(self) -> Dict[str, BatchLoaderStats]:
+        """Get the number of batches and calls handled by each method's batch handler."""
+        return {name: loader.getStats() for name, loader in self._batchLoaders.items()}
+
+    def invalidateResultCache(self, method: str, args: Dict[str, Any] = None) -> None:
+        """Remove cached responses of a method registered with rpcmethod(cache=...).
+
+        `args` are the method's args as they are sent over the wire (i.e. the JSON request body)
+        - only responses for those args are removed, for every caller. With no args the method's
+        whole cache is cleared.
+
+        NOTE: caches belong to a single process, so with multiple server workers this only
+        affects the worker it's called in.
+        """
+        try:
+            cache = self._resultCaches[method]
+        except KeyError:
+            raise Exception(f'Method {method!r} was not registered with a result cache')
+        cache.invalidate(args)
+
+    def addExecutionPool(
+        self,
+        name: str,
+        kind: PoolKind,
+        *,
+        workers: int,
+        max_queue: int = 0,
+        aging_interval: float = 1.0,
+    ) -> None:
+        """Add a named pool which methods can be executed in using rpcmethod(execution=name).
+
+        At most `workers` calls run at once and at most `max_queue` more can wait for a free
+        worker; calls beyond that are rejected with a 503 response. Waiting calls are started in
+        order of priority, but every `aging_interval` seconds spent waiting raises a call's
+        priority by one class so that low priority calls can't be starved.
+        """
+        if name == INLINE or name in self._pools:
+            raise Exception(f'An execution pool named {name!r} already exists')
+        self._pools[name] = ExecutionPool(
+            name,
+            kind,
+            workers=workers,
+            maxQueue=max_queue,
+            agingInterval=aging_interval,
+        )
+
+    def getExecutionPoolStats(self) -> Dict[str, ExecutionPoolStats]:
+        """Get a snapshot of the size, queue depth, counters and queue times for each execution
+        pool.
+        """
+        return {name: pool.getStats() for name, pool in self._pools.items()}
+
+    def _getPool(self, method: str) -> Optional[ExecutionPool]:
+        try:
+            poolName = self._methodPools[method]
+        except KeyError:
+            return None
+
+        try:
+            return self._pools[poolName]
+        except KeyError:
+            raise Exception(f'{method}(): execution pool {poolName!r} does not exist')
+
     def getThings(self, name: str) -> Tuple[Callable[..., Any], FuncSpec]:
         try:
             fn = self._targets[name]
@@ -85,22 +458,150 @@ class BifrostRPCService:
         self,
         newType: Type[T],
         factory: Callable[[], T],
+        *,
+        lifetime: Lifetime = 'call',
+        pool_size: int = 10,
+        pool_timeout: float = 5.0,
     ) -> None:
+        """Register a context type and the factory which produces its values.
+
+        `lifetime` decides how often the factory is called - see Lifetime for details. With
+        lifetime='pooled' at most pool_size values are created, and a call which can't get one
+        within pool_timeout seconds fails with a 503 response. Pooled values are returned to the
+        pool once the method has returned.
+        """
         assert newType not in self._factory
         self._adv.addContextType(newType)
         self._factory[newType] = factory
+        self._contextProviders[newType] = makeProvider(
+            newType,
+            factory,
+            lifetime,
+            poolSize=pool_size,
+            poolTimeout=pool_timeout,
+        )
+
+    def getContextPoolStats(self) -> Dict[str, ObjectPoolStats]:
+        """Get a snapshot of the pools of context types registered with lifetime='pooled'."""
+        return {
+            t.__name__: p.pool.getStats()
+            for t, p in self._contextProviders.items()
+            if p.pool is not None
+        }
 
     def addAuthType(
         self,
         newType: Type[T],
         factory: Callable[[], Optional[T]],
+        *,
+        before_body: bool = True,
+        cache_key: Callable[[], Optional[Hashable]] = None,
+        cache_ttl: float = 60.0,
+        cache_size: int = 1000,
+        identity: Callable[[T], AuthIdentity] = None,
     ) -> None:
+        """Register an auth type and the factory which produces its values.
+
+        Auth factories are run before the request body is read so that unauthorized requests are
+        rejected cheaply. Use before_body=False for a factory which needs to read the request
+        body itself (e.g. to verify a signature); it will run after the body has been imported.
+
+        If cache_key is given, successful results of the factory are cached for cache_ttl
+        seconds (up to cache_size entries). cache_key() is called for each request and must
+        return the credential that the factory's result depends on (e.g. the session cookie or
+        bearer token), or None to bypass the cache. Cached values are shared between requests so
+        they shouldn't be modified. Use invalidateAuth() when credentials are revoked.
+
+        Rate limits, per_identity result caches, single_flight and Idempotency-Keys tell callers
+        apart by their auth values. Values which are a str, int, float or None identify
+        themselves; for any other type, identity(value) must return one of those which stays the
+        same for the same caller (e.g. lambda user: user.userId).
+
+        The ASGI app calls factories which aren't coroutine functions in a worker thread, so that
+        a slow lookup doesn't hold up other requests.
+        """
         assert newType not in self._factory
         self._adv.addAuthType(newType)
+        if not inspect.iscoroutinefunction(factory):
+            self._blockingAuthTypes.add(newType)
+        if cache_key is not None:
+            factory = CachedAuthFactory(factory, cache_key, ttl=cache_ttl, maxSize=cache_size)
         self._factory[newType] = factory
+        if identity is not None:
+            self._authIdentity[newType] = identity
+        if not before_body:
+            self._bodyAuthTypes.add(newType)
+
+    def invalidateAuth(
+        self,
+        authType: Type[T],
+        credential: Optional[Hashable] = None,
+        *,
+        where: Callable[[T], bool] = None,
+    ) -> None:
+        """Remove cached results of an auth factory registered with a cache_key.
+
+        Pass the credential (as returned by cache_key()) to forget a single session - e.g. on
+        logout - or `where` to forget all the cached values it returns True for - e.g. all the
+        sessions of a deleted user. With neither, the whole cache is cleared.
+
+        NOTE: caches belong to a single process, so with multiple server workers this only
+        affects the worker it's called in.
+        """
+        factory = self._factory[authType]
+        if not isinstance(factory, CachedAuthFactory):
+            raise Exception(f'Auth type {authType.__name__} was not registered with a cache_key')
+        factory.invalidate(credential, where)
 
-    def addDataclass(self, class_: Type[Any]) -> None:
-        self._adv.addDataclass(class_)
+    def addDataclass(
+        self,
+        class_: Type[Any],
+        *,
+        structural: bool = False,
+        memoize: bool = False,
+    ) -> None:
+        """Register a dataclass so that it can be used in method signatures.
+
+        With structural=True, methods returning this dataclass may instead return a mapping, a
+        named tuple or a sqlite3.Row-like object with the same fields, which avoids constructing a
+        dataclass instance only for it to be exported again.
+
+        With memoize=True (frozen dataclasses only), the exported form of each instance is cached
+        for as long as that instance is alive, so long-lived reference objects are only validated
+        and converted once. The exported dicts are shared and must not be modified.
+        """
+        self._adv.addDataclass(class_, structural=structural, memoize=memoize)
+
+    def addTypedDict(self, class_: Type[Any]) -> None:
+        """Register a TypedDict so that it can be used in method signatures.
+
+        Methods can return plain dicts instead of constructing a dataclass for every result.
+        TypedDicts are sent without a '__dataclass__' item, and keys which aren't required may be
+        left out. Generated clients still get a class for each TypedDict, with missing keys set to
+        null.
+        """
+        self._adv.addTypedDict(class_)
+
+    def addEnum(self, enumClass: Type[Enum], *, encoding: EnumEncoding = 'name') -> None:
+        """Register an Enum so that it can be used in method signatures.
+
+        With encoding='name' members are sent over the wire as their name (e.g. "RED"); with
+        encoding='int' they are sent as their integer value, which is more compact.
+        """
+        self._adv.addEnum(enumClass, encoding=encoding)
+
+    def _getValidator(self, name: str) -> ReturnValidator:
+        try:
+            return self._validators[name]
+        except KeyError:
+            pass
+
+        policy = getPolicy(self._methodReturnValidation.get(name, self._returnValidation))
+        return self._validators.setdefault(name, ReturnValidator(name, policy))
+
+    def getReturnValidationStats(self) -> Dict[str, ReturnValidationStats]:
+        """Get a snapshot of return value validation counts for each method called so far."""
+        return {name: v.getStats() for name, v in self._validators.items()}
 
     def _getTypeSpec(self, name: str) -> FuncSpec:
         try:
@@ -136,6 +637,7 @@ class BifrostRPCService:
             funcspecs=[(k, self._getTypeSpec(k)) for k in self._targets],
             adv=self._adv,
             flavour=flavour,
+            idempotent=set(self._conditionalMethods),
         )
 
         # TODO: turn pretty on when paradox adds support
@@ -159,6 +661,8 @@ class BifrostRPCService:
             funcspecs=[(k, self._getTypeSpec(k)) for k in self._targets],
             adv=self._adv,
             flavour=flavour,
+            idempotent=set(self._conditionalMethods),
+            idempotencyKeys=self._idempotency is not None,
         )
 
         # TODO: turn pretty on when paradox adds support
@@ -182,126 +686,646 @@ class BifrostRPCService:
             funcspecs=[(k, self._getTypeSpec(k)) for k in self._targets],
             adv=self._adv,
             flavour=flavour,
+            idempotent=set(self._conditionalMethods),
             on_error=on_error,
         )
 
         # TODO: turn pretty on when paradox adds support
         script.write_to_path(filepath, lang='php', pretty=False)
 
+    def _startCall(
+        self,
+        method: str,
+        httpMethod: str,
+        contentLength: Optional[int],
+        getHeader: GetHeader,
+        sharedAuth: Optional[SharedAuth],
+    ) -> Union[_Response, _PreparedCall]:
+        """Do all the checks which are possible before the request body has been read.
+
+        Raises InvalidMethodError for unknown methods.
+        """
+        fn, spec = self.getThings(method)
+
+        # TODO: we should be rethinking errors / error codes and make sure the generated
+        # clients handle these scenarios correctly and visibly.
+        # - server error (503 etc)
+        # - network outage
+        # - client error (e.g. sending a HTTP GET instead of POST)
+        # - client misuse (passing wrong data type to a generated client method)
+        # Also this might be the point where we rethink whether it was a good idea to
+        # return error codes as values instead of raising them as exceptions.
+
+        # GET request is allowed for methods with no arguments
+        if httpMethod == 'GET':
+            # FIXME: apparently GET (and HEAD) are mandatory methods and must not return a
+            # 405 error code like we're doing here.
+            return _Response(405, 'Bifrost RPC method calls must be submitted by POST')
+
+        if self._isBodyTooLarge(contentLength):
+            return _Response(413, 'Request body is too large')
+
+        noAuth = self._getUnauthorizedResponse(method, spec)
+        if noAuth is not None:
+            return noAuth
+
+        loader = self._batchLoaders.get(method)
+        if loader is not None:
+            fn = loader.loadAsync if loader.isAsync else loader.load
+        prepared = _PreparedCall(fn, spec)
+        prepared.deadline = parseDeadline(getHeader(DEADLINE_HEADER))
+        if prepared.deadline.expired():
+            # the caller has already given up
+            return _Response(504, 'Deadline exceeded')
+        prepared.scope.values[Deadline] = prepared.deadline
+        prepared.resultCache = self._resultCaches.get(method)
+        prepared.singleFlight = self._singleFlights.get(method)
+        prepared.sharedAuth = sharedAuth
+        prepared.limiter = self._methodLimiters.get(method, self._limiter)
+        prepared.rateLimiter = self._methodRateLimiters.get(method, self._rateLimiter)
+        prepared.priority = getPriority(
+            self._methodPriorities.get(method, 'normal'),
+            getHeader(PRIORITY_HEADER),
+        )
+        if self._idempotency is not None:
+            prepared.idempotencyKey = getHeader(IDEMPOTENCY_HEADER)
+        if method in self._conditionalMethods:
+            prepared.conditional = True
+            prepared.ifNoneMatch = getHeader('If-None-Match')
+            prepared.version = self._conditionalMethods[method]
+        return prepared
+
+    def _isBodyTooLarge(self, length: Optional[int]) -> bool:
+        return self._maxBodySize is not None and length is not None and length > self._maxBodySize
+
+    def _getAuthFactories(
+        self,
+        prepared: _PreparedCall,
+        beforeBody: bool,
+        offload: Callable[[Callable[[], Any]], Callable[[], Any]] = None,
+    ) -> List[Tuple[str, Type[Any], Callable[[], Any]]]:
+        """Get the auth factories which run before (or after) the request body is read.
+
+        offload() wraps the factories which may block, e.g. so an async server can call them in a
+        worker thread.
+        """
+        factories = []
+        for name, t in prepared.spec.authvars.items():
+            if (t not in self._bodyAuthTypes) != beforeBody:
+                continue
+            factory = self._factory[t]
+            if offload is not None and t in self._blockingAuthTypes:
+                factory = offload(factory)
+            if beforeBody and prepared.sharedAuth is not None:
+                factory = prepared.sharedAuth.wrap(t, factory)
+            factories.append((name, t, factory))
+        return factories
+
+    def _importBody(self, prepared: _PreparedCall, provided: Any) -> Optional[_Response]:
+        """Import the method's args from the decoded JSON body of the request."""
+        spec = prepared.spec
+        if not isinstance(provided, dict):
+            return _Response(400, 'Request body must be a JSON object')
+
+        # clients which don't send an Idempotency-Key header may send their key instead
+        key = provided.pop("__idempotency_key__", None)
+        if self._idempotency is not None and prepared.idempotencyKey is None:
+            prepared.idempotencyKey = key if isinstance(key, str) else None
+
+        if (
+            prepared.resultCache is not None
+            or prepared.singleFlight is not None
+            or prepared.idempotencyKey is not None
+        ):
+            # the timeout differs between retries of the same call
+            prepared.body = {k: v for k, v in provided.items() if k != '__timeout__'}
+
+        # pop off the __showdataclass__ flag if it's present
+        prepared.showdc = bool(provided.pop("__showdataclass__", False))
+        # pop off the client's __fields__ projection if it's present
+        fieldPaths = provided.pop("__fields__", None)
+        # clients which don't send an X-Bifrost-Deadline header may send their timeout instead
+        timeout = provided.pop("__timeout__", None)
+        if isinstance(timeout, (int, float)) and prepared.deadline.expires is None:
+            prepared.deadline.expires = time.time() + timeout
+
+        errors: List[str] = []
+        # import the data - this will type-check the whole thing and turn dicts into
+        # dataclasses as necessary, etc
+        kwargs = spec.importArgs(provided, 'body', lambda err: errors.append(err))
+        if fieldPaths is not None:
+            prepared.fields = spec.importProjection(
+                fieldPaths,
+                "body['__fields__']",
+                lambda err: errors.append(err),
+            )
+        if errors:
+            return _Response(400, '.\n'.join(errors) + '.')
+
+        prepared.kwargs.update(kwargs)
+        if spec.fieldsvar is not None:
+            prepared.kwargs[spec.fieldsvar] = prepared.fields or FieldProjection()
+        return None
+
+    def _checkAuthValue(
+        self,
+        method: str,
+        prepared: _PreparedCall,
+        name: str,
+        t: Type[Any],
+        value: Any,
+    ) -> Optional[_Response]:
+        if isinstance(value, AuthFailure):
+            return _Response(401, value.args[0])
+        if not value:
+            log.info(
+                f"{method}(): Authorization error"
+                f": factory for {name}: {t.__name__} returned a Falsy value."
+            )
+            return _Response(401, 'Unknown authorization error')
+        prepared.kwargs[name] = value
+        return None
+
+    def _getUnauthorizedResponse(self, method: str, spec: FuncSpec) -> Optional[_Response]:
+        if not spec.authvars:
+            log.error(
+                f"{method}(): Authorization error"
+                f": No auth vars configured for this method."
+            )
+            return _Response(401, 'Authorization error')
+        return None
+
+    def _callAuthFactories(
+        self,
+        method: str,
+        prepared: _PreparedCall,
+        beforeBody: bool,
+    ) -> Optional[_Response]:
+        for name, t, factory in self._getAuthFactories(prepared, beforeBody):
+            try:
+                value = factory()
+            except AuthFailure as e:
+                value = e
+
+            failure = self._checkAuthValue(method, prepared, name, t, value)
+            if failure is not None:
+                return failure
+        return None
+
+    def _getCachedResponse(self, prepared: _PreparedCall) -> Optional[_Response]:
+        """Look up the call's response in the method's result cache, if it has one."""
+        cache = prepared.resultCache
+        if cache is None:
+            return None
+
+        identity = self._getIdentity(prepared) if cache.policy.perIdentity else ''
+        prepared.cacheKey = cache.getKey(prepared.body, identity)
+        cached = cache.get(prepared.cacheKey)
+        if cached is None:
+            return None
+        return self._addETag(prepared, _Response(200, cached, 'application/json'))
+
+    def _getReplayedResponse(self, method: str, prepared: _PreparedCall) -> Optional[_Response]:
+        """Get the stored response of an earlier attempt of a call with an Idempotency-Key."""
+        store = self._idempotency
+        if store is None or prepared.idempotencyKey is None:
+            return None
+
+        prepared.idempotencyKey, prepared.fingerprint = store.getKey(
+            method,
+            prepared.idempotencyKey,
+            prepared.body,
+            self._getIdentity(prepared),
+        )
+        stored = store.get(prepared.idempotencyKey, prepared.fingerprint)
+        if stored is None:
+            return None
+        return self._addETag(prepared, _Response(
+            200,
+            stored,
+            'application/json',
+            headers=((REPLAYED_HEADER, 'true'), ),
+        ))
+
+    def _getFlight(self, prepared: _PreparedCall) -> Tuple[Optional[SingleFlight], str]:
+        """Get the SingleFlight (and key) which lets identical concurrent calls share a response.
+
+        Attempts of a call with an Idempotency-Key wait for each other, even if the method isn't
+        single_flight.
+        """
+        # a flight's 304 response (see _checkVersion()) is only valid for calls which sent the
+        # same If-None-Match header
+        notModifiedKey = ''
+        if prepared.version is not None:
+            notModifiedKey = '\n' + (prepared.ifNoneMatch or '')
+        if self._idempotency is not None and prepared.idempotencyKey is not None:
+            return (
+                self._idempotency.flight,
+                prepared.idempotencyKey + prepared.fingerprint + notModifiedKey,
+            )
+        flight = prepared.singleFlight
+        if flight is None:
+            return None, ''
+        return flight, flight.getKey(prepared.body, self._getIdentity(prepared)) + notModifiedKey
+
+    def _getIdentity(self, prepared: _PreparedCall) -> str:
+        """Identify the caller by the auth values it has so far (see addAuthType(identity=...))."""
+        import json
+
+        identity: List[AuthIdentity] = []
+        for name, t in prepared.spec.authvars.items():
+            if name not in prepared.kwargs:
+                # e.g. rate limits are checked before the before_body=False factories are called
+                continue
+            value = prepared.kwargs[name]
+            getIdentity = self._authIdentity.get(t)
+            if getIdentity is not None:
+                value = getIdentity(value)
+            if value is not None and not isinstance(value, (str, int, float)):
+                # NOTE: a repr() could contain a memory address, giving the same caller a new
+                # identity for every request
+                raise Exception(
+                    f'Auth type {t.__name__} needs addAuthType(identity=...) to identify callers'
+                    f' by its values; got a {type(value).__name__}'
+                )
+            identity.append(value)
+        return json.dumps(identity)
+
+    def _checkVersion(self, prepared: _PreparedCall) -> Optional[_Response]:
+        """Returns a 304 response if the client already has the current version of the result."""
+        if prepared.version is None:
+            return None
+        version = prepared.version(**resolveKwargs(prepared.kwargs))
+        prepared.etag = makeETag(version.encode('utf-8'))
+        if etagMatches(prepared.ifNoneMatch, prepared.etag):
+            return _Response(304, b'', headers=(('ETag', prepared.etag), ))
+        return None
+
+    def _addETag(self, prepared: _PreparedCall, response: _Response) -> _Response:
+        # error responses aren't worth caching, and mustn't be turned into a 304
+        if not prepared.conditional or response.status != 200:
+            return response
+
+        etag = prepared.etag or makeETag(response.getBytes())
+        if etagMatches(prepared.ifNoneMatch, etag):
+            return _Response(304, b'', headers=(('ETag', etag), ))
+        return response._replace(headers=response.headers + (('ETag', etag), ))
+
+    def _checkRateLimit(self, prepared: _PreparedCall) -> None:
+        """Take a token from the caller's bucket, or raise RateLimitedError.
+
+        This happens before the request body is read, so the caller is identified by the auth
+        values which don't depend on the body.
+        """
+        if prepared.rateLimiter is not None:
+            prepared.rateLimiter.take(self._getIdentity(prepared))
+
+    def _acquireLimit(self, prepared: _PreparedCall) -> None:
+        """Wait for the concurrency limiter to admit the call, or raise OverloadedError."""
+        limiter = prepared.limiter
+        if limiter is not None:
+            started = limiter.acquire(prepared.priority)
+            # the call holds its place until the method has really finished
+            prepared.scope.addCleanup(lambda: limiter.release(started))
+
+    def _callContextFactories(self, prepared: _PreparedCall) -> None:
+        # context factories are only called once the request is known to be authorized
+        for name, t in prepared.spec.contextvars.items():
+            prepared.kwargs[name] = self._contextProviders[t].get(prepared.scope)
+
+    def _getResultResponse(self, method: str, prepared: _PreparedCall, result: Any) -> _Response:
+        import json
+
+        def handle_err(msg: str) -> None:
+            # TODO: raise a more specific exception type here
+            raise Exception(f"method response was invalid: {msg}")
+
+        # sanity-check the return value and convert fancy types (dataclasses) to plain
+        # dicts
+        jsonSafe = self._getValidator(method).exportRetval(
+            prepared.spec,
+            result,
+            '<retval>',
+            prepared.showdc,
+            onerr=handle_err,
+            fields=prepared.fields,
+        )
+
+        # pack it up and send it back
+        # TODO: don't do pretty output in production mode
+        try:
+            packed = json.dumps(jsonSafe, indent=2, sort_keys=True).encode('utf-8')
+        except (TypeError, ValueError):
+            # a return value which wasn't fully validated (see ReturnValidation) may not be
+            # JSON-safe, so validate it fully to report which part of it was invalid
+            prepared.spec.exportRetval(
+                result,
+                '<retval>',
+                prepared.showdc,
+                onerr=handle_err,
+                fields=prepared.fields,
+            )
+            raise
+        if prepared.resultCache is not None and prepared.cacheKey is not None:
+            prepared.resultCache.set(prepared.cacheKey, packed)
+        if self._idempotency is not None and prepared.idempotencyKey is not None:
+            self._idempotency.set(prepared.idempotencyKey, prepared.fingerprint, packed)
+        return _Response(200, packed, 'application/json')
+
+    def _getExceptionResponse(self, method: str, e: Exception) -> _Response:
+        # TODO: in production mode we  need to log errors rather than sending them to
+        # the client
+        if isinstance(e, ArgumentError):
+            return _Response(500, e.args[0] + '.')
+        if isinstance(e, InvalidMethodError):
+            return _Response(501, f'invalid method name {method!r}')
+        if isinstance(e, BodyTooLargeError):
+            return _Response(413, 'Request body is too large')
+        if isinstance(e, OverloadedError):
+            # this is expected under load, so it isn't worth logging
+            return _Response(
+                503,
+                'Server is too busy to handle this request',
+                headers=(('Retry-After', str(e.retryAfter)), ),
+            )
+        if isinstance(e, DeadlineExceededError):
+            # nobody is waiting for this response any more
+            return _Response(504, 'Deadline exceeded')
+        if isinstance(e, RateLimitedError):
+            return _Response(
+                429,
+                f'Rate limit exceeded; retry after {e.retryAfter:.3g}s',
+                headers=(('Retry-After', str(max(1, math.ceil(e.retryAfter)))), ),
+            )
+        if isinstance(e, IdempotencyKeyError):
+            return _Response(422, str(e))
+        if isinstance(e, (PoolFullError, PoolTimeoutError)):
+            log.warning(f'BifrostRPC {method!r}: {e}')
+            return _Response(503, 'Server is too busy to handle this request')
+        log.exception(f'BifrostRPC {method!r}: Exception encountered')
+        return _Response(500, str(e))
+
+    def _handleCall(
+        self,
+        method: str,
+        httpMethod: str,
+        contentLength: Optional[int],
+        getBody: Callable[[], Any],
+        getHeader: GetHeader,
+        sharedAuth: SharedAuth = None,
+    ) -> _Response:
+        """Handle a call to `method` synchronously, independent of any web framework.
+
+        getBody() should read the request and return its decoded JSON body. It isn't called for
+        requests which can be rejected without it.
+        """
+        # FIXME: provide a reuseable way to attach authentication/security
+        prepared: Optional[_PreparedCall] = None
+        try:
+            started = self._startCall(method, httpMethod, contentLength, getHeader, sharedAuth)
+            if isinstance(started, _Response):
+                return started
+            prepared = started
+
+            failure = self._callAuthFactories(method, prepared, beforeBody=True)
+            if failure is not None:
+                return failure
+            self._checkRateLimit(prepared)
+            failure = (
+                self._importBody(prepared, getBody())
+                or self._callAuthFactories(method, prepared, beforeBody=False)
+            )
+            if failure is not None:
+                return failure
+
+            cached = (
+                self._getCachedResponse(prepared)
+                or self._getReplayedResponse(method, prepared)
+            )
+            if cached is not None:
+                return cached
+
+            # calls waiting for an identical call don't need a concurrency limit slot or context
+            # values of their own, so only the leader of a flight runs the call
+            flight, key = self._getFlight(prepared)
+            if flight is None:
+                response, _ = self._runCall(method, prepared)
+            else:
+                response, prepared.etag = flight.run(
+                    key,
+                    lambda: self._runCall(method, prepared),
+                )
+            return self._addETag(prepared, response)
+        except Exception as e:  # pylint: disable=broad-except
+            return self._getExceptionResponse(method, e)
+        finally:
+            if prepared is not None:
+                # e.g. return pooled context values
+                prepared.scope.close()
+
+    def _handleBatch(
+        self,
+        httpMethod: str,
+        contentLength: Optional[int],
+        getBody: Callable[[], Any],
+        getHeader: GetHeader,
+    ) -> _Response:
+        """Handle a request to /api.v1/batch synchronously - see bifrostrpc.batch."""
+        if httpMethod != 'POST':
+            return _Response(405, 'Bifrost RPC batches must be submitted by POST')
+        if self._isBodyTooLarge(contentLength):
+            return _Response(413, 'Request body is too large')
+        try:
+            items, inParallel = parseBatch(getBody(), self._maxBatchSize)
+        except BatchError as e:
+            return _Response(400, str(e))
+        except BodyTooLargeError:
+            return _Response(413, 'Request body is too large')
+
+        sharedAuth = SharedAuth()
+
+        def _handleItem(item: Any) -> _Response:
+            return self._handleCall(
+                item.method,
+                'POST',
+                None,
+                lambda: item.params,
+                # headers such as If-None-Match apply to the batch, not to each call
+                lambda name: getHeader(name) if name in ITEM_HEADERS else None,
+                sharedAuth,
+            )
+
+        responses: List[_Response]
+        if inParallel and len(items) > 1:
+            # each call sees the request's context (e.g. Flask's request or getEnviron())
+            contexts = [contextvars.copy_context() for _ in items]
+            with concurrent.futures.ThreadPoolExecutor(
+                min(len(items), self._batchWorkers)
+            ) as executor:
+                responses = list(executor.map(
+                    lambda context, item: context.run(_handleItem, item),
+                    contexts,
+                    items,
+                ))
+        else:
+            responses = [_handleItem(item) for item in items]
+
+        return self._getBatchResponse(responses)
+
+    def _getBatchResponse(self, responses: List[_Response]) -> _Response:
+        return _Response(200, encodeBatch([
+            encodeItem(r.status, r.getBytes(), r.contentType == 'application/json')
+            for r in responses
+        ]), 'application/json')
+
+    def _runCall(self, method: str, prepared: _PreparedCall) -> Tuple[_Response, Optional[str]]:
+        """Call the method once the call is admitted, unless the client has its current version.
+
+        Also returns the ETag of the method's version (if it has a version function), so that it
+        can be shared with identical calls.
+        """
+        self._acquireLimit(prepared)
+        self._callContextFactories(prepared)
+        notModified = self._checkVersion(prepared)
+        if notModified is not None:
+            return notModified, prepared.etag
+        # e.g. the call spent too long waiting for the concurrency limiter
+        prepared.deadline.check()
+        return self._getMethodResponse(method, prepared), prepared.etag
+
+    def _getMethodResponse(self, method: str, prepared: _PreparedCall) -> _Response:
+        try:
+            pool = self._getPool(method)
+            result: Any
+            if pool is not None:
+                result = pool.submit(
+                    prepared.fn,
+                    prepared.kwargs,
+                    prepared.priority,
+                    prepared.deadline.expires,
+                ).result()
+            else:
+                result = prepared.fn(**resolveKwargs(prepared.kwargs))
+                if inspect.iscoroutine(result):
+                    # async methods can still be used outside of an ASGI app
+                    result = asyncio.run(runUntilDeadline(result, prepared.deadline))
+
+            return self._getResultResponse(method, prepared, result)
+        except CALLER_ERRORS:
+            # these aren't shared with identical calls waiting for this one (see SingleFlight)
+            raise
+        except Exception as e:  # pylint: disable=broad-except
+            return self._getExceptionResponse(method, e)
+
+    def get_wsgi_app(self) -> "WSGIApp":
+        """Get a WSGI application which serves this service's methods at /api.v1/call/<method>
+        (and batches of calls at /api.v1/batch).
+
+        This behaves the same as get_flask_blueprint() but doesn't require Flask.
+        """
+        # pylint: disable=cyclic-import
+        from bifrostrpc.wsgi import makeWSGIApp
+
+        return makeWSGIApp(self)
+
+    def serve(
+        self,
+        *,
+        host: str = '127.0.0.1',
+        port: int = 8000,
+        workers: int = None,
+        keepalive_timeout: float = 5.0,
+        graceful_timeout: float = 30.0,
+    ) -> None:
+        """Serve the service's methods over HTTP using a pre-forked pool of worker processes.
+
+        `workers` defaults to the number of CPUs. Send SIGHUP to gracefully replace all workers,
+        or SIGTERM/SIGINT to shut down once in-flight requests are finished. See
+        bifrostrpc.server for details.
+        """
+        # pylint: disable=cyclic-import
+        from bifrostrpc.server import serve
+
+        # build all the FuncSpecs up front so that forked workers share them instead of each
+        # building (and allocating) their own copy
+        for name in self._targets:
+            self._getTypeSpec(name)
+            self._getValidator(name)
+            self._getPool(name)
+
+        serve(
+            self.get_wsgi_app(),
+            host=host,
+            port=port,
+            workers=workers or os.cpu_count() or 1,
+            keepaliveTimeout=keepalive_timeout,
+            gracefulTimeout=graceful_timeout,
+        )
+
+    def _readFlaskBody(self, request: "flask.Request") -> Any:
+        from werkzeug.exceptions import RequestEntityTooLarge
+
+        if self._maxBodySize is not None:
+            # also enforces the limit for chunked bodies which don't have a Content-Length
+            request.max_content_length = self._maxBodySize
+        try:
+            # NOTE: like the WSGI and ASGI apps, the Content-Type isn't checked, and a body which
+            # isn't valid JSON is rejected with a 400 response because it's not a JSON object
+            return request.get_json(force=True, silent=True)
+        except RequestEntityTooLarge as e:
+            raise BodyTooLargeError() from e
+
     def get_flask_blueprint(self, name: str, import_name: str) -> "flask.Blueprint":
         from flask import Blueprint, Response
 
         bp = Blueprint(name, import_name)
 
-        def _call(method: str) -> Response:
-            import json
-
-            from flask import make_response, request
+        def _makeResponse(ret: _Response) -> Response:
+            from flask import make_response
 
-            # FIXME: provide a reuseable way to attach authentication/security
-            try:
-                fn, spec = self.getThings(method)
-
-                # TODO: we should be rethinking errors / error codes and make sure the generated
-                # clients handle these scenarios correctly and visibly.
-                # - server error (503 etc)
-                # - network outage
-                # - client error (e.g. sending a HTTP GET instead of POST)
-                # - client misuse (passing wrong data type to a generated client method)
-                # Also this might be the point where we rethink whether it was a good idea to
-                # return error codes as values instead of raising them as exceptions.
-
-                # GET request is allowed for methods with no arguments
-                if request.method == 'GET':
-                    # FIXME: apparently GET (and HEAD) are mandatory methods and must not return a
-                    # 405 error code like we're doing here.
-                    return make_response('Bifrost RPC method calls must be submitted by POST', 405)
-
-                provided = request.get_json()
-                if not isinstance(provided, dict):
-                    return make_response('Request body must be a JSON object', 400)
-
-                # pop off the __showdataclass__ flag if it's present
-                showdataclasses = bool(provided.pop("__showdataclass__", False))
-
-                errors: List[str] = []
-                # import the data - this will type-check the whole thing and turn dicts into
-                # dataclasses as necessary, etc
-                kwargs = spec.importArgs(provided, 'body', lambda err: errors.append(err))
-                if errors:
-                    return make_response('.\n'.join(errors) + '.', 400)
-
-                authorized = False
-                for name, t in spec.authvars.items():
-                    factory = self._factory[t]
-                    try:
-                        value = factory()
-                    except AuthFailure as e:
-                        return make_response(e.args[0], 401)
-
-                    if not value:
-                        log.info(
-                            f"{method}(): Authorization error"
-                            f": factory for {name}: {t.__name__} returned a Falsy value."
-                        )
-                        return make_response('Unknown authorization error', 401)
-
-                    kwargs[name] = value
-                    authorized = True
-
-                if not authorized:
-                    log.error(
-                        f"{method}(): Authorization error"
-                        f": No auth vars configured for this method."
-                    )
-                    return make_response('Authorization error', 401)
-
-                # set up context for the function call
-                for name, t in spec.contextvars.items():
-                    factory = self._factory[t]
-                    kwargs[name] = factory()
-
-                # now call the function
-                try:
-                    result: Any = fn(**kwargs)
-                except ArgumentError as e:
-                    errors = [e.args[0]]
-                else:
-                    def handle_err(msg: str) -> None:
-                        # TODO: raise a more specific exception type here
-                        raise Exception(f"method response was invalid: {msg}")
-
-                    # sanity-check the return value and convert fancy types (dataclasses) to plain
-                    # dicts
-                    errors = []
-                    jsonSafe = spec.exportRetval(
-                        result,
-                        '<retval>',
-                        showdataclasses,
-                        onerr=handle_err,
-                    )
-
-                if errors:
-                    # TODO: in production mode we  need to log errors rather than sending them to
-                    # the client
-                    return make_response('.\n'.join(errors) + '.', 500)
-
-                # pack it up and send it back
-                # TODO: don't do pretty output in production mode
-                packed = json.dumps(jsonSafe, indent=2, sort_keys=True)
-                response = make_response(packed, 200)
+            response = make_response(ret.body, ret.status)
+            if ret.contentType == 'application/json':
                 response.headers['Content-Type'] = 'application/json'
-                return response
-            except InvalidMethodError:
-                return make_response(f'invalid method name {method!r}', 501)
-            except Exception as e:  # pylint: disable=broad-except
-                # FIXME: in production mode we  need to log errors rather than sending them to the
-                # client
-                log.exception(f'BifrostRPC {name!r}: Exception encountered')
-                return make_response(str(e), 500)
+            for name, value in ret.headers:
+                response.headers[name] = value
+            return response
+
+        def _call(method: str) -> Response:
+            from flask import request
+
+            return _makeResponse(self._handleCall(
+                method,
+                request.method,
+                request.content_length,
+                lambda: self._readFlaskBody(request),
+                request.headers.get,
+            ))
+
+        def _batch() -> Response:
+            from flask import request
+
+            return _makeResponse(self._handleBatch(
+                request.method,
+                request.content_length,
+                lambda: self._readFlaskBody(request),
+                request.headers.get,
+            ))
 
         bp.route('/api.v1/call/<method>', methods=['GET', 'POST'])(_call)
+        bp.route(BATCH_PATH, methods=['GET', 'POST'])(_batch)
 
         # FIXME: auto-generate a / route that lists the method calls and what they do
 
         return bp
+
+    def get_asgi_app(self) -> "ASGIApp":
+        """Get an ASGI application which serves this service's methods at /api.v1/call/<method>
+        (and batches of calls at /api.v1/batch).
+
+        Methods and auth/context factories may be `async def` functions, in which case they run
+        directly on the event loop. Other methods are run in the loop's default executor.
+        """
+        # pylint: disable=cyclic-import
+        from bifrostrpc.asgi import makeASGIApp
+
+        return makeASGIApp(self)
@@ -0,0 +1,527 @@
+"""
+A framework-free ASGI application for serving a BifrostRPCService.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+from typing import (Any, Awaitable, Callable, List, MutableMapping, Optional,
+                    Tuple, TypeVar, Union)
+
+from bifrostrpc import (AuthFailure, BifrostRPCService, BodyTooLargeError,
+                        _PreparedCall, _Response)
+from bifrostrpc.batch import (BATCH_PATH, ITEM_HEADERS, BatchError, SharedAuth,
+                              parseBatch)
+from bifrostrpc.deadlines import runUntilDeadline
+from bifrostrpc.lifetimes import resolveKwargs
+from bifrostrpc.singleflight import CALLER_ERRORS, FlightAbandoned, SingleFlight
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+T = TypeVar('T')
+
+CALL_PREFIX = '/api.v1/call/'
+
+_currentScope: 'contextvars.ContextVar[Scope]' = contextvars.ContextVar('bifrostrpc_asgi_scope')
+
+
+def getScope() -> Scope:
+    """Return the ASGI scope of the request currently being handled.
+
+    This is intended for use inside auth/context factories, which aren't given any arguments.
+    """
+    return _currentScope.get()
+
+
+def getHeader(name: str) -> Optional[str]:
+    """Return the value of a header from the request currently being handled."""
+    return _getScopeHeader(getScope(), name)
+
+
+def _getScopeHeader(scope: Scope, name: str) -> Optional[str]:
+    wanted = name.lower().encode('latin-1')
+    for k, v in scope['headers']:
+        if k.lower() == wanted:
+            return v.decode('latin-1')
+    return None
+
+
+def makeASGIApp(service: BifrostRPCService) -> ASGIApp:
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] == 'lifespan':
+            await _lifespan(receive, send)
+            return
+
+        if scope['type'] != 'http':
+            raise Exception(f"Unsupported ASGI scope type {scope['type']!r}")
+
+        path: str = scope['path']
+        method = path[len(CALL_PREFIX):]
+        isBatch = path == BATCH_PATH
+        if not isBatch and (not path.startswith(CALL_PREFIX) or not method or '/' in method):
+            await _sendResponse(send, _Response(404, 'Not Found'))
+            return
+
+        if scope['method'] not in ('GET', 'POST'):
+            await _sendResponse(send, _Response(405, 'Method Not Allowed'))
+            return
+
+        token = _currentScope.set(scope)
+        try:
+            if isBatch:
+                response = await _handleBatch(service, scope, receive)
+            else:
+                response = await _handleCall(service, method, scope, receive)
+        finally:
+            _currentScope.reset(token)
+        if response is not None:
+            await _sendResponse(send, response)
+
+    return app
+
+
+async def _handleCall(
+    service: BifrostRPCService,
+    method: str,
+    scope: Scope,
+    receive: Optional[Receive],
+    params: Any = None,
+    sharedAuth: SharedAuth = None,
+) -> Optional[_Response]:
+    """Returns None if the client disconnected before the response was ready.
+
+    For calls which are part of a batch, `receive` is None and `params` are the call's args.
+    """
+    # pylint: disable=protected-access
+    prepared: Optional[_PreparedCall] = None
+    # set once the method itself is responsible for closing the request scope
+    closeLater = False
+    try:
+        started = service._startCall(
+            method,
+            scope['method'],
+            _getContentLength(scope) if receive is not None else None,
+            # headers such as If-None-Match apply to a batch, not to each call in it
+            functools.partial(_getScopeHeader, scope) if receive is not None
+            else functools.partial(_getBatchItemHeader, scope),
+            sharedAuth,
+        )
+        if isinstance(started, _Response):
+            return started
+        prepared = started
+
+        failure = await _callAuthFactories(service, method, prepared, beforeBody=True)
+        if failure is not None:
+            return failure
+        rateLimiter = prepared.rateLimiter
+        if rateLimiter is not None:
+            await _runSync(rateLimiter.backend.blocking, service._checkRateLimit, prepared)
+
+        if receive is None:
+            provided = params
+        else:
+            # NOTE: servers which support "Expect: 100-continue" send the 100 response when the
+            # body is first received, so clients don't send the body of requests rejected before
+            # this point
+            body = await _readBody(receive, service._maxBodySize)
+            if body is None:
+                return None
+            provided = _decodeBody(body)
+
+        blocking = _usesBlockingStore(service, prepared)
+        failure = (
+            service._importBody(prepared, provided)
+            or await _callAuthFactories(service, method, prepared, beforeBody=False)
+            or await _runSync(blocking, service._getCachedResponse, prepared)
+            or await _runSync(blocking, service._getReplayedResponse, method, prepared)
+        )
+        if failure is not None:
+            return failure
+
+        # calls waiting for an identical call don't need a concurrency limit slot or context
+        # values of their own, so only the leader of a flight runs the call
+        task: 'asyncio.Future[_Response]'
+        flight, key = service._getFlight(prepared)
+        if flight is None:
+            notModified = await _prepareToRun(service, prepared)
+            if notModified is not None:
+                return notModified
+            task = asyncio.ensure_future(_getMethodResponse(service, method, prepared))
+            closeLater = True
+        else:
+            async def _runInFlight(flight: SingleFlight) -> _Response:
+                nonlocal closeLater
+                while True:
+                    shared, leader = flight.join(key)
+                    if leader:
+                        own = asyncio.ensure_future(_runCall(service, method, prepared))
+                        closeLater = True
+                        flight.finishFrom(key, own)
+                        # the method keeps running for the other callers if this client
+                        # disconnects
+                        response, _ = await asyncio.shield(own)
+                        return response
+                    try:
+                        response, prepared.etag = await asyncio.shield(asyncio.wrap_future(shared))
+                        return response
+                    except FlightAbandoned:
+                        # one of the waiting calls runs the method instead
+                        continue
+
+            task = asyncio.ensure_future(_runInFlight(flight))
+
+        if receive is None:
+            # the batch as a whole is cancelled if the client disconnects
+            return service._addETag(prepared, await task)
+        if not await _waitUnlessDisconnected(task, receive):
+            return None
+
+        return service._addETag(prepared, task.result())
+    except Exception as e:  # pylint: disable=broad-except
+        return service._getExceptionResponse(method, e)
+    finally:
+        if prepared is not None and not closeLater:
+            prepared.scope.close()
+
+
+def _getBatchItemHeader(scope: Scope, name: str) -> Optional[str]:
+    return _getScopeHeader(scope, name) if name in ITEM_HEADERS else None
+
+
+async def _handleBatch(
+    service: BifrostRPCService,
+    scope: Scope,
+    receive: Receive,
+) -> Optional[_Response]:
+    """Returns None if the client disconnected before the response was ready."""
+    # pylint: disable=protected-access
+    if scope['method'] != 'POST':
+        return _Response(405, 'Bifrost RPC batches must be submitted by POST')
+    if service._isBodyTooLarge(_getContentLength(scope)):
+        return _Response(413, 'Request body is too large')
+    try:
+        body = await _readBody(receive, service._maxBodySize)
+    except BodyTooLargeError:
+        return _Response(413, 'Request body is too large')
+    if body is None:
+        return None
+    try:
+        items, inParallel = parseBatch(_decodeBody(body), service._maxBatchSize)
+    except BatchError as e:
+        return _Response(400, str(e))
+
+    sharedAuth = SharedAuth()
+
+    async def _handleItems() -> List[Optional[_Response]]:
+        if inParallel:
+            return await asyncio.gather(*[
+                _handleCall(service, item.method, scope, None, item.params, sharedAuth)
+                for item in items
+            ])
+        return [
+            await _handleCall(service, item.method, scope, None, item.params, sharedAuth)
+            for item in items
+        ]
+
+    task = asyncio.ensure_future(_handleItems())
+    if not await _waitUnlessDisconnected(task, receive):
+        return None
+    # calls in a batch always have a response
+    return service._getBatchResponse([r for r in task.result() if r is not None])
+
+
+def _startHandler(
+    service: BifrostRPCService,
+    method: str,
+    prepared: _PreparedCall,
+) -> 'asyncio.Future[Any]':
+    # pylint: disable=protected-access
+    # NOTE: the request scope (e.g. pooled context values) is only closed once the method has
+    # really finished, which may be after the client has disconnected
+    requestScope = prepared.scope
+    handler: 'asyncio.Future[Any]'
+    pool = service._getPool(method)
+    if pool is not None:
+        future = pool.submit(
+            prepared.fn,
+            prepared.kwargs,
+            prepared.priority,
+            prepared.deadline.expires,
+        )
+        future.add_done_callback(lambda _: requestScope.close())
+        return asyncio.wrap_future(future)
+
+    if inspect.iscoroutinefunction(prepared.fn):
+        # async methods are cancelled when the caller's deadline passes
+        handler = asyncio.ensure_future(
+            runUntilDeadline(prepared.fn(**resolveKwargs(prepared.kwargs)), prepared.deadline)
+        )
+        handler.add_done_callback(lambda _: requestScope.close())
+        return handler
+
+    # regular functions are run in a worker thread so they don't block the event loop
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(
+        None,
+        functools.partial(context.run, _callThenClose, prepared),
+    )
+
+
+async def _prepareToRun(
+    service: BifrostRPCService,
+    prepared: _PreparedCall,
+) -> Optional[_Response]:
+    """Wait for the call to be admitted and get its context values.
+
+    Returns a 304 response instead if the client already has the current version of the result.
+    """
+    # pylint: disable=protected-access
+    limiter = prepared.limiter
+    if limiter is not None:
+        started = await limiter.acquireAsync(prepared.priority)
+        prepared.scope.addCleanup(lambda: limiter.release(started))
+
+    # context factories are only called once the request is known to be authorized
+    await _callContextFactories(service, prepared)
+    # the method's version function is user code which may e.g. query a database
+    notModified = await _runSync(
+        prepared.version is not None,
+        service._checkVersion,
+        prepared,
+    )
+    if notModified is not None:
+        return notModified
+    # e.g. the call spent too long waiting for the concurrency limiter
+    prepared.deadline.check()
+    return None
+
+
+async def _runCall(
+    service: BifrostRPCService,
+    method: str,
+    prepared: _PreparedCall,
+) -> Tuple[_Response, Optional[str]]:
+    """Run a call on behalf of a flight, closing its request scope once it has finished.
+
+    Also returns the ETag of the method's version (if it has a version function), so that it can
+    be shared with identical calls.
+    """
+    try:
+        notModified = await _prepareToRun(service, prepared)
+    except BaseException:
+        prepared.scope.close()
+        raise
+    if notModified is not None:
+        prepared.scope.close()
+        return notModified, prepared.etag
+    return await _getMethodResponse(service, method, prepared), prepared.etag
+
+
+async def _getMethodResponse(
+    service: BifrostRPCService,
+    method: str,
+    prepared: _PreparedCall,
+) -> _Response:
+    # pylint: disable=protected-access
+    try:
+        handler = _startHandler(service, method, prepared)
+    except BaseException:
+        prepared.scope.close()
+        raise
+
+    try:
+        result = await handler
+        return await _runSync(
+            _usesBlockingStore(service, prepared),
+            service._getResultResponse,
+            method,
+            prepared,
+            result,
+        )
+    except CALLER_ERRORS:
+        # these aren't shared with identical calls waiting for this one (see SingleFlight)
+        raise
+    except Exception as e:  # pylint: disable=broad-except
+        return service._getExceptionResponse(method, e)
+
+
+async def _runSync(blocking: bool, fn: Callable[..., T], *args: Any) -> T:
+    """Call fn - in a worker thread if it may block, so that it doesn't hold up the event loop."""
+    if not blocking:
+        return fn(*args)
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        None,
+        functools.partial(context.run, fn, *args),
+    )
+
+
+def _usesBlockingStore(service: BifrostRPCService, prepared: _PreparedCall) -> bool:
+    """Returns True if the call's responses are kept in a cache backend which may block."""
+    # pylint: disable=protected-access
+    cache = prepared.resultCache
+    if cache is not None and cache.backend.blocking:
+        return True
+    store = service._idempotency
+    return store is not None and prepared.idempotencyKey is not None and store.backend.blocking
+
+
+def _callThenClose(prepared: _PreparedCall) -> Any:
+    try:
+        return prepared.fn(**resolveKwargs(prepared.kwargs))
+    finally:
+        prepared.scope.close()
+
+
+async def _callFactory(factory: Callable[[], Any]) -> Any:
+    value = factory()
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+def _inWorkerThread(factory: Callable[[], Any]) -> Callable[[], Awaitable[Any]]:
+    """Wrap a plain auth factory so that it doesn't hold up the event loop while it runs."""
+    async def _call() -> Any:
+        value = await _runSync(True, factory)
+        if inspect.isawaitable(value):
+            # e.g. a lambda which calls a coroutine function
+            value = await value
+        return value
+
+    return _call
+
+
+async def _callAuthFactories(
+    service: BifrostRPCService,
+    method: str,
+    prepared: _PreparedCall,
+    beforeBody: bool,
+) -> Optional[_Response]:
+    # pylint: disable=protected-access
+    # all the auth factories are resolved concurrently, but failures are still reported in the
+    # order the auth vars were declared
+    factories = service._getAuthFactories(prepared, beforeBody, _inWorkerThread)
+    values: List[Union[Any, BaseException]] = await asyncio.gather(
+        *[_callFactory(factory) for _, _, factory in factories],
+        return_exceptions=True,
+    )
+    for (name, t, _), value in zip(factories, values):
+        if isinstance(value, BaseException) and not isinstance(value, AuthFailure):
+            raise value
+        failure = service._checkAuthValue(method, prepared, name, t, value)
+        if failure is not None:
+            return failure
+    return None
+
+
+async def _callContextFactories(service: BifrostRPCService, prepared: _PreparedCall) -> None:
+    # pylint: disable=protected-access
+    loop = asyncio.get_running_loop()
+    calls: List[Awaitable[Any]] = []
+    for t in prepared.spec.contextvars.values():
+        provider = service._contextProviders[t]
+        if provider.blocking:
+            # e.g. waiting for a pooled value
+            calls.append(loop.run_in_executor(None, provider.get, prepared.scope))
+        else:
+            calls.append(_callFactory(functools.partial(provider.get, prepared.scope)))
+
+    # wait for all the factories to finish, even if some fail, so that nothing is added to the
+    # request scope after it has been closed
+    values: List[Union[Any, BaseException]] = await asyncio.gather(
+        *calls,
+        return_exceptions=True,
+    )
+    for name, value in zip(prepared.spec.contextvars, values):
+        if isinstance(value, BaseException):
+            raise value
+        prepared.kwargs[name] = value
+
+
+async def _waitUnlessDisconnected(task: 'asyncio.Future[Any]', receive: Receive) -> bool:
+    """Wait for task to finish, or cancel it if the client disconnects first."""
+    watcher = asyncio.ensure_future(_waitForDisconnect(receive))
+    try:
+        await asyncio.wait([task, watcher], return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+
+    if task.done():
+        return True
+
+    # NOTE: methods running in a worker thread can't be interrupted - their result is discarded
+    task.cancel()
+    return False
+
+
+async def _waitForDisconnect(receive: Receive) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+def _getContentLength(scope: Scope) -> Optional[int]:
+    value = _getScopeHeader(scope, 'Content-Length')
+    try:
+        return None if value is None else int(value)
+    except ValueError:
+        return None
+
+
+async def _readBody(receive: Receive, limit: Optional[int]) -> Optional[bytes]:
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if limit is not None and size > limit:
+            # the Content-Length was missing or wrong
+            raise BodyTooLargeError()
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+def _decodeBody(body: bytes) -> Any:
+    try:
+        return json.loads(body)
+    except ValueError:
+        # this will be rejected because it's not a dict
+        return None
+
+
+async def _sendResponse(send: Send, response: _Response) -> None:
+    body = response.getBytes()
+    await send({
+        'type': 'http.response.start',
+        'status': response.status,
+        'headers': [
+            (b'content-type', response.contentType.encode('latin-1')),
+            (b'content-length', str(len(body)).encode('latin-1')),
+            *[(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response.headers],
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _lifespan(receive: Receive, send: Send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -0,0 +1,101 @@
+"""
+Support for /api.v1/batch, which makes several method calls in a single HTTP request.
+
+The request body is a JSON object:
+
+    {"calls": [{"method": "getUser", "params": {...}}, ...], "concurrent": false}
+
+and the response is a JSON list with an item for each call, in the same order:
+
+    [{"status": 200, "result": ...}, {"status": 400, "error": "..."}, ...]
+
+A batch request only fails as a whole (with a non-200 status) if the batch itself is invalid.
+"""
+import asyncio
+import functools
+import inspect
+import json
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple, Type
+
+from bifrostrpc.deadlines import DEADLINE_HEADER
+from bifrostrpc.priority import PRIORITY_HEADER
+
+BATCH_PATH = '/api.v1/batch'
+
+# the headers of a batch request which apply to each call in it (others, such as
+# If-None-Match, only make sense for a single call)
+ITEM_HEADERS = (PRIORITY_HEADER, DEADLINE_HEADER)
+
+
+class BatchError(Exception):
+    """Raised when a batch request's body is invalid."""
+
+
+class BatchItem(NamedTuple):
+    method: str
+    params: Any
+
+
+def parseBatch(body: Any, maxSize: int) -> Tuple[List[BatchItem], bool]:
+    """Returns the calls in a batch request's body, and whether they may run concurrently."""
+    if not isinstance(body, dict) or not isinstance(body.get('calls'), list):
+        raise BatchError('Request body must be a JSON object with a "calls" list')
+
+    calls: List[Any] = body['calls']
+    if len(calls) > maxSize:
+        raise BatchError(f'A batch may contain at most {maxSize} calls')
+
+    items = []
+    for i, call in enumerate(calls):
+        if not isinstance(call, dict) or not isinstance(call.get('method'), str):
+            raise BatchError(f'calls[{i}] must be a JSON object with a "method" string')
+        items.append(BatchItem(call['method'], call.get('params', {})))
+    return items, body.get('concurrent') is True
+
+
+def encodeItem(status: int, body: bytes, isJSON: bool) -> bytes:
+    if status == 200 and isJSON:
+        # the result is already encoded
+        return b'{"status": 200, "result": ' + body + b'}'
+    return json.dumps({'status': status, 'error': body.decode('utf-8')}).encode('utf-8')
+
+
+def encodeBatch(items: List[bytes]) -> bytes:
+    return b'[' + b', '.join(items) + b']'
+
+
+class SharedAuth:
+    """
+    The values of the auth factories which don't need the request body, shared by all the calls
+    in a batch so that each factory is only called once per batch.
+
+    A factory's exceptions (e.g. AuthFailure) are shared in the same way.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # {authType: (value, exception)}
+        self._outcomes: Dict[Type[Any], Tuple[Any, Any]] = {}
+
+    def wrap(self, authType: Type[Any], factory: Callable[[], Any]) -> Callable[[], Any]:
+        return functools.partial(self._get, authType, factory)
+
+    def _get(self, authType: Type[Any], factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            try:
+                value, exception = self._outcomes[authType]
+            except KeyError:
+                value, exception = None, None
+                try:
+                    value = factory()
+                except Exception as e:  # pylint: disable=broad-except
+                    exception = e
+                if inspect.isawaitable(value):
+                    # share the pending result so the factory still only runs once
+                    value = asyncio.ensure_future(value)
+                self._outcomes[authType] = (value, exception)
+
+        if exception is not None:
+            raise exception
+        return value
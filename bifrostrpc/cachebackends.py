@@ -0,0 +1,304 @@
+"""
+Storage backends for rpcmethod result caches.
+
+Entries are grouped into namespaces (one per method) and each entry has a tag (derived from the
+method's args) so that all the entries for some args can be invalidated together.
+"""
+import abc
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from bifrostrpc.caching import TTLCache
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    sets: int = 0
+    # number of entries removed to stay within the backend's size limits
+    evictions: int = 0
+    # number of entries currently stored (-1 if the backend can't tell)
+    entries: int = 0
+
+
+class CacheBackend(abc.ABC):
+    # True if the backend's methods may block (e.g. on I/O), in which case async servers call
+    # them in a worker thread
+    blocking = True
+
+    @abc.abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        """Return the value stored for key, or None if it's missing or has expired."""
+
+    @abc.abstractmethod
+    def set(self, namespace: str, key: str, value: bytes, *, ttl: float, tag: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def invalidate(self, namespace: str, tag: str = None) -> None:
+        """Remove all the entries in namespace, or only those with the given tag."""
+
+    @abc.abstractmethod
+    def getStats(self) -> CacheStats:
+        ...
+
+
+class MemoryBackend(CacheBackend):
+    """An in-memory backend - each process has its own entries."""
+
+    blocking = False
+
+    def __init__(self, *, maxEntries: int = 1000, maxBytes: int = None) -> None:
+        # {(namespace, key): (namespace, tag, value)} - the ttl is given for each entry by set()
+        self._cache: TTLCache[Tuple[str, str], Tuple[str, str, bytes]] = TTLCache(
+            ttl=3600,
+            maxSize=maxEntries,
+            maxBytes=maxBytes,
+            sizeOf=lambda entry: len(entry[2]),
+        )
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        entry = self._cache.get((namespace, key))
+        with self._lock:
+            if entry is None:
+                self._stats.misses += 1
+                return None
+            self._stats.hits += 1
+        return entry[2]
+
+    def set(self, namespace: str, key: str, value: bytes, *, ttl: float, tag: str) -> None:
+        self._cache.set((namespace, key), (namespace, tag, value), ttl=ttl)
+        with self._lock:
+            self._stats.sets += 1
+
+    def invalidate(self, namespace: str, tag: str = None) -> None:
+        self._cache.deleteWhere(
+            lambda entry: entry[0] == namespace and (tag is None or entry[1] == tag)
+        )
+
+    def getStats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                sets=self._stats.sets,
+                evictions=self._cache.evictions,
+                entries=len(self._cache),
+            )
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    A backend which keeps its entries in an SQLite database in WAL mode.
+
+    All the server workers on a host can share the same database file, and entries survive
+    workers being restarted.
+
+    To keep writes cheap, the maxEntries/maxBytes limits are only enforced once every `evictEvery`
+    sets (by whichever process makes that set), and an entry's last-used time is updated at most
+    once every `touchInterval` seconds, so eviction is only approximately LRU.
+
+    NOTE: hit/miss/set counts are per process; evictions count the entries this process evicted.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        *,
+        maxEntries: int = 10000,
+        maxBytes: int = None,
+        evictEvery: int = 100,
+        touchInterval: float = 1.0,
+        timeout: float = 5.0,
+    ) -> None:
+        self.path = str(path)
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.evictEvery = evictEvery
+        self.touchInterval = touchInterval
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def _getConnection(self) -> sqlite3.Connection:
+        # each thread gets its own connection, and connections aren't carried over into forked
+        # processes
+        conn: Optional[sqlite3.Connection] = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS bifrost_cache ('
+            ' namespace TEXT NOT NULL,'
+            ' key TEXT NOT NULL,'
+            ' tag TEXT NOT NULL,'
+            ' value BLOB NOT NULL,'
+            ' expires REAL NOT NULL,'
+            ' used REAL NOT NULL,'
+            ' PRIMARY KEY (namespace, key)'
+            ')'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS bifrost_cache_tag ON bifrost_cache (namespace, tag)')
+        conn.execute('CREATE INDEX IF NOT EXISTS bifrost_cache_used ON bifrost_cache (used)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        conn = self._getConnection()
+        now = time.time()
+        row = conn.execute(
+            'SELECT value, expires, used FROM bifrost_cache WHERE namespace = ? AND key = ?',
+            (namespace, key),
+        ).fetchone()
+        if row is None or row[1] <= now:
+            with self._lock:
+                self._stats.misses += 1
+            return None
+
+        if now - row[2] >= self.touchInterval:
+            conn.execute(
+                'UPDATE bifrost_cache SET used = ? WHERE namespace = ? AND key = ?',
+                (now, namespace, key),
+            )
+        with self._lock:
+            self._stats.hits += 1
+        return bytes(row[0])
+
+    def set(self, namespace: str, key: str, value: bytes, *, ttl: float, tag: str) -> None:
+        conn = self._getConnection()
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO bifrost_cache (namespace, key, tag, value, expires, used)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            (namespace, key, tag, value, now + ttl, now),
+        )
+        with self._lock:
+            self._stats.sets += 1
+            evict = self._stats.sets % self.evictEvery == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove expired entries, then the least recently used ones beyond the size limits."""
+        conn = self._getConnection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM bifrost_cache WHERE expires <= ?', (time.time(), ))
+            count, total = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM bifrost_cache'
+            ).fetchone()
+            doomed = []
+            if count > self.maxEntries or (self.maxBytes is not None and total > self.maxBytes):
+                rows = conn.execute('SELECT rowid, LENGTH(value) FROM bifrost_cache ORDER BY used')
+                for rowid, size in rows:
+                    if count <= self.maxEntries and (
+                        self.maxBytes is None or total <= self.maxBytes
+                    ):
+                        break
+                    doomed.append((rowid, ))
+                    count -= 1
+                    total -= size
+                conn.executemany('DELETE FROM bifrost_cache WHERE rowid = ?', doomed)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        with self._lock:
+            self._stats.evictions += len(doomed)
+
+    def invalidate(self, namespace: str, tag: str = None) -> None:
+        conn = self._getConnection()
+        if tag is None:
+            conn.execute('DELETE FROM bifrost_cache WHERE namespace = ?', (namespace, ))
+        else:
+            conn.execute(
+                'DELETE FROM bifrost_cache WHERE namespace = ? AND tag = ?',
+                (namespace, tag),
+            )
+
+    def getStats(self) -> CacheStats:
+        (entries, ) = self._getConnection().execute(
+            'SELECT COUNT(*) FROM bifrost_cache WHERE expires > ?',
+            (time.time(), ),
+        ).fetchone()
+        with self._lock:
+            return CacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                sets=self._stats.sets,
+                evictions=self._stats.evictions,
+                entries=entries,
+            )
+
+
+class RedisBackend(CacheBackend):
+    """
+    A backend for a Redis-compatible server.
+
+    `client` would usually be a redis.Redis instance, but only these methods of it are used:
+    get(name), set(name, value, px=milliseconds), delete(*names), sadd(name, *values),
+    smembers(name), pttl(name) and pexpire(name, milliseconds).
+
+    The server is responsible for evicting entries (e.g. with maxmemory-policy allkeys-lru), so
+    evictions and entries aren't counted.
+    """
+
+    def __init__(self, client: Any, *, prefix: str = 'bifrostrpc:') -> None:
+        self.client = client
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stats = CacheStats(entries=-1)
+
+    def _getKeys(self, namespace: str, key: str, tag: str) -> Dict[str, str]:
+        base = f'{self.prefix}{namespace}:'
+        return {
+            'entry': f'{base}entry:{key}',
+            # sets of the entry names belonging to each tag and to the namespace as a whole
+            'tag': f'{base}tag:{tag}',
+            'namespace': f'{base}entries',
+        }
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        value: Optional[bytes] = self.client.get(self._getKeys(namespace, key, '')['entry'])
+        with self._lock:
+            if value is None:
+                self._stats.misses += 1
+            else:
+                self._stats.hits += 1
+        return value
+
+    def set(self, namespace: str, key: str, value: bytes, *, ttl: float, tag: str) -> None:
+        keys = self._getKeys(namespace, key, tag)
+        ms = max(int(ttl * 1000), 1)
+        self.client.set(keys['entry'], value, px=ms)
+        for setName in (keys['tag'], keys['namespace']):
+            self.client.sadd(setName, keys['entry'])
+            # the sets must live at least as long as all of their entries
+            if self.client.pttl(setName) < ms:
+                self.client.pexpire(setName, ms)
+        with self._lock:
+            self._stats.sets += 1
+
+    def invalidate(self, namespace: str, tag: str = None) -> None:
+        keys = self._getKeys(namespace, '', tag or '')
+        setName = keys['namespace'] if tag is None else keys['tag']
+        members = self.client.smembers(setName)
+        self.client.delete(setName, *members)
+
+    def getStats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(**self._stats.__dict__)
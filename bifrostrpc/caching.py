@@ -0,0 +1,166 @@
+import hashlib
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from typing import (Any, Awaitable, Callable, Generic, Hashable, Optional,
+                    Tuple, TypeVar)
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class TTLCache(Generic[K, V]):
+    """
+    A thread-safe in-memory cache with a time-to-live and an LRU bound.
+
+    Entries expire `ttl` seconds after they were stored. Once there are more than `maxSize`
+    entries, or their total size (as measured by `sizeOf`) is more than `maxBytes`, the least
+    recently used ones are evicted.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl: float,
+        maxSize: int,
+        maxBytes: int = None,
+        sizeOf: Callable[[V], int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if ttl <= 0:
+            raise Exception(f'ttl must be greater than 0; got {ttl!r}')
+        if maxSize < 1:
+            raise Exception(f'maxSize must be 1 or more; got {maxSize!r}')
+        if maxBytes is not None and sizeOf is None:
+            raise Exception('maxBytes requires a sizeOf function')
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.maxBytes = maxBytes
+        self._sizeOf = sizeOf
+        self._clock = clock
+        self._lock = threading.Lock()
+        # {key: (expiry time, value, size)} in least to most recently used order
+        self._entries: 'OrderedDict[K, Tuple[float, V, int]]' = OrderedDict()
+        self._bytes = 0
+        # number of entries removed to stay within maxSize/maxBytes
+        self.evictions = 0
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            try:
+                expires, value, _ = self._entries[key]
+            except KeyError:
+                return None
+            if expires <= self._clock():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V, ttl: float = None) -> None:
+        expires = self._clock() + (self.ttl if ttl is None else ttl)
+        size = self._sizeOf(value) if self._sizeOf is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (expires, value, size)
+            self._bytes += size
+            while len(self._entries) > self.maxSize or (
+                self.maxBytes is not None and self._bytes > self.maxBytes
+            ):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: K) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def delete(self, key: K) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._drop(key)
+            return True
+
+    def deleteWhere(self, predicate: Callable[[V], bool]) -> int:
+        """Delete the entries whose value matches `predicate` and return how many there were."""
+        with self._lock:
+            doomed = [k for k, (_, v, _) in self._entries.items() if predicate(v)]
+            for k in doomed:
+                self._drop(k)
+            return len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def getBytes(self) -> int:
+        return self._bytes
+
+
+def getFingerprint(credential: Hashable) -> bytes:
+    """Hash a credential so the cache doesn't hold on to raw tokens."""
+    return hashlib.sha256(repr(credential).encode('utf-8')).digest()
+
+
+class CachedAuthFactory:
+    """
+    Wraps an auth factory so its results are reused for requests with the same credentials.
+
+    `key` is called for each request and should return the credential the factory's result
+    depends on (e.g. a session cookie or bearer token), or None if the request doesn't have one,
+    in which case the factory is always called. Only successful (truthy) results are cached, so
+    AuthFailures are never remembered.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        key: Callable[[], Optional[Hashable]],
+        *,
+        ttl: float,
+        maxSize: int,
+    ) -> None:
+        self.factory = factory
+        self.key = key
+        self.cache: TTLCache[bytes, Any] = TTLCache(ttl=ttl, maxSize=maxSize)
+
+    def __call__(self) -> Any:
+        credential = self.key()
+        if credential is None:
+            return self.factory()
+
+        fingerprint = getFingerprint(credential)
+        cached = self.cache.get(fingerprint)
+        if cached is not None:
+            return cached
+
+        value = self.factory()
+        if inspect.isawaitable(value):
+            return self._remember(fingerprint, value)
+        if value:
+            self.cache.set(fingerprint, value)
+        return value
+
+    async def _remember(self, fingerprint: bytes, awaitable: Awaitable[Any]) -> Any:
+        value = await awaitable
+        if value:
+            self.cache.set(fingerprint, value)
+        return value
+
+    def invalidate(
+        self,
+        credential: Optional[Hashable] = None,
+        where: Callable[[Any], bool] = None,
+    ) -> None:
+        if credential is not None:
+            self.cache.delete(getFingerprint(credential))
+        if where is not None:
+            self.cache.deleteWhere(where)
+        if credential is None and where is None:
+            self.cache.clear()
@@ -0,0 +1,71 @@
+"""
+Deadlines sent by clients, so that the server can stop working on calls nobody is waiting for.
+
+A client which is only willing to wait a limited time for a call sends the time at which it will
+give up (in seconds since the epoch) in an X-Bifrost-Deadline header. Calls which arrive after
+their deadline are rejected straight away, calls which are still queued at their deadline are
+never started, and `async def` methods are cancelled when it passes. Regular methods can't be
+interrupted, but they can take an arg of type Deadline to find out how much time is left.
+
+NOTE: this relies on the clocks of the client and server roughly agreeing.
+"""
+import asyncio
+import time
+from typing import Awaitable, Optional, TypeVar
+
+DEADLINE_HEADER = 'X-Bifrost-Deadline'
+
+T = TypeVar('T')
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a call's deadline passes before it has finished."""
+
+
+class Deadline:
+    """
+    The time (in seconds since the epoch) by which the caller needs a response, or None if it
+    will wait forever.
+    """
+
+    def __init__(self, expires: Optional[float]) -> None:
+        self.expires = expires
+
+    def remaining(self) -> Optional[float]:
+        """Get the number of seconds left before the deadline, or None if there's no deadline."""
+        if self.expires is None:
+            return None
+        return max(self.expires - time.time(), 0.0)
+
+    def expired(self) -> bool:
+        return self.expires is not None and time.time() >= self.expires
+
+    def check(self) -> None:
+        """Raise DeadlineExceededError if the deadline has passed."""
+        if self.expired():
+            raise DeadlineExceededError('Deadline exceeded')
+
+    def __repr__(self) -> str:
+        return f'Deadline({self.expires!r})'
+
+
+def parseDeadline(value: Optional[str]) -> Deadline:
+    """Get the Deadline from the value of an X-Bifrost-Deadline header (which may be missing)."""
+    if value is None:
+        return Deadline(None)
+    try:
+        return Deadline(float(value))
+    except ValueError:
+        # a malformed deadline is ignored rather than rejecting the call
+        return Deadline(None)
+
+
+async def runUntilDeadline(awaitable: Awaitable[T], deadline: Deadline) -> T:
+    """Await `awaitable`, but cancel it and raise DeadlineExceededError if the deadline passes."""
+    remaining = deadline.remaining()
+    if remaining is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, remaining)
+    except asyncio.TimeoutError:
+        raise DeadlineExceededError('Deadline exceeded') from None
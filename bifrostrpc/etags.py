@@ -0,0 +1,20 @@
+import hashlib
+from typing import Optional
+
+
+def makeETag(data: bytes) -> str:
+    return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+
+def etagMatches(ifNoneMatch: Optional[str], etag: str) -> bool:
+    """Returns True if an If-None-Match header matches etag (using weak comparison)."""
+    if ifNoneMatch is None:
+        return False
+    if ifNoneMatch.strip() == '*':
+        return True
+    wanted = _stripWeak(etag)
+    return any(_stripWeak(candidate.strip()) == wanted for candidate in ifNoneMatch.split(','))
+
+
+def _stripWeak(etag: str) -> str:
+    return etag[2:] if etag.startswith('W/') else etag
@@ -0,0 +1,226 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Literal, Optional, Tuple
+
+from bifrostrpc.deadlines import DeadlineExceededError
+from bifrostrpc.lifetimes import resolveKwargs
+from bifrostrpc.priority import Priority, PriorityQueue, QueueTimeStats
+
+# Where an rpcmethod's handler is executed:
+# - 'thread': a bounded pool of threads - useful for keeping slow methods from tying up the
+#   request threads
+# - 'process': a pool of worker processes. Args (including auth/context values) and return values
+#   are pickled, so the method and everything it receives must be picklable.
+# - 'interpreter': a pool of sub-interpreters (python 3.14+). The same pickling rules as 'process'
+#   apply.
+PoolKind = Literal['thread', 'process', 'interpreter']
+
+# the execution policy for methods which run directly on the request thread
+INLINE = 'inline'
+
+
+class PoolFullError(Exception):
+    """Raised when an ExecutionPool's queue is full and can't accept another call."""
+
+
+@dataclass
+class ExecutionPoolStats:
+    kind: PoolKind
+    workers: int
+    maxQueue: int
+    # number of calls currently executing
+    running: int = 0
+    # number of calls waiting for a free worker
+    queued: int = 0
+    # number of calls which have finished (successfully or not)
+    completed: int = 0
+    # number of calls rejected because the queue was full
+    rejected: int = 0
+    # time spent waiting for a free worker, for each priority class
+    queueTimes: Dict[str, QueueTimeStats] = field(default_factory=dict)
+
+
+def _invoke(fn: Callable[..., Any], kwargs: Dict[str, Any]) -> Any:
+    # NOTE: this needs to be a module-level function so it can be pickled for process pools
+    result = fn(**resolveKwargs(kwargs))
+    if asyncio.iscoroutine(result):
+        result = asyncio.run(result)
+    return result
+
+
+_QueuedCall = Tuple[
+    Callable[..., Any],
+    Dict[str, Any],
+    'concurrent.futures.Future[Any]',
+    Optional[float],
+]
+
+
+class ExecutionPool:
+    """
+    A named pool of workers for executing rpcmethods.
+
+    At most `workers` calls run at once, and at most `maxQueue` more may wait for a free worker.
+    Any further calls are rejected with PoolFullError rather than being queued indefinitely.
+
+    Waiting calls are started in order of priority, but a call is treated as one class higher for
+    every `agingInterval` seconds it has waited so that lower priority calls aren't starved.
+    """
+    name: str
+    kind: PoolKind
+    workers: int
+    maxQueue: int
+
+    def __init__(
+        self,
+        name: str,
+        kind: PoolKind,
+        *,
+        workers: int,
+        maxQueue: int,
+        agingInterval: float = 1.0,
+    ) -> None:
+        if kind not in ('thread', 'process', 'interpreter'):
+            raise Exception(f'Unexpected execution pool kind {kind!r}')
+        if kind == 'interpreter' and not hasattr(concurrent.futures, 'InterpreterPoolExecutor'):
+            raise Exception(
+                f"Can't create execution pool {name!r}"
+                ": sub-interpreter pools require python 3.14 or later"
+            )
+        if workers < 1:
+            raise Exception(f'workers must be 1 or more; got {workers!r}')
+        if maxQueue < 0:
+            raise Exception(f'maxQueue must be 0 or more; got {maxQueue!r}')
+        self.name = name
+        self.kind = kind
+        self.workers = workers
+        self.maxQueue = maxQueue
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._running = 0
+        self._queue: PriorityQueue[_QueuedCall] = PriorityQueue(agingInterval=agingInterval)
+        self._completed = 0
+        self._rejected = 0
+        # NOTE: the executor is only created when the first call is submitted so that worker
+        # processes aren't started before a server forks
+        self._executor: Optional[concurrent.futures.Executor] = None
+
+    def _getExecutor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            prefix = f'bifrostrpc-{self.name}'
+            if self.kind == 'thread':
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.workers,
+                    thread_name_prefix=prefix,
+                )
+            elif self.kind == 'process':
+                self._executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+            else:
+                executorClass = getattr(concurrent.futures, 'InterpreterPoolExecutor')
+                self._executor = executorClass(self.workers, thread_name_prefix=prefix)
+        return self._executor
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        kwargs: Dict[str, Any],
+        priority: Priority = 'normal',
+        deadline: float = None,
+    ) -> 'concurrent.futures.Future[Any]':
+        """Queue a call of fn(**kwargs). If the call is still queued at `deadline` (in seconds
+        since the epoch) it fails with DeadlineExceededError instead of being started.
+        """
+        future: 'concurrent.futures.Future[Any]' = concurrent.futures.Future()
+        with self._lock:
+            if self._inflight >= self.workers + self.maxQueue:
+                self._rejected += 1
+                raise PoolFullError(f'Execution pool {self.name!r} is full')
+            self._inflight += 1
+            # NOTE: calls wait in our own queue rather than the executor's so that they can be
+            # started in order of priority
+            if self._running >= self.workers:
+                self._queue.push((fn, kwargs, future, deadline), priority)
+                return future
+            self._running += 1
+
+        if not self._start(fn, kwargs, future, None):
+            self._finished()
+        return future
+
+    def _start(
+        self,
+        fn: Callable[..., Any],
+        kwargs: Dict[str, Any],
+        future: 'concurrent.futures.Future[Any]',
+        deadline: Optional[float],
+    ) -> bool:
+        """Returns False if the call was finished without being handed to the executor."""
+        # a call which was cancelled while it was queued is skipped
+        if not future.set_running_or_notify_cancel():
+            return False
+        if deadline is not None and time.time() >= deadline:
+            future.set_exception(DeadlineExceededError('Deadline exceeded while queued'))
+            return False
+        try:
+            if self.kind != 'thread':
+                # values are copied to the worker, so they can only come from this thread
+                kwargs = resolveKwargs(kwargs)
+            inner = self._getExecutor().submit(_invoke, fn, kwargs)
+        except BaseException as e:  # pylint: disable=broad-except
+            future.set_exception(e)
+            return False
+        inner.add_done_callback(lambda inner: self._relay(inner, future))
+        return True
+
+    def _relay(
+        self,
+        inner: 'concurrent.futures.Future[Any]',
+        future: 'concurrent.futures.Future[Any]',
+    ) -> None:
+        if inner.cancelled():
+            # the executor was shut down before it started the call
+            future.set_exception(concurrent.futures.CancelledError())
+            self._finished()
+            return
+        error = inner.exception()
+        if error is None:
+            future.set_result(inner.result())
+        else:
+            future.set_exception(error)
+        self._finished()
+
+    def _finished(self) -> None:
+        # NOTE: queued calls which are skipped are finished in this loop rather than recursively,
+        # so that a long run of cancelled or expired calls can't exhaust the stack
+        while True:
+            with self._lock:
+                self._inflight -= 1
+                self._completed += 1
+                if not self._queue:
+                    self._running -= 1
+                    return
+                nextCall = self._queue.pop()
+            if self._start(*nextCall):
+                return
+
+    def getStats(self) -> ExecutionPoolStats:
+        with self._lock:
+            return ExecutionPoolStats(
+                kind=self.kind,
+                workers=self.workers,
+                maxQueue=self.maxQueue,
+                running=self._running,
+                queued=len(self._queue),
+                completed=self._completed,
+                rejected=self._rejected,
+                queueTimes=self._queue.getStats(),
+            )
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
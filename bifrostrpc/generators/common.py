@@ -1,5 +1,84 @@
+from typing import Iterable, Optional
+
 from paradox.generate.statements import ClassSpec
 from paradox.interfaces import AcceptsStatements
+from paradox.typing import (CrossAny, CrossDict, CrossList, CrossNull,
+                            CrossType, CrossUnion, dictof, listof, unionof)
+
+from bifrostrpc.typing import (Advanced, DataclassTypeSpec, DictTypeSpec,
+                               FuncSpec, ListTypeSpec, LiteralTypeSpec,
+                               NullTypeSpec, ScalarTypeSpec, TypedDictTypeSpec,
+                               TypeSpec, UnionTypeSpec, _generateCrossType)
+
+# name of the client method parameter used to send a field projection
+FIELDS_ARG = 'fields'
+# suffix of the extra client method generated for sending a field projection - its results are
+# missing fields, so they are returned as plain dicts instead of being converted
+PROJECTED_SUFFIX = '_projected'
+# name of the client method parameter used to give a call a timeout (in seconds), which the
+# client's dispatcher sends to the server as a deadline
+TIMEOUT_ARG = 'timeout'
+# name of the client method parameter used to retry a call - the server replays the response of
+# an earlier attempt sent with the same key instead of calling the method again
+IDEMPOTENCY_KEY_ARG = 'idempotency_key'
+
+
+def getProjectedMethodName(
+    name: str,
+    funcspec: FuncSpec,
+    methodnames: Iterable[str],
+) -> Optional[str]:
+    """Returns the name of the client method which sends a field projection, if there is one."""
+    # NOTE: methods which already have an argument named "fields" can't offer a projection, and
+    # neither can methods whose projected name is taken by another method
+    projected = name + PROJECTED_SUFFIX
+    if not funcspec.isProjectable() or FIELDS_ARG in funcspec.getArgSpecs():
+        return None
+    if projected in methodnames:
+        return None
+    return projected
+
+
+def getFieldsArgType() -> CrossType:
+    return listof(str)
+
+
+def getProjectedCrossType(spec: TypeSpec, adv: Advanced) -> CrossType:
+    """Returns the type of a projected return value, which is never converted by the client."""
+    if isinstance(spec, (DataclassTypeSpec, TypedDictTypeSpec)):
+        return dictof(str, CrossAny())
+    if isinstance(spec, ListTypeSpec):
+        return CrossList(getProjectedCrossType(spec.itemSpec, adv))
+    if isinstance(spec, DictTypeSpec):
+        return CrossDict(
+            _generateCrossType(spec.keySpec, adv),
+            getProjectedCrossType(spec.valueSpec, adv),
+        )
+    if isinstance(spec, UnionTypeSpec):
+        return CrossUnion([getProjectedCrossType(v, adv) for v in spec.variants])
+    if isinstance(spec, (NullTypeSpec, ScalarTypeSpec, LiteralTypeSpec)):
+        return _generateCrossType(spec, adv)
+    # enums and temporal values are left in their wire format
+    return CrossAny()
+
+
+def wantsTimeoutArg(funcspec: FuncSpec) -> bool:
+    """Returns True if a client method should accept a `timeout` parameter."""
+    # NOTE: methods which already have an argument named "timeout" can't be given a timeout
+    return TIMEOUT_ARG not in funcspec.getArgSpecs()
+
+
+def getTimeoutArgType() -> CrossType:
+    return unionof(float, CrossNull())
+
+
+def wantsIdempotencyKeyArg(funcspec: FuncSpec) -> bool:
+    """Returns True if a client method should accept an `idempotency_key` parameter."""
+    return IDEMPOTENCY_KEY_ARG not in funcspec.getArgSpecs()
+
+
+def getIdempotencyKeyArgType() -> CrossType:
+    return unionof(str, CrossNull())
 
 
 def appendFailureModeClasses(dest: AcceptsStatements, as_exception: bool) -> None:
@@ -55,3 +134,16 @@ def appendFailureModeClasses(dest: AcceptsStatements, as_exception: bool) -> Non
     c_ApiUnauthorized.addPythonBaseClass('ApiFailure')
     c_ApiUnauthorized.setPHPParentClass('ApiFailure')
     c_ApiUnauthorized.setTypeScriptParentClass('ApiFailure')
+
+    c_ApiRateLimited = dest.also(ClassSpec(
+        'ApiRateLimited',
+        tsexport=True,
+        docstring=[
+            'returned (not thrown) by api methods when the caller has made too',
+            'many calls recently. The call may succeed if it is retried after',
+            'the number of seconds given by the HTTP Retry-After header.',
+        ]
+    ))
+    c_ApiRateLimited.addPythonBaseClass('ApiFailure')
+    c_ApiRateLimited.setPHPParentClass('ApiFailure')
+    c_ApiRateLimited.setTypeScriptParentClass('ApiFailure')
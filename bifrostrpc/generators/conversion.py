@@ -1,22 +1,29 @@
 import dataclasses
+import enum
 import uuid
-from typing import Any, List, Literal, Optional, Type
+from datetime import date, datetime, timedelta
+from typing import (Any, Iterable, List, Literal, Optional, Set, Tuple,
+                    Type)
 
 from paradox.expressions import (PanCall, PanDict, PanExpr, PanList, PanVar,
                                  and_, exacteq_, isbool, isdict, isint, islist,
                                  isnull, isstr, not_, pan, phpexpr, pyexpr)
 from paradox.generate.statements import (AssignmentStatement, ClassSpec,
                                          ConditionalBlock, FunctionSpec,
-                                         Statement, Statements)
+                                         HardCodedStatement, Statement,
+                                         Statements)
 from paradox.interfaces import AcceptsStatements
 from paradox.typing import CrossAny, CrossCustomType, CrossStr
 
 from bifrostrpc.generators import Names
 from bifrostrpc.polyglot import raiseTypeError, withCatchTypeError
 from bifrostrpc.typing import (Advanced, DataclassTypeSpec, DictTypeSpec,
+                               EnumEncoding, EnumTypeSpec, FuncSpec,
                                ListTypeSpec, LiteralTypeSpec, NullTypeSpec,
-                               ScalarTypeSpec, TypeSpec, UnionTypeSpec,
-                               _generateCrossType, getTypeSpec)
+                               ScalarTypeSpec, TemporalEncoding,
+                               TemporalTypes, TemporalTypeSpec, TypeSpec,
+                               TypedDictTypeSpec, UnionTypeSpec,
+                               _generateCrossType, _istypeddict, getTypeSpec)
 
 
 class FilterNotPossible(Exception):
@@ -89,6 +96,16 @@ def getFilterBlock(
         )
         return cond
 
+    if isinstance(spec, EnumTypeSpec) and lang == 'php':
+        # php enums are just constants holding the wire values, so all we need to do is check the
+        # value is in the lookup table
+        nomatchexpr = _getTypeNoMatchExpr(var_or_prop, spec, lang=lang)
+        assert nomatchexpr is not None
+        cond = ConditionalBlock(nomatchexpr)
+        msg = f"{label} must be a valid {spec.enumClass.__name__}"
+        _raiseTypeError(cond, pymsg=msg, phpmsg=msg)
+        return cond
+
     if isinstance(spec, ListTypeSpec):
         ret = Statements()
 
@@ -199,6 +216,16 @@ def _getTypeNoMatchExpr(
         ]
         return and_(*comparisons)
 
+    if isinstance(spec, EnumTypeSpec):
+        if lang == 'python':
+            # not possible - python clients need to convert wire values into real Enum members
+            return None
+
+        phpvar = var_or_prop.getPHPExpr()[0]
+        phpcheck = 'is_string' if spec.wireType is str else 'is_int'
+        table = f'{spec.enumClass.__name__}::WIRE_VALUES'
+        return phpexpr(f'!({phpcheck}({phpvar}) && array_key_exists({phpvar}, {table}))')
+
     if isinstance(spec, UnionTypeSpec):
         exprs = []
         for subspec in spec.variants:
@@ -223,7 +250,7 @@ def _getTypeNoMatchExpr(
         # not possible
         return None
 
-    if isinstance(spec, DataclassTypeSpec):
+    if isinstance(spec, (DataclassTypeSpec, TypedDictTypeSpec)):
         # not possible
         return None
 
@@ -232,6 +259,10 @@ def _getTypeNoMatchExpr(
         # comprehension
         return None
 
+    if isinstance(spec, TemporalTypeSpec):
+        # not possible - wire values always need converting
+        return None
+
     raise Exception(f"Unexpected TypeSpec {spec!r}")
 
 
@@ -248,8 +279,8 @@ def getConverterExpr(
     # or dict comprehension (assuming converter expressions are possible for
     # all sub-types)
 
-    if isinstance(spec, DataclassTypeSpec):
-        if not adv.hasDataclass(spec.class_):
+    if isinstance(spec, (DataclassTypeSpec, TypedDictTypeSpec)):
+        if not (adv.hasDataclass(spec.class_) or adv.hasTypedDict(spec.class_)):
             raise Exception(
                 f'Cannot generate a converter for unknown dataclass {spec.class_.__name__}')
 
@@ -267,6 +298,24 @@ def getConverterExpr(
             pan(label),
         )
 
+    if isinstance(spec, TemporalTypeSpec):
+        return PanCall(
+            f'_{spec.temporalType.__name__}_from_wire',
+            var_or_prop,
+            pan(label),
+        )
+
+    if isinstance(spec, EnumTypeSpec) and lang == 'python':
+        if not adv.hasEnum(spec.enumClass):
+            raise Exception(
+                f'Cannot generate a converter for unknown Enum {spec.enumClass.__name__}')
+
+        return PanCall(
+            f'{spec.enumClass.__name__}.fromWire',
+            var_or_prop,
+            pan(label),
+        )
+
     raise ConverterNotPossible(f"A converter expression for {spec!r} not possible")
 
 
@@ -626,6 +675,26 @@ def getFilterOrConverterBlock(
         )
 
 
+def getClassFields(dc: Type[Any], adv: Advanced) -> List[Tuple[str, TypeSpec]]:
+    """
+    Return the names and TypeSpecs of the fields of a dataclass or TypedDict.
+
+    Keys which aren't required by a TypedDict are given an Optional[...] TypeSpec, since client
+    classes represent a missing key as a null value.
+    """
+    if not _istypeddict(dc):
+        return [(field.name, getTypeSpec(field.type, adv)) for field in dataclasses.fields(dc)]
+
+    spec = getTypeSpec(dc, adv)
+    assert isinstance(spec, TypedDictTypeSpec)
+    ret: List[Tuple[str, TypeSpec]] = []
+    for fname, fieldspec in spec.fieldSpecs.items():
+        if fname not in spec.requiredKeys:
+            fieldspec = UnionTypeSpec([fieldspec, NullTypeSpec()])
+        ret.append((fname, fieldspec))
+    return ret
+
+
 def getDataclassSpec(
     dc: Type[Any],
     *,
@@ -633,13 +702,16 @@ def getDataclassSpec(
     lang: Literal['python', 'php'],
     hoistcontext: AcceptsStatements,
 ) -> ClassSpec:
+    """
+    Return a paradox ClassSpec for a client-side copy of a dataclass or TypedDict.
+    """
     name = dc.__name__
     cls = ClassSpec(name, pydataclass=True)
+    fields = getClassFields(dc, adv)
 
-    for field in dataclasses.fields(dc):
-        fieldspec = getTypeSpec(field.type, adv)
+    for fname, fieldspec in fields:
         cls.addProperty(
-            field.name,
+            fname,
             _generateCrossType(fieldspec, adv),
             initarg=True,
             tsreadonly=True,
@@ -663,29 +735,28 @@ def getDataclassSpec(
         )
 
     # constructor part 2 - ensure the __dataclass__ item is present
-    expr_dataclass = v_data.getitem('__dataclass__', pan(None))
-    with fromdict.withCond(not_(exacteq_(expr_dataclass, pan(name)))) as cond:
-        # Tell pylint not to worry about the use of %-string formatting here -
-        # using an f-string to generate an f-string is too error prone:
-        # pylint: disable=C0209
-        raiseTypeError(
-            cond,
-            pyexpr=pyexpr('f"{label}[\'__dataclass__\'] must be \'%s\'"' % (name, )),
-            phpexpr=phpexpr('"{$label}[\'__dataclass__\'] must be \'%s\'"' % (name, )),
-        )
+    # NOTE: TypedDicts are sent without the __dataclass__ item
+    if not _istypeddict(dc):
+        expr_dataclass = v_data.getitem('__dataclass__', pan(None))
+        with fromdict.withCond(not_(exacteq_(expr_dataclass, pan(name)))) as cond:
+            # Tell pylint not to worry about the use of %-string formatting here -
+            # using an f-string to generate an f-string is too error prone:
+            # pylint: disable=C0209
+            raiseTypeError(
+                cond,
+                pyexpr=pyexpr('f"{label}[\'__dataclass__\'] must be \'%s\'"' % (name, )),
+                phpexpr=phpexpr('"{$label}[\'__dataclass__\'] must be \'%s\'"' % (name, )),
+            )
 
     names = Names()
 
     buildargs: List[PanExpr] = []
 
     # validate each property item
-    for field in dataclasses.fields(dc):
-        fname = field.name
+    for fname, fieldspec in fields:
         v_var = names.getNewName2('', fname, True, type=CrossAny())
         fromdict.alsoDeclare(v_var, None, v_data.getitem(fname, pan(None)))
 
-        fieldspec = getTypeSpec(field.type, adv)
-
         # check the local variable's type
         try:
             fromdict.also(getFilterBlock(
@@ -713,3 +784,510 @@ def getDataclassSpec(
     fromdict.alsoReturn(PanCall.callClassConstructor(name, *buildargs))
 
     return cls
+
+
+def getEnumSpec(
+    enumClass: Type[enum.Enum],
+    encoding: EnumEncoding,
+    *,
+    lang: Literal['python', 'php'],
+) -> Statements:
+    """
+    Return a paradox Statement that declares a client-side copy of an Enum.
+
+    Python gets a real Enum whose values are the wire values (so that members are
+    JSON-serializable as-is) along with a fromWire() method for converting responses. PHP gets a
+    class of constants plus a WIRE_VALUES lookup table for validating responses.
+    """
+    name = enumClass.__name__
+    spec = EnumTypeSpec(enumClass, encoding)
+
+    if lang == 'python':
+        if spec.wireType is str:
+            lines = [f'class {name}(str, enum.Enum):']
+        else:
+            lines = [f'class {name}(enum.IntEnum):']
+        for wireValue, member in spec.importTable.items():
+            lines.append(f'    {member.name} = {wireValue!r}')
+        wireTypeName = spec.wireType.__name__
+        lines.extend([
+            '',
+            '    @classmethod',
+            f"    def fromWire(cls, value: object, label: str) -> '{name}':",
+            f'        if type(value) is not {wireTypeName}'
+            ' or value not in cls._value2member_map_:',
+            f'            raise TypeError(f"{{label}} must be a valid {name}")',
+            '        return cls(value)',
+        ])
+    else:
+        assert lang == 'php'
+        lines = [f'final class {name}', '{']
+        for wireValue, member in spec.importTable.items():
+            lines.append(f'    const {member.name} = {_phpScalar(wireValue)};')
+        lines.append('    const WIRE_VALUES = [')
+        for wireValue in spec.importTable:
+            lines.append(f'        {_phpScalar(wireValue)} => true,')
+        lines.extend(['    ];', '}'])
+
+    return _getRawLines(lines, lang=lang)
+
+
+def _getRawLines(lines: List[str], *, lang: Literal['python', 'php']) -> Statements:
+    ret = Statements()
+    for line in lines:
+        ret.also(HardCodedStatement(
+            python=line if lang == 'python' else None,
+            php=line if lang == 'php' else None,
+        ))
+    return ret
+
+
+def findTemporalTypes(
+    funcspecs: List[Tuple[str, FuncSpec]],
+    adv: Advanced,
+) -> List[TemporalTypes]:
+    """
+    Return the temporal types used anywhere in the given methods or dataclasses.
+    """
+    found: List[TemporalTypes] = []
+
+    def _walk(spec: TypeSpec) -> None:
+        if isinstance(spec, TemporalTypeSpec):
+            if spec.temporalType not in found:
+                found.append(spec.temporalType)
+        elif isinstance(spec, ListTypeSpec):
+            _walk(spec.itemSpec)
+        elif isinstance(spec, DictTypeSpec):
+            _walk(spec.valueSpec)
+        elif isinstance(spec, UnionTypeSpec):
+            for vspec in spec.variants:
+                _walk(vspec)
+
+    for _, funcspec in funcspecs:
+        for argspec in funcspec.getArgSpecs().values():
+            _walk(argspec)
+        _walk(funcspec.getReturnSpec())
+    for dc in [*adv.getAllDataclasses(), *adv.getAllTypedDicts()]:
+        for _, fieldspec in getClassFields(dc, adv):
+            _walk(fieldspec)
+
+    return found
+
+
+ToWireLang = Literal['python', 'php', 'typescript']
+
+
+def needsToWire(
+    spec: TypeSpec,
+    *,
+    lang: ToWireLang,
+    _seen: Optional[Set[Any]] = None,
+) -> bool:
+    """
+    Returns True if a client-side value of type `spec` can't be JSON-encoded as-is.
+    """
+    if isinstance(spec, TemporalTypeSpec):
+        # PHP and typescript clients represent a timedelta as its wire value already
+        return lang == 'python' or spec.temporalType is not timedelta
+
+    if isinstance(spec, ListTypeSpec):
+        return needsToWire(spec.itemSpec, lang=lang, _seen=_seen)
+
+    if isinstance(spec, DictTypeSpec):
+        return needsToWire(spec.valueSpec, lang=lang, _seen=_seen)
+
+    if isinstance(spec, UnionTypeSpec):
+        return any(needsToWire(vspec, lang=lang, _seen=_seen) for vspec in spec.variants)
+
+    if isinstance(spec, (DataclassTypeSpec, TypedDictTypeSpec)):
+        if lang == 'python':
+            # python's json module can't encode the client's dataclasses
+            return True
+        seen = _seen if _seen is not None else set()
+        if spec.class_ in seen:
+            # the class refers to itself, so it only needs converting if one of its other fields
+            # does
+            return False
+        seen.add(spec.class_)
+        return any(
+            needsToWire(fieldspec, lang=lang, _seen=seen)
+            for fieldspec in spec.fieldSpecs.values()
+        )
+
+    return False
+
+
+def getToWireExpr(
+    expr: str,
+    spec: TypeSpec,
+    *,
+    lang: ToWireLang,
+    depth: int = 0,
+) -> Optional[str]:
+    """
+    Return source code for an expression that converts the client-side value `expr` of type `spec`
+    into its wire format, or None if the value can be sent as-is.
+
+    Dataclasses and TypedDicts are converted by the _<class>_to_wire() functions declared by
+    getToWireHelpers(). `expr` is evaluated more than once, so it should be a variable or property.
+    """
+    if not needsToWire(spec, lang=lang):
+        return None
+
+    if isinstance(spec, TemporalTypeSpec):
+        return f'_{spec.temporalType.__name__}_to_wire({expr})'
+
+    if isinstance(spec, (DataclassTypeSpec, TypedDictTypeSpec)):
+        return f'_{spec.class_.__name__}_to_wire({expr})'
+
+    var = ('$' if lang == 'php' else '') + f'_v{depth}'
+
+    if isinstance(spec, ListTypeSpec):
+        item = getToWireExpr(var, spec.itemSpec, lang=lang, depth=depth + 1)
+        if lang == 'python':
+            return f'[{item} for {var} in {expr}]'
+        if lang == 'php':
+            return f'array_map(function ({var}) {{ return {item}; }}, {expr})'
+        return f'{expr}.map(({var}: any) => {item})'
+
+    if isinstance(spec, DictTypeSpec):
+        if lang == 'python':
+            key = f'_k{depth}'
+            value = getToWireExpr(var, spec.valueSpec, lang=lang, depth=depth + 1)
+            return f'{{{key}: {value} for {key}, {var} in {expr}.items()}}'
+        if lang == 'php':
+            # NOTE: array_map() keeps the keys of a single array
+            value = getToWireExpr(var, spec.valueSpec, lang=lang, depth=depth + 1)
+            return f'array_map(function ({var}) {{ return {value}; }}, {expr})'
+        key = f'_k{depth}'
+        value = getToWireExpr(f'{expr}[{key}]', spec.valueSpec, lang=lang, depth=depth + 1)
+        return (
+            f'Object.keys({expr}).reduce(({var}: any, {key}: string) =>'
+            f' {{ {var}[{key}] = {value}; return {var}; }}, {{}})'
+        )
+
+    assert isinstance(spec, UnionTypeSpec)
+    converted: List[Tuple[str, str]] = []
+    onlyNull = True
+    for vspec in _getUnionVariants(spec):
+        if not needsToWire(vspec, lang=lang):
+            onlyNull = onlyNull and isinstance(vspec, NullTypeSpec)
+            continue
+        vexpr = getToWireExpr(expr, vspec, lang=lang, depth=depth)
+        assert vexpr is not None
+        converted.append((_getToWireTestExpr(expr, vspec, lang=lang), vexpr))
+
+    if len(converted) == 1 and onlyNull:
+        # e.g. Optional[datetime] doesn't need a type check
+        if lang == 'python':
+            test = f'{expr} is not None'
+        elif lang == 'php':
+            test = f'{expr} !== null'
+        else:
+            # TypedDict keys which aren't required may also be undefined
+            test = f'{expr} != null'
+        converted = [(test, converted[0][1])]
+
+    tests = [test for test, _ in converted]
+    if len(set(tests)) != len(tests):
+        raise Exception(f"Can't generate a client which sends {spec!r} - the variants which"
+                        f" need converting can't be told apart in {lang}")
+
+    ret = expr
+    for test, vexpr in reversed(converted):
+        if lang == 'python':
+            ret = f'({vexpr} if {test} else {ret})'
+        else:
+            ret = f'({test} ? {vexpr} : {ret})'
+    return ret
+
+
+def _getUnionVariants(spec: UnionTypeSpec) -> List[TypeSpec]:
+    ret: List[TypeSpec] = []
+    for vspec in spec.variants:
+        if isinstance(vspec, UnionTypeSpec):
+            ret.extend(_getUnionVariants(vspec))
+        else:
+            ret.append(vspec)
+    return ret
+
+
+def _getToWireTestExpr(expr: str, spec: TypeSpec, *, lang: ToWireLang) -> str:
+    """Return an expression which is true if `expr` is a client-side value of type `spec`."""
+    if isinstance(spec, TemporalTypeSpec):
+        if lang == 'python':
+            test = f'isinstance({expr}, datetime.{spec.temporalType.__name__})'
+            if spec.temporalType is date:
+                # a datetime is also a date
+                test += f' and not isinstance({expr}, datetime.datetime)'
+            return test
+        if lang == 'php':
+            return f'{expr} instanceof DateTimeInterface'
+        return f'{expr} instanceof Date'
+
+    if isinstance(spec, ListTypeSpec):
+        if lang == 'python':
+            return f'isinstance({expr}, list)'
+        if lang == 'php':
+            return f'is_array({expr})'
+        return f'Array.isArray({expr})'
+
+    if isinstance(spec, (DataclassTypeSpec, TypedDictTypeSpec)) and lang != 'typescript':
+        if lang == 'python':
+            return f'isinstance({expr}, {spec.class_.__name__})'
+        return f'{expr} instanceof {spec.class_.__name__}'
+
+    assert isinstance(spec, (DictTypeSpec, DataclassTypeSpec, TypedDictTypeSpec))
+    if lang == 'python':
+        return f'isinstance({expr}, dict)'
+    if lang == 'php':
+        return f'is_array({expr})'
+    # typescript interfaces are just objects
+    return (f'typeof {expr} === "object" && {expr} !== null && !Array.isArray({expr})'
+            f' && !({expr} instanceof Date)')
+
+
+def getToWireHelpers(
+    adv: Advanced,
+    *,
+    lang: Literal['python', 'php'],
+) -> Optional[Statements]:
+    """
+    Return paradox Statements declaring a _<class>_to_wire() function for each dataclass or
+    TypedDict which can't be JSON-encoded as-is, or None if there aren't any.
+    """
+    lines: List[str] = []
+    for dc in [*adv.getAllDataclasses(), *adv.getAllTypedDicts()]:
+        spec = getTypeSpec(dc, adv)
+        assert isinstance(spec, (DataclassTypeSpec, TypedDictTypeSpec))
+        if not needsToWire(spec, lang=lang):
+            continue
+
+        name = dc.__name__
+        # TypedDict keys which aren't required are left out when they are null
+        optional = [
+            fname for fname in spec.fieldSpecs
+            if isinstance(spec, TypedDictTypeSpec) and fname not in spec.requiredKeys
+        ]
+        items: List[str] = []
+        for fname, fieldspec in spec.fieldSpecs.items():
+            if fname in optional:
+                continue
+            prop = f'value.{fname}' if lang == 'python' else f'$value->{fname}'
+            value = getToWireExpr(prop, fieldspec, lang=lang) or prop
+            if lang == 'python':
+                items.append(f'        {fname!r}: {value},')
+            else:
+                items.append(f'        {_phpScalar(fname)} => {value},')
+        if lang == 'python':
+            lines.extend([
+                '',
+                '',
+                f"def _{name}_to_wire(value: '{name}') -> typing.Dict[str, typing.Any]:",
+                '    ret: typing.Dict[str, typing.Any] = {' + ('' if items else '}'),
+            ])
+            if items:
+                lines.extend([*items, '    }'])
+        else:
+            lines.extend(['', f'function _{name}_to_wire($value)', '{'])
+            lines.extend(['    $ret = [', *items, '    ];'] if items else ['    $ret = [];'])
+        for fname in optional:
+            fieldspec = spec.fieldSpecs[fname]
+            if lang == 'python':
+                prop = f'value.{fname}'
+                value = getToWireExpr(prop, fieldspec, lang=lang) or prop
+                lines.extend([
+                    f'    if {prop} is not None:',
+                    f'        ret[{fname!r}] = {value}',
+                ])
+            else:
+                prop = f'$value->{fname}'
+                value = getToWireExpr(prop, fieldspec, lang=lang) or prop
+                lines.extend([
+                    f'    if ({prop} !== null) {{',
+                    f'        $ret[{_phpScalar(fname)}] = {value};',
+                    '    }',
+                ])
+        lines.append('    return ret' if lang == 'python' else '    return $ret;')
+        if lang == 'php':
+            lines.append('}')
+
+    return _getRawLines(lines, lang=lang) if lines else None
+
+
+def getTemporalHelpers(
+    temporalTypes: Iterable[TemporalTypes],
+    encoding: TemporalEncoding,
+    *,
+    lang: Literal['python', 'php'],
+) -> Statements:
+    """
+    Return paradox Statements declaring the _<type>_from_wire() and _<type>_to_wire() functions.
+
+    These convert between datetime/date/timedelta values and the service's wire encoding, and are
+    used by converters and when sending arguments.
+    """
+    lines: List[str] = []
+    for temporalType in temporalTypes:
+        spec = TemporalTypeSpec(temporalType, encoding)
+        if lang == 'python':
+            lines.extend(_getPythonTemporalHelper(spec))
+        else:
+            assert lang == 'php'
+            lines.extend(_getPHPTemporalHelper(spec))
+    return _getRawLines(lines, lang=lang)
+
+
+def _getPythonTemporalHelper(spec: TemporalTypeSpec) -> List[str]:
+    name = spec.temporalType.__name__
+    pytype = f'datetime.{name}'
+    unit = 'microseconds' if spec.encoding == 'epoch_us' else 'milliseconds'
+    unitsPerDay = timedelta(days=1) // spec.unit
+    epochOrdinal = date(1970, 1, 1).toordinal()
+    epoch = 'datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)'
+
+    lines = [
+        '',
+        '',
+        f'def _{name}_from_wire(value: object, label: str) -> {pytype}:',
+    ]
+    if spec.wireType is str:
+        lines.extend([
+            '    if not isinstance(value, str):',
+            '        raise TypeError(f"{label} must be an ISO-8601 string")',
+        ])
+        if spec.temporalType is datetime:
+            lines.extend([
+                "    if value.endswith('Z'):",
+                "        value = value[:-1] + '+00:00'",
+            ])
+        lines.extend([
+            '    try:',
+            f'        return {pytype}.fromisoformat(value)',
+            '    except ValueError:',
+            '        raise TypeError(f"{label} must be an ISO-8601 string")',
+        ])
+    else:
+        lines.extend([
+            '    if isinstance(value, bool) or not isinstance(value, int):',
+            '        raise TypeError(f"{label} must be an integer")',
+        ])
+        if spec.temporalType is timedelta:
+            lines.append(f'    return datetime.timedelta({unit}=value)')
+        elif spec.temporalType is date:
+            lines.extend([
+                f'    days, remainder = divmod(value, {unitsPerDay})',
+                '    if remainder:',
+                '        raise TypeError(f"{label} must be a timestamp at midnight UTC")',
+                f'    return datetime.date.fromordinal({epochOrdinal} + days)',
+            ])
+        else:
+            # NOTE: adding a timedelta is exact, unlike fromtimestamp() which goes via float
+            lines.extend([
+                '    try:',
+                f'        return {epoch} + datetime.timedelta({unit}=value)',
+                '    except OverflowError:',
+                '        raise TypeError(f"{label} is out of range")',
+            ])
+
+    wiretype = spec.wireType.__name__
+    lines.extend([
+        '',
+        '',
+        f'def _{name}_to_wire(value: {pytype}) -> {wiretype}:',
+    ])
+    if spec.wireType is str:
+        lines.append('    return value.isoformat()')
+    elif spec.temporalType is timedelta:
+        lines.append(f'    return value // datetime.timedelta({unit}=1)')
+    elif spec.temporalType is date:
+        lines.append(f'    return (value.toordinal() - {epochOrdinal}) * {unitsPerDay}')
+    else:
+        lines.append(f'    return (value - {epoch}) // datetime.timedelta({unit}=1)')
+
+    return lines
+
+
+def _getPHPTemporalHelper(spec: TemporalTypeSpec) -> List[str]:
+    name = spec.temporalType.__name__
+    unitsPerSecond = timedelta(seconds=1) // spec.unit
+    unitsPerDay = timedelta(days=1) // spec.unit
+    # DateTimeImmutable can represent microseconds, so 'Uu' formats as a microsecond timestamp
+    usPerUnit = spec.unit // timedelta(microseconds=1)
+
+    lines = [
+        '',
+        f'function _{name}_from_wire($value, $label)',
+        '{',
+    ]
+    if spec.wireType is str:
+        if spec.temporalType is date:
+            lines.extend([
+                "    if (!is_string($value) || !preg_match('/^\\d{4}-\\d{2}-\\d{2}$/', $value)) {",
+                '        throw new UnexpectedValueException("$label must be an ISO-8601 date");',
+                '    }',
+                "    return DateTimeImmutable::createFromFormat("
+                "'!Y-m-d', $value, new DateTimeZone('UTC'));",
+            ])
+        else:
+            lines.extend([
+                '    if (!is_string($value)) {',
+                '        throw new UnexpectedValueException("$label must be an ISO-8601 string");',
+                '    }',
+                '    try {',
+                '        return new DateTimeImmutable($value);',
+                '    } catch (Exception $e) {',
+                '        throw new UnexpectedValueException("$label must be an ISO-8601 string");',
+                '    }',
+            ])
+    else:
+        lines.extend([
+            '    if (!is_int($value)) {',
+            '        throw new UnexpectedValueException("$label must be an integer");',
+            '    }',
+        ])
+        if spec.temporalType is timedelta:
+            lines.append('    return $value;')
+        else:
+            if spec.temporalType is date:
+                lines.extend([
+                    f'    if ($value % {unitsPerDay} !== 0) {{',
+                    '        throw new UnexpectedValueException('
+                    '"$label must be a timestamp at midnight UTC");',
+                    '    }',
+                ])
+            lines.extend([
+                "    return DateTimeImmutable::createFromFormat("
+                f"'U.u', sprintf('%.6F', $value / {unitsPerSecond}));",
+            ])
+    lines.append('}')
+
+    lines.extend([
+        '',
+        f'function _{name}_to_wire($value)',
+        '{',
+    ])
+    if spec.temporalType is timedelta:
+        lines.append('    return $value;')
+    elif spec.wireType is str:
+        if spec.temporalType is date:
+            lines.append("    return $value->format('Y-m-d');")
+        else:
+            lines.append("    return $value->format('Y-m-d\\TH:i:s.uP');")
+    elif spec.temporalType is date:
+        lines.extend([
+            "    $midnight = DateTimeImmutable::createFromFormat("
+            "'!Y-m-d', $value->format('Y-m-d'), new DateTimeZone('UTC'));",
+            f'    return $midnight->getTimestamp() * {unitsPerSecond};',
+        ])
+    else:
+        lines.append(f"    return intdiv((int)$value->format('Uu'), {usPerUnit});")
+    lines.append('}')
+
+    return lines
+
+
+def _phpScalar(value: Any) -> str:
+    if isinstance(value, str):
+        return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+    return str(value)
@@ -1,6 +1,7 @@
-from typing import List, Literal, Tuple
+from typing import List, Literal, Set, Tuple
 
-from paradox.expressions import PanCall, PanProp, PanVar, pan
+from paradox.expressions import (PanCall, PanProp, PanVar, exacteq_, not_, pan,
+                                 phpexpr)
 from paradox.generate.statements import ClassSpec, DictBuilderStatement
 from paradox.interfaces import AcceptsStatements
 from paradox.output import Script
@@ -8,12 +9,26 @@ from paradox.typing import (CrossAny, CrossCallable, CrossCustomType, dictof,
                             unionof)
 
 from bifrostrpc.generators import Names
-from bifrostrpc.generators.common import appendFailureModeClasses
+from bifrostrpc.generators.common import (FIELDS_ARG, IDEMPOTENCY_KEY_ARG,
+                                          TIMEOUT_ARG,
+                                          appendFailureModeClasses,
+                                          getFieldsArgType,
+                                          getIdempotencyKeyArgType,
+                                          getProjectedCrossType,
+                                          getProjectedMethodName,
+                                          getTimeoutArgType,
+                                          wantsIdempotencyKeyArg,
+                                          wantsTimeoutArg)
 from bifrostrpc.generators.conversion import (ConverterNotPossible,
                                               FilterNotPossible,
                                               getConverterBlock,
                                               getConverterExpr,
-                                              getDataclassSpec, getFilterBlock)
+                                              findTemporalTypes,
+                                              getDataclassSpec, getEnumSpec,
+                                              getFilterBlock,
+                                              getTemporalHelpers,
+                                              getToWireExpr,
+                                              getToWireHelpers)
 from bifrostrpc.typing import Advanced, FuncSpec, _generateCrossType
 
 HEADER = 'generated by Bifrost RPC'
@@ -30,15 +45,30 @@ def generateClient(
     adv: Advanced,
     flavour: Literal['abstract'],
     on_error: Literal['return', 'raise'],
+    idempotent: Set[str],
 ) -> None:
     dest.add_file_comment(HEADER)
 
     appendFailureModeClasses(dest, as_exception=on_error == 'raise')
 
-    # make copies of all our dataclasses
-    for dc in adv.getAllDataclasses():
+    # make copies of all our enums
+    for enumClass, encoding in adv.getAllEnums():
+        dest.also(getEnumSpec(enumClass, encoding, lang='php'))
+
+    # add conversion functions for any temporal types
+    temporalTypes = findTemporalTypes(funcspecs, adv)
+    if temporalTypes:
+        dest.also(getTemporalHelpers(temporalTypes, adv.temporalEncoding, lang='php'))
+
+    # make copies of all our dataclasses and TypedDicts
+    for dc in [*adv.getAllDataclasses(), *adv.getAllTypedDicts()]:
         dest.also(getDataclassSpec(dc, adv=adv, lang='php', hoistcontext=dest))
 
+    # add functions which convert dataclasses and TypedDicts to their wire format
+    toWire = getToWireHelpers(adv, lang='php')
+    if toWire is not None:
+        dest.also(toWire)
+
     # generate function wrappers
     _generateWrappers(
         classname,
@@ -47,6 +77,7 @@ def generateClient(
         flavour=flavour,
         context=dest,
         on_error=on_error,
+        idempotent=idempotent,
     )
 
 
@@ -58,6 +89,7 @@ def _generateWrappers(
     flavour: Literal['abstract'],
     context: AcceptsStatements,
     on_error: Literal['return', 'raise'],
+    idempotent: Set[str],
 ) -> None:
     next_conv_nr = 1
     cls = context.also(ClassSpec(
@@ -65,7 +97,17 @@ def _generateWrappers(
         isabstract=flavour == 'abstract',
         # TODO: we really should have a docstring for this
     ))
-    # add an dispatch() function that is used for all methods
+
+    # only the responses of idempotent methods have an ETag worth remembering
+    isidempotent = cls.createMethod('_isIdempotent', bool)
+    isidempotent.addPositionalArg('method', str)
+    methodnames = ', '.join(f"'{name}'" for name in sorted(idempotent))
+    isidempotent.alsoReturn(phpexpr(f'in_array($method, [{methodnames}], true)'))
+    # add an dispatch() function that is used for all methods. Implementations are expected to
+    # send every attempt of a call with the same Idempotency-Key header:
+    # $params['__idempotency_key__'] if the caller passed one, otherwise a key generated once per
+    # call (e.g. bin2hex(random_bytes(16))), and to retry a bounded number of times on a 503
+    # response or a connection error. See demo_curl_client.php.
     dispatchfn = cls.createMethod(
         '_dispatch',
         unionof(T_ApiFailure, CrossAny()) if on_error == 'return' else CrossAny(),
@@ -82,6 +124,12 @@ def _generateWrappers(
     # if any part of result does not match the method's return type.
     dispatchfn.addPositionalArg('converter_name', CrossCallable([CrossAny()], CrossAny()))
 
+    methodnames = [name for name, _ in funcspecs]
+    if any(getProjectedMethodName(n, f, methodnames) is not None for n, f in funcspecs):
+        # projected results are missing fields, so they are returned as-is
+        passthrough = cls.createMethod('_converter_passthrough', CrossAny())
+        passthrough.alsoReturn(passthrough.addPositionalArg('result', CrossAny()))
+
     for name, funcspec in funcspecs:
         retspec = funcspec.getReturnSpec()
 
@@ -119,31 +167,71 @@ def _generateWrappers(
                 ))
                 conv.alsoReturn(v_converted)
 
-        rettype = _generateCrossType(retspec, adv)
-        if on_error == 'return':
-            rettype = unionof(T_ApiFailure, rettype)
-        method = cls.createMethod(name, rettype)
-
-        for argname, spec in funcspec.getArgSpecs().items():
-            method.addPositionalArg(argname, _generateCrossType(spec, adv))
-
-        v_args = PanVar('args', dictof(str, CrossAny()))
-        argnames = DictBuilderStatement.fromPanVar(v_args)
-        for n in funcspec.getArgSpecs().keys():
-            # TODO: dataclasses aren't automatically JSON serializable, so we need to raise an
-            # error if we try to generate a client that has a dataclass argument type
-            argnames.addPair(n, False)
-        method.also(argnames)
-
-        method.blank()
-        method.remark(
-            'include [__dataclass__] in returned values so that we can rebuild dataclasses',
-        )
-        method.alsoAssign(v_args["__showdataclass__"], True)
-
-        method.alsoReturn(PanCall(
-            PanProp('_dispatch', CrossAny(), None),
-            pan(name),
-            v_args,
-            pan(conv_name),
-        ))
+        projectedname = getProjectedMethodName(name, funcspec, methodnames)
+        variants = [(name, False)]
+        if projectedname is not None:
+            variants.append((projectedname, True))
+
+        for methodname, projected in variants:
+            if projected:
+                rettype = getProjectedCrossType(retspec, adv)
+            else:
+                rettype = _generateCrossType(retspec, adv)
+            if on_error == 'return':
+                rettype = unionof(T_ApiFailure, rettype)
+            method = cls.createMethod(methodname, rettype)
+
+            for argname, spec in funcspec.getArgSpecs().items():
+                method.addPositionalArg(argname, _generateCrossType(spec, adv))
+            if projected:
+                v_fields = method.addPositionalArg(FIELDS_ARG, getFieldsArgType())
+            withTimeout = wantsTimeoutArg(funcspec)
+            if withTimeout:
+                v_timeout = method.addPositionalArg(
+                    TIMEOUT_ARG,
+                    getTimeoutArgType(),
+                    default=None,
+                )
+            withKey = wantsIdempotencyKeyArg(funcspec)
+            if withKey:
+                v_key = method.addPositionalArg(
+                    IDEMPOTENCY_KEY_ARG,
+                    getIdempotencyKeyArgType(),
+                    default=None,
+                )
+
+            v_args = PanVar('args', dictof(str, CrossAny()))
+            argnames = DictBuilderStatement.fromPanVar(v_args)
+            for n in funcspec.getArgSpecs().keys():
+                argnames.addPair(n, False)
+            method.also(argnames)
+
+            # convert temporal values and dataclasses (including nested ones) to their wire
+            # format
+            for n, spec in funcspec.getArgSpecs().items():
+                wire = getToWireExpr('$' + n, spec, lang='php')
+                if wire is not None:
+                    method.alsoAssign(v_args[n], phpexpr(wire))
+
+            method.blank()
+            method.remark(
+                'include [__dataclass__] in returned values so that we can rebuild dataclasses',
+            )
+            method.alsoAssign(v_args["__showdataclass__"], True)
+            if withTimeout:
+                with method.withCond(not_(exacteq_(v_timeout, pan(None)))) as cond:
+                    cond.remark('the dispatcher sends this to the server as a deadline')
+                    cond.alsoAssign(v_args["__timeout__"], v_timeout)
+            if withKey:
+                with method.withCond(not_(exacteq_(v_key, pan(None)))) as cond:
+                    cond.remark('replaces the key the dispatcher would generate for this call')
+                    cond.alsoAssign(v_args["__idempotency_key__"], v_key)
+            if projected:
+                method.alsoAssign(v_args["__fields__"], v_fields)
+
+            method.alsoReturn(PanCall(
+                PanProp('_dispatch', CrossAny(), None),
+                pan(name),
+                v_args,
+                pan('_converter_passthrough' if projected else conv_name),
+            ))
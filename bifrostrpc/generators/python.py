@@ -1,21 +1,35 @@
-from typing import List, Tuple
+from typing import List, Set, Tuple
 
 from paradox.expressions import (PanCall, PanStringBuilder, PanVar, exacteq_,
                                  not_, pan, pandict, pyexpr)
 from paradox.generate.statements import (ClassSpec, DictBuilderStatement,
-                                         FunctionSpec)
+                                         FunctionSpec, HardCodedStatement)
 from paradox.output import Script
 from paradox.typing import (CrossAny, CrossCallable, CrossCustomType, dictof,
                             unionof)
 
 from bifrostrpc import Flavour
 from bifrostrpc.generators import Names
-from bifrostrpc.generators.common import appendFailureModeClasses
+from bifrostrpc.generators.common import (FIELDS_ARG, IDEMPOTENCY_KEY_ARG,
+                                          TIMEOUT_ARG,
+                                          appendFailureModeClasses,
+                                          getFieldsArgType,
+                                          getIdempotencyKeyArgType,
+                                          getProjectedCrossType,
+                                          getProjectedMethodName,
+                                          getTimeoutArgType,
+                                          wantsIdempotencyKeyArg,
+                                          wantsTimeoutArg)
 from bifrostrpc.generators.conversion import (ConverterNotPossible,
                                               FilterNotPossible,
                                               getConverterBlock,
                                               getConverterExpr,
-                                              getDataclassSpec, getFilterBlock)
+                                              findTemporalTypes,
+                                              getDataclassSpec, getEnumSpec,
+                                              getFilterBlock,
+                                              getTemporalHelpers,
+                                              getToWireExpr,
+                                              getToWireHelpers)
 from bifrostrpc.typing import Advanced, FuncSpec, _generateCrossType
 
 HEADER = 'generated by Bifrost RPC'
@@ -31,6 +45,8 @@ def generateClient(
     funcspecs: List[Tuple[str, FuncSpec]],
     adv: Advanced,
     flavour: Flavour,
+    idempotent: Set[str],
+    idempotencyKeys: bool,
 ) -> None:
     dest.add_file_comment(HEADER)
 
@@ -40,16 +56,35 @@ def generateClient(
 
     appendFailureModeClasses(dest, as_exception=False)
 
-    # make copies of all our dataclasses
-    for dc in adv.getAllDataclasses():
+    # make copies of all our enums
+    for enumClass, encoding in adv.getAllEnums():
+        dest.alsoImportPy('enum')
+        dest.also(getEnumSpec(enumClass, encoding, lang='python'))
+
+    # add conversion functions for any temporal types
+    temporalTypes = findTemporalTypes(funcspecs, adv)
+    if temporalTypes:
+        dest.alsoImportPy('datetime')
+        dest.also(getTemporalHelpers(temporalTypes, adv.temporalEncoding, lang='python'))
+
+    # make copies of all our dataclasses and TypedDicts
+    for dc in [*adv.getAllDataclasses(), *adv.getAllTypedDicts()]:
         dest.also(getDataclassSpec(dc, adv=adv, lang='python', hoistcontext=dest))
 
+    # add functions which convert dataclasses and TypedDicts to their wire format
+    toWire = getToWireHelpers(adv, lang='python')
+    if toWire is not None:
+        dest.alsoImportPy('typing')
+        dest.also(toWire)
+
     # generate function wrappers
     dest.also(_generateClientClass(
         classname,
         funcspecs,
         adv=adv,
         flavour=flavour,
+        idempotent=idempotent,
+        idempotencyKeys=idempotencyKeys,
     ))
 
 
@@ -59,6 +94,8 @@ def _generateClientClass(
     *,
     adv: Advanced,
     flavour: Flavour,
+    idempotent: Set[str],
+    idempotencyKeys: bool,
 ) -> ClassSpec:
     cls = ClassSpec(
         classname,
@@ -66,6 +103,11 @@ def _generateClientClass(
         # TODO: we really should have a docstring for this
     )
 
+    # only the responses of idempotent methods have an ETag worth remembering
+    isidempotent = cls.createMethod('_isIdempotent', bool)
+    isidempotent.addPositionalArg('method', str)
+    isidempotent.alsoReturn(pyexpr(f'method in {tuple(sorted(idempotent))!r}'))
+
     # add an dispatch() function that is used for all methods
     dispatchfn = cls.createMethod(
         '_dispatch',
@@ -95,6 +137,25 @@ def _generateClientClass(
             CrossCustomType(python='requests.Session'),
             default=PanCall('requests.Session'),
         )
+        # {cachekey: (etag, converted result)} for the last response of each idempotent call,
+        # so the server can reply with a 304 Not Modified instead of sending it again. The least
+        # recently used entries are dropped once there are more than etag_cache_size.
+        cls.alsoImportPy('collections')
+        cls.alsoImportPy('typing')
+        p_etags = cls.addProperty(
+            '_etags',
+            CrossCustomType(python='typing.OrderedDict[str, typing.Any]'),
+            default=PanCall('collections.OrderedDict'),
+        )
+        cls.addProperty('etag_cache_size', int, default=pan(100))
+        # calls which fail before the server has started them (a 503 response, or a connection
+        # error when it's safe to send the call again) are retried this many times, waiting
+        # retry_delay seconds before the first retry and twice as long before each one after that
+        cls.addProperty('retries', int, default=pan(2))
+        cls.addProperty('retry_delay', float, default=pan(0.1))
+        # set to 'low' to let the server start other calls before this client's calls when it's
+        # busy (e.g. for background syncing)
+        p_priority = cls.addProperty('priority', str, default=pan(''))
 
         urlexpr = PanStringBuilder([
             pan('http://'),
@@ -109,15 +170,95 @@ def _generateClientClass(
             'Accept': 'application/json',
             'Content-Type': 'application/json',
         }))
-        dispatchfn.alsoImportPy('requests')
-        v_result = dispatchfn.alsoDeclare('result', "no_type", PanCall(
-            p_session.getprop('post'),
-            v_url,
-            json=v_params,
-            headers=v_headers,
+        # a timeout passed to the client method is sent as the time the client will give up
+        v_timeout = dispatchfn.alsoDeclare(
+            'timeout',
+            'no_type',
+            pyexpr("params.pop('__timeout__', None)"),
+        )
+        dispatchfn.alsoImportPy('time')
+        with dispatchfn.withCond(not_(exacteq_(v_timeout, pan(None)))) as cond:
+            cond.alsoAssign(v_headers['X-Bifrost-Deadline'], pyexpr('str(time.time() + timeout)'))
+        # every attempt of a call is sent with the same key, so the server replays the response of
+        # an attempt which succeeded instead of calling the method again. Callers can pass their
+        # own idempotency_key, e.g. to retry a call after the client has been restarted.
+        v_idempotencyKey = dispatchfn.alsoDeclare(
+            'idempotency_key',
+            'no_type',
+            pyexpr("params.pop('__idempotency_key__', None)"),
+        )
+        if idempotencyKeys:
+            dispatchfn.alsoImportPy('uuid')
+            with dispatchfn.withCond(exacteq_(v_idempotencyKey, pan(None))) as cond:
+                cond.alsoAssign(v_idempotencyKey, pyexpr('uuid.uuid4().hex'))
+        with dispatchfn.withCond(not_(exacteq_(v_idempotencyKey, pan(None)))) as cond:
+            cond.alsoAssign(v_headers['Idempotency-Key'], v_idempotencyKey)
+        # NOTE: the per-call options (__timeout__, __idempotency_key__) have already been
+        # removed from params so they aren't part of the key, but __fields__ is because it
+        # changes the result
+        dispatchfn.alsoImportPy('json')
+        v_cachekey = dispatchfn.alsoDeclare('cachekey', str, PanStringBuilder([
+            v_method,
+            pan(':'),
+            PanCall('json.dumps', v_params, sort_keys=True),
+        ]))
+        v_cached = dispatchfn.alsoDeclare('cached', 'no_type', pyexpr(
+            'self._etags.get(cachekey) if self._isIdempotent(method) else None',
         ))
+        with dispatchfn.withCond(not_(exacteq_(v_cached, pan(None)))) as cond:
+            cond.alsoAssign(v_headers['If-None-Match'], pyexpr('cached[0]'))
+            cond.also(PanCall(p_etags.getprop('move_to_end'), v_cachekey))
+        with dispatchfn.withCond(not_(exacteq_(p_priority, pan('')))) as cond:
+            cond.alsoAssign(v_headers['X-Bifrost-Priority'], p_priority)
+        dispatchfn.alsoImportPy('requests')
+        v_attempt = PanVar('attempt', None)
+        with dispatchfn.withFor(v_attempt, pyexpr('range(self.retries + 1)')) as loop:
+            with loop.withCond(pyexpr('attempt > 0')) as cond:
+                cond.also(PanCall('time.sleep', pyexpr('self.retry_delay * 2 ** (attempt - 1)')))
+            with loop.withTryBlock() as tryblock:
+                v_result = tryblock.alsoDeclare('result', "no_type", PanCall(
+                    p_session.getprop('post'),
+                    v_url,
+                    json=v_params,
+                    headers=v_headers,
+                    timeout=v_timeout,
+                ))
+                with tryblock.withCatchBlock2(
+                    PanVar('e', None),
+                    pyclass='requests.RequestException',
+                ) as catchblock:
+                    with catchblock.withCond(pyexpr('isinstance(e, requests.Timeout)')) as cond:
+                        cond.alsoReturn(PanCall('ApiOutage', PanStringBuilder([
+                            pan('Timed out waiting for '),
+                            v_method,
+                            pan(': '),
+                            pyexpr('str(e)'),
+                        ])))
+                    catchblock.remark(
+                        'the call may have reached the server, so it is only sent again if that'
+                        ' is safe'
+                    )
+                    with catchblock.withCond(pyexpr(
+                        'attempt == self.retries'
+                        ' or (idempotency_key is None and not self._isIdempotent(method))'
+                    )) as cond:
+                        cond.alsoReturn(PanCall('ApiOutage', PanStringBuilder([
+                            pan('Could not send '),
+                            v_method,
+                            pan(': '),
+                            pyexpr('str(e)'),
+                        ])))
+                    catchblock.also(HardCodedStatement(python='continue'))
+            loop.remark("a 503 response means the server didn't start the call (e.g. it was busy)")
+            v_status = v_result.getprop('status_code', type=CrossAny())
+            with loop.withCond(not_(exacteq_(v_status, 503))) as cond:
+                cond.also(HardCodedStatement(python='break'))
         statuscodeexpr = v_result.getprop('status_code', type=CrossAny())
 
+        # the result hasn't changed since the cached response
+        with dispatchfn.withCond(exacteq_(statuscodeexpr, 304)) as cond:
+            cond.alsoReturn(pyexpr('cached[1]'))
+
         # return ApiUnauthorized when 401 response received
         with dispatchfn.withCond(exacteq_(statuscodeexpr, 401)) as cond:
             cond.alsoReturn(PanCall('ApiUnauthorized', PanStringBuilder([
@@ -127,6 +268,15 @@ def _generateClientClass(
                 v_result.getprop('text'),
             ])))
 
+        # return ApiRateLimited when 429 response received
+        with dispatchfn.withCond(exacteq_(statuscodeexpr, 429)) as cond:
+            cond.alsoReturn(PanCall('ApiRateLimited', PanStringBuilder([
+                pan('Rate limited - retry after '),
+                pyexpr("result.headers.get('Retry-After', '1')"),
+                pan('s: '),
+                v_result.getprop('text'),
+            ])))
+
         # TODO: return ApiBroken instead when appropriate
         # TODO: have more descriptive errors for various kinds of HTTP responses
         with dispatchfn.withCond(not_(exacteq_(statuscodeexpr, 200))) as cond:
@@ -154,10 +304,19 @@ def _generateClientClass(
                     pan(' was invalid: '),
                     pyexpr('e.args[0]'),
                 ])))
+        dispatchfn.alsoDeclare('etag', 'no_type', pyexpr("result.headers.get('ETag')"))
+        with dispatchfn.withCond(pyexpr(
+            'etag is not None and self._isIdempotent(method)',
+        )) as cond:
+            cond.alsoAssign(p_etags.getitem(v_cachekey), pyexpr('(etag, ret)'))
+            cond.also(PanCall(p_etags.getprop('move_to_end'), v_cachekey))
+            with cond.withCond(pyexpr('len(self._etags) > self.etag_cache_size')) as evict:
+                evict.also(PanCall(p_etags.getprop('popitem'), last=False))
         dispatchfn.alsoReturn(v_ret)
     else:
         assert flavour == 'abstract'
 
+    methodnames = [name for name, _ in funcspecs]
     for name, funcspec in funcspecs:
         retspec = funcspec.getReturnSpec()
 
@@ -199,33 +358,82 @@ def _generateClientClass(
                 ))
                 conv.alsoReturn(v_converted)
 
-        rettype = unionof(T_ApiFailure, _generateCrossType(retspec, adv))
-        method = cls.createMethod(name, rettype)
+        projectedname = getProjectedMethodName(name, funcspec, methodnames)
+        variants = [(name, False)]
+        if projectedname is not None:
+            variants.append((projectedname, True))
 
-        for argname, spec in funcspec.getArgSpecs().items():
-            method.addPositionalArg(argname, _generateCrossType(spec, adv))
+        for methodname, projected in variants:
+            if projected:
+                rettype = unionof(T_ApiFailure, getProjectedCrossType(retspec, adv))
+            else:
+                rettype = unionof(T_ApiFailure, _generateCrossType(retspec, adv))
+            method = cls.createMethod(methodname, rettype)
 
-        v_args = PanVar('args', dictof(str, CrossAny()))
-        argnames = DictBuilderStatement.fromPanVar(v_args)
-        for n in funcspec.getArgSpecs().keys():
-            # TODO: dataclasses aren't automatically JSON serializable, so we need to raise an
-            # error if we try to generate a client that has a dataclass argument type
-            argnames.addPair(n, False)
-        method.also(argnames)
+            for argname, spec in funcspec.getArgSpecs().items():
+                method.addPositionalArg(argname, _generateCrossType(spec, adv))
+            if projected:
+                v_fields = method.addPositionalArg(FIELDS_ARG, getFieldsArgType())
+            withTimeout = wantsTimeoutArg(funcspec)
+            if withTimeout:
+                v_timeout = method.addPositionalArg(
+                    TIMEOUT_ARG,
+                    getTimeoutArgType(),
+                    default=None,
+                )
+            withKey = wantsIdempotencyKeyArg(funcspec)
+            if withKey:
+                v_key = method.addPositionalArg(
+                    IDEMPOTENCY_KEY_ARG,
+                    getIdempotencyKeyArgType(),
+                    default=None,
+                )
 
-        method.blank()
-        method.remark(
-            'include [__dataclass__] in returned values so that we can rebuild dataclasses',
-        )
-        method.alsoAssign(v_args["__showdataclass__"], True)
+            v_args = PanVar('args', dictof(str, CrossAny()))
+            argnames = DictBuilderStatement.fromPanVar(v_args)
+            for n in funcspec.getArgSpecs().keys():
+                argnames.addPair(n, False)
+            method.also(argnames)
 
-        method.also(conv)
+            # convert temporal values and dataclasses (including nested ones) to their wire
+            # format
+            for n, spec in funcspec.getArgSpecs().items():
+                wire = getToWireExpr(n, spec, lang='python')
+                if wire is not None:
+                    method.alsoAssign(v_args[n], pyexpr(wire))
 
-        method.alsoReturn(PanCall(
-            'self._dispatch',
-            pan(name),
-            v_args,
-            pyexpr('_converter'),
-        ))
+            method.blank()
+            method.remark(
+                'include [__dataclass__] in returned values so that we can rebuild dataclasses',
+            )
+            method.alsoAssign(v_args["__showdataclass__"], True)
+            if withTimeout:
+                with method.withCond(not_(exacteq_(v_timeout, pan(None)))) as cond:
+                    cond.remark('the dispatcher sends this to the server as a deadline')
+                    cond.alsoAssign(v_args["__timeout__"], v_timeout)
+            if withKey:
+                with method.withCond(not_(exacteq_(v_key, pan(None)))) as cond:
+                    cond.remark('replaces the key the dispatcher would generate for this call')
+                    cond.alsoAssign(v_args["__idempotency_key__"], v_key)
+
+            if projected:
+                method.remark('projected results are missing fields, so they are returned as-is')
+                method.alsoAssign(v_args["__fields__"], v_fields)
+                method.alsoReturn(PanCall(
+                    'self._dispatch',
+                    pan(name),
+                    v_args,
+                    pyexpr('lambda result: result'),
+                ))
+                continue
+
+            method.also(conv)
+
+            method.alsoReturn(PanCall(
+                'self._dispatch',
+                pan(name),
+                v_args,
+                pyexpr('_converter'),
+            ))
 
     return cls
@@ -1,6 +1,7 @@
-import dataclasses
+import json
 import re
-from typing import List, Literal, Optional, Tuple, cast
+from datetime import date, timedelta
+from typing import List, Literal, Optional, Set, Tuple, cast
 
 from paradox.expressions import pandict, tsexpr
 from paradox.generate.statements import ClassSpec, InterfaceSpec, RawTypescript
@@ -10,10 +11,24 @@ from paradox.typing import (CrossAny, CrossCallable, CrossCustomType, dictof,
                             unionof)
 
 from bifrostrpc.generators import Names
-from bifrostrpc.generators.common import appendFailureModeClasses
+from bifrostrpc.generators.common import (FIELDS_ARG, IDEMPOTENCY_KEY_ARG,
+                                          TIMEOUT_ARG,
+                                          appendFailureModeClasses,
+                                          getFieldsArgType,
+                                          getIdempotencyKeyArgType,
+                                          getProjectedCrossType,
+                                          getProjectedMethodName,
+                                          getTimeoutArgType,
+                                          wantsIdempotencyKeyArg,
+                                          wantsTimeoutArg)
+from bifrostrpc.generators.conversion import (findTemporalTypes,
+                                              getClassFields, getToWireExpr,
+                                              needsToWire)
 from bifrostrpc.typing import (Advanced, DataclassTypeSpec, DictTypeSpec,
-                               FuncSpec, ListTypeSpec, LiteralTypeSpec,
-                               NullTypeSpec, ScalarTypeSpec, TypeSpec,
+                               EnumTypeSpec, FuncSpec, ListTypeSpec,
+                               LiteralTypeSpec, NullTypeSpec, ScalarTypeSpec,
+                               TemporalEncoding, TemporalTypes,
+                               TemporalTypeSpec, TypeSpec, TypedDictTypeSpec,
                                UnionTypeSpec, _generateCrossType, getTypeSpec)
 
 HEADER = 'generated by Bifrost RPC'
@@ -35,13 +50,23 @@ def generateClient(
     funcspecs: List[Tuple[str, FuncSpec]],
     adv: Advanced,
     flavour: Literal['abstract'],
+    idempotent: Set[str],
 ) -> None:
     dest.add_file_comment(HEADER)
 
     appendFailureModeClasses(dest, as_exception=False)
     _importExternalTypes(dest, adv)
     _generateAdvancedTypes(dest, adv)
-    _generateWrappers(dest, classname, funcspecs, adv=adv, flavour=flavour)
+    _generateTemporalHelpers(dest, findTemporalTypes(funcspecs, adv), adv.temporalEncoding)
+    _generateToWireHelpers(dest, adv)
+    _generateWrappers(
+        dest,
+        classname,
+        funcspecs,
+        adv=adv,
+        flavour=flavour,
+        idempotent=idempotent,
+    )
 
 
 def _importExternalTypes(dest: AcceptsStatements, adv: Advanced) -> None:
@@ -68,12 +93,102 @@ def _generateAdvancedTypes(dest: AcceptsStatements, adv: Advanced) -> None:
         dest.blank()
         dest.also(tsexpr(f'export type {name} = {typeExpr}'))
 
-    for dc in adv.getAllDataclasses():
+    for enumClass, encoding in adv.getAllEnums():
+        spec = EnumTypeSpec(enumClass, encoding)
+        members = ', '.join(
+            f'{member.name} = {json.dumps(wireValue)}'
+            for wireValue, member in spec.importTable.items()
+        )
+        wirevalues = ', '.join(json.dumps(wireValue) for wireValue in spec.importTable)
+        dest.blank()
+        dest.also(tsexpr(f'export enum {enumClass.__name__} {{{members}}}'))
+        # lookup table used by converters to validate wire values
+        dest.also(tsexpr(f'const {_getEnumTableName(spec)} = new Set<any>([{wirevalues}])'))
+
+    for dc in [*adv.getAllDataclasses(), *adv.getAllTypedDicts()]:
         dest.blank()
         iface = dest.also(InterfaceSpec(dc.__name__, tsexport=True))
-        for field in dataclasses.fields(dc):
-            generated = _generateCrossType(getTypeSpec(field.type, adv), adv)
-            iface.addProperty(field.name, generated)
+        for fname, fieldspec in getClassFields(dc, adv):
+            iface.addProperty(fname, _generateCrossType(fieldspec, adv))
+
+
+def _generateTemporalHelpers(
+    dest: AcceptsStatements,
+    temporalTypes: List[TemporalTypes],
+    encoding: TemporalEncoding,
+) -> None:
+    # javascript Dates only have millisecond precision
+    scale = ' * 1000' if encoding == 'epoch_us' else ''
+    unscale = ' / 1000' if encoding == 'epoch_us' else ''
+
+    for temporalType in temporalTypes:
+        spec = TemporalTypeSpec(temporalType, encoding)
+        name = temporalType.__name__
+        tstype = _generateType(spec, Advanced())
+
+        if temporalType is timedelta:
+            check = '!Number.isInteger(value)'
+            msg = 'an integer'
+            fromwire = 'value'
+            towire = 'value'
+        elif spec.wireType is str and temporalType is date:
+            check = 'typeof value !== "string" || !/^\\d{4}-\\d{2}-\\d{2}$/.test(value)'
+            msg = 'an ISO-8601 date'
+            fromwire = 'new Date(value + "T00:00:00Z")'
+            towire = 'value.toISOString().slice(0, 10)'
+        elif spec.wireType is str:
+            check = 'typeof value !== "string" || isNaN(Date.parse(value))'
+            msg = 'an ISO-8601 string'
+            fromwire = 'new Date(value)'
+            towire = 'value.toISOString()'
+        elif temporalType is date:
+            unitsPerDay = timedelta(days=1) // spec.unit
+            check = f'!Number.isInteger(value) || value % {unitsPerDay} !== 0'
+            msg = 'a timestamp at midnight UTC'
+            fromwire = f'new Date(value{unscale})'
+            towire = (
+                'Date.UTC(value.getUTCFullYear(), value.getUTCMonth(), value.getUTCDate())'
+                + scale
+            )
+        else:
+            check = '!Number.isInteger(value)'
+            msg = 'an integer timestamp'
+            fromwire = f'new Date(value{unscale})'
+            towire = f'value.getTime(){scale}'
+
+        dest.blank()
+        dest.also(tsexpr(
+            f'function _{name}_from_wire(value: any, label: string): {tstype} {{'
+            f' if ({check}) {{ throw new TypeError(label + " must be {msg}"); }}'
+            f' return {fromwire}; }}'
+        ))
+        dest.also(tsexpr(
+            f'function _{name}_to_wire(value: {tstype}): any {{ return {towire}; }}'
+        ))
+
+
+def _generateToWireHelpers(dest: AcceptsStatements, adv: Advanced) -> None:
+    for dc in [*adv.getAllDataclasses(), *adv.getAllTypedDicts()]:
+        spec = getTypeSpec(dc, adv)
+        assert isinstance(spec, (DataclassTypeSpec, TypedDictTypeSpec))
+        if not needsToWire(spec, lang='typescript'):
+            continue
+
+        # only the class's own fields are copied, so a value received from the server can be sent
+        # back without its __dataclass__ key
+        name = dc.__name__
+        lines = [f'function _{name}_to_wire(value: {name}): any {{', 'const ret: any = {};']
+        for fname, fieldspec in spec.fieldSpecs.items():
+            prop = f'value.{fname}'
+            wire = getToWireExpr(prop, fieldspec, lang='typescript') or prop
+            if isinstance(spec, TypedDictTypeSpec) and fname not in spec.requiredKeys:
+                # keys which aren't required are left out when they are null
+                lines.append(f'if ({prop} != null) {{ ret.{fname} = {wire}; }}')
+            else:
+                lines.append(f'ret.{fname} = {wire};')
+        lines.extend(['return ret;', '}'])
+        dest.blank()
+        dest.also(tsexpr(' '.join(lines)))
 
 
 def _generateWrappers(
@@ -83,6 +198,7 @@ def _generateWrappers(
     *,
     adv: Advanced,
     flavour: Literal['abstract'],
+    idempotent: Set[str],
 ) -> None:
     cls = dest.also(ClassSpec(
         classname,
@@ -90,7 +206,16 @@ def _generateWrappers(
         tsexport=True,
     ))
 
-    # dispatch() function
+    # only the responses of idempotent methods have an ETag worth remembering
+    isidempotent = cls.createMethod('isIdempotent', bool)
+    isidempotent.addPositionalArg('method', str)
+    with isidempotent.withRawTS() as ts:
+        ts.rawline(f'return {json.dumps(sorted(idempotent))}.indexOf(method) !== -1;')
+
+    # dispatch() function. Implementations are expected to send every attempt of a call with the
+    # same Idempotency-Key header: params['__idempotency_key__'] if the caller passed one,
+    # otherwise a key generated once per call (e.g. crypto.randomUUID()), and to retry a bounded
+    # number of times on a 503 response or a connection error. See demo_fetch_client.ts.
     # FIXME: this should be protected, but we don't support that yet
     dispatchfn = cls.createMethod(
         'dispatch',
@@ -110,29 +235,66 @@ def _generateWrappers(
         # XXX: implement other flavours here
         raise Exception(f"Unexpected flavour {flavour!r}")
 
+    methodnames = [name for name, _ in funcspecs]
     for name, funcspec in funcspecs:
-        argnames = funcspec.getArgSpecs().keys()
         retspec = funcspec.getReturnSpec()
-        # TODO: need to ensure that FunctionSpec writes this out as a Promise<ApiFailure, ...> due
-        # to the isasync=True kwarg
-        rettype = unionof(T_ApiFailure, _generateCrossType(retspec, adv))
-
-        fn = cls.createMethod(name, rettype, isasync=True)
-        for argname, argspec in funcspec.getArgSpecs().items():
-            fn.addPositionalArg(argname, _generateCrossType(argspec, adv))
-
-        names = Names()
-
-        argsdict = {argname: tsexpr(argname) for argname in argnames}
-        fn.alsoDeclare('args', None, pandict(argsdict, CrossAny()))
-
-        with fn.withRawTS() as ts:
-            ts.rawline(f"const converter = (result: any) => {{")
-            # verify that result matches the typespec for ret
-            _generateConverter(ts, 'result', retspec, names, adv, '  ')
-            ts.rawline(f'  return result;')
-            ts.rawline(f'}};')
-            ts.rawline(f"return await this.dispatch('{name}', args, converter);")
+        projectedname = getProjectedMethodName(name, funcspec, methodnames)
+        variants = [(name, False)]
+        if projectedname is not None:
+            variants.append((projectedname, True))
+
+        for methodname, projected in variants:
+            # TODO: need to ensure that FunctionSpec writes this out as a Promise<ApiFailure, ...>
+            # due to the isasync=True kwarg
+            if projected:
+                rettype = unionof(T_ApiFailure, getProjectedCrossType(retspec, adv))
+            else:
+                rettype = unionof(T_ApiFailure, _generateCrossType(retspec, adv))
+
+            fn = cls.createMethod(methodname, rettype, isasync=True)
+            for argname, argspec in funcspec.getArgSpecs().items():
+                fn.addPositionalArg(argname, _generateCrossType(argspec, adv))
+            if projected:
+                fn.addPositionalArg(FIELDS_ARG, getFieldsArgType())
+            withTimeout = wantsTimeoutArg(funcspec)
+            if withTimeout:
+                fn.addPositionalArg(TIMEOUT_ARG, getTimeoutArgType(), default=None)
+            withKey = wantsIdempotencyKeyArg(funcspec)
+            if withKey:
+                fn.addPositionalArg(IDEMPOTENCY_KEY_ARG, getIdempotencyKeyArgType(), default=None)
+
+            names = Names()
+
+            argsdict = {}
+            for argname, argspec in funcspec.getArgSpecs().items():
+                # convert Dates (including nested ones) to their wire format
+                argsdict[argname] = tsexpr(
+                    getToWireExpr(argname, argspec, lang='typescript') or argname)
+            fn.alsoDeclare('args', None, pandict(argsdict, CrossAny()))
+
+            with fn.withRawTS() as ts:
+                if withTimeout:
+                    # the dispatcher sends this to the server as a deadline
+                    ts.rawline(f'if ({TIMEOUT_ARG} !== null) {{')
+                    ts.rawline(f"  args['__timeout__'] = {TIMEOUT_ARG};")
+                    ts.rawline(f'}}')
+                if withKey:
+                    # replaces the key the dispatcher would generate for this call
+                    ts.rawline(f'if ({IDEMPOTENCY_KEY_ARG} !== null) {{')
+                    ts.rawline(f"  args['__idempotency_key__'] = {IDEMPOTENCY_KEY_ARG};")
+                    ts.rawline(f'}}')
+                if projected:
+                    # projected results are missing fields, so they are returned as-is
+                    ts.rawline(f"args['__fields__'] = {FIELDS_ARG};")
+                    ts.rawline(
+                        f"return await this.dispatch('{name}', args, (result: any) => result);")
+                    continue
+                ts.rawline(f"const converter = (result: any) => {{")
+                # verify that result matches the typespec for ret
+                _generateConverter(ts, 'result', retspec, names, adv, '  ')
+                ts.rawline(f'  return result;')
+                ts.rawline(f'}};')
+                ts.rawline(f"return await this.dispatch('{name}', args, converter);")
 
 
 def _generateType(spec: TypeSpec, adv: Advanced) -> str:
@@ -167,13 +329,23 @@ def _generateType(spec: TypeSpec, adv: Advanced) -> str:
                 f'Cannot generate a typescript alias matching {typeName}'
                 f'; no known primitive type for {typeName}')
 
-    if isinstance(spec, DataclassTypeSpec):
-        if not adv.hasDataclass(spec.class_):
+    if isinstance(spec, (DataclassTypeSpec, TypedDictTypeSpec)):
+        if not (adv.hasDataclass(spec.class_) or adv.hasTypedDict(spec.class_)):
             raise Exception(
                 f'Cannot generate a typescript type for unknown dataclass {spec.class_.__name__}')
 
         return spec.class_.__name__
 
+    if isinstance(spec, EnumTypeSpec):
+        if not adv.hasEnum(spec.enumClass):
+            raise Exception(
+                f'Cannot generate a typescript type for unknown Enum {spec.enumClass.__name__}')
+
+        return spec.enumClass.__name__
+
+    if isinstance(spec, TemporalTypeSpec):
+        return 'number' if spec.temporalType is timedelta else 'Date'
+
     if isinstance(spec, ListTypeSpec):
         itemstr = _generateType(spec.itemSpec, adv)
         if re.match(r'^\w+$', itemstr):
@@ -192,6 +364,19 @@ def _generateType(spec: TypeSpec, adv: Advanced) -> str:
     raise Exception(f"TODO: generate a type for {spec!r}")
 
 
+def _isReplacedByConverter(spec: TypeSpec) -> bool:
+    """Returns True if the converter for spec needs to assign a new value to the variable."""
+    if isinstance(spec, TemporalTypeSpec):
+        return True
+    if isinstance(spec, UnionTypeSpec):
+        return any(_isReplacedByConverter(vspec) for vspec in spec.variants)
+    return False
+
+
+def _getEnumTableName(spec: EnumTypeSpec) -> str:
+    return f'_{spec.enumClass.__name__}_WIRE_VALUES'
+
+
 def _getTypeNoMatchExpr(var_or_prop: str, spec: TypeSpec) -> Optional[str]:
     if isinstance(spec, NullTypeSpec):
         return f"{var_or_prop} !== null"
@@ -205,7 +390,10 @@ def _getTypeNoMatchExpr(var_or_prop: str, spec: TypeSpec) -> Optional[str]:
         valueexpr = _generateType(spec, Advanced())
         return f'{var_or_prop} !== {valueexpr}'
 
-    if isinstance(spec, DataclassTypeSpec):
+    if isinstance(spec, EnumTypeSpec):
+        return f'!{_getEnumTableName(spec)}.has({var_or_prop})'
+
+    if isinstance(spec, (DataclassTypeSpec, TypedDictTypeSpec)):
         # not possible
         return None
 
@@ -213,6 +401,10 @@ def _getTypeNoMatchExpr(var_or_prop: str, spec: TypeSpec) -> Optional[str]:
         # not possible
         return None
 
+    if isinstance(spec, TemporalTypeSpec):
+        # not possible - the wire value needs converting
+        return None
+
     raise Exception(f'TODO: no code to get a type-match expr for {spec!r}')
 
 
@@ -240,6 +432,20 @@ def _generateConverter(
         ts.rawline(f'{indent}}}')
         return
 
+    if isinstance(spec, EnumTypeSpec):
+        # make sure the thing is one of the enum's wire values
+        name = spec.enumClass.__name__
+        ts.rawline(f'{indent}if ({_getTypeNoMatchExpr(var_or_prop, spec)}) {{')
+        ts.rawline(f'{indent}  throw new TypeError("{var_or_prop} should be a valid {name}");')
+        ts.rawline(f'{indent}}}')
+        return
+
+    if isinstance(spec, TemporalTypeSpec):
+        # replace the wire value with the real value
+        name = spec.temporalType.__name__
+        ts.rawline(f'{indent}{var_or_prop} = _{name}_from_wire({var_or_prop}, "{var_or_prop}");')
+        return
+
     if isinstance(spec, ListTypeSpec):
         # make sure the thing is an array
         ts.rawline(f'{indent}if (!Array.isArray({var_or_prop})) {{')
@@ -248,6 +454,17 @@ def _generateConverter(
 
         # make sure all items have the correct type
         itemspec = spec.itemSpec
+        if _isReplacedByConverter(itemspec):
+            # the converter needs to assign the converted item back into the array, so we need to
+            # iterate over indexes instead of values
+            idxvar = names.getNewName(var_or_prop, 'idx', False)
+            ts.rawline(
+                f'{indent}for (let {idxvar} = 0; {idxvar} < {var_or_prop}.length; {idxvar}++) {{')
+            itemexpr = f'{var_or_prop}[{idxvar}]'
+            _generateConverter(ts, itemexpr, itemspec, names, adv, indent + '  ')
+            ts.rawline(f'{indent}}}')
+            return
+
         itemvar = names.getNewName(var_or_prop, 'item', False)
         # TODO: if we actually need to *convert* a type, then we probably need to use
         #   for (let idx in var) { itemvar = var[idx]; ... }
@@ -276,6 +493,28 @@ def _generateConverter(
             _generateConverter(ts, propexpr, fieldspec, names, adv, indent)
         return
 
+    if isinstance(spec, TypedDictTypeSpec):
+        if not adv.hasTypedDict(spec.class_):
+            raise Exception(
+                f'Cannot generate a typescript type for unknown TypedDict {spec.class_.__name__}')
+
+        ts.rawline(f"{indent}// make sure {var_or_prop} is an object that has properties")
+        ts.rawline(f"{indent}if (!{var_or_prop}) {{")
+        msg = f'{var_or_prop} must be an object that satisfies {spec.class_.__name__} interface'
+        ts.rawline(f"{indent}  throw new TypeError('{msg}');")
+        ts.rawline(f"{indent}}}")
+        ts.rawline(f'{indent}// verify each member of {spec.class_.__name__}')
+        for name, fieldspec in spec.fieldSpecs.items():
+            propexpr = var_or_prop + '.' + name
+            if name in spec.requiredKeys:
+                _generateConverter(ts, propexpr, fieldspec, names, adv, indent)
+            else:
+                # optional keys only need verifying when they are present
+                ts.rawline(f'{indent}if ({propexpr} !== undefined) {{')
+                _generateConverter(ts, propexpr, fieldspec, names, adv, indent + '  ')
+                ts.rawline(f'{indent}}}')
+        return
+
     if isinstance(spec, UnionTypeSpec):
         # make a list of simple expressions that can be used to verify simple types quickly, and a
         # list of TypeSpecs for which simple expressions aren't possible
@@ -289,10 +528,9 @@ def _generateConverter(
             else:
                 simpleexprs.append(nomatchexpr)
 
-        joinedexpr = ' && '.join(simpleexprs)
-
         # if they were all simple, we can use a single negative-if to match invalid types
-        # TODO: this won't work if we have no simpleexprs
+        joinedexpr = ' && '.join(simpleexprs) or 'true'
+
         ts.rawline(f'{indent}if ({joinedexpr}) {{')
         # use a nested function for flow-control ... mostly so we can use 'return' statements
         # to break out of the function early if we find a matching type
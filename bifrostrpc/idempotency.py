@@ -0,0 +1,130 @@
+"""
+Idempotency keys, so that clients can safely retry calls which may or may not have succeeded.
+
+A client sends the same (random) Idempotency-Key header with every attempt of one logical call.
+The first attempt to succeed stores its encoded response under that key, and later attempts get
+the stored response back instead of calling the method again. Attempts which arrive while
+another attempt with the same key is still running wait for its response.
+
+Keys are scoped to the method and the caller (the method's auth values), and a key can't be
+reused with a different request body.
+
+NOTE: only concurrent attempts handled by the same process wait for each other - with a shared
+backend, attempts made to different workers at the same time may both call the method.
+"""
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from bifrostrpc.cachebackends import CacheBackend, MemoryBackend
+from bifrostrpc.singleflight import SingleFlight
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+# added to responses which were stored by an earlier attempt
+REPLAYED_HEADER = 'Idempotent-Replayed'
+# longer keys are rejected
+MAX_KEY_LENGTH = 255
+
+_NAMESPACE = 'idempotency'
+
+
+class IdempotencyKeyError(Exception):
+    """Raised when an Idempotency-Key is malformed, or is reused for a different request."""
+
+
+class IdempotencyPolicy:
+    """
+    How long the responses of calls with an Idempotency-Key are kept.
+
+    `backend` is where the responses are stored - e.g. an SQLiteBackend shared by all the server's
+    workers. It defaults to a per-process MemoryBackend holding at most `maxEntries` responses /
+    `maxBytes` bytes.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        *,
+        maxEntries: int = 10000,
+        maxBytes: int = None,
+        backend: CacheBackend = None,
+    ) -> None:
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.backend = backend
+
+
+@dataclass
+class IdempotencyStats:
+    # number of responses stored
+    stored: int = 0
+    # number of calls answered with a stored response
+    replayed: int = 0
+    # number of calls which waited for a concurrent call with the same key
+    waited: int = 0
+    # number of calls rejected for reusing a key with a different body
+    conflicts: int = 0
+
+
+class IdempotencyStore:
+    """The stored responses of calls which were sent with an Idempotency-Key."""
+
+    def __init__(self, policy: IdempotencyPolicy) -> None:
+        self.policy = policy
+        self.backend = policy.backend or MemoryBackend(
+            maxEntries=policy.maxEntries,
+            maxBytes=policy.maxBytes,
+        )
+        # concurrent attempts with the same key share a single execution of the method
+        self.flight = SingleFlight(_NAMESPACE)
+        self._lock = threading.Lock()
+        self._stats = IdempotencyStats()
+
+    def getKey(
+        self,
+        method: str,
+        key: str,
+        body: Dict[str, Any],
+        identity: str,
+    ) -> Tuple[str, str]:
+        """Get the storage key and the fingerprint of the request body for a call."""
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyKeyError(f'{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} chars')
+        scoped = json.dumps([method, key, identity], separators=(',', ':'))
+        fingerprint = json.dumps(body, sort_keys=True, separators=(',', ':'))
+        return _hash(scoped), _hash(fingerprint)
+
+    def get(self, key: str, fingerprint: str) -> Optional[bytes]:
+        """Return the response stored for key, or None if there isn't one (yet)."""
+        value = self.backend.get(_NAMESPACE, key)
+        if value is None:
+            return None
+        storedFingerprint, _, response = value.partition(b'\n')
+        if storedFingerprint.decode('ascii') != fingerprint:
+            with self._lock:
+                self._stats.conflicts += 1
+            raise IdempotencyKeyError(
+                f'{IDEMPOTENCY_HEADER} was already used for a different request'
+            )
+        with self._lock:
+            self._stats.replayed += 1
+        return response
+
+    def set(self, key: str, fingerprint: str, response: bytes) -> None:
+        value = fingerprint.encode('ascii') + b'\n' + response
+        self.backend.set(_NAMESPACE, key, value, ttl=self.policy.ttl, tag=key)
+        with self._lock:
+            self._stats.stored += 1
+
+    def getStats(self) -> IdempotencyStats:
+        with self._lock:
+            stats = IdempotencyStats(**self._stats.__dict__)
+        stats.waited = self.flight.getStats().coalesced
+        return stats
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
@@ -0,0 +1,275 @@
+import asyncio
+import functools
+import inspect
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Literal, Optional, Type
+
+# How long the value produced by a context type's factory is used for:
+# - 'call': the factory is called for every context var of every call
+# - 'request': the factory is called once per request and its value is shared by every context
+#   var of that type
+# - 'thread': one value per thread, created on first use by the thread which runs the method
+# - 'process': one value per process, created on first use (so forked server workers each get
+#   their own)
+# - 'pooled': values are borrowed from a bounded pool and returned once the method has returned
+Lifetime = Literal['call', 'request', 'thread', 'process', 'pooled']
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled value became available within the pool's checkout timeout."""
+
+
+class RequestScope:
+    """The context values and clean-up steps belonging to a single request."""
+
+    def __init__(self) -> None:
+        self.values: Dict[Type[Any], Any] = {}
+        self._cleanups: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def addCleanup(self, cleanup: Callable[[], None]) -> None:
+        with self._lock:
+            self._cleanups.append(cleanup)
+
+    def close(self) -> None:
+        """Run the clean-up steps in reverse order. Safe to call more than once."""
+        with self._lock:
+            cleanups, self._cleanups = self._cleanups, []
+        for cleanup in reversed(cleanups):
+            cleanup()
+
+
+@dataclass
+class ObjectPoolStats:
+    maxSize: int
+    timeout: float
+    # number of values created by the pool which haven't been discarded
+    size: int = 0
+    # number of values currently checked out
+    inUse: int = 0
+    checkouts: int = 0
+    # number of checkouts which had to wait for a value to be returned
+    waits: int = 0
+    # number of checkouts which gave up waiting
+    timeouts: int = 0
+    # total and longest time spent waiting (in seconds)
+    waitTime: float = 0.0
+    maxWaitTime: float = 0.0
+
+
+class ObjectPool:
+    """
+    A bounded pool of values created by `factory`.
+
+    At most `maxSize` values exist at once. When they are all checked out, acquire() waits up to
+    `timeout` seconds for one to be released before raising PoolTimeoutError.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        *,
+        maxSize: int,
+        timeout: float,
+    ) -> None:
+        if maxSize < 1:
+            raise Exception(f'maxSize must be 1 or more; got {maxSize!r}')
+        self.name = name
+        self.factory = factory
+        self._cond = threading.Condition()
+        self._idle: List[Any] = []
+        self._stats = ObjectPoolStats(maxSize=maxSize, timeout=timeout)
+
+    def acquire(self) -> Any:
+        stats = self._stats
+        started: Optional[float] = None
+        create = False
+        with self._cond:
+            while not self._idle and stats.size >= stats.maxSize:
+                now = time.monotonic()
+                if started is None:
+                    started = now
+                    stats.waits += 1
+                remaining = started + stats.timeout - now
+                if remaining <= 0:
+                    stats.timeouts += 1
+                    self._recordWait(now - started)
+                    raise PoolTimeoutError(f'Timed out waiting for a pooled {self.name}')
+                self._cond.wait(remaining)
+
+            if started is not None:
+                self._recordWait(time.monotonic() - started)
+            if self._idle:
+                value = self._idle.pop()
+            else:
+                stats.size += 1
+                create = True
+            stats.inUse += 1
+            stats.checkouts += 1
+
+        if create:
+            try:
+                value = self.factory()
+            except BaseException:
+                self._forget()
+                raise
+        return value
+
+    def _recordWait(self, waited: float) -> None:
+        self._stats.waitTime += waited
+        self._stats.maxWaitTime = max(self._stats.maxWaitTime, waited)
+
+    def _forget(self) -> None:
+        with self._cond:
+            self._stats.size -= 1
+            self._stats.inUse -= 1
+            self._cond.notify()
+
+    def release(self, value: Any) -> None:
+        with self._cond:
+            self._stats.inUse -= 1
+            self._idle.append(value)
+            self._cond.notify()
+
+    def getStats(self) -> ObjectPoolStats:
+        with self._cond:
+            return ObjectPoolStats(**self._stats.__dict__)
+
+
+class ContextProvider:
+    """Produces the value of a context type for a call, according to its Lifetime."""
+
+    # True if get() may block, in which case async servers call it in a worker thread
+    blocking = False
+    pool: Optional['ObjectPool'] = None
+
+    def __init__(self, newType: Type[Any], factory: Callable[[], Any]) -> None:
+        self.newType = newType
+        self.factory = factory
+
+    def get(self, scope: RequestScope) -> Any:
+        return self.factory()
+
+
+class _RequestProvider(ContextProvider):
+    def get(self, scope: RequestScope) -> Any:
+        try:
+            return scope.values[self.newType]
+        except KeyError:
+            pass
+
+        value = self.factory()
+        if inspect.isawaitable(value):
+            # share the pending result so the factory still only runs once
+            value = asyncio.ensure_future(value)
+        scope.values[self.newType] = value
+        return value
+
+
+class ThreadBound:
+    """
+    Stands in for a lifetime='thread' value until the method is called.
+
+    Methods may run on a different thread (e.g. an execution pool's worker) to the one which
+    handled the request, so the value is only looked up by resolveKwargs() on the thread which
+    actually calls the method.
+    """
+
+    def __init__(self, provider: '_ThreadProvider') -> None:
+        self.provider = provider
+
+    def get(self) -> Any:
+        return self.provider.getForThread()
+
+
+def resolveKwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace the ThreadBound values in a method's kwargs with the current thread's values."""
+    if not any(isinstance(value, ThreadBound) for value in kwargs.values()):
+        return kwargs
+    return {
+        name: value.get() if isinstance(value, ThreadBound) else value
+        for name, value in kwargs.items()
+    }
+
+
+class _ThreadProvider(ContextProvider):
+    def __init__(self, newType: Type[Any], factory: Callable[[], Any]) -> None:
+        super().__init__(newType, factory)
+        self._local = threading.local()
+        self._bound = ThreadBound(self)
+
+    def get(self, scope: RequestScope) -> Any:
+        return self._bound
+
+    def getForThread(self) -> Any:
+        try:
+            return self._local.value
+        except AttributeError:
+            value = self._local.value = self.factory()
+            return value
+
+
+class _ProcessProvider(ContextProvider):
+    def __init__(self, newType: Type[Any], factory: Callable[[], Any]) -> None:
+        super().__init__(newType, factory)
+        self._lock = threading.Lock()
+        # {pid: value}
+        self._values: Dict[int, Any] = {}
+
+    def get(self, scope: RequestScope) -> Any:
+        pid = os.getpid()
+        try:
+            return self._values[pid]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if pid not in self._values:
+                # a value created before the process was forked belongs to the parent
+                self._values.clear()
+                self._values[pid] = self.factory()
+            return self._values[pid]
+
+
+class _PooledProvider(ContextProvider):
+    blocking = True
+
+    def __init__(self, newType: Type[Any], factory: Callable[[], Any], pool: ObjectPool) -> None:
+        super().__init__(newType, factory)
+        self.pool = pool
+
+    def get(self, scope: RequestScope) -> Any:
+        value = self.pool.acquire()
+        scope.addCleanup(functools.partial(self.pool.release, value))
+        return value
+
+
+def makeProvider(
+    newType: Type[Any],
+    factory: Callable[[], Any],
+    lifetime: Lifetime,
+    *,
+    poolSize: int,
+    poolTimeout: float,
+) -> ContextProvider:
+    if lifetime in ('thread', 'process', 'pooled') and inspect.iscoroutinefunction(factory):
+        raise TypeError(
+            f"Factory for {newType.__name__} can't be async with lifetime={lifetime!r}"
+        )
+
+    if lifetime == 'call':
+        return ContextProvider(newType, factory)
+    if lifetime == 'request':
+        return _RequestProvider(newType, factory)
+    if lifetime == 'thread':
+        return _ThreadProvider(newType, factory)
+    if lifetime == 'process':
+        return _ProcessProvider(newType, factory)
+    if lifetime == 'pooled':
+        pool = ObjectPool(newType.__name__, factory, maxSize=poolSize, timeout=poolTimeout)
+        return _PooledProvider(newType, factory, pool)
+    raise Exception(f'Unexpected lifetime {lifetime!r}')
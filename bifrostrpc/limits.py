@@ -0,0 +1,214 @@
+"""
+Adaptive concurrency limiting, so that an overloaded server sheds load with fast 503 responses
+instead of queueing every request until latency is unbounded.
+"""
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from bifrostrpc.priority import Priority, PriorityQueue, QueueTimeStats
+
+
+class OverloadedError(Exception):
+    """Raised when a call is rejected by a ConcurrencyLimiter."""
+
+    def __init__(self, message: str, retryAfter: int) -> None:
+        super().__init__(message)
+        self.retryAfter = retryAfter
+
+
+class ConcurrencyLimitPolicy:
+    """
+    How many calls may run at once, and how long others may wait for their turn.
+
+    The limit starts at `initialLimit` and adapts (AIMD) to the latency of the calls: it grows by
+    about 1 for every `limit` calls which finish within `tolerance` times the baseline latency
+    (the lowest recently observed latency) and is multiplied by `backoff` whenever a call is
+    slower than that. It always stays between `minLimit` and `maxLimit`.
+
+    At most `maxQueue` calls wait for a free slot, for at most `queueTimeout` seconds. Calls
+    beyond that are rejected with a 503 response which asks the client to retry after
+    `retryAfter` seconds.
+
+    Waiting calls are admitted in order of priority, but a call is treated as one class higher
+    for every `agingInterval` seconds it has waited so that lower priority calls aren't starved.
+    """
+
+    def __init__(
+        self,
+        *,
+        initialLimit: int = 20,
+        minLimit: int = 1,
+        maxLimit: int = 200,
+        maxQueue: int = 50,
+        queueTimeout: float = 0.1,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+        retryAfter: int = 1,
+        agingInterval: float = 0.05,
+    ) -> None:
+        if not 1 <= minLimit <= initialLimit <= maxLimit:
+            raise Exception('Limits must satisfy 1 <= minLimit <= initialLimit <= maxLimit')
+        if not 0 < backoff < 1:
+            raise Exception(f'backoff must be between 0 and 1; got {backoff!r}')
+        self.initialLimit = initialLimit
+        self.minLimit = minLimit
+        self.maxLimit = maxLimit
+        self.maxQueue = maxQueue
+        self.queueTimeout = queueTimeout
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.retryAfter = retryAfter
+        self.agingInterval = agingInterval
+
+
+@dataclass
+class ConcurrencyLimiterStats:
+    limit: int
+    inFlight: int = 0
+    queued: int = 0
+    accepted: int = 0
+    # number of calls rejected because the queue was full or they waited too long
+    rejected: int = 0
+    # the latency (in seconds) below which the limit is allowed to grow
+    baselineLatency: float = 0.0
+    # time spent waiting for a slot, for each priority class
+    queueTimes: Dict[str, QueueTimeStats] = field(default_factory=dict)
+
+
+# how quickly the baseline latency drifts up towards the observed latency, so that one unusually
+# fast call doesn't set the baseline forever
+_BASELINE_DRIFT = 0.01
+
+
+class _Waiter:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event()
+        self.future: Optional['asyncio.Future[None]'] = (
+            loop.create_future() if loop is not None else None
+        )
+
+    def wake(self) -> None:
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._setResult)
+
+    def _setResult(self) -> None:
+        assert self.future is not None
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class ConcurrencyLimiter:
+    """
+    Limits the number of calls running at once according to a ConcurrencyLimitPolicy.
+
+    acquire() (or acquireAsync() on an event loop) returns the time the call was admitted, which
+    must be passed to release() once the call has finished.
+    """
+
+    def __init__(self, name: str, policy: ConcurrencyLimitPolicy) -> None:
+        self.name = name
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._limit = float(policy.initialLimit)
+        self._baseline: Optional[float] = None
+        self._inFlight = 0
+        self._waiters: PriorityQueue[_Waiter] = PriorityQueue(agingInterval=policy.agingInterval)
+        self._accepted = 0
+        self._rejected = 0
+
+    def _getLimit(self) -> int:
+        return max(self.policy.minLimit, int(self._limit))
+
+    def _reject(self, reason: str) -> OverloadedError:
+        self._rejected += 1
+        return OverloadedError(f'{self.name}: {reason}', self.policy.retryAfter)
+
+    def _enter(self, waiter: _Waiter, priority: Priority) -> bool:
+        """Returns True if the call was admitted straight away, or False if it must wait."""
+        with self._lock:
+            if not self._waiters and self._inFlight < self._getLimit():
+                self._inFlight += 1
+                self._accepted += 1
+                return True
+            if len(self._waiters) >= self.policy.maxQueue:
+                raise self._reject('queue is full')
+            self._waiters.push(waiter, priority)
+            return False
+
+    def _finishWait(self, waiter: _Waiter) -> None:
+        with self._lock:
+            if waiter.granted:
+                self._accepted += 1
+                return
+            self._waiters.remove(waiter)
+            raise self._reject(f'waited more than {self.policy.queueTimeout}s')
+
+    def acquire(self, priority: Priority = 'normal') -> float:
+        waiter = _Waiter(None)
+        if not self._enter(waiter, priority):
+            waiter.event.wait(self.policy.queueTimeout)
+            self._finishWait(waiter)
+        return time.monotonic()
+
+    async def acquireAsync(self, priority: Priority = 'normal') -> float:
+        waiter = _Waiter(asyncio.get_running_loop())
+        if not self._enter(waiter, priority):
+            assert waiter.future is not None
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.policy.queueTimeout)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                with self._lock:
+                    if not waiter.granted:
+                        self._waiters.remove(waiter)
+                        raise
+                # the slot was given to this call just as it was cancelled
+                self._release(None)
+                raise
+            self._finishWait(waiter)
+        return time.monotonic()
+
+    def release(self, started: float) -> None:
+        self._release(time.monotonic() - started)
+
+    def _release(self, latency: Optional[float]) -> None:
+        with self._lock:
+            self._inFlight -= 1
+            if latency is not None:
+                self._adapt(latency)
+            while self._waiters and self._inFlight < self._getLimit():
+                self._inFlight += 1
+                self._waiters.pop().wake()
+
+    def _adapt(self, latency: float) -> None:
+        policy = self.policy
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+        else:
+            self._baseline += (latency - self._baseline) * _BASELINE_DRIFT
+
+        if latency > self._baseline * policy.tolerance:
+            self._limit = max(float(policy.minLimit), self._limit * policy.backoff)
+        else:
+            self._limit = min(float(policy.maxLimit), self._limit + 1 / self._limit)
+
+    def getStats(self) -> ConcurrencyLimiterStats:
+        with self._lock:
+            return ConcurrencyLimiterStats(
+                limit=self._getLimit(),
+                inFlight=self._inFlight,
+                queued=len(self._waiters),
+                accepted=self._accepted,
+                rejected=self._rejected,
+                baselineLatency=self._baseline or 0.0,
+                queueTimes=self._waiters.getStats(),
+            )
@@ -0,0 +1,162 @@
+"""
+Batch handlers, which let concurrent calls of an rpcmethod be answered together.
+
+A batch handler receives a list of calls (each one being the kwargs the rpcmethod would have been
+called with) and returns a list with a result for each call, in the same order. A result may be
+an Exception instance, in which case only that call fails.
+"""
+import asyncio
+import inspect
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+BatchHandler = Callable[[List[Dict[str, Any]]], Any]
+
+
+@dataclass
+class BatchLoaderStats:
+    # number of times the batch handler was called
+    batches: int = 0
+    # number of calls answered by the batch handler
+    calls: int = 0
+    largestBatch: int = 0
+
+
+class _PendingBatch:
+    def __init__(self) -> None:
+        self.calls: List[Dict[str, Any]] = []
+        # set once the batch is full (so it shouldn't wait for the rest of the window)
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results: List[Any] = []
+        self.error: Optional[BaseException] = None
+
+
+@dataclass
+class _PendingAsyncBatch:
+    loop: asyncio.AbstractEventLoop
+    calls: List[Dict[str, Any]] = field(default_factory=list)
+    futures: List['asyncio.Future[Any]'] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+    task: Optional['asyncio.Future[None]'] = None
+
+
+class BatchLoader:
+    """
+    Collects concurrent calls of a method for up to `window` seconds (or until there are
+    `maxSize` of them) and then answers them all with a single call of `handler`.
+
+    Use load() from threads when the handler is a regular function, and loadAsync() from an
+    event loop when it's an `async def` function.
+    """
+
+    def __init__(
+        self,
+        method: str,
+        handler: BatchHandler,
+        *,
+        maxSize: int,
+        window: float,
+    ) -> None:
+        if maxSize < 1:
+            raise Exception(f'maxSize must be 1 or more; got {maxSize!r}')
+        if window < 0:
+            raise Exception(f'window must not be negative; got {window!r}')
+        self.method = method
+        self.handler = handler
+        self.maxSize = maxSize
+        self.window = window
+        self.isAsync = inspect.iscoroutinefunction(handler)
+        self._lock = threading.Lock()
+        self._pending: Optional[_PendingBatch] = None
+        self._pendingAsync: Optional[_PendingAsyncBatch] = None
+        self._stats = BatchLoaderStats()
+
+    def load(self, **kwargs: Any) -> Any:
+        with self._lock:
+            batch = self._pending
+            leader = batch is None
+            if batch is None:
+                batch = self._pending = _PendingBatch()
+            index = len(batch.calls)
+            batch.calls.append(kwargs)
+            if len(batch.calls) >= self.maxSize:
+                self._pending = None
+                batch.full.set()
+
+        if leader:
+            # the first call waits for the others and then runs the handler for all of them
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._pending is batch:
+                    self._pending = None
+            try:
+                batch.results = self._getResults(batch.calls, self.handler(batch.calls))
+            except BaseException as e:  # pylint: disable=broad-except
+                batch.error = e
+            batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return self._unwrap(batch.results[index])
+
+    async def loadAsync(self, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        batch = self._pendingAsync
+        if batch is None or batch.loop is not loop:
+            batch = self._pendingAsync = _PendingAsyncBatch(loop)
+            batch.timer = loop.call_later(self.window, self._dispatchAsync, batch)
+
+        future: 'asyncio.Future[Any]' = loop.create_future()
+        batch.calls.append(kwargs)
+        batch.futures.append(future)
+        if len(batch.calls) >= self.maxSize:
+            assert batch.timer is not None
+            batch.timer.cancel()
+            self._dispatchAsync(batch)
+        return self._unwrap(await future)
+
+    def _dispatchAsync(self, batch: _PendingAsyncBatch) -> None:
+        if self._pendingAsync is batch:
+            self._pendingAsync = None
+        # NOTE: the batch keeps running even if some of its callers are cancelled
+        batch.task = asyncio.ensure_future(self._runAsync(batch))
+
+    async def _runAsync(self, batch: _PendingAsyncBatch) -> None:
+        try:
+            results = self._getResults(batch.calls, await self.handler(batch.calls))
+        except Exception as e:  # pylint: disable=broad-except
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _getResults(self, calls: List[Dict[str, Any]], results: Any) -> List[Any]:
+        results = list(results)
+        if len(results) != len(calls):
+            raise Exception(
+                f'{self.method}(): batch handler returned {len(results)} results'
+                f' for {len(calls)} calls'
+            )
+        with self._lock:
+            self._stats.batches += 1
+            self._stats.calls += len(calls)
+            self._stats.largestBatch = max(self._stats.largestBatch, len(calls))
+        return results
+
+    @staticmethod
+    def _unwrap(result: Any) -> Any:
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def getStats(self) -> BatchLoaderStats:
+        with self._lock:
+            return BatchLoaderStats(**self._stats.__dict__)
@@ -0,0 +1,116 @@
+"""
+Priority classes for calls waiting in a queue (for an execution pool's workers, or for a
+concurrency limiter to admit them).
+"""
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import (Callable, Deque, Dict, Generic, Literal, Optional,
+                    Tuple, TypeVar)
+
+# - 'high': e.g. interactive calls a user is waiting on
+# - 'normal': the default
+# - 'low': e.g. background syncing
+Priority = Literal['high', 'normal', 'low']
+PRIORITIES: Tuple[Priority, ...] = ('high', 'normal', 'low')
+
+# callers can use this header to lower the priority of a call (but never to raise it above the
+# method's own priority)
+PRIORITY_HEADER = 'X-Bifrost-Priority'
+
+T = TypeVar('T')
+
+
+def getPriority(methodPriority: Priority, requested: Optional[str]) -> Priority:
+    """Get the priority of a call from its method's priority and the caller's header."""
+    if requested is None:
+        return methodPriority
+    requested = requested.strip().lower()
+    if requested not in PRIORITIES:
+        return methodPriority
+    return PRIORITIES[max(PRIORITIES.index(methodPriority), PRIORITIES.index(requested))]
+
+
+@dataclass
+class QueueTimeStats:
+    # number of calls currently waiting
+    queued: int = 0
+    # number of calls which have left the queue, and the total and longest time they waited
+    dequeued: int = 0
+    totalWait: float = 0.0
+    maxWait: float = 0.0
+
+
+class PriorityQueue(Generic[T]):
+    """
+    A queue which serves higher priority items first.
+
+    To stop lower priority items from starving, an item is treated as one class higher for
+    every `agingInterval` seconds it has waited. Items of the same (effective) priority are
+    served in the order they were added.
+
+    NOTE: this isn't thread-safe - its owner is expected to hold a lock while using it.
+    """
+
+    def __init__(
+        self,
+        *,
+        agingInterval: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if agingInterval <= 0:
+            raise Exception(f'agingInterval must be greater than 0; got {agingInterval!r}')
+        self.agingInterval = agingInterval
+        self._clock = clock
+        # one FIFO queue of (enqueue time, item) for each priority class
+        self._queues: Dict[Priority, Deque[Tuple[float, T]]] = {p: deque() for p in PRIORITIES}
+        self._stats: Dict[Priority, QueueTimeStats] = {p: QueueTimeStats() for p in PRIORITIES}
+
+    def push(self, item: T, priority: Priority) -> None:
+        self._queues[priority].append((self._clock(), item))
+        self._stats[priority].queued += 1
+
+    def pop(self) -> T:
+        """Remove and return the next item to serve. Raises IndexError if the queue is empty."""
+        now = self._clock()
+        best: Optional[Tuple[float, float, Priority]] = None
+        for rank, priority in enumerate(PRIORITIES):
+            queue = self._queues[priority]
+            if not queue:
+                continue
+            # only the oldest item of each class can be the next one served
+            enqueued = queue[0][0]
+            effective = rank - (now - enqueued) // self.agingInterval
+            if best is None or (effective, enqueued) < best[:2]:
+                best = (effective, enqueued, priority)
+        if best is None:
+            raise IndexError('pop from an empty PriorityQueue')
+
+        priority = best[2]
+        enqueued, item = self._queues[priority].popleft()
+        self._recordWait(priority, now - enqueued)
+        return item
+
+    def remove(self, item: T) -> bool:
+        """Remove an item which gave up waiting. Returns False if it wasn't in the queue."""
+        now = self._clock()
+        for priority, queue in self._queues.items():
+            for entry in queue:
+                if entry[1] is item:
+                    queue.remove(entry)
+                    self._recordWait(priority, now - entry[0])
+                    return True
+        return False
+
+    def _recordWait(self, priority: Priority, waited: float) -> None:
+        stats = self._stats[priority]
+        stats.queued -= 1
+        stats.dequeued += 1
+        stats.totalWait += waited
+        stats.maxWait = max(stats.maxWait, waited)
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def getStats(self) -> Dict[str, QueueTimeStats]:
+        return {p: QueueTimeStats(**stats.__dict__) for p, stats in self._stats.items()}
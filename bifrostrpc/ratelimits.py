@@ -0,0 +1,216 @@
+"""
+Per-identity rate limits using token buckets.
+
+Each caller (identified by the values of the method's auth args) gets a bucket which holds up to
+`burst` tokens and is refilled at a steady rate. Every call takes a token, and calls which find the
+bucket empty are rejected with a 429 response before the request body is read.
+"""
+import abc
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional, Tuple, Union
+
+
+class RateLimitedError(Exception):
+    """Raised when a call is rejected by a RateLimiter."""
+
+    def __init__(self, message: str, retryAfter: float) -> None:
+        super().__init__(message)
+        # seconds until the caller's bucket will have a token again
+        self.retryAfter = retryAfter
+
+
+class RateLimitPolicy:
+    """
+    Allows each caller `calls` calls every `period` seconds, with bursts of up to `burst` calls
+    (by default the same as `calls`).
+    """
+
+    def __init__(self, *, calls: int, period: float = 1.0, burst: int = None) -> None:
+        if calls < 1:
+            raise Exception(f'calls must be 1 or more; got {calls!r}')
+        if period <= 0:
+            raise Exception(f'period must be greater than 0; got {period!r}')
+        if burst is not None and burst < 1:
+            raise Exception(f'burst must be 1 or more; got {burst!r}')
+        self.calls = calls
+        self.period = period
+        self.burst = calls if burst is None else burst
+
+    @property
+    def rate(self) -> float:
+        """The number of tokens added to each bucket per second."""
+        return self.calls / self.period
+
+
+class RateLimitBackend(abc.ABC):
+    """Where the token buckets are kept."""
+
+    # True if take() may block (e.g. on I/O), in which case async servers call it in a worker
+    # thread
+    blocking = True
+
+    @abc.abstractmethod
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """Take a token from the bucket for `key` (creating a full bucket if there isn't one).
+
+        Returns 0 if a token was taken, or else the number of seconds until one will be available.
+        """
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, burst: int) -> float:
+    return min(float(burst), tokens + max(now - updated, 0.0) * rate)
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    Keeps the buckets in memory - each process has its own buckets.
+
+    At most `maxBuckets` buckets are kept; the least recently used ones are dropped beyond that,
+    which is the same as letting them refill.
+    """
+
+    blocking = False
+
+    def __init__(
+        self,
+        *,
+        maxBuckets: int = 100000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.maxBuckets = maxBuckets
+        self._clock = clock
+        self._lock = threading.Lock()
+        # {key: (tokens, updated)}
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        with self._lock:
+            now = self._clock()
+            bucket = self._buckets.pop(key, None)
+            tokens = float(burst) if bucket is None else _refill(*bucket, now, rate, burst)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxBuckets:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """
+    Keeps the buckets in an SQLite database, so that all the server workers on a host can share
+    them.
+
+    Buckets which have refilled are removed once every `cleanupEvery` calls.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        *,
+        cleanupEvery: int = 1000,
+        timeout: float = 5.0,
+    ) -> None:
+        self.path = str(path)
+        self.cleanupEvery = cleanupEvery
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def _getConnection(self) -> sqlite3.Connection:
+        # each thread gets its own connection, and connections aren't carried over into forked
+        # processes
+        conn: Optional[sqlite3.Connection] = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS bifrost_ratelimit ('
+            ' key TEXT PRIMARY KEY,'
+            ' tokens REAL NOT NULL,'
+            ' updated REAL NOT NULL,'
+            # when the bucket will be full again, after which it can be removed
+            ' full REAL NOT NULL'
+            ')'
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        conn = self._getConnection()
+        # the bucket must be read and updated by one process at a time
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute(
+                'SELECT tokens, updated FROM bifrost_ratelimit WHERE key = ?',
+                (key, ),
+            ).fetchone()
+            tokens = float(burst) if row is None else _refill(row[0], row[1], now, rate, burst)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute(
+                'INSERT OR REPLACE INTO bifrost_ratelimit (key, tokens, updated, full)'
+                ' VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + (burst - tokens) / rate),
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        with self._lock:
+            self._calls += 1
+            cleanup = self._calls % self.cleanupEvery == 0
+        if cleanup:
+            conn.execute('DELETE FROM bifrost_ratelimit WHERE full <= ?', (time.time(), ))
+        return wait
+
+
+@dataclass
+class RateLimiterStats:
+    allowed: int = 0
+    limited: int = 0
+
+
+class RateLimiter:
+    """Applies a RateLimitPolicy to the calls of one method (or of a whole service)."""
+
+    def __init__(self, name: str, policy: RateLimitPolicy, backend: RateLimitBackend) -> None:
+        self.name = name
+        self.policy = policy
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._stats = RateLimiterStats()
+
+    def take(self, identity: str) -> None:
+        """Take a token from the caller's bucket, or raise RateLimitedError."""
+        policy = self.policy
+        wait = self.backend.take(f'{self.name}:{identity}', policy.rate, policy.burst)
+        with self._lock:
+            if not wait:
+                self._stats.allowed += 1
+                return
+            self._stats.limited += 1
+        raise RateLimitedError(f'{self.name}: rate limit exceeded', wait)
+
+    def getStats(self) -> RateLimiterStats:
+        with self._lock:
+            return RateLimiterStats(**self._stats.__dict__)
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, NamedTuple, Optional, Union
+
+from bifrostrpc.cachebackends import CacheBackend, CacheStats, MemoryBackend
+
+
+class ResultCachePolicy:
+    """
+    How an rpcmethod's responses are cached.
+
+    Responses are kept for `ttl` seconds. With perIdentity=True, each caller gets their own cache
+    entries - the caller is identified by the method's auth values (see addAuthType(identity=...)).
+
+    `backend` is where the responses are stored - e.g. an SQLiteBackend shared by all the server's
+    workers. It defaults to the service's cache_backend, or else a per-process MemoryBackend
+    holding at most `maxEntries` responses / `maxBytes` bytes for this method.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        *,
+        maxEntries: int = 1000,
+        maxBytes: int = None,
+        perIdentity: bool = False,
+        backend: CacheBackend = None,
+    ) -> None:
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.perIdentity = perIdentity
+        self.backend = backend
+
+
+# an rpcmethod's cache= arg can be a ResultCachePolicy or just the ttl in seconds
+ResultCacheArg = Union[float, ResultCachePolicy]
+
+
+def getResultCachePolicy(arg: ResultCacheArg) -> ResultCachePolicy:
+    if isinstance(arg, ResultCachePolicy):
+        return arg
+    return ResultCachePolicy(arg)
+
+
+@dataclass
+class ResultCacheStats:
+    hits: int = 0
+    misses: int = 0
+    # stats for the whole backend, which may be shared with other methods
+    backend: CacheStats = field(default_factory=CacheStats)
+
+
+class ResultCacheKey(NamedTuple):
+    key: str
+    # all the entries for the same args have the same tag
+    tag: str
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def _canonicalize(args: Dict[str, Any]) -> str:
+    return json.dumps(args, sort_keys=True, separators=(',', ':'))
+
+
+class ResultCache:
+    """The encoded responses of a single rpcmethod, keyed by the args they were called with."""
+
+    def __init__(
+        self,
+        method: str,
+        policy: ResultCachePolicy,
+        defaultBackend: Optional[CacheBackend],
+    ) -> None:
+        self.method = method
+        self.policy = policy
+        self.backend = policy.backend or defaultBackend or MemoryBackend(
+            maxEntries=policy.maxEntries,
+            maxBytes=policy.maxBytes,
+        )
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def getKey(self, body: Dict[str, Any], identity: str) -> ResultCacheKey:
+        """Get the cache key for a call from its (validated) JSON body and the caller's identity
+        (which is '' unless the policy is perIdentity).
+        """
+        args = _canonicalize({k: v for k, v in body.items() if not k.startswith('__')})
+        options = _canonicalize({k: v for k, v in body.items() if k.startswith('__')})
+        return ResultCacheKey(_hash(json.dumps([args, options, identity])), _hash(args))
+
+    def get(self, key: ResultCacheKey) -> Optional[bytes]:
+        value = self.backend.get(self.method, key.key)
+        with self._lock:
+            if value is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return value
+
+    def set(self, key: ResultCacheKey, body: bytes) -> None:
+        self.backend.set(self.method, key.key, body, ttl=self.policy.ttl, tag=key.tag)
+
+    def invalidate(self, args: Dict[str, Any] = None) -> None:
+        tag = None if args is None else _hash(_canonicalize(args))
+        self.backend.invalidate(self.method, tag)
+
+    def getStats(self) -> ResultCacheStats:
+        with self._lock:
+            hits, misses = self._hits, self._misses
+        return ResultCacheStats(hits=hits, misses=misses, backend=self.backend.getStats())
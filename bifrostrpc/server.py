@@ -0,0 +1,445 @@
+"""
+A pre-forking multi-process HTTP server for a BifrostRPCService.
+
+The master process builds everything it can up front, then forks worker processes which each
+accept connections on the same port and serve requests with a pool of threads. The master restarts
+workers which die and handles these signals:
+
+- SIGHUP: graceful reload - a new set of workers is started before the old ones are told to finish
+  their in-flight requests and exit, so no requests are refused during the reload.
+- SIGTERM/SIGINT: graceful shutdown.
+
+NOTE: a SIGHUP reload forks new workers from the master, so it won't pick up code changes. To
+deploy new code without downtime, start a new server on the same port (possible because of
+SO_REUSEPORT) and then send SIGTERM to the old one.
+"""
+import gc
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from bifrostrpc.wsgi import WSGIApp
+
+log = logging.getLogger()
+
+CAN_REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+
+# a worker which dies sooner than this after it was started is considered to have crashed during
+# startup, and is restarted after a delay which doubles with each consecutive crash
+HEALTHY_UPTIME = 5.0
+RESPAWN_DELAY_MIN = 0.1
+RESPAWN_DELAY_MAX = 30.0
+
+# the longest chunk-size or trailer line accepted in a chunked request body
+MAX_CHUNK_LINE = 1024
+
+
+def serve(
+    app: WSGIApp,
+    *,
+    host: str,
+    port: int,
+    workers: int,
+    keepaliveTimeout: float,
+    gracefulTimeout: float,
+) -> None:
+    # move everything allocated so far into the permanent generation, so that the garbage
+    # collector doesn't touch (and therefore copy) those pages in the forked workers
+    gc.collect()
+    gc.freeze()
+
+    master = _Master(app, host, port, workers, keepaliveTimeout, gracefulTimeout)
+    master.run()
+
+
+def _bindSocket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if CAN_REUSE_PORT:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(socket.SOMAXCONN)
+    return sock
+
+
+class _Master:
+    def __init__(
+        self,
+        app: WSGIApp,
+        host: str,
+        port: int,
+        workers: int,
+        keepaliveTimeout: float,
+        gracefulTimeout: float,
+    ) -> None:
+        if workers < 1:
+            raise Exception(f'workers must be 1 or more; got {workers!r}')
+        self.app = app
+        self.host = host
+        self.port = port
+        self.numWorkers = workers
+        self.keepaliveTimeout = keepaliveTimeout
+        self.gracefulTimeout = gracefulTimeout
+        # {pid: generation}
+        self.workers: Dict[int, int] = {}
+        # {pid: time it was started}
+        self.started: Dict[int, float] = {}
+        self.generation = 0
+        # times at which workers which died unexpectedly are due to be replaced
+        self.respawns: List[float] = []
+        self.respawnDelay = 0.0
+        # {pid: time by which it must have exited} for workers which have been told to stop
+        self.stopping: Dict[int, float] = {}
+        self.reloadRequested = False
+        self.stopRequested = False
+        # without SO_REUSEPORT the master binds the socket once and the workers inherit it. With
+        # SO_REUSEPORT each worker binds its own socket and the kernel balances connections
+        # between them.
+        self.sharedSocket: Optional[socket.socket] = None
+
+    def run(self) -> None:
+        if not CAN_REUSE_PORT:
+            self.sharedSocket = _bindSocket(self.host, self.port)
+
+        signal.signal(signal.SIGHUP, self._onReload)
+        signal.signal(signal.SIGTERM, self._onStop)
+        signal.signal(signal.SIGINT, self._onStop)
+
+        log.info(f'BifrostRPC master {os.getpid()} starting {self.numWorkers} workers')
+        self._spawnGeneration()
+        try:
+            while self.workers or self.respawns:
+                self._reap()
+                if self.stopRequested:
+                    self.stopRequested = False
+                    # a reload which hasn't happened yet would start workers that are never stopped
+                    self.reloadRequested = False
+                    self._stopWorkers(list(self.workers))
+                    # don't respawn anything from now on
+                    self.generation = -1
+                    self.respawns.clear()
+                elif self.reloadRequested:
+                    self.reloadRequested = False
+                    old = list(self.workers)
+                    # the new generation replaces any workers which were waiting to be restarted
+                    self.respawns.clear()
+                    self._spawnGeneration()
+                    self._stopWorkers(old)
+                self._respawnDue()
+                self._killOverdue()
+                time.sleep(0.1)
+        finally:
+            if self.sharedSocket is not None:
+                self.sharedSocket.close()
+
+    def _onReload(self, signum: int, frame: Any) -> None:
+        self.reloadRequested = True
+
+    def _onStop(self, signum: int, frame: Any) -> None:
+        self.stopRequested = True
+
+    def _spawnGeneration(self) -> None:
+        self.generation += 1
+        for _ in range(self.numWorkers):
+            self._spawnWorker()
+
+    def _spawnWorker(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                worker = _Worker(self.app, self.keepaliveTimeout)
+                worker.run(self.sharedSocket or _bindSocket(self.host, self.port))
+                code = 0
+            except BaseException:  # pylint: disable=broad-except
+                log.exception(f'BifrostRPC worker {os.getpid()} crashed')
+            finally:
+                # never return into the master's code
+                os._exit(code)  # pylint: disable=protected-access
+        self.workers[pid] = self.generation
+        self.started[pid] = time.monotonic()
+
+    def _stopWorkers(self, pids: List[int]) -> None:
+        deadline = time.monotonic() + self.gracefulTimeout
+        for pid in pids:
+            if pid in self.workers and pid not in self.stopping:
+                self.stopping[pid] = deadline
+                _signal(pid, signal.SIGTERM)
+
+    def _killOverdue(self) -> None:
+        now = time.monotonic()
+        for pid, deadline in list(self.stopping.items()):
+            if now > deadline:
+                log.warning(f'BifrostRPC worker {pid} did not stop in time and will be killed')
+                _signal(pid, signal.SIGKILL)
+                # don't try to kill it again
+                self.stopping[pid] = float('inf')
+
+    def _reap(self) -> None:
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                return
+            if pid == 0:
+                return
+
+            generation = self.workers.pop(pid, None)
+            started = self.started.pop(pid, None)
+            expected = self.stopping.pop(pid, None) is not None
+            if generation == self.generation and not expected:
+                uptime = time.monotonic() - started if started is not None else 0.0
+                delay = self._scheduleRespawn(uptime)
+                log.error(
+                    f'BifrostRPC worker {pid} exited unexpectedly ({status})'
+                    f'; restarting in {delay:.1f}s'
+                )
+
+    def _scheduleRespawn(self, uptime: float) -> float:
+        """Schedules a replacement for a worker which died after `uptime` seconds, and returns how
+        long it will be before the replacement is started.
+        """
+        if uptime < HEALTHY_UPTIME:
+            # don't refork as fast as possible while workers keep dying at startup
+            delay = max(self.respawnDelay * 2, RESPAWN_DELAY_MIN)
+            self.respawnDelay = min(delay, RESPAWN_DELAY_MAX)
+        else:
+            self.respawnDelay = 0.0
+        self.respawns.append(time.monotonic() + self.respawnDelay)
+        return self.respawnDelay
+
+    def _respawnDue(self) -> None:
+        now = time.monotonic()
+        due = [at for at in self.respawns if at <= now]
+        if due:
+            self.respawns = [at for at in self.respawns if at > now]
+            for _ in due:
+                self._spawnWorker()
+
+
+def _signal(pid: int, signum: int) -> None:
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+class _Worker:
+    def __init__(self, app: WSGIApp, keepaliveTimeout: float) -> None:
+        self.app = app
+        self.keepaliveTimeout = keepaliveTimeout
+
+    def run(self, sock: socket.socket) -> None:
+        handlerClass = type('_BoundHandler', (_Handler, ), {
+            'app': staticmethod(self.app),
+            # idle keep-alive connections are closed after this many seconds
+            'timeout': self.keepaliveTimeout,
+        })
+        server = ThreadingHTTPServer(sock.getsockname()[:2], handlerClass, bind_and_activate=False)
+        server.socket.close()
+        server.socket = sock
+        # wait for in-flight requests to finish when the server is closed
+        server.daemon_threads = False
+        server.block_on_close = True
+
+        def _onStop(signum: int, frame: Any) -> None:
+            # NOTE: shutdown() blocks until serve_forever() returns, so it can't be called
+            # directly from the signal handler running in the same thread
+            threading.Thread(target=server.shutdown).start()
+
+        # reloads are coordinated by the master, which replaces this worker by sending it SIGTERM
+        # - a SIGHUP sent to the whole process group mustn't kill it in the middle of a request
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, _onStop)
+        signal.signal(signal.SIGINT, _onStop)
+
+        server.serve_forever()
+        if CAN_REUSE_PORT:
+            # connections which are already queued on this worker's own socket would be reset
+            # when it's closed, so accept and handle those first
+            while select.select([sock], [], [], 0)[0]:
+                server._handle_request_noblock()  # pylint: disable=protected-access
+        server.server_close()
+
+
+class _BodyReader:
+    """Wraps a connection's input so a WSGI app can't read past the end of the request body."""
+
+    def __init__(self, rfile: Any, length: int, onFirstRead: Optional[Callable[[], None]]) -> None:
+        self.rfile = rfile
+        self.remaining = length
+        self.onFirstRead = onFirstRead
+
+    @property
+    def exhausted(self) -> bool:
+        return not self.remaining
+
+    def read(self, size: int = -1) -> bytes:
+        if self.onFirstRead is not None:
+            onFirstRead, self.onFirstRead = self.onFirstRead, None
+            onFirstRead()
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data: bytes = self.rfile.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+
+class _ChunkedBodyReader(_BodyReader):
+    """Decodes a request body sent with "Transfer-Encoding: chunked"."""
+
+    def __init__(self, rfile: Any, onFirstRead: Optional[Callable[[], None]]) -> None:
+        super().__init__(rfile, 0, onFirstRead)
+        # set once the last chunk and the trailers have been read
+        self.done = False
+
+    @property
+    def exhausted(self) -> bool:
+        return self.done
+
+    def read(self, size: int = -1) -> bytes:
+        if self.onFirstRead is not None:
+            onFirstRead, self.onFirstRead = self.onFirstRead, None
+            onFirstRead()
+        parts: List[bytes] = []
+        wanted = size
+        while wanted and not self.done:
+            if not self.remaining:
+                self._startChunk()
+                continue
+            data: bytes = self.rfile.read(
+                self.remaining if wanted < 0 else min(wanted, self.remaining))
+            if not data:
+                raise Exception('Connection closed during chunked request body')
+            parts.append(data)
+            self.remaining -= len(data)
+            if wanted > 0:
+                wanted -= len(data)
+            if not self.remaining and self._readLine() != b'':
+                raise Exception('Invalid chunked request body')
+        return b''.join(parts)
+
+    def _startChunk(self) -> None:
+        line = self._readLine()
+        try:
+            self.remaining = int(line.split(b';', 1)[0], 16)
+        except ValueError:
+            raise Exception('Invalid chunked request body') from None
+        if self.remaining < 0:
+            raise Exception('Invalid chunked request body')
+        if self.remaining == 0:
+            # skip over any trailers up to the blank line which ends the body
+            while self._readLine():
+                pass
+            self.done = True
+
+    def _readLine(self) -> bytes:
+        line: bytes = self.rfile.readline(MAX_CHUNK_LINE + 1)
+        if len(line) > MAX_CHUNK_LINE or not line.endswith(b'\n'):
+            raise Exception('Invalid chunked request body')
+        return line.strip()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 gives us keep-alive connections
+    protocol_version = 'HTTP/1.1'
+    app: WSGIApp
+    # set when the current request has "Expect: 100-continue"
+    expectingContinue = False
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        self._handle()
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        self._handle()
+
+    def _handle(self) -> None:
+        path, _, query = self.path.partition('?')
+        expectingContinue, self.expectingContinue = self.expectingContinue, False
+        onFirstRead = self._sendContinue if expectingContinue else None
+        body: _BodyReader
+        contentLength = ''
+        encoding = self.headers.get('Transfer-Encoding')
+        if encoding is not None:
+            # NOTE: when both are sent, Transfer-Encoding overrides Content-Length
+            if encoding.strip().lower() != 'chunked':
+                self.close_connection = True
+                self.send_error(501, 'Unsupported Transfer-Encoding')
+                return
+            body = _ChunkedBodyReader(self.rfile, onFirstRead)
+        else:
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                self.close_connection = True
+                self.send_error(400, 'Invalid Content-Length')
+                return
+            body = _BodyReader(self.rfile, length, onFirstRead)
+            contentLength = str(length)
+
+        environ: Dict[str, Any] = {
+            'REQUEST_METHOD': self.command,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path),
+            'QUERY_STRING': query,
+            'CONTENT_TYPE': self.headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': contentLength,
+            'SERVER_NAME': self.server.server_address[0],
+            'SERVER_PORT': str(self.server.server_address[1]),
+            'SERVER_PROTOCOL': self.request_version,
+            'REMOTE_ADDR': self.client_address[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            # a chunked body (which has no CONTENT_LENGTH) can be read until EOF
+            'wsgi.input_terminated': True,
+        }
+        for name, value in self.headers.items():
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            if key not in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+                environ[key] = value
+
+        started: List[Tuple[str, List[Tuple[str, str]]]] = []
+
+        def start_response(status: str, headers: List[Tuple[str, str]]) -> None:
+            started.append((status, headers))
+
+        chunks = self.app(environ, start_response)
+        status, headers = started[0]
+        code, _, reason = status.partition(' ')
+        self.send_response(int(code), reason)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(chunk)
+
+        # the connection can only be reused if the whole request body was consumed
+        if not body.exhausted:
+            self.close_connection = True
+
+    def handle_expect_100(self) -> bool:
+        # don't tell the client to send the body yet - it's only wanted once the request has got
+        # past the checks which happen before the body is read (method name, auth, size)
+        self.expectingContinue = True
+        return True
+
+    def _sendContinue(self) -> None:
+        self.wfile.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        self.wfile.flush()
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        log.debug(format % args)
@@ -0,0 +1,129 @@
+import asyncio
+import concurrent.futures
+import json
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Tuple, Union
+
+from bifrostrpc.deadlines import DeadlineExceededError
+from bifrostrpc.execution import PoolFullError
+from bifrostrpc.lifetimes import PoolTimeoutError
+from bifrostrpc.limits import OverloadedError
+
+# failures which belong to the call that happened to be the leader (e.g. its own deadline passed
+# while it was waiting for an execution pool) rather than to the method, so they aren't shared
+CALLER_ERRORS = (
+    DeadlineExceededError,
+    OverloadedError,
+    PoolFullError,
+    PoolTimeoutError,
+    asyncio.CancelledError,
+    concurrent.futures.CancelledError,
+)
+
+
+class FlightAbandoned(Exception):
+    """Given to the calls waiting for a leader which failed with one of CALLER_ERRORS."""
+
+
+@dataclass
+class SingleFlightStats:
+    # number of calls which executed the method
+    executions: int = 0
+    # number of calls which waited for another identical call and shared its response
+    coalesced: int = 0
+    # number of executions currently in progress
+    inFlight: int = 0
+    # number of executions which failed with one of CALLER_ERRORS, so weren't shared with the
+    # calls waiting for them
+    abandoned: int = 0
+
+
+class SingleFlight:
+    """
+    Lets concurrent identical calls of a method share a single execution.
+
+    The first call with a given key (the leader) executes the method; calls with the same key
+    which arrive before it has finished wait for its result instead. Results aren't kept once
+    the leader has finished - that's what rpcmethod(cache=...) is for. If the leader fails for a
+    reason of its own (see CALLER_ERRORS), the waiting calls start a new flight instead.
+
+    Waiting works from threads (Future.result()) as well as from asyncio (asyncio.wrap_future()).
+    """
+
+    def __init__(self, method: str) -> None:
+        self.method = method
+        self._lock = threading.Lock()
+        self._flights: Dict[str, 'concurrent.futures.Future[Any]'] = {}
+        self._stats = SingleFlightStats()
+
+    def getKey(self, body: Dict[str, Any], identity: str) -> str:
+        """Calls are only identical if they have the same (validated) JSON body and caller."""
+        return json.dumps([body, identity], sort_keys=True, separators=(',', ':'))
+
+    def join(self, key: str) -> Tuple['concurrent.futures.Future[Any]', bool]:
+        """Returns the future for key's result, and True if the caller is the leader.
+
+        The leader must pass the result to finish() (or finishFrom()) once it has it.
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self._stats.coalesced += 1
+                return future, False
+            future = self._flights[key] = concurrent.futures.Future()
+            self._stats.executions += 1
+            self._stats.inFlight += 1
+            return future, True
+
+    def finish(self, key: str, result: Any = None, exception: BaseException = None) -> None:
+        with self._lock:
+            future = self._flights.pop(key)
+            self._stats.inFlight -= 1
+            if isinstance(exception, CALLER_ERRORS):
+                exception = FlightAbandoned(f'Leading call of {self.method} failed: {exception}')
+                self._stats.abandoned += 1
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def finishFrom(
+        self,
+        key: str,
+        source: Union['asyncio.Future[Any]', 'concurrent.futures.Future[Any]'],
+    ) -> None:
+        """Finish key's flight with the outcome of another (asyncio or concurrent) future."""
+        def _onDone(done: Any) -> None:
+            if done.cancelled():
+                self.finish(key, exception=concurrent.futures.CancelledError())
+            elif done.exception() is not None:
+                self.finish(key, exception=done.exception())
+            else:
+                self.finish(key, done.result())
+
+        source.add_done_callback(_onDone)
+
+    def run(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Return fn()'s result, or wait for the result of an identical call already running."""
+        while True:
+            future, leader = self.join(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except FlightAbandoned:
+                # one of the waiting calls runs the method instead
+                continue
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, exception=e)
+            raise
+        self.finish(key, result)
+        return result
+
+    def getStats(self) -> SingleFlightStats:
+        with self._lock:
+            return SingleFlightStats(**self._stats.__dict__)
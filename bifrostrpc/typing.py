@@ -1,10 +1,13 @@
 import abc
 import dataclasses
+import enum
 import sys
+import weakref
 from dataclasses import is_dataclass
-from typing import (TYPE_CHECKING, Any, Callable, Dict, Iterable, List,
-                    Literal, NewType, Set, Tuple, Type, Union, cast,
-                    get_type_hints)
+from datetime import date, datetime, timedelta, timezone
+from typing import (TYPE_CHECKING, Any, Callable, Dict, FrozenSet, Iterable,
+                    List, Literal, NewType, Optional, Set, Tuple, Type, Union,
+                    cast, get_type_hints)
 
 from paradox.typing import (CrossBool, CrossCustomType, CrossDict, CrossList,
                             CrossLiteral, CrossNull, CrossNum, CrossStr,
@@ -17,6 +20,24 @@ if TYPE_CHECKING:
 ErrHandler = Callable[[str], None]
 ScalarTypes = Union[Type[str], Type[int], Type[bool]]
 
+# How an Enum is sent over the wire:
+# - 'name': the member's name as a string, e.g. "RED"
+# - 'int': the member's (integer) value, e.g. 1
+EnumEncoding = Literal['name', 'int']
+
+# How datetime/date/timedelta values are sent over the wire:
+# - 'iso': ISO-8601 strings for datetime/date, integer milliseconds for timedelta
+# - 'epoch_ms': integer milliseconds since 1970-01-01T00:00:00Z (or duration in milliseconds)
+# - 'epoch_us': integer microseconds since 1970-01-01T00:00:00Z (or duration in microseconds)
+TemporalEncoding = Literal['iso', 'epoch_ms', 'epoch_us']
+TemporalTypes = Union[Type[datetime], Type[date], Type[timedelta]]
+
+# How much checking FuncSpec.exportRetval() does:
+# - 'full': the whole return value is type-checked
+# - 'shallow': only the top-level type of the return value is checked
+# - 'off': the return value is converted to its exported form without any type checks
+ValidationLevel = Literal['full', 'shallow', 'off']
+
 
 if sys.version_info >= (3, 10, 0):
     # 3.10.0 onwards we can use a simple isinstance check
@@ -30,9 +51,26 @@ else:
         return isinstance(sometype, type(NewType))
 
 
+def _istypeddict(sometype: Any) -> bool:
+    # NOTE: typing.is_typeddict() would be nicer but it isn't available until python 3.10
+    return (
+        isinstance(sometype, type)
+        and issubclass(sometype, dict)
+        and hasattr(sometype, '__total__')
+    )
+
+
+def _getTypedDictRequiredKeys(class_: Any) -> FrozenSet[str]:
+    try:
+        return frozenset(class_.__required_keys__)
+    except AttributeError:
+        # python 3.8 doesn't track required keys, so we have to assume all keys follow __total__
+        return frozenset(get_type_hints(class_)) if class_.__total__ else frozenset()
+
+
 class Advanced:
     """
-    A collection of "advanced" types (NewType()s and dataclasses).
+    A collection of "advanced" types (NewType()s, Enums, dataclasses and TypedDicts).
 
     This collection can be passed along to FuncSpec() and will enable the generated TypeSpecs to
     work with the more advanced types.
@@ -40,14 +78,28 @@ class Advanced:
     newTypes: Dict[str, Type[Any]]
     childTypes: Dict[str, List[str]]
     dataclasses: List[Type[Any]]
+    # dataclasses which may be exported from a mapping/namedtuple/row instead of an instance
+    structuralDataclasses: Set[Type[Any]]
+    # frozen dataclasses whose exported form is cached per instance
+    memoizedDataclasses: Set[Type[Any]]
+    typedDicts: List[Type[Any]]
+    enums: Dict[Type[enum.Enum], EnumEncoding]
     contextTypes: Set[Type[Any]]
     authTypes: Set[Type[Any]]
     # {<newtype>: (<tsmodule>, )}
     externalTypes: Dict[Type[Any], Tuple[str, ]]
+    temporalEncoding: TemporalEncoding
 
-    def __init__(self) -> None:
+    def __init__(self, *, temporalEncoding: TemporalEncoding = 'iso') -> None:
+        if temporalEncoding not in ('iso', 'epoch_ms', 'epoch_us'):
+            raise Exception(f'Unexpected temporal encoding {temporalEncoding!r}')
+        self.temporalEncoding = temporalEncoding
         self.newTypes = {}
         self.dataclasses = []
+        self.structuralDataclasses = set()
+        self.memoizedDataclasses = set()
+        self.typedDicts = []
+        self.enums = {}
         self.childTypes = {}
         self.contextTypes = set()
         self.authTypes = set()
@@ -85,10 +137,43 @@ class Advanced:
         assert newType not in self.externalTypes
         self.externalTypes[newType] = (tsmodule, )
 
-    def addDataclass(self, class_: Type[Any]) -> None:
+    def addDataclass(
+        self,
+        class_: Type[Any],
+        *,
+        structural: bool = False,
+        memoize: bool = False,
+    ) -> None:
         if not is_dataclass(class_):
             raise TypeError(f'{class_!r} is not a dataclass')
+        if memoize and not class_.__dataclass_params__.frozen:  # type: ignore
+            raise TypeError(f"Can't memoize {class_.__name__}: it is not a frozen dataclass")
         self.dataclasses.append(class_)
+        if structural:
+            self.structuralDataclasses.add(class_)
+        if memoize:
+            self.memoizedDataclasses.add(class_)
+
+    def addTypedDict(self, class_: Type[Any]) -> None:
+        if not _istypeddict(class_):
+            raise TypeError(f'{class_!r} is not a TypedDict')
+        self.typedDicts.append(class_)
+
+    def addEnum(self, enumClass: Type[enum.Enum], *, encoding: EnumEncoding = 'name') -> None:
+        if not (isinstance(enumClass, type) and issubclass(enumClass, enum.Enum)):
+            raise TypeError(f'{enumClass!r} is not an Enum')
+        if enumClass in self.enums:
+            raise Exception(f'Enum {enumClass.__name__!r} has already been added')
+        if encoding == 'int':
+            for member in enumClass:
+                if type(member.value) is not int:  # pylint: disable=unidiomatic-typecheck
+                    raise TypeError(
+                        f"Can't use int encoding for {enumClass.__name__}"
+                        f"; {member.name} has non-int value {member.value!r}"
+                    )
+        elif encoding != 'name':
+            raise Exception(f'Unexpected enum encoding {encoding!r}')
+        self.enums[enumClass] = encoding
 
     def hasNewType(self, someType: Any) -> bool:
         try:
@@ -109,6 +194,12 @@ class Advanced:
     def hasDataclass(self, class_: Any) -> bool:
         return class_ in self.dataclasses
 
+    def hasTypedDict(self, class_: Any) -> bool:
+        return class_ in self.typedDicts
+
+    def hasEnum(self, enumClass: Any) -> bool:
+        return enumClass in self.enums
+
     def getNewTypeDetails(self) -> Iterable[Tuple[str, Type[Any], List[str]]]:
         for name, nt in self.newTypes.items():
             # typeName, supertype, resolvedType
@@ -126,18 +217,106 @@ class Advanced:
     def getAllDataclasses(self) -> Iterable[Any]:
         yield from self.dataclasses
 
+    def getAllTypedDicts(self) -> Iterable[Any]:
+        yield from self.typedDicts
+
+    def getAllEnums(self) -> Iterable[Tuple[Type[enum.Enum], EnumEncoding]]:
+        yield from self.enums.items()
+
+
+class FieldProjection:
+    """
+    The fields of a method's return value that were requested by the client.
+
+    Clients select fields using dotted paths such as ["name", "owner.email"]. Naming a field
+    selects all of it, while a dotted path selects only some fields of a nested dataclass or
+    TypedDict. Methods can receive the projection by declaring a parameter of type FieldProjection
+    - e.g. to avoid loading expensive columns which weren't requested.
+    """
+    # {fieldName: subProjection}, where a subProjection of None means the whole field is selected.
+    # When selected is None, the client didn't ask for a projection and every field is selected.
+    selected: Optional[Dict[str, Optional['FieldProjection']]]
+
+    def __init__(self, selected: Dict[str, Optional['FieldProjection']] = None) -> None:
+        self.selected = selected
+
+    def __repr__(self) -> str:
+        return f'FieldProjection({self.selected!r})'
+
+    def includes(self, name: str) -> bool:
+        return self.selected is None or name in self.selected
+
+    def get(self, name: str) -> Optional['FieldProjection']:
+        """Return the projection for a nested field, or None if the whole field is wanted."""
+        if self.selected is None:
+            return None
+        return self.selected.get(name)
+
+    @classmethod
+    def fromPaths(cls, paths: Any, label: str, *, onerr: ErrHandler) -> 'FieldProjection':
+        if not isinstance(paths, list):
+            actualTypeName = _getActualTypeName(paths)
+            onerr(f'{label} must be a list; got {actualTypeName} instead')
+            return cls()
+
+        root: Dict[str, Any] = {}
+        for idx, path in enumerate(paths):
+            if not isinstance(path, str) or '' in path.split('.'):
+                onerr(f'{label}[{idx}] must be a dotted field path; got {path!r} instead')
+                continue
+
+            *parents, last = path.split('.')
+            node: Optional[Dict[str, Any]] = root
+            for part in parents:
+                assert node is not None
+                if part in node and node[part] is None:
+                    # the whole of this field was already selected
+                    node = None
+                    break
+                node = node.setdefault(part, {})
+            if node is not None:
+                # selecting the whole field overrides any nested selections
+                node[last] = None
+
+        def _build(node: Dict[str, Any]) -> 'FieldProjection':
+            return cls({
+                name: None if child is None else _build(child)
+                for name, child in node.items()
+            })
+
+        return _build(root)
+
+
+def _projectFields(
+    fieldSpecs: Dict[str, 'TypeSpec'],
+    fields: Optional[FieldProjection],
+) -> Iterable[Tuple[str, 'TypeSpec', Optional[FieldProjection]]]:
+    if fields is None or fields.selected is None:
+        return ((name, spec, None) for name, spec in fieldSpecs.items())
+    return (
+        (name, fieldSpecs[name], subfields)
+        for name, subfields in fields.selected.items()
+        if name in fieldSpecs
+    )
+
 
 class FuncSpec:
     argSpecs: Dict[str, 'TypeSpec']
     retvalSpec: 'TypeSpec'
     contextvars: Dict[str, Type[Any]]
     authvars: Dict[str, Type[Any]]
+    # name of the parameter which receives the FieldProjection, if there is one
+    fieldsvar: Optional[str]
 
     def __init__(self, fn: Callable[..., Any], adv: Advanced) -> None:
         self.contextvars = {}
         self.authvars = {}
         self.argSpecs = {}
+        self.fieldsvar = None
         for name, someType in get_type_hints(fn).items():
+            if someType is FieldProjection:
+                self.fieldsvar = name
+                continue
             if adv.hasAuthType(someType):
                 self.authvars[name] = someType
                 continue
@@ -186,13 +365,70 @@ class FuncSpec:
         showdc: bool,
         *,
         onerr: ErrHandler,
+        validation: ValidationLevel = 'full',
+        fields: FieldProjection = None,
     ) -> Any:
-        return self.retvalSpec.getExported(retval, label, showdc, onerr=onerr)
+        if validation == 'full':
+            return self.retvalSpec.getExported(retval, label, showdc, onerr=onerr, fields=fields)
+
+        if validation == 'shallow':
+            self.retvalSpec.checkShallow(retval, label, onerr=onerr)
+
+        return self.retvalSpec.getConverted(retval, label, showdc, onerr=onerr, fields=fields)
+
+    def isProjectable(self) -> bool:
+        """Returns True if the return value contains dataclasses or TypedDicts to project."""
+        return bool(_getRecordSpecs(self.retvalSpec))
+
+    def importProjection(self, paths: Any, label: str, onerr: ErrHandler) -> FieldProjection:
+        """Build a FieldProjection from the client's field paths and check they all exist."""
+        fields = FieldProjection.fromPaths(paths, label, onerr=onerr)
+        _checkProjection(self.retvalSpec, fields, label, onerr)
+        return fields
 
     def getReturnSpec(self) -> 'TypeSpec':
         return self.retvalSpec
 
 
+def _ignoreErr(msg: str) -> None:
+    pass
+
+
+def _getRecordSpecs(spec: 'TypeSpec') -> List[Union['DataclassTypeSpec', 'TypedDictTypeSpec']]:
+    """Find the dataclasses/TypedDicts which a projection would apply to."""
+    if isinstance(spec, (DataclassTypeSpec, TypedDictTypeSpec)):
+        return [spec]
+    if isinstance(spec, ListTypeSpec):
+        return _getRecordSpecs(spec.itemSpec)
+    if isinstance(spec, DictTypeSpec):
+        return _getRecordSpecs(spec.valueSpec)
+    if isinstance(spec, UnionTypeSpec):
+        return [r for variant in spec.variants for r in _getRecordSpecs(variant)]
+    return []
+
+
+def _checkProjection(
+    spec: 'TypeSpec',
+    fields: FieldProjection,
+    label: str,
+    onerr: ErrHandler,
+) -> None:
+    if fields.selected is None:
+        return
+
+    records = _getRecordSpecs(spec)
+    if not records:
+        onerr(f'{label} selects fields from a value which has no fields')
+        return
+
+    for name, subfields in fields.selected.items():
+        fieldSpecs = [r.fieldSpecs[name] for r in records if name in r.fieldSpecs]
+        if not fieldSpecs:
+            onerr(f'{label} contains unknown field {name!r}')
+        elif subfields is not None:
+            _checkProjection(UnionTypeSpec(fieldSpecs), subfields, f'{label}.{name}', onerr)
+
+
 class TypeSpec(abc.ABC):
     """
     Holds a type definition for an argument or return value.
@@ -202,9 +438,39 @@ class TypeSpec(abc.ABC):
         ...
 
     @abc.abstractmethod
-    def getExported(self, value: Any, label: str, showdc: bool, *, onerr: ErrHandler) -> Any:
+    def getExported(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
         ...
 
+    def getConverted(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
+        """
+        Convert value to its exported form like getExported(), but without any type checks.
+
+        If value doesn't match the TypeSpec, the result is undefined (and may not be JSON-safe).
+        Only problems which make conversion impossible (e.g. a structural source which is missing
+        a dataclass field) are reported to onerr.
+        """
+        return value
+
+    def checkShallow(self, value: Any, label: str, *, onerr: ErrHandler) -> None:
+        """Type-check only the top level of value - list items, fields etc. are not checked."""
+        self.getExported(value, label, False, onerr=onerr)
+
 
 def getTypeSpec(someType: Any, adv: Advanced) -> TypeSpec:
     from bifrostrpc import TypeNotSupportedError
@@ -232,7 +498,31 @@ def getTypeSpec(someType: Any, adv: Advanced) -> TypeSpec:
         for f in dataclasses.fields(realType):
             fieldExporter = getTypeSpec(f.type, adv)
             fieldSpecs[f.name] = fieldExporter
-        return DataclassTypeSpec(realType, fieldSpecs)
+        return DataclassTypeSpec(
+            realType,
+            fieldSpecs,
+            structural=realType in adv.structuralDataclasses,
+            memoize=realType in adv.memoizedDataclasses,
+        )
+
+    if _istypeddict(realType):
+        if not adv.hasTypedDict(realType):
+            raise TypeError(f"Can't get TypeSpec for unknown TypedDict {realType!r}")
+
+        fieldSpecs = {
+            name: getTypeSpec(fieldType, adv)
+            for name, fieldType in get_type_hints(realType).items()
+        }
+        return TypedDictTypeSpec(realType, fieldSpecs, _getTypedDictRequiredKeys(realType))
+
+    if isinstance(realType, type) and issubclass(realType, enum.Enum):
+        if not adv.hasEnum(realType):
+            raise TypeError(f"Can't get TypeSpec for unknown Enum {realType!r}")
+        return EnumTypeSpec(realType, adv.enums[realType])
+
+    # NOTE: identity checks are necessary here because datetime is a subclass of date
+    if realType is datetime or realType is date or realType is timedelta:
+        return TemporalTypeSpec(realType, adv.temporalEncoding)
 
     # NOTE: this doesn't work under python 3.7 or python 3.8
     if isinstance(realType, type(Literal)) or getattr(realType, '__origin__', None) is Literal:
@@ -287,7 +577,15 @@ def getTypeSpec(someType: Any, adv: Advanced) -> TypeSpec:
 
 
 class NullTypeSpec(TypeSpec):
-    def getExported(self, value: Any, label: str, showdc: bool, *, onerr: ErrHandler) -> None:
+    def getExported(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> None:
         if value is not None:
             actualTypeName = _getActualTypeName(value)
             onerr(f'{label} must be None; got {actualTypeName} instead')
@@ -360,7 +658,15 @@ class ListTypeSpec(TypeSpec):
     def __init__(self, itemSpec: TypeSpec):
         self.itemSpec = itemSpec
 
-    def getExported(self, value: Any, label: str, showdc: bool, *, onerr: ErrHandler) -> List[Any]:
+    def getExported(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> List[Any]:
         if isinstance(value, (str, bytes)):
             typeName = type(value).__name__
             onerr(f'Cowardly efusing to export {label} ({typeName}) as a list')
@@ -375,9 +681,35 @@ class ListTypeSpec(TypeSpec):
 
         ret = []
         for idx, item in enumerate(iter_):
-            ret.append(self.itemSpec.getExported(item, f'{label}[{idx}]', showdc, onerr=onerr))
+            ret.append(self.itemSpec.getExported(
+                item,
+                f'{label}[{idx}]',
+                showdc,
+                onerr=onerr,
+                fields=fields,
+            ))
         return ret
 
+    def getConverted(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
+        itemSpec = self.itemSpec
+        return [
+            itemSpec.getConverted(item, f'{label}[{idx}]', showdc, onerr=onerr, fields=fields)
+            for idx, item in enumerate(value)
+        ]
+
+    def checkShallow(self, value: Any, label: str, *, onerr: ErrHandler) -> None:
+        if isinstance(value, (str, bytes)) or not hasattr(value, '__iter__'):
+            actualTypeName = _getActualTypeName(value)
+            onerr(f'{label} must be a list; got {actualTypeName} instead')
+
     def getImported(self, value: Any, label: str, *, onerr: ErrHandler) -> Any:
         if type(value) is not list:  # pylint: disable=unidiomatic-typecheck
             actualTypeName = _getActualTypeName(value)
@@ -425,13 +757,48 @@ class UnionTypeSpec(TypeSpec):
             onerr(err)
         return value
 
-    def getExported(self, value: Any, label: str, showdc: bool, *, onerr: ErrHandler) -> Any:
+    def getExported(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
         return self._process(
             value,
             label,
             onerr,
             lambda spec, value, variantLabel, errhandler:
-                spec.getExported(value, variantLabel, showdc, onerr=errhandler)
+                spec.getExported(value, variantLabel, showdc, onerr=errhandler, fields=fields)
+        )
+
+    def getConverted(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
+        # without full type checks the best we can do is use the first variant whose top-level
+        # type matches
+        for spec in self.variants:
+            errors: List[str] = []
+            spec.checkShallow(value, '', onerr=errors.append)
+            if not errors:
+                return spec.getConverted(value, label, showdc, onerr=onerr, fields=fields)
+        return value
+
+    def checkShallow(self, value: Any, label: str, *, onerr: ErrHandler) -> None:
+        self._process(
+            value,
+            label,
+            onerr,
+            lambda spec, value, variantLabel, errhandler:
+                spec.checkShallow(value, variantLabel, onerr=errhandler)
         )
 
     def getImported(self, value: Any, label: str, *, onerr: ErrHandler) -> Any:
@@ -452,7 +819,15 @@ class DictTypeSpec(TypeSpec):
         self.keySpec = keySpec
         self.valueSpec = valueSpec
 
-    def getExported(self, value: Any, label: str, showdc: bool, *, onerr: ErrHandler) -> Any:
+    def getExported(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
         if type(value) is not dict:  # pylint: disable=unidiomatic-typecheck
             actualTypeName = _getActualTypeName(value)
             onerr(f'{label} must be a dict; got {actualTypeName} instead')
@@ -462,10 +837,30 @@ class DictTypeSpec(TypeSpec):
         for k, v in value.items():
             valuelabel = label + '[' + repr(k) + ']'
             newKey = self.keySpec.getExported(k, label, showdc, onerr=onerr)
-            newVal = self.valueSpec.getExported(v, valuelabel, showdc, onerr=onerr)
+            newVal = self.valueSpec.getExported(v, valuelabel, showdc, onerr=onerr, fields=fields)
             transformed[newKey] = newVal
         return transformed
 
+    def getConverted(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
+        valueSpec = self.valueSpec
+        return {
+            k: valueSpec.getConverted(v, f'{label}[{k!r}]', showdc, onerr=onerr, fields=fields)
+            for k, v in value.items()
+        }
+
+    def checkShallow(self, value: Any, label: str, *, onerr: ErrHandler) -> None:
+        if type(value) is not dict:  # pylint: disable=unidiomatic-typecheck
+            actualTypeName = _getActualTypeName(value)
+            onerr(f'{label} must be a dict; got {actualTypeName} instead')
+
     def getImported(self, value: Any, label: str, *, onerr: ErrHandler) -> Any:
         if type(value) is not dict:  # pylint: disable=unidiomatic-typecheck
             # NOTE: we don't support importing dataclasses here because we're
@@ -485,10 +880,54 @@ class DictTypeSpec(TypeSpec):
 class DataclassTypeSpec(TypeSpec):
     class_: Any
     fieldSpecs: Dict[str, TypeSpec]
-
-    def __init__(self, class_: Any, fieldSpecs: Dict[str, TypeSpec]):
+    # when True, getExported() will also accept a "structural source" in place of an instance of
+    # class_: a mapping, a named tuple, or anything with keys() and __getitem__() such as a
+    # sqlite3.Row. Fields are read by name and validated exactly as they would be on an instance.
+    structural: bool
+    # when True, the exported form of each instance of class_ is cached until that instance is
+    # garbage collected. This is only safe for frozen dataclasses.
+    memoize: bool
+    # {(id(instance), showdc): (weakref(instance), exported)}
+    _memo: Dict[Tuple[int, bool], Tuple['weakref.ref[Any]', Dict[str, Any]]]
+
+    def __init__(
+        self,
+        class_: Any,
+        fieldSpecs: Dict[str, TypeSpec],
+        *,
+        structural: bool = False,
+        memoize: bool = False,
+    ):
         self.class_ = class_
         self.fieldSpecs = fieldSpecs
+        self.structural = structural
+        self.memoize = memoize
+        self._memo = {}
+
+    def _remember(self, value: Any, showdc: bool, exported: Dict[str, Any]) -> None:
+        key = (id(value), showdc)
+        try:
+            ref = weakref.ref(value, lambda _: self._memo.pop(key, None))
+        except TypeError:
+            # instances of dataclasses using __slots__ can't be weakly referenced
+            return
+        self._memo[key] = (ref, exported)
+
+    def _getFieldReader(self, value: Any) -> Optional[Callable[[str], Any]]:
+        if isinstance(value, self.class_):
+            return lambda name: getattr(value, name)
+
+        if not self.structural:
+            return None
+
+        # named tuples must be checked first since they don't have keys()
+        if isinstance(value, tuple) and hasattr(value, '_fields'):
+            return lambda name: getattr(value, name)
+
+        if hasattr(value, 'keys') and hasattr(value, '__getitem__'):
+            return value.__getitem__
+
+        return None
 
     def getImported(self, value: Any, label: str, *, onerr: ErrHandler) -> Any:
         if not isinstance(value, dict):
@@ -526,23 +965,212 @@ class DataclassTypeSpec(TypeSpec):
         showdc: bool,
         *,
         onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
     ) -> Dict[str, Any]:
-        if not isinstance(value, self.class_):
+        # NOTE: only the complete exported form is memoized, so the memo is bypassed when a
+        # projection is in effect
+        memoize = fields is None and self.memoize and isinstance(value, self.class_)
+        if memoize:
+            try:
+                ref, exported = self._memo[id(value), showdc]
+            except KeyError:
+                pass
+            else:
+                # the id() may have been reused by a new object before the old weakref fired
+                if ref() is value:
+                    return exported
+
+        read = self._getFieldReader(value)
+        if read is None:
             actualTypeName = _getActualTypeName(value)
             onerr(f'{label} must be an instance of {self.class_.__name__}'
                   f'; got {actualTypeName} instead')
             return value
 
+        errors: List[str] = []
+
+        def _onerr(msg: str) -> None:
+            errors.append(msg)
+            onerr(msg)
+
         # NOTE: you *could* use dataclasses.asdict() to recursively turn `target` into a dict, but
         # then you wouldn't be recursively verifying types along the way.
         ret = {}
-        for name, spec in self.fieldSpecs.items():
+        for name, spec, subfields in _projectFields(self.fieldSpecs, fields):
             fieldLabel = f'{label}.{name}'
-            ret[name] = spec.getExported(getattr(value, name), fieldLabel, showdc, onerr=onerr)
+            try:
+                fieldValue = read(name)
+            except (KeyError, IndexError, AttributeError):
+                _onerr(f'{label} is missing field {name!r}')
+                continue
+            ret[name] = spec.getExported(
+                fieldValue,
+                fieldLabel,
+                showdc,
+                onerr=_onerr,
+                fields=subfields,
+            )
         if showdc:
             ret['__dataclass__'] = self.class_.__name__
+        if memoize and not errors:
+            self._remember(value, showdc, ret)
         return ret
 
+    def getConverted(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
+        read = self._getFieldReader(value)
+        if read is None:
+            return value
+
+        ret = {}
+        for name, spec, subfields in _projectFields(self.fieldSpecs, fields):
+            try:
+                fieldValue = read(name)
+            except (KeyError, IndexError, AttributeError):
+                onerr(f'{label} is missing field {name!r}')
+                continue
+            ret[name] = spec.getConverted(
+                fieldValue,
+                f'{label}.{name}',
+                showdc,
+                onerr=onerr,
+                fields=subfields,
+            )
+        if showdc:
+            ret['__dataclass__'] = self.class_.__name__
+        return ret
+
+    def checkShallow(self, value: Any, label: str, *, onerr: ErrHandler) -> None:
+        if self._getFieldReader(value) is None:
+            actualTypeName = _getActualTypeName(value)
+            onerr(f'{label} must be an instance of {self.class_.__name__}'
+                  f'; got {actualTypeName} instead')
+
+
+class TypedDictTypeSpec(TypeSpec):
+    """
+    Validates plain dicts against a TypedDict without constructing any new objects.
+
+    Dicts are passed through as-is unless one of their values needs converting (e.g. a nested
+    dataclass or Enum), in which case a shallow copy is made. Unlike dataclasses, exported
+    TypedDicts never include a '__dataclass__' item since that would require a copy of every dict.
+    """
+    class_: Any
+    fieldSpecs: Dict[str, TypeSpec]
+    requiredKeys: FrozenSet[str]
+
+    def __init__(
+        self,
+        class_: Any,
+        fieldSpecs: Dict[str, TypeSpec],
+        requiredKeys: FrozenSet[str],
+    ) -> None:
+        self.class_ = class_
+        self.fieldSpecs = fieldSpecs
+        self.requiredKeys = requiredKeys
+
+    def _process(
+        self,
+        value: Any,
+        label: str,
+        onerr: ErrHandler,
+        transformer: Callable[[TypeSpec, Any, str, Optional['FieldProjection']], Any],
+        fields: 'FieldProjection' = None,
+    ) -> Any:
+        if not isinstance(value, dict):
+            actualTypeName = _getActualTypeName(value)
+            onerr(f'{label} must be a dict; got {actualTypeName} instead')
+            return value
+
+        selected = None if fields is None else fields.selected
+        if selected is not None:
+            # unselected keys need to be dropped, so a projection always requires a copy
+            value = {k: v for k, v in value.items() if k in selected}
+
+        converted = None
+        for k, v in value.items():
+            try:
+                spec = self.fieldSpecs[k]
+            except KeyError:
+                onerr(f'{label} contains unexpected key {k!r}')
+                continue
+
+            subfields = None if selected is None else selected[k]
+            newValue = transformer(spec, v, f'{label}[{k!r}]', subfields)
+            if newValue is not v:
+                if converted is None:
+                    converted = dict(value)
+                converted[k] = newValue
+
+        for k in self.requiredKeys:
+            if k not in value and (selected is None or k in selected):
+                onerr(f'{label} is missing key {k!r}')
+
+        return value if converted is None else converted
+
+    def getImported(self, value: Any, label: str, *, onerr: ErrHandler) -> Any:
+        return self._process(
+            value,
+            label,
+            onerr,
+            lambda spec, v, itemLabel, _: spec.getImported(v, itemLabel, onerr=onerr),
+        )
+
+    def getExported(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
+        return self._process(
+            value,
+            label,
+            onerr,
+            lambda spec, v, itemLabel, subfields:
+                spec.getExported(v, itemLabel, showdc, onerr=onerr, fields=subfields),
+            fields,
+        )
+
+    def getConverted(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
+        # NOTE: the TypedDict's own keys aren't checked, but errors converting its values are
+        # still reported
+        return self._process(
+            value,
+            label,
+            _ignoreErr,
+            lambda spec, v, itemLabel, subfields: spec.getConverted(
+                v,
+                itemLabel,
+                showdc,
+                onerr=onerr,
+                fields=subfields,
+            ),
+            fields,
+        )
+
+    def checkShallow(self, value: Any, label: str, *, onerr: ErrHandler) -> None:
+        if not isinstance(value, dict):
+            actualTypeName = _getActualTypeName(value)
+            onerr(f'{label} must be a dict; got {actualTypeName} instead')
+
 
 class ScalarTypeSpec(TypeSpec):
     # the primitive type
@@ -561,7 +1189,15 @@ class ScalarTypeSpec(TypeSpec):
         self.typeName = typeName
         self.originalType = originalType
 
-    def getExported(self, value: Any, label: str, showdc: bool, *, onerr: ErrHandler) -> Any:
+    def getExported(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
         # NOTE: for scalar values we don't actually transform (heaven forbid we should cast our
         # ints to strs automatically like PHP); we just warn on incorrect types
         if not isinstance(value, self.scalarType):
@@ -586,6 +1222,191 @@ class ScalarTypeSpec(TypeSpec):
         return isbool(value)
 
 
+class EnumTypeSpec(TypeSpec):
+    enumClass: Type[enum.Enum]
+    encoding: EnumEncoding
+
+    # the primitive type used to send the enum over the wire
+    wireType: Union[Type[str], Type[int]]
+
+    # lookup tables mapping wire values to members and back again - these keep import/export
+    # validation to a single dict lookup regardless of how many members the Enum has
+    importTable: Dict[Union[str, int], enum.Enum]
+    exportTable: Dict[enum.Enum, Union[str, int]]
+
+    def __init__(self, enumClass: Type[enum.Enum], encoding: EnumEncoding) -> None:
+        self.enumClass = enumClass
+        self.encoding = encoding
+        self.wireType = str if encoding == 'name' else int
+        self.importTable = {}
+        self.exportTable = {}
+        for member in enumClass:
+            wireValue: Union[str, int]
+            if encoding == 'name':
+                wireValue = member.name
+            else:
+                wireValue = int(member.value)
+            self.importTable[wireValue] = member
+            self.exportTable[member] = wireValue
+
+    @property
+    def values(self) -> List[Union[str, int]]:
+        return list(self.importTable)
+
+    def getExported(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
+        # NOTE: the type() check is necessary because IntEnum members hash and compare equal to
+        # plain ints, which would otherwise be found in exportTable
+        if type(value) is self.enumClass:  # pylint: disable=unidiomatic-typecheck
+            return self.exportTable[value]
+
+        actualTypeName = _getActualTypeName(value)
+        onerr(f'{label} must be a member of {self.enumClass.__name__}'
+              f'; got {actualTypeName} instead')
+        return value
+
+    def getConverted(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
+        return self.exportTable.get(value, value)
+
+    def getImported(self, value: Any, label: str, *, onerr: ErrHandler) -> Any:
+        # NOTE: the type() check prevents True/False from matching the int values 1/0
+        if type(value) is self.wireType:  # pylint: disable=unidiomatic-typecheck
+            try:
+                return self.importTable[value]
+            except KeyError:
+                pass
+
+        if type(value) in (str, int, bool):
+            show = repr(value)
+        else:
+            show = _getActualTypeName(value)
+        onerr(f'{label} must be a valid {self.enumClass.__name__}; got {show} instead')
+        return value
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_ONE_MS = timedelta(milliseconds=1)
+_ONE_US = timedelta(microseconds=1)
+
+
+class TemporalTypeSpec(TypeSpec):
+    temporalType: TemporalTypes
+    encoding: TemporalEncoding
+
+    # the primitive type used to send the value over the wire
+    wireType: Union[Type[str], Type[int]]
+
+    # the size of one integer unit on the wire (unused for ISO strings)
+    unit: timedelta
+
+    def __init__(self, temporalType: TemporalTypes, encoding: TemporalEncoding) -> None:
+        self.temporalType = temporalType
+        self.encoding = encoding
+        self.unit = _ONE_US if encoding == 'epoch_us' else _ONE_MS
+        if encoding == 'iso' and temporalType is not timedelta:
+            self.wireType = str
+        else:
+            self.wireType = int
+        self._unitsPerDay = timedelta(days=1) // self.unit
+
+    def _isTemporal(self, value: Any) -> bool:
+        if self.temporalType is date:
+            # a datetime is also a date, but it's not what we're looking for here
+            return isinstance(value, date) and not isinstance(value, datetime)
+        return isinstance(value, self.temporalType)
+
+    def getExported(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
+        if not self._isTemporal(value):
+            actualTypeName = _getActualTypeName(value)
+            onerr(f'{label} must be of type {self.temporalType.__name__}'
+                  f'; got {actualTypeName} instead')
+            return value
+
+        if self.wireType is str:
+            return value.isoformat()
+
+        if self.temporalType is timedelta:
+            return value // self.unit
+
+        if self.temporalType is date:
+            return (value.toordinal() - _EPOCH_ORDINAL) * self._unitsPerDay
+
+        if value.tzinfo is None:
+            onerr(f'{label} must be a timezone-aware datetime to be sent as an epoch timestamp')
+            return value
+
+        # NOTE: integer-dividing timedeltas is exact, unlike value.timestamp() which goes via float
+        return (value - _EPOCH) // self.unit
+
+    def getConverted(
+        self,
+        value: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
+    ) -> Any:
+        return self.getExported(value, label, showdc, onerr=_ignoreErr)
+
+    def getImported(self, value: Any, label: str, *, onerr: ErrHandler) -> Any:
+        if type(value) is not self.wireType:  # pylint: disable=unidiomatic-typecheck
+            actualTypeName = _getActualTypeName(value)
+            expected = 'an ISO-8601 string' if self.wireType is str else 'an integer'
+            onerr(f'{label} must be {expected}; got {actualTypeName} instead')
+            return value
+
+        try:
+            if self.temporalType is timedelta:
+                return value * self.unit
+
+            if self.wireType is str:
+                if self.temporalType is date:
+                    return date.fromisoformat(value)
+                if value.endswith('Z') and sys.version_info < (3, 11):
+                    # fromisoformat() doesn't understand the 'Z' suffix until python 3.11, but
+                    # it's what javascript's Date.toISOString() produces
+                    value = value[:-1] + '+00:00'
+                return datetime.fromisoformat(value)
+
+            if self.temporalType is date:
+                days, remainder = divmod(value, self._unitsPerDay)
+                if remainder:
+                    onerr(f'{label} must be a timestamp at midnight UTC; got {value!r} instead')
+                    return value
+                return date.fromordinal(_EPOCH_ORDINAL + days)
+
+            # NOTE: multiplying timedeltas is exact, unlike fromtimestamp() which goes via float
+            return _EPOCH + value * self.unit
+        except (ValueError, OverflowError, OSError) as e:
+            onerr(f'{label} is not a valid {self.temporalType.__name__}: {e}')
+            return value
+
+
 class LiteralTypeSpec(TypeSpec):
     # TODO: this needs rewriting to support multiple Literal values
     expected: Union[str, int, bool]
@@ -607,6 +1428,7 @@ class LiteralTypeSpec(TypeSpec):
         showdc: bool,
         *,
         onerr: ErrHandler,
+        fields: 'FieldProjection' = None,
     ) -> Union[str, int, bool]:
         if not (isinstance(value, self.expectedType) and value == self.expected):
             if type(value) in (str, int, bool, None):
@@ -674,6 +1496,51 @@ def _generateCrossType(
             phpdoc=spec.class_.__name__,
         )
 
+    if isinstance(spec, TypedDictTypeSpec):
+        if not adv.hasTypedDict(spec.class_):
+            raise Exception(
+                f'Cannot generate a type for unknown TypedDict {spec.class_.__name__}')
+
+        return CrossCustomType(
+            python=spec.class_.__name__,
+            typescript=spec.class_.__name__,
+            phplang=spec.class_.__name__,
+            phpdoc=spec.class_.__name__,
+        )
+
+    if isinstance(spec, EnumTypeSpec):
+        if not adv.hasEnum(spec.enumClass):
+            raise Exception(
+                f'Cannot generate a type for unknown Enum {spec.enumClass.__name__}')
+
+        # php has no custom types so we have to fall back to the wire type
+        wiretype = CrossStr() if spec.wireType is str else CrossNum()
+        phplang, phpdoc, _ = wiretype.getPHPTypes()
+        return CrossCustomType(
+            python=spec.enumClass.__name__,
+            typescript=spec.enumClass.__name__,
+            phplang=phplang,
+            phpdoc=phpdoc,
+        )
+
+    if isinstance(spec, TemporalTypeSpec):
+        if spec.temporalType is timedelta:
+            # only python has a native type for durations
+            phplang, phpdoc, _ = CrossNum().getPHPTypes()
+            return CrossCustomType(
+                python='datetime.timedelta',
+                typescript='number',
+                phplang=phplang,
+                phpdoc=phpdoc,
+            )
+
+        return CrossCustomType(
+            python=f'datetime.{spec.temporalType.__name__}',
+            typescript='Date',
+            phplang='DateTimeImmutable',
+            phpdoc='DateTimeImmutable',
+        )
+
     if isinstance(spec, UnionTypeSpec):
         return CrossUnion([
             _generateCrossType(variantspec, adv)
@@ -0,0 +1,147 @@
+import itertools
+import logging
+import threading
+from dataclasses import dataclass, replace
+from typing import Any, Iterator, List, Literal, Union
+
+from bifrostrpc.typing import ErrHandler, FieldProjection, FuncSpec
+
+log = logging.getLogger()
+
+# How thoroughly return values are validated before being sent to the client:
+# - 'full': every return value is fully type-checked
+# - 'sampled': 1 in every N return values is fully type-checked, the rest are converted without
+#   any type checks
+# - 'shallow': only the top-level type of each return value is checked
+# - 'off': return values are converted without any type checks
+ReturnValidation = Literal['full', 'sampled', 'shallow', 'off']
+
+# What happens when a sampled validation fails:
+# - 'log': the errors are logged and the response is sent anyway
+# - 'raise': the call fails just as it would under 'full' validation
+# NOTE: an unsampled return value which can't be JSON-encoded is fully validated after all, so
+# that the call fails with an error saying which part of it was invalid
+SampleFailureAction = Literal['log', 'raise']
+
+
+class ReturnValidationPolicy:
+    mode: ReturnValidation
+    sampleEvery: int
+    onFailure: SampleFailureAction
+
+    def __init__(
+        self,
+        mode: ReturnValidation = 'full',
+        *,
+        sampleEvery: int = 100,
+        onFailure: SampleFailureAction = 'log',
+    ) -> None:
+        if mode not in ('full', 'sampled', 'shallow', 'off'):
+            raise Exception(f'Unexpected return validation mode {mode!r}')
+        if sampleEvery < 1:
+            raise Exception(f'sampleEvery must be 1 or more; got {sampleEvery!r}')
+        if onFailure not in ('log', 'raise'):
+            raise Exception(f'Unexpected sample failure action {onFailure!r}')
+        self.mode = mode
+        self.sampleEvery = sampleEvery
+        self.onFailure = onFailure
+
+
+ReturnValidationArg = Union[ReturnValidation, ReturnValidationPolicy]
+
+
+def getPolicy(arg: ReturnValidationArg) -> ReturnValidationPolicy:
+    if isinstance(arg, ReturnValidationPolicy):
+        return arg
+    return ReturnValidationPolicy(arg)
+
+
+@dataclass
+class ReturnValidationStats:
+    # number of return values exported
+    calls: int = 0
+    # number of return values which were fully validated under the 'sampled' policy
+    sampled: int = 0
+    # number of sampled validations which found errors
+    failures: int = 0
+
+
+class ReturnValidator:
+    """Exports a single method's return values according to a ReturnValidationPolicy."""
+    policy: ReturnValidationPolicy
+    stats: ReturnValidationStats
+
+    def __init__(self, method: str, policy: ReturnValidationPolicy) -> None:
+        self.method = method
+        self.policy = policy
+        self.stats = ReturnValidationStats()
+        # NOTE: next() on an itertools.count() is atomic, so samples are picked and calls are
+        # counted without taking the lock
+        self._counter: Iterator[int] = itertools.count()
+        # getStats() can only read _calls by advancing it, so it is kept separate from _counter
+        # to avoid stats reads changing which calls are sampled
+        self._calls: Iterator[int] = itertools.count()
+        # the number of times getStats() has advanced _calls; only changed under the lock
+        self._statsReads = 0
+        # protects the sampled/failures stats
+        self._lock = threading.Lock()
+
+    def getStats(self) -> ReturnValidationStats:
+        with self._lock:
+            stats = replace(self.stats)
+            stats.calls = next(self._calls) - self._statsReads
+            self._statsReads += 1
+        return stats
+
+    def exportRetval(
+        self,
+        spec: FuncSpec,
+        retval: Any,
+        label: str,
+        showdc: bool,
+        *,
+        onerr: ErrHandler,
+        fields: FieldProjection = None,
+    ) -> Any:
+        policy = self.policy
+        mode = policy.mode
+        next(self._calls)
+        sample = next(self._counter) % policy.sampleEvery == 0
+
+        if mode != 'sampled':
+            return spec.exportRetval(
+                retval,
+                label,
+                showdc,
+                onerr=onerr,
+                validation=mode,
+                fields=fields,
+            )
+
+        if not sample:
+            return spec.exportRetval(
+                retval,
+                label,
+                showdc,
+                onerr=onerr,
+                validation='off',
+                fields=fields,
+            )
+
+        errors: List[str] = []
+        exported = spec.exportRetval(retval, label, showdc, onerr=errors.append, fields=fields)
+        with self._lock:
+            self.stats.sampled += 1
+            if errors:
+                self.stats.failures += 1
+
+        if errors:
+            if policy.onFailure == 'raise':
+                for err in errors:
+                    onerr(err)
+            else:
+                log.warning(
+                    f"{self.method}(): sampled return value validation failed"
+                    f": {'. '.join(errors)}"
+                )
+        return exported
@@ -0,0 +1,123 @@
+"""
+A framework-free WSGI application for serving a BifrostRPCService.
+
+This behaves the same as the Flask blueprint (status codes, auth factories, error messages) but
+avoids the overhead of Flask's routing, request/response objects and JSON helpers.
+"""
+import contextvars
+import json
+from http import HTTPStatus
+from typing import (Any, Callable, Dict, Iterable, List, MutableMapping,
+                    Optional, Tuple)
+
+from bifrostrpc import BifrostRPCService, BodyTooLargeError, _Response
+from bifrostrpc.batch import BATCH_PATH
+
+Environ = MutableMapping[str, Any]
+StartResponse = Callable[[str, List[Tuple[str, str]]], Any]
+WSGIApp = Callable[[Environ, StartResponse], Iterable[bytes]]
+
+CALL_PREFIX = '/api.v1/call/'
+
+# pre-built status lines - e.g. {200: '200 OK'}
+_STATUS_LINES: Dict[int, str] = {s.value: f'{s.value} {s.phrase}' for s in HTTPStatus}
+
+_currentEnviron: 'contextvars.ContextVar[Environ]' = contextvars.ContextVar(
+    'bifrostrpc_wsgi_environ')
+
+
+def getEnviron() -> Environ:
+    """Return the WSGI environ of the request currently being handled.
+
+    This is intended for use inside auth/context factories, which aren't given any arguments.
+    """
+    return _currentEnviron.get()
+
+
+def makeWSGIApp(service: BifrostRPCService) -> WSGIApp:
+    # pylint: disable=protected-access
+
+    def app(environ: Environ, start_response: StartResponse) -> Iterable[bytes]:
+        path: str = environ.get('PATH_INFO', '')
+        method = path[len(CALL_PREFIX):]
+        isBatch = path == BATCH_PATH
+        if not isBatch and (not path.startswith(CALL_PREFIX) or not method or '/' in method):
+            return _respond(start_response, _Response(404, 'Not Found'))
+
+        httpMethod: str = environ['REQUEST_METHOD']
+        if httpMethod not in ('GET', 'POST'):
+            return _respond(start_response, _Response(405, 'Method Not Allowed'))
+
+        token = _currentEnviron.set(environ)
+        try:
+            if isBatch:
+                response = service._handleBatch(
+                    httpMethod,
+                    _getContentLength(environ),
+                    lambda: _readBody(environ, service._maxBodySize),
+                    lambda name: environ.get('HTTP_' + name.upper().replace('-', '_')),
+                )
+                return _respond(start_response, response)
+
+            response = service._handleCall(
+                method,
+                httpMethod,
+                _getContentLength(environ),
+                lambda: _readBody(environ, service._maxBodySize),
+                lambda name: environ.get('HTTP_' + name.upper().replace('-', '_')),
+            )
+        finally:
+            _currentEnviron.reset(token)
+        return _respond(start_response, response)
+
+    return app
+
+
+def _getContentLength(environ: Environ) -> Optional[int]:
+    """Returns None if the length of the request body isn't known in advance."""
+    try:
+        return int(environ['CONTENT_LENGTH'])
+    except (KeyError, ValueError):
+        return None
+
+
+def _readBody(environ: Environ, limit: Optional[int]) -> Any:
+    # NOTE: servers which support "Expect: 100-continue" send the 100 response when wsgi.input
+    # is first read, so clients don't send the body of requests rejected before this point
+    stream = environ['wsgi.input']
+    length = _getContentLength(environ)
+    if length is not None:
+        body = stream.read(length) if length > 0 else b''
+    elif environ.get('wsgi.input_terminated'):
+        # e.g. a chunked body, which the server has decoded and will end with EOF
+        body = stream.read() if limit is None else stream.read(limit + 1)
+        if limit is not None and len(body) > limit:
+            raise BodyTooLargeError()
+    elif environ.get('CONTENT_LENGTH'):
+        # an invalid Content-Length
+        return None
+    else:
+        # without a Content-Length or wsgi.input_terminated, reading past the end of the body
+        # could block forever, so there is no body
+        body = b''
+    try:
+        return json.loads(body)
+    except ValueError:
+        # this will be rejected because it's not a dict
+        return None
+
+
+def _respond(start_response: StartResponse, response: _Response) -> List[bytes]:
+    body = response.getBytes()
+    headers = [
+        ('Content-Type', response.contentType),
+        ('Content-Length', str(len(body))),
+        *response.headers,
+    ]
+    start_response(_getStatusLine(response.status), headers)
+    return [body]
+
+
+def _getStatusLine(status: int) -> str:
+    line: Optional[str] = _STATUS_LINES.get(status)
+    return line or f'{status} Unknown'
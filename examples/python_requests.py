@@ -1,9 +1,30 @@
-from typing import Any, Callable, Dict, Union
+import collections
+import json
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, OrderedDict, Tuple, Union
 
-from your_generated_module import ApiBroken, ApiFailure, ApiOutage, YourGeneratedClient
+from your_generated_module import (ApiBroken, ApiFailure, ApiOutage, ApiRateLimited,
+                                   YourGeneratedClient)
 
 
 class CoolClient(YourGeneratedClient):
+    # set to 'low' so the server runs other clients' calls first when it's busy (e.g. for
+    # background syncing)
+    priority: Optional[str] = None
+    # the most ETags to remember
+    etag_cache_size = 100
+    # calls which the server didn't start (a 503 response, or a connection error) are retried this
+    # many times, waiting retry_delay seconds before the first retry and twice as long after that
+    retries = 2
+    retry_delay = 0.1
+
+    def __init__(self) -> None:
+        # {cachekey: (etag, converted result)} - lets the server reply with "304 Not Modified"
+        # when the result of an idempotent method hasn't changed. The least recently used entries
+        # are dropped first.
+        self._etags: OrderedDict[str, Tuple[str, Any]] = collections.OrderedDict()
+
     def _dispatch(
         self,
         method: str,
@@ -16,7 +37,44 @@ class CoolClient(YourGeneratedClient):
         host = '127.0.0.1'
         url = f'http://{host}:{port}/api.v1/call/{method}'
         headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
-        result = requests.post(url, json=params, headers=headers)
+        # a timeout passed to the client method is sent as the time the client will give up, so
+        # the server doesn't keep working on calls nobody is waiting for
+        timeout = params.pop('__timeout__', None)
+        if timeout is not None:
+            headers['X-Bifrost-Deadline'] = str(time.time() + timeout)
+        # every attempt of the call is sent with the same key, so if an attempt succeeded but its
+        # response was lost, the server sends that response again instead of repeating the call.
+        # Callers can pass their own idempotency_key, e.g. to retry after the app has restarted.
+        idempotency_key = params.pop('__idempotency_key__', None) or uuid.uuid4().hex
+        headers['Idempotency-Key'] = idempotency_key
+        # the per-call options above aren't part of the key
+        cachekey = method + ':' + json.dumps(params, sort_keys=True)
+        cached = self._etags.get(cachekey) if self._isIdempotent(method) else None
+        if cached is not None:
+            headers['If-None-Match'] = cached[0]
+            self._etags.move_to_end(cachekey)
+        if self.priority is not None:
+            headers['X-Bifrost-Priority'] = self.priority
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                result = requests.post(url, json=params, headers=headers, timeout=timeout)
+            except requests.Timeout as e:
+                return ApiOutage(f'Timed out waiting for {method}: {e}')
+            except requests.ConnectionError as e:
+                if attempt == self.retries:
+                    return ApiOutage(f'Could not reach Cool App server: {e}')
+                continue
+            # a 503 response means the server didn't start the call
+            if result.status_code != 503:
+                break
+        if result.status_code == 304 and cached is not None:
+            return cached[1]
+        if result.status_code == 429:
+            # this client has made too many calls recently
+            retryAfter = result.headers.get('Retry-After')
+            return ApiRateLimited(f'Rate limited, retry after {retryAfter}s: {result.text}')
         if result.status_code != 200:
             # TODO: return ApiBroken instead when appropriate
             # TODO: have more descriptive errors for various types of errors
@@ -33,4 +91,10 @@ class CoolClient(YourGeneratedClient):
         except TypeError as e:
             return ApiBroken(f'Response data from {method} was invalid: {e.args[0]}')
 
+        etag = result.headers.get('ETag')
+        if etag is not None and self._isIdempotent(method):
+            self._etags[cachekey] = (etag, ret)
+            self._etags.move_to_end(cachekey)
+            if len(self._etags) > self.etag_cache_size:
+                self._etags.popitem(last=False)
         return ret
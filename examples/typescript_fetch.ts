@@ -2,11 +2,13 @@ import {YourGeneratedClient} from 'your_generated_module';
 import {ApiFailure} from 'your_generated_module';
 import {ApiOutage} from 'your_generated_module';
 import {ApiBroken} from 'your_generated_module';
+import {ApiRateLimited} from 'your_generated_module';
 
 // re-export
 export {ApiFailure};
 export {ApiOutage};
 export {ApiBroken};
+export {ApiRateLimited};
 
 // re-export types so everything can be imported from this module
 export {YourNumberType} from 'your_generated_module';
@@ -14,6 +16,19 @@ export {YourDataclass} from 'your_generated_module';
 
 
 export class CoolClient extends YourGeneratedClient {
+  // the last response of each idempotent call, so the server can reply with "304 Not Modified"
+  // when the result hasn't changed
+  private etags: Map<string, {etag: string, result: any}> = new Map();
+  // the most ETags to remember - the least recently used are dropped first
+  public etagCacheSize: number = 100;
+  // set to 'low' so the server runs other clients' calls first when it's busy (e.g. for
+  // background syncing)
+  public priority: string | null = null;
+  // calls which the server didn't start (a 503 response, or a network error) are retried this
+  // many times, waiting retryDelay seconds before the first retry and twice as long after that
+  public retries: number = 2;
+  public retryDelay: number = 0.1;
+
   constructor(private base_url: string) {
     super();
   }
@@ -27,35 +42,112 @@ export class CoolClient extends YourGeneratedClient {
 
     let resp: undefined|Response = undefined;
 
-    const p = window.fetch(url, {
-      method: "POST",
-
-      // TODO: finalise good cross-origin sample code
-      mode: 'cors',
-      credentials: "include",
+    const timeout: number | undefined = params['__timeout__'];
+    delete params['__timeout__'];
+    // every attempt of the call is sent with the same key, so if an attempt succeeded but its
+    // response was lost, the server sends that response again instead of repeating the call.
+    // Callers can pass their own idempotency_key, e.g. to retry after the page has reloaded.
+    const idempotencyKey: string = params['__idempotency_key__'] ?? crypto.randomUUID();
+    delete params['__idempotency_key__'];
 
-      headers: {
-        'Accept': 'application/json',
-        'Content-Type': 'application/json',
-      },
+    // the per-call options above aren't part of the key
+    const cachekey = method + ':' + JSON.stringify(params);
+    const cached = this.isIdempotent(method) ? this.etags.get(cachekey) : undefined;
+    if (cached !== undefined) {
+      // Maps iterate in insertion order, so this marks the entry as the most recently used
+      this.etags.delete(cachekey);
+      this.etags.set(cachekey, cached);
+    }
+    const headers: {[k: string]: string} = {
+      'Accept': 'application/json',
+      'Content-Type': 'application/json',
+    };
+    headers['Idempotency-Key'] = idempotencyKey;
+    if (cached !== undefined) {
+      headers['If-None-Match'] = cached.etag;
+    }
+    if (this.priority !== null) {
+      headers['X-Bifrost-Priority'] = this.priority;
+    }
 
-      cache: "no-cache",
-      body: JSON.stringify(params),
-    });
+    // a timeout passed to the client method is sent as the time the client will give up, so the
+    // server doesn't keep working on calls nobody is waiting for
+    const controller = new AbortController();
+    let timer: number | undefined = undefined;
+    if (timeout !== undefined) {
+      headers['X-Bifrost-Deadline'] = `${Date.now() / 1000 + timeout}`;
+      timer = window.setTimeout(() => controller.abort(), timeout * 1000);
+    }
 
     try {
-      resp = await p;
-    } catch(e) {
-      if (e.message == "NetworkError when attempting to fetch resource.") {
-        return new ApiOutage(e.message);
+      for (let attempt = 0; attempt <= this.retries; attempt++) {
+        if (attempt > 0) {
+          const delay = this.retryDelay * 2 ** (attempt - 1) * 1000;
+          await new Promise((resolve) => window.setTimeout(resolve, delay));
+        }
+        try {
+          resp = await window.fetch(url, {
+            method: "POST",
+
+            // TODO: finalise good cross-origin sample code
+            mode: 'cors',
+            credentials: "include",
+
+            headers: headers,
+
+            cache: "no-cache",
+            body: JSON.stringify(params),
+            signal: controller.signal,
+          });
+        } catch(e) {
+          if (controller.signal.aborted) {
+            return new ApiOutage(`Timed out waiting for ${method}`);
+          }
+          if (e.message == "NetworkError when attempting to fetch resource.") {
+            if (attempt < this.retries) {
+              continue;
+            }
+            return new ApiOutage(e.message);
+          }
+
+          // anything else becomes a system error
+          return new ApiBroken('System error: ' + e.message);
+        }
+        // a 503 response means the server didn't start the call
+        if (resp.status !== 503) {
+          break;
+        }
       }
+    } finally {
+      window.clearTimeout(timer);
+    }
 
-      // anything else becomes a system error
-      return new ApiBroken('System error: ' + e.message);
+    if (resp.status === 304 && cached !== undefined) {
+      return cached.result;
     }
 
     if (resp.ok) {
-        return converter(await resp.json());
+      const result = converter(await resp.json());
+      const etag = resp.headers.get('ETag');
+      if (etag !== null && this.isIdempotent(method)) {
+        this.etags.delete(cachekey);
+        this.etags.set(cachekey, {etag: etag, result: result});
+        if (this.etags.size > this.etagCacheSize) {
+          this.etags.delete(this.etags.keys().next().value);
+        }
+      }
+      return result;
+    }
+
+    if (resp.status === 503) {
+      // the server is overloaded - try again later (see the Retry-After header)
+      return new ApiOutage(`Server is too busy: ${await resp.text()}`);
+    }
+
+    if (resp.status === 429) {
+      // this client has made too many calls recently
+      const retryAfter = resp.headers.get('Retry-After');
+      return new ApiRateLimited(`Rate limited, retry after ${retryAfter}s: ${await resp.text()}`);
     }
 
     // TODO: handle different values of Response.type as per:
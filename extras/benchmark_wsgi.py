@@ -0,0 +1,75 @@
+"""
+Compare per-call overhead of the Flask blueprint against BifrostRPCService.get_wsgi_app().
+
+Both apps are called directly through the WSGI interface with identical environs, so the numbers
+only include the server-side work done for each call.
+
+Usage: python extras/benchmark_wsgi.py [NUMBER_OF_CALLS]
+"""
+import io
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, List, NewType, Tuple
+from wsgiref.util import setup_testing_defaults
+
+from flask import Flask
+
+from bifrostrpc import BifrostRPCService
+
+UserID = NewType('UserID', int)
+
+
+def makeService() -> BifrostRPCService:
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(1))
+
+    @service.rpcmethod
+    def add(user: UserID, a: int, b: int) -> int:
+        return a + b
+
+    return service
+
+
+def makeEnviron(body: bytes) -> Dict[str, Any]:
+    environ: Dict[str, Any] = {
+        'PATH_INFO': '/api.v1/call/add',
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+    setup_testing_defaults(environ)
+    return environ
+
+
+def bench(app: Callable[..., Any], calls: int) -> float:
+    body = json.dumps({'a': 1, 'b': 2}).encode()
+
+    def start_response(status: str, headers: List[Tuple[str, str]]) -> None:
+        assert status.startswith('200'), status
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        environ = makeEnviron(body)
+        b''.join(app(environ, start_response))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    service = makeService()
+
+    flaskapp = Flask('benchmark')
+    flaskapp.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+
+    results = {
+        'flask blueprint': bench(flaskapp.wsgi_app, calls),
+        'get_wsgi_app()': bench(service.get_wsgi_app(), calls),
+    }
+    for name, elapsed in results.items():
+        print(f'{name:>16}: {elapsed / calls * 1e6:8.1f}us per call ({calls} calls)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,22 @@
 # pylint: disable=unnecessary-lambda
 from dataclasses import dataclass
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Literal, NewType, Union
+from typing import Dict, List, Literal, NewType, Set, Union
 
-from flask import Flask, session
+from flask import Flask, Response, request, session
 
 from bifrostrpc import AuthFailure, BifrostRPCService
+from bifrostrpc.idempotency import (IDEMPOTENCY_HEADER, REPLAYED_HEADER,
+                                    IdempotencyPolicy)
+from tests.scenarios.contacts import Address, Contact, Delivery
+from tests.scenarios.events import Event, Venue
+from tests.scenarios.paints import Colour, Finish, Paint
 from tests.scenarios.pets import Pet
 
 DEMO_SERVICE_ROOT = Path(__file__).parent
 
-service = BifrostRPCService()
+service = BifrostRPCService(idempotency=IdempotencyPolicy(60))
 
 # test having a simple NewType
 # TODO: add a test to ensure the clients are applying utilising the NewType correctly and that
@@ -36,13 +42,22 @@ def get_session_user() -> SessionUser:
     return SessionUser(username)
 
 
-service.addAuthType(NoLogin, lambda: NoLogin())
-service.addAuthType(SessionUser, get_session_user)
+# Idempotency-Keys are scoped to the caller
+service.addAuthType(NoLogin, lambda: NoLogin(), identity=lambda _: None)
+service.addAuthType(SessionUser, get_session_user, identity=lambda user: user.username)
 service.addNewType(UserName)
 service.addDataclass(Pet)
+service.addDataclass(Event)
+service.addDataclass(Venue)
+service.addEnum(Colour)
+service.addEnum(Finish, encoding='int')
+service.addDataclass(Paint)
+service.addTypedDict(Address)
+service.addTypedDict(Contact)
+service.addDataclass(Delivery)
 
 
-@service.rpcmethod
+@service.rpcmethod(idempotent=True)
 def get_reversed(_: NoLogin, input_: str) -> str:
     return input_[::-1]
 
@@ -76,6 +91,59 @@ def check_pets(_: NoLogin, pets: Dict[str, Pet]) -> str:
     return "pets_ok!"
 
 
+@service.rpcmethod
+def get_event(_: NoLogin) -> Event:
+    return Event(
+        eventName='Launch',
+        starts=datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        reminders=[datetime(2020, 1, 1, 3, 4, 5, tzinfo=timezone.utc)],
+        venue=None,
+        registered={'Basil': None},
+    )
+
+
+@service.rpcmethod
+def describe_event(_: NoLogin, event: Event) -> str:
+    return f"{event.eventName} starts {event.starts.isoformat()}"
+
+
+@service.rpcmethod
+def describe_times(_: NoLogin, times: List[datetime]) -> str:
+    return ','.join(t.isoformat() for t in times)
+
+
+@service.rpcmethod
+def get_paint(_: NoLogin) -> Paint:
+    return Paint(
+        colour=Colour.RED,
+        finish=Finish.GLOSS,
+        mixes=[Colour.GREEN],
+        rooms={'kitchen': Finish.MATTE},
+    )
+
+
+@service.rpcmethod
+def describe_paint(_: NoLogin, paint: Paint) -> str:
+    finish = paint.finish.name if paint.finish else 'no'
+    return f"{paint.colour.name} with {finish} finish"
+
+
+@service.rpcmethod
+def get_delivery(_: NoLogin) -> Delivery:
+    return Delivery(
+        parcelId=17,
+        destination={'street': '2 High St', 'postcode': '2000'},
+        recipient={'contactName': 'Billy'},
+    )
+
+
+@service.rpcmethod
+def describe_contact(_: NoLogin, contact: Contact) -> str:
+    address = contact.get('address')
+    where = address['street'] if address else 'nowhere'
+    return f"{contact.get('contactName')} at {where} with {len(contact.get('phones', []))} phones"
+
+
 @service.rpcmethod
 def login(_: NoLogin, username: str, password: str) -> Union[Literal[True], str]:
     if username == 'neo' and password == 'trinity':
@@ -101,6 +169,24 @@ def logout(_: NoLogin) -> None:
     session.pop('current_user', None)
 
 
+# the number of times record_payment() has run, and the number of its responses which were replays
+# of an earlier attempt's response
+payment_counts = {'runs': 0, 'replayed': 0}
+# Idempotency-Keys of the record_payment() calls whose first response has been lost
+lost_payment_keys: Set[str] = set()
+
+
+@service.rpcmethod
+def record_payment(_: NoLogin, amount: int) -> int:
+    payment_counts['runs'] += 1
+    return amount
+
+
+@service.rpcmethod
+def get_payment_counts(_: NoLogin) -> List[int]:
+    return [payment_counts['runs'], payment_counts['replayed']]
+
+
 # TODO: test addInternalType()
 # TODO: test addExternalType()
 
@@ -109,3 +195,18 @@ app = Flask('tests.demo_service')
 app.register_blueprint(service.get_flask_blueprint('demo_service', 'tests.demo_service'))
 # this is required for session usage
 app.secret_key = 'unit_test_secret'
+
+
+@app.after_request
+def lose_first_payment_response(response: Response) -> Response:
+    """Replace the first response of each record_payment() call with a 503, as if it was lost."""
+    if not request.path.endswith('/record_payment'):
+        return response
+    if response.headers.get(REPLAYED_HEADER):
+        payment_counts['replayed'] += 1
+        return response
+    key = request.headers.get(IDEMPOTENCY_HEADER, '')
+    if key in lost_payment_keys:
+        return response
+    lost_payment_keys.add(key)
+    return Response('Lost the response', status=503)
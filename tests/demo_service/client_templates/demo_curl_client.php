@@ -1,10 +1,38 @@
 <?php
 
+class DemoBatchResult {
+    // the converted result (or an ApiFailure), set once the batch has been sent
+    public $value = null;
+}
+
+class DemoBatchQueued extends Exception {
+    public $result;
+
+    public function __construct(DemoBatchResult $result) {
+        parent::__construct('The call was added to a batch');
+        $this->result = $result;
+    }
+}
+
 class DemoCurlClient extends ClientBase {
     private $host;
     private $port;
     private $cookiejar;
     private $on_error;
+    // [cachekey => [etag, converted result]] for the last response of each idempotent call,
+    // least recently used first
+    private $etags = [];
+    // the most ETags to remember
+    public $etag_cache_size = 100;
+    // calls which the server didn't start (a 503 response, or a connection error) are retried
+    // this many times, waiting retry_delay seconds before the first retry and twice as long after
+    public $retries = 2;
+    public $retry_delay = 0.1;
+    // calls are added to $queued instead of being made while $queuing is true
+    private $queuing = false;
+    private $queued = [];
+    // e.g. 'low' for background syncing
+    public $priority = null;
 
     public function __construct($host, $port, $cookiejar, $on_error) {
         $this->host = $host;
@@ -13,24 +41,54 @@ class DemoCurlClient extends ClientBase {
         $this->on_error = $on_error;
     }
 
-    public function _dispatch(
-        string $method,
-        array $params,
-        $converter_name
-    ) {
-        $url = "http://{$this->host}:{$this->port}/api.v1/call/{$method}";
+    /**
+     * Add a call to the next batch instead of making it now, e.g.
+     *
+     *   $user = $client->queue(fn () => $client->getUser(5));
+     *   $client->sendBatch();
+     *   $user->value;
+     */
+    public function queue(callable $fn): DemoBatchResult {
+        $this->queuing = true;
+        try {
+            $fn();
+        } catch (DemoBatchQueued $e) {
+            return $e->result;
+        } finally {
+            $this->queuing = false;
+        }
+        throw new Exception('The queued function did not call a client method');
+    }
+
+    private function getHeaders(): array {
         $headers = [
             'Accept: application/json',
             'Content-Type: application/json',
         ];
-        $ch = curl_init($url);
+        if ($this->priority !== null) {
+            $headers[] = "X-Bifrost-Priority: {$this->priority}";
+        }
+        return $headers;
+    }
+
+    public function sendBatch(bool $concurrent = false) {
+        $calls = $this->queued;
+        $this->queued = [];
+        if (!$calls) {
+            return;
+        }
+
+        $body = [
+            'calls' => array_map(function ($c) {
+                return ['method' => $c[0], 'params' => (object)$c[1]];
+            }, $calls),
+            'concurrent' => $concurrent,
+        ];
+        $ch = curl_init("http://{$this->host}:{$this->port}/api.v1/batch");
         curl_setopt($ch, CURLOPT_CUSTOMREQUEST, "POST");
-        curl_setopt($ch, CURLOPT_HEADER, 0);
-        curl_setopt($ch, CURLOPT_HTTPHEADER, $headers);
-        curl_setopt($ch, CURLOPT_POSTFIELDS, json_encode($params));
+        curl_setopt($ch, CURLOPT_HTTPHEADER, $this->getHeaders());
+        curl_setopt($ch, CURLOPT_POSTFIELDS, json_encode($body));
         curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
-
-        // this is required if we want to use HTTP sessions
         curl_setopt($ch, CURLOPT_COOKIEJAR, $this->cookiejar);
         curl_setopt($ch, CURLOPT_COOKIEFILE, $this->cookiejar);
 
@@ -41,6 +99,119 @@ class DemoCurlClient extends ClientBase {
         }
 
         $info = curl_getinfo($ch);
+        $items = $info['http_code'] === 200 ? json_decode($result, true) : null;
+        foreach ($calls as $i => [$method, $params, $converter_name, $queued]) {
+            if ($info['http_code'] === 503) {
+                $queued->value = new ApiOutage("Server is too busy: {$result}");
+            } elseif ($info['http_code'] === 429) {
+                $queued->value = new ApiRateLimited("Rate limited: {$result}");
+            } elseif ($items === null) {
+                $queued->value = new ApiBroken("Unexpected HTTP {$info['http_code']} response from rpc server: {$result}");
+            } elseif ($items[$i]['status'] === 401) {
+                $queued->value = new ApiUnauthorized("HTTP 401 Unauthorized: {$items[$i]['error']}");
+            } elseif ($items[$i]['status'] === 503) {
+                $queued->value = new ApiOutage("Server is too busy: {$items[$i]['error']}");
+            } elseif ($items[$i]['status'] === 429) {
+                $queued->value = new ApiRateLimited($items[$i]['error']);
+            } elseif ($items[$i]['status'] !== 200) {
+                $queued->value = new ApiBroken("Unexpected HTTP {$items[$i]['status']} response from rpc server: {$items[$i]['error']}");
+            } else {
+                $queued->value = $this->{$converter_name}($items[$i]['result']);
+            }
+        }
+    }
+
+    public function _dispatch(
+        string $method,
+        array $params,
+        $converter_name
+    ) {
+        if ($this->queuing) {
+            $queued = new DemoBatchResult();
+            $this->queued[] = [$method, $params, $converter_name, $queued];
+            // unwind out of the client method without needing a value of its return type
+            throw new DemoBatchQueued($queued);
+        }
+
+        $url = "http://{$this->host}:{$this->port}/api.v1/call/{$method}";
+        $headers = $this->getHeaders();
+        // the server is told when this client will give up on the call
+        $timeout = $params['__timeout__'] ?? null;
+        unset($params['__timeout__']);
+        if ($timeout !== null) {
+            $headers[] = 'X-Bifrost-Deadline: ' . (microtime(true) + $timeout);
+        }
+        // every attempt of the call is sent with the same key, so the server replays the response
+        // of an attempt which succeeded instead of running the method again
+        $idempotency_key = $params['__idempotency_key__'] ?? bin2hex(random_bytes(16));
+        unset($params['__idempotency_key__']);
+        $headers[] = "Idempotency-Key: {$idempotency_key}";
+        // the per-call options above aren't part of the key
+        $cachekey = $method . ':' . json_encode($params);
+        $cached = $this->_isIdempotent($method) ? ($this->etags[$cachekey] ?? null) : null;
+        if ($cached !== null) {
+            $headers[] = "If-None-Match: {$cached[0]}";
+            // arrays keep their insertion order, so this marks the entry as the most recently used
+            unset($this->etags[$cachekey]);
+            $this->etags[$cachekey] = $cached;
+        }
+        for ($attempt = 0; $attempt <= $this->retries; $attempt++) {
+            if ($attempt > 0) {
+                usleep((int)($this->retry_delay * 2 ** ($attempt - 1) * 1000000));
+            }
+            $etag = null;
+            $retry_after = null;
+            $ch = curl_init($url);
+            curl_setopt($ch, CURLOPT_CUSTOMREQUEST, "POST");
+            curl_setopt($ch, CURLOPT_HEADER, 0);
+            curl_setopt($ch, CURLOPT_HEADERFUNCTION, function ($ch, $line) use (&$etag, &$retry_after) {
+                $parts = explode(':', $line, 2);
+                if (count($parts) === 2 && strtolower(trim($parts[0])) === 'etag') {
+                    $etag = trim($parts[1]);
+                }
+                if (count($parts) === 2 && strtolower(trim($parts[0])) === 'retry-after') {
+                    $retry_after = trim($parts[1]);
+                }
+                return strlen($line);
+            });
+            curl_setopt($ch, CURLOPT_HTTPHEADER, $headers);
+            curl_setopt($ch, CURLOPT_POSTFIELDS, json_encode($params));
+            curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+            if ($timeout !== null) {
+                curl_setopt($ch, CURLOPT_TIMEOUT_MS, (int)ceil($timeout * 1000));
+            }
+
+            // this is required if we want to use HTTP sessions
+            curl_setopt($ch, CURLOPT_COOKIEJAR, $this->cookiejar);
+            curl_setopt($ch, CURLOPT_COOKIEFILE, $this->cookiejar);
+
+            $result = curl_exec($ch);
+            if ($result === false && curl_errno($ch) === CURLE_OPERATION_TIMEDOUT) {
+                $e = new ApiOutage("Timed out waiting for {$method}");
+                if ($this->on_error === 'raise') {
+                    throw $e;
+                }
+
+                return $e;
+            }
+            if ($result === false) {
+                if ($attempt < $this->retries) {
+                    continue;
+                }
+                $err = curl_error($ch);
+                throw new Exception("CURL ERROR: $err");
+            }
+
+            $info = curl_getinfo($ch);
+            // a 503 response means the server didn't start the call
+            if ($info['http_code'] !== 503) {
+                break;
+            }
+        }
+
+        if ($info['http_code'] === 304 && $cached !== null) {
+            return $cached[1];
+        }
 
         if ($info['http_code'] === 401) {
             $e = new ApiUnauthorized("HTTP 401 Unauthorized: $result");
@@ -51,6 +222,26 @@ class DemoCurlClient extends ClientBase {
             return $e;
         }
 
+        if ($info['http_code'] === 503) {
+            // the server is overloaded - try again later
+            $e = new ApiOutage("Server is too busy: {$result}");
+            if ($this->on_error === 'raise') {
+                throw $e;
+            }
+
+            return $e;
+        }
+
+        if ($info['http_code'] === 429) {
+            // this client has made too many calls recently
+            $e = new ApiRateLimited("Retry after {$retry_after}s: {$result}");
+            if ($this->on_error === 'raise') {
+                throw $e;
+            }
+
+            return $e;
+        }
+
         if ($info['http_code'] !== 200) {
             # TODO: test this code path when we rework errors
             $e = new ApiBroken("Unexpected HTTP {$info['http_code']} response from rpc server: {$result}");
@@ -66,6 +257,13 @@ class DemoCurlClient extends ClientBase {
 
         // TODO: should return or raise ApiBroken() when the converter fails
         $ret = $this->{$converter_name}($data);
+        if ($etag !== null && $this->_isIdempotent($method)) {
+            unset($this->etags[$cachekey]);
+            $this->etags[$cachekey] = [$etag, $ret];
+            if (count($this->etags) > $this->etag_cache_size) {
+                unset($this->etags[array_key_first($this->etags)]);
+            }
+        }
         return $ret;
     }
 }
@@ -2,14 +2,132 @@ import {ClientBase} from './generated_client';
 import {ApiFailure} from './generated_client';
 import {ApiOutage} from './generated_client';
 import {ApiBroken} from './generated_client';
+import {ApiRateLimited} from './generated_client';
+import {randomUUID} from 'crypto';
+
+
+interface QueuedCall {
+  method: string;
+  params: {[k: string]: any};
+  converter: (result: any) => any;
+  resolve: (result: ApiFailure | any) => void;
+}
 
 
 export class DemoClient extends ClientBase {
+  // when true, calls made in the same microtask window are sent together in a single request to
+  // /api.v1/batch
+  public batching: boolean = false;
+  private queued: QueuedCall[] = [];
+  // e.g. 'low' for background syncing
+  public priority: string | null = null;
+
+  // the last response of each idempotent call, so the server can reply with "304 Not Modified"
+  // when the result hasn't changed
+  private etags: Map<string, {etag: string, result: any}> = new Map();
+  // the most ETags to remember - the least recently used are dropped first
+  public etagCacheSize: number = 100;
+  // calls which the server didn't start (a 503 response, or a connection error) are retried this
+  // many times, waiting retryDelay seconds before the first retry and twice as long after that
+  public retries: number = 2;
+  public retryDelay: number = 0.1;
+
   public constructor(public host: string, public port: number) {
     super();
   }
 
-  public async dispatch(
+  public dispatch(
+    method: string,
+    params: {[k: string]: any},
+    converter: (result: any) => any,
+  ): Promise<ApiFailure | any> {
+    if (!this.batching) {
+      return this.send(method, params, converter);
+    }
+
+    return new Promise((resolve) => {
+      this.queued.push({method, params, converter, resolve});
+      if (this.queued.length === 1) {
+        // send everything queued by the time the current microtasks have run
+        Promise.resolve().then(() => this.flush());
+      }
+    });
+  }
+
+  private async flush(): Promise<void> {
+    const calls = this.queued;
+    this.queued = [];
+    if (calls.length === 1) {
+      const c = calls[0];
+      c.resolve(await this.send(c.method, c.params, c.converter));
+      return;
+    }
+
+    const results = await this.sendBatch(calls);
+    calls.forEach((c, i) => c.resolve(results[i]));
+  }
+
+  private getHeaders(): {[k: string]: string} {
+    const headers: {[k: string]: string} = {
+      'Accept': 'application/json',
+      'Content-Type': 'application/json',
+    };
+    if (this.priority !== null) {
+      headers['X-Bifrost-Priority'] = this.priority;
+    }
+    return headers;
+  }
+
+  private async sendBatch(calls: QueuedCall[]): Promise<Array<ApiFailure | any>> {
+    const url = `http://${this.host}:${this.port}/api.v1/batch`;
+    let resp: Response;
+    try {
+      resp = await fetch(url, {
+        method: "POST",
+        headers: this.getHeaders(),
+        body: JSON.stringify({
+          calls: calls.map((c) => ({method: c.method, params: c.params})),
+        }),
+      });
+    } catch(e) {
+      const failure = new ApiOutage(e instanceof Error ? e.message : `${e}`);
+      return calls.map(() => failure);
+    }
+
+    if (resp.status === 503) {
+      // the server is overloaded - try again later
+      const failure = new ApiOutage(`Server is too busy: ${await resp.text()}`);
+      return calls.map(() => failure);
+    }
+
+    if (resp.status === 429) {
+      const failure = new ApiRateLimited(
+        `Retry after ${resp.headers.get('Retry-After')}s: ${await resp.text()}`,
+      );
+      return calls.map(() => failure);
+    }
+
+    if (!resp.ok) {
+      const failure = new ApiBroken(`Error making request: ${resp.status} ${resp.statusText}`);
+      return calls.map(() => failure);
+    }
+
+    const items: Array<{status: number, result?: any, error?: string}> = await resp.json();
+    return items.map((item, i) => {
+      if (item.status === 200) {
+        return calls[i].converter(item.result);
+      }
+      if (item.status === 503) {
+        return new ApiOutage(`Server is too busy: ${item.error}`);
+      }
+      if (item.status === 429) {
+        return new ApiRateLimited(`${item.error}`);
+      }
+      return new ApiBroken(`Error making request: ${item.status}: ${item.error}`);
+    });
+  }
+
+  private async send(
     method: string,
     params: {[k: string]: any},
     converter: (result: any) => any,
@@ -18,41 +136,111 @@ export class DemoClient extends ClientBase {
     const url = base_url + '/api.v1/call/' + method;
     let resp: undefined|Response = undefined;
 
-    const p = fetch(url, {
-      method: "POST",
+    const timeout: number | undefined = params['__timeout__'];
+    delete params['__timeout__'];
+    // every attempt of the call is sent with the same key, so the server replays the response of
+    // an attempt which succeeded instead of running the method again
+    const idempotencyKey: string = params['__idempotency_key__'] ?? randomUUID();
+    delete params['__idempotency_key__'];
 
-      // TODO: finalise good cross-origin sample code
-      // XXX: node-fetch types don't include `mode` or `credentials` or `cache`
-      //mode: 'cors',
-      //credentials: "include",
-      //cache: "no-cache",
+    // the per-call options above aren't part of the key
+    const cachekey = method + ':' + JSON.stringify(params);
+    const cached = this.isIdempotent(method) ? this.etags.get(cachekey) : undefined;
+    if (cached !== undefined) {
+      // Maps iterate in insertion order, so this marks the entry as the most recently used
+      this.etags.delete(cachekey);
+      this.etags.set(cachekey, cached);
+    }
+    const headers = this.getHeaders();
+    headers['Idempotency-Key'] = idempotencyKey;
+    if (cached !== undefined) {
+      headers['If-None-Match'] = cached.etag;
+    }
 
-      headers: {
-        'Accept': 'application/json',
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify(params),
-    });
+    // the server is told when this client will give up on the call
+    const controller = new AbortController();
+    let timer: ReturnType<typeof setTimeout> | undefined = undefined;
+    if (timeout !== undefined) {
+      headers['X-Bifrost-Deadline'] = `${Date.now() / 1000 + timeout}`;
+      timer = setTimeout(() => controller.abort(), timeout * 1000);
+    }
 
     try {
-      resp = await p;
-    } catch(e) {
-      if (e instanceof Error) {
-        if (e.message == "NetworkError when attempting to fetch resource.") {
-          // TODO: test this code path
-          return new ApiOutage(e.message);
+      for (let attempt = 0; attempt <= this.retries; attempt++) {
+        if (attempt > 0) {
+          const delay = this.retryDelay * 2 ** (attempt - 1) * 1000;
+          await new Promise((resolve) => setTimeout(resolve, delay));
         }
+        try {
+          resp = await fetch(url, {
+            method: "POST",
+
+            // TODO: finalise good cross-origin sample code
+            // XXX: node-fetch types don't include `mode` or `credentials` or `cache`
+            //mode: 'cors',
+            //credentials: "include",
+            //cache: "no-cache",
+
+            headers: headers,
+            body: JSON.stringify(params),
+            signal: controller.signal,
+          });
+        } catch(e) {
+          if (controller.signal.aborted) {
+            return new ApiOutage(`Timed out waiting for ${method}`);
+          }
+          if (e instanceof Error) {
+            if (attempt < this.retries) {
+              continue;
+            }
+            if (e.message == "NetworkError when attempting to fetch resource.") {
+              // TODO: test this code path
+              return new ApiOutage(e.message);
+            }
+
+            // anything else becomes a system error
+            // TODO: test this code path
+            return new ApiBroken('System error: ' + e.message);
+          }
 
-        // anything else becomes a system error
-        // TODO: test this code path
-        return new ApiBroken('System error: ' + e.message);
+          throw new Error(`Unexpected error type ${e}`)
+        }
+        // a 503 response means the server didn't start the call
+        if (resp.status !== 503) {
+          break;
+        }
       }
+    } finally {
+      clearTimeout(timer);
+    }
 
-      throw new Error(`Unexpected error type ${e}`)
+    if (resp.status === 304 && cached !== undefined) {
+      return cached.result;
     }
 
     if (resp.ok) {
-        return converter(await resp.json());
+      const result = converter(await resp.json());
+      const etag = resp.headers.get('ETag');
+      if (etag !== null && this.isIdempotent(method)) {
+        this.etags.delete(cachekey);
+        this.etags.set(cachekey, {etag: etag, result: result});
+        if (this.etags.size > this.etagCacheSize) {
+          this.etags.delete(this.etags.keys().next().value);
+        }
+      }
+      return result;
+    }
+
+    if (resp.status === 503) {
+      // the server is overloaded - try again later
+      return new ApiOutage(`Server is too busy: ${await resp.text()}`);
+    }
+
+    if (resp.status === 429) {
+      // this client has made too many calls recently
+      return new ApiRateLimited(
+        `Retry after ${resp.headers.get('Retry-After')}s: ${await resp.text()}`,
+      );
     }
 
     // TODO: deal with other error conditions
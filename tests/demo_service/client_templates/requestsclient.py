@@ -1,33 +1,185 @@
+import collections
+import contextlib
+import json
 import os
-from typing import Any, Callable, Dict, Union
+import time
+import uuid
+from typing import (Any, Callable, Dict, Generic, Iterator, List, Optional,
+                    OrderedDict, Tuple, TypeVar, Union)
 
 import requests
 from generated_client import (ApiBroken, ApiFailure, ApiOutage,
-                              ApiUnauthorized, ClientBase)
+                              ApiRateLimited, ApiUnauthorized, ClientBase)
+
+T = TypeVar('T')
+
+
+class BatchResult(Generic[T]):
+    def __init__(self) -> None:
+        # the converted result (or an ApiFailure), set once the batch has been sent
+        self.value: Union[ApiFailure, T, None] = None
+
+
+class Batch:
+    def __init__(self) -> None:
+        self.calls: List[Tuple[str, Dict[str, Any], Callable[[Any], Any], BatchResult[Any]]] = []
+        self.queuing = False
+
+    def call(self, fn: Callable[..., Union[ApiFailure, T]], *args: Any) -> BatchResult[T]:
+        """Add a call of one of the client's methods to the batch, e.g.
+
+            batch.call(client.getUser, 5)
+        """
+        self.queuing = True
+        try:
+            queued: BatchResult[T] = fn(*args)  # type: ignore
+        finally:
+            self.queuing = False
+        return queued
 
 
 class RequestsPythonClient(ClientBase):
     def __init__(self) -> None:
         self._session = requests.Session()
+        # {cachekey: (etag, converted result)} for idempotent methods, least recently used first
+        self._etags: OrderedDict[str, Tuple[str, Any]] = collections.OrderedDict()
+        self.etag_cache_size = 100
+        # calls which the server didn't start (a 503 response, or a connection error when it's
+        # safe to send the call again) are retried this many times, with exponential backoff
+        self.retries = 2
+        self.retry_delay = 0.1
+        self._batch: Optional[Batch] = None
+        # e.g. 'low' for background syncing
+        self.priority: Optional[str] = None
 
-    def _dispatch(
-        self,
-        method: str,
-        params: Dict[str, Any],
-        converter: Callable[[Any], Any],
-    ) -> Union[ApiFailure, Any]:
+    def _getBaseURL(self) -> str:
         port = int(os.environ['DEMO_SERVICE_PORT'])
         host = '127.0.0.1'
-        url = f'http://{host}:{port}/api.v1/call/{method}'
+        return f'http://{host}:{port}'
+
+    @contextlib.contextmanager
+    def batch(self, *, concurrent: bool = False) -> Iterator[Batch]:
+        """Send the calls added to the batch in a single request at the end of the block."""
+        batch = self._batch = Batch()
+        try:
+            yield batch
+        finally:
+            self._batch = None
+        self._sendBatch(batch, concurrent)
+
+    def _getHeaders(self) -> Dict[str, str]:
         headers = {
             'Accept': 'application/json',
             'Content-Type': 'application/json',
         }
-        result = self._session.post(url, json=params, headers=headers)
+        if self.priority is not None:
+            headers['X-Bifrost-Priority'] = self.priority
+        return headers
+
+    def _sendBatch(self, batch: Batch, concurrent: bool) -> None:
+        if not batch.calls:
+            return
+
+        result = self._session.post(
+            self._getBaseURL() + '/api.v1/batch',
+            json={
+                'calls': [{'method': m, 'params': p} for m, p, _, _ in batch.calls],
+                'concurrent': concurrent,
+            },
+            headers=self._getHeaders(),
+        )
+        items: List[Dict[str, Any]] = []
+        failure: Optional[ApiFailure] = None
+        if result.status_code == 401:
+            failure = ApiUnauthorized(f'HTTP 401 Unauthorized: {result.text}')
+        elif result.status_code == 429:
+            failure = ApiRateLimited(
+                f'Retry after {result.headers.get("Retry-After")}s: {result.text}'
+            )
+        elif result.status_code != 200:
+            failure = ApiOutage(
+                f'Unexpected HTTP {result.status_code} response from rpc server: {result.text}'
+            )
+        else:
+            try:
+                items = result.json()
+            except Exception as e:
+                failure = ApiBroken(f'Response was not valid JSON: {e.args[0]}')
+
+        for i, (method, _, converter, queued) in enumerate(batch.calls):
+            if failure is not None:
+                queued.value = failure
+                continue
+            item = items[i]
+            if item['status'] == 401:
+                queued.value = ApiUnauthorized(f'HTTP 401 Unauthorized: {item["error"]}')
+            elif item['status'] == 429:
+                queued.value = ApiRateLimited(item['error'])
+            elif item['status'] != 200:
+                queued.value = ApiOutage(
+                    f'Unexpected HTTP {item["status"]} response from rpc server: {item["error"]}'
+                )
+            else:
+                try:
+                    queued.value = converter(item['result'])
+                except TypeError as e:
+                    queued.value = ApiBroken(
+                        f'Response data from {method} was invalid: {e.args[0]}'
+                    )
+
+    def _dispatch(
+        self,
+        method: str,
+        params: Dict[str, Any],
+        converter: Callable[[Any], Any],
+    ) -> Union[ApiFailure, Any]:
+        if self._batch is not None and self._batch.queuing:
+            queued: BatchResult[Any] = BatchResult()
+            self._batch.calls.append((method, params, converter, queued))
+            return queued
+
+        url = f'{self._getBaseURL()}/api.v1/call/{method}'
+        headers = self._getHeaders()
+        # the server is told when this client will give up on the call
+        timeout = params.pop('__timeout__', None)
+        if timeout is not None:
+            headers['X-Bifrost-Deadline'] = str(time.time() + timeout)
+        # every attempt of the call is sent with the same key, so the server replays the response
+        # of an attempt which succeeded instead of running the method again
+        idempotency_key = params.pop('__idempotency_key__', None)
+        if idempotency_key is None:
+            idempotency_key = uuid.uuid4().hex
+        headers['Idempotency-Key'] = idempotency_key
+        # the per-call options above aren't part of the key
+        cachekey = method + ':' + json.dumps(params, sort_keys=True)
+        cached = self._etags.get(cachekey) if self._isIdempotent(method) else None
+        if cached is not None:
+            headers['If-None-Match'] = cached[0]
+            self._etags.move_to_end(cachekey)
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                result = self._session.post(url, json=params, headers=headers, timeout=timeout)
+            except requests.Timeout as e:
+                return ApiOutage(f'Timed out waiting for {method}: {e}')
+            except requests.ConnectionError as e:
+                if attempt == self.retries:
+                    return ApiOutage(f'Could not send {method}: {e}')
+                continue
+            # a 503 response means the server didn't start the call
+            if result.status_code != 503:
+                break
+        if result.status_code == 304 and cached is not None:
+            return cached[1]
         if result.status_code == 401:
             return ApiUnauthorized(
                 f'HTTP 401 Unauthorized: {result.text}'
             )
+        if result.status_code == 429:
+            return ApiRateLimited(
+                f'Retry after {result.headers.get("Retry-After")}s: {result.text}'
+            )
         if result.status_code != 200:
             # TODO: return ApiBroken instead when appropriate
             # TODO: have more descriptive errors for various types of errors
@@ -47,4 +199,10 @@ class RequestsPythonClient(ClientBase):
         except TypeError as e:
             return ApiBroken(f'Response data from {method} was invalid: {e.args[0]}')
 
+        etag = result.headers.get('ETag')
+        if etag is not None and self._isIdempotent(method):
+            self._etags[cachekey] = (etag, ret)
+            self._etags.move_to_end(cachekey)
+            if len(self._etags) > self.etag_cache_size:
+                self._etags.popitem(last=False)
         return ret
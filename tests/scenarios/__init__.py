@@ -1,10 +1,13 @@
-from typing import Any, Dict, List, Protocol, Type, Union
+import enum
+from typing import Any, Dict, List, Protocol, Tuple, Type, Union
 
 from paradox.expressions import (NotSupportedError, PanExpr, Pannable, PanVar,
                                  pan)
 from paradox.generate.statements import HardCodedStatement
 from paradox.interfaces import AcceptsStatements
 
+from bifrostrpc.typing import EnumEncoding
+
 
 def json_obj_to_php(obj: Any) -> str:
     if isinstance(obj, list):
@@ -41,6 +44,8 @@ def json_obj_to_python(obj: Any) -> str:
 class Scenario(Protocol):
     obj: Dict[str, Any]
     dataclasses: List[Type[Any]]
+    # Enums used by the dataclasses, and the encoding they are registered with
+    enums: List[Tuple[Type[enum.Enum], EnumEncoding]] = []
 
     def add_assertions(self, context: AcceptsStatements, v: PanVar) -> None:
         pass
@@ -0,0 +1,56 @@
+from dataclasses import dataclass
+from typing import List, TypedDict
+
+from paradox.expressions import PanVar
+from paradox.interfaces import AcceptsStatements
+
+from . import Scenario, assert_eq, assert_islist
+
+
+class Address(TypedDict):
+    street: str
+    postcode: str
+
+
+class Contact(TypedDict, total=False):
+    contactName: str
+    address: Address
+    phones: List[str]
+
+
+@dataclass
+class Delivery:
+    parcelId: int
+    destination: Address
+    recipient: Contact
+
+
+class CONTACT0(Scenario):
+    dataclasses = [Contact, Address]
+    # TypedDicts are sent without a __dataclass__ item
+    obj = {
+        "contactName": "Basil",
+        "address": {"street": "1 Main St", "postcode": "4000"},
+    }
+
+    def add_assertions(self, context: AcceptsStatements, v: PanVar) -> None:
+        assert_eq(context, v.getprop('contactName'), "Basil")
+        assert_eq(context, v.getprop('address').getprop('postcode'), "4000")
+        # keys which aren't required are null when they are missing
+        assert_eq(context, v.getprop('phones'), None)
+
+
+class DELIVERY0(Scenario):
+    dataclasses = [Delivery, Address, Contact]
+    obj = {
+        "__dataclass__": "Delivery",
+        "parcelId": 17,
+        "destination": {"street": "2 High St", "postcode": "2000"},
+        "recipient": {"phones": ["555-1234"]},
+    }
+
+    def add_assertions(self, context: AcceptsStatements, v: PanVar) -> None:
+        assert_eq(context, v.getprop('parcelId'), 17)
+        assert_eq(context, v.getprop('destination').getprop('street'), "2 High St")
+        assert_eq(context, v.getprop('recipient').getprop('contactName'), None)
+        assert_islist(context, v.getprop('recipient').getprop('phones'), size=1)
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from paradox.expressions import PanVar
+from paradox.generate.statements import HardCodedStatement
+from paradox.interfaces import AcceptsStatements
+
+from . import Scenario, assert_eq
+
+
+@dataclass
+class Venue:
+    venueName: str
+    opened: date
+
+
+@dataclass
+class Event:
+    eventName: str
+    starts: datetime
+    reminders: List[datetime]
+    venue: Optional[Venue]
+    # mapping of attendee name -> when they registered
+    registered: Dict[str, Optional[datetime]]
+
+
+class EVENT0(Scenario):
+    dataclasses = [Event, Venue]
+    obj = {
+        "__dataclass__": "Event",
+        "eventName": "Launch",
+        "starts": "2020-01-02T03:04:05+00:00",
+        "reminders": ["2020-01-01T03:04:05+00:00", "2020-01-02T02:04:05+00:00"],
+        "venue": {"__dataclass__": "Venue", "venueName": "Town Hall", "opened": "1999-12-31"},
+        "registered": {"Basil": "2019-11-30T12:00:00+00:00", "Billy": None},
+    }
+
+    def add_assertions(self, context: AcceptsStatements, v: PanVar) -> None:
+        assert_eq(context, v.getprop('eventName'), "Launch")
+        var = v.getPyExpr()[0]
+        phpvar = v.getPHPExpr()[0]
+        context.also(HardCodedStatement(
+            python=f'assert {var}.reminders[1].hour == 2',
+            php=f"assert({phpvar}->reminders[1]->format('H') === '02');",
+        ))
+        context.also(HardCodedStatement(
+            python=f'assert {var}.venue.opened.year == 1999',
+            php=f"assert({phpvar}->venue->opened->format('Y') === '1999');",
+        ))
+        context.also(HardCodedStatement(
+            python=f"assert {var}.registered['Billy'] is None",
+            php=f"assert({phpvar}->registered['Billy'] === null);",
+        ))
+
+
+class EVENT1(Scenario):
+    dataclasses = [Event, Venue]
+    obj = {
+        "__dataclass__": "Event",
+        "eventName": "Meetup",
+        "starts": "2021-06-01T18:30:00+00:00",
+        "reminders": [],
+        "venue": None,
+        "registered": {},
+    }
+
+    def add_assertions(self, context: AcceptsStatements, v: PanVar) -> None:
+        assert_eq(context, v.getprop('eventName'), "Meetup")
+        assert_eq(context, v.getprop('venue'), None)
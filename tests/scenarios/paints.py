@@ -0,0 +1,65 @@
+import enum
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from paradox.expressions import PanVar
+from paradox.interfaces import AcceptsStatements
+
+from . import Scenario, assert_eq, assert_islist
+
+
+class Colour(enum.Enum):
+    RED = 'r'
+    GREEN = 'g'
+
+
+class Finish(enum.Enum):
+    MATTE = 1
+    GLOSS = 2
+
+
+@dataclass
+class Paint:
+    colour: Colour
+    finish: Optional[Finish]
+    # colours which can be mixed with this paint
+    mixes: List[Colour]
+    # mapping of room name -> the finish used there
+    rooms: Dict[str, Finish]
+
+
+class PAINT0(Scenario):
+    dataclasses = [Paint]
+    # Colour uses the default name encoding, Finish uses the compact int encoding
+    enums = [(Colour, 'name'), (Finish, 'int')]
+    obj = {
+        "__dataclass__": "Paint",
+        "colour": "RED",
+        "finish": 2,
+        "mixes": ["GREEN", "RED"],
+        "rooms": {"kitchen": 1},
+    }
+
+    def add_assertions(self, context: AcceptsStatements, v: PanVar) -> None:
+        # client-side enum members compare equal to their wire values
+        assert_eq(context, v.getprop('colour'), "RED")
+        assert_eq(context, v.getprop('finish'), 2)
+        assert_islist(context, v.getprop('mixes'), size=2)
+        assert_eq(context, v.getprop('mixes').getindex(0), "GREEN")
+        assert_eq(context, v.getprop('rooms').getitem('kitchen'), 1)
+
+
+class PAINT1(Scenario):
+    dataclasses = [Paint]
+    enums = [(Colour, 'name'), (Finish, 'int')]
+    obj = {
+        "__dataclass__": "Paint",
+        "colour": "GREEN",
+        "finish": None,
+        "mixes": [],
+        "rooms": {},
+    }
+
+    def add_assertions(self, context: AcceptsStatements, v: PanVar) -> None:
+        assert_eq(context, v.getprop('colour'), "GREEN")
+        assert_eq(context, v.getprop('finish'), None)
@@ -0,0 +1,217 @@
+import asyncio
+import json
+from typing import Any, Dict, List, NewType, Tuple
+
+import pytest
+
+from bifrostrpc import AuthFailure, BifrostRPCService
+from bifrostrpc.asgi import getHeader
+
+UserID = NewType('UserID', int)
+Token = NewType('Token', str)
+
+
+def _makeService() -> Tuple[BifrostRPCService, Dict[str, Any]]:
+    state: Dict[str, Any] = {'cancelled': False}
+    service = BifrostRPCService()
+
+    async def get_user() -> UserID:
+        await asyncio.sleep(0)
+        header = getHeader('X-User')
+        if header is None:
+            raise AuthFailure('Missing X-User header')
+        return UserID(int(header))
+
+    service.addAuthType(UserID, get_user)
+    # a plain (non-async) factory
+    service.addInternalType(Token, lambda: Token('secret'))
+
+    @service.rpcmethod
+    async def whoami(user: UserID, token: Token) -> str:
+        await asyncio.sleep(0)
+        return f'{user}:{token}'
+
+    @service.rpcmethod
+    def add(user: UserID, a: int, b: int) -> int:
+        return a + b
+
+    @service.rpcmethod
+    async def slow(user: UserID) -> int:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state['cancelled'] = True
+            raise
+        return 1
+
+    return service, state
+
+
+def _call(
+    service: BifrostRPCService,
+    path: str,
+    body: Any = None,
+    *,
+    method: str = 'POST',
+    headers: List[Tuple[bytes, bytes]] = None,
+    disconnect: bool = False,
+) -> Tuple[Any, str]:
+    app = service.get_asgi_app()
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'headers': headers or [(b'x-user', b'5')],
+    }
+    incoming = [{
+        'type': 'http.request',
+        'body': json.dumps(body).encode() if body is not None else b'',
+        'more_body': False,
+    }]
+    sent: List[Dict[str, Any]] = []
+
+    async def receive() -> Dict[str, Any]:
+        if incoming:
+            return incoming.pop(0)
+        if disconnect:
+            await asyncio.sleep(0.01)
+            return {'type': 'http.disconnect'}
+        await asyncio.sleep(60)
+        raise Exception('Test took too long')
+
+    async def send(message: Dict[str, Any]) -> None:
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    if not sent:
+        return None, ''
+    assert sent[0]['type'] == 'http.response.start'
+    return sent[0]['status'], sent[1]['body'].decode()
+
+
+def test_asgi_app() -> None:
+    service, state = _makeService()
+
+    assert _call(service, '/api.v1/call/whoami', {}) == (200, '"5:secret"')
+    assert _call(service, '/api.v1/call/add', {'a': 1, 'b': 2}) == (200, '3')
+
+    assert _call(service, '/api.v1/call/whoami', {}, headers=[(b'x-other', b'1')]) == (
+        401,
+        'Missing X-User header',
+    )
+    assert _call(service, '/api.v1/call/add', {'a': 1}) == (400, "body['b'] is required.")
+    assert _call(service, '/api.v1/call/add', method='GET')[0] == 405
+    assert _call(service, '/api.v1/call/nope', {}) == (501, "invalid method name 'nope'")
+    assert _call(service, '/elsewhere', {})[0] == 404
+
+    # a client disconnecting cancels the running method and no response is sent
+    assert _call(service, '/api.v1/call/slow', {}, disconnect=True) == (None, '')
+    assert state['cancelled']
+
+
+def test_asgi_body_size_limit() -> None:
+    service, _ = _makeService()
+    service._maxBodySize = 20  # pylint: disable=protected-access
+    body = {'a': 1, 'b': 2, 'c': 'x' * 20}
+
+    assert _call(service, '/api.v1/call/add', {'a': 1, 'b': 2}) == (200, '3')
+    # rejected because of the Content-Length header
+    headers = [(b'x-user', b'5'), (b'content-length', b'1000')]
+    assert _call(service, '/api.v1/call/add', body, headers=headers)[0] == 413
+    # rejected while the body is being read
+    assert _call(service, '/api.v1/call/add', body)[0] == 413
+
+
+def test_asgi_blocking_calls_leave_event_loop() -> None:
+    import threading
+
+    from bifrostrpc.asgi import getScope
+
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(1))
+    threads: List[Any] = []
+
+    def getVersion(user: UserID) -> str:
+        threads.append(threading.current_thread())
+        # the request scope is still available in the worker thread
+        return getScope()['path']
+
+    @service.rpcmethod(version=getVersion)
+    async def versioned(user: UserID) -> int:
+        threads.append(threading.current_thread())
+        return 1
+
+    assert _call(service, '/api.v1/call/versioned', {}) == (200, '1')
+    versionThread, methodThread = threads
+    assert methodThread is threading.main_thread()
+    assert versionThread is not threading.main_thread()
+
+    # servers may handle several requests in the same task, so the scope of a finished request
+    # mustn't be left behind
+    async def _handleTwice() -> None:
+        app = service.get_asgi_app()
+        for _ in range(2):
+            incoming = [{'type': 'http.request', 'body': b'{}', 'more_body': False}]
+
+            async def receive() -> Dict[str, Any]:
+                return incoming.pop(0)
+
+            async def send(message: Dict[str, Any]) -> None:
+                pass
+
+            scope = {'type': 'http', 'method': 'POST', 'path': '/api.v1/call/versioned',
+                     'headers': []}
+            await app(scope, receive, send)
+            with pytest.raises(LookupError):
+                getScope()
+
+    asyncio.run(_handleTwice())
+
+
+def test_asgi_plain_auth_factories_leave_event_loop() -> None:
+    import time
+
+    service = BifrostRPCService()
+
+    def get_user() -> UserID:
+        # e.g. a slow session lookup
+        header = getHeader('X-User')
+        if header == 'slow':
+            time.sleep(0.5)
+        return UserID(1)
+
+    service.addAuthType(UserID, get_user)
+    finished: List[str] = []
+
+    @service.rpcmethod
+    async def whoami(user: UserID) -> int:
+        return user
+
+    async def _handle(user: bytes) -> None:
+        app = service.get_asgi_app()
+        incoming = [{'type': 'http.request', 'body': b'{}', 'more_body': False}]
+        sent: List[Dict[str, Any]] = []
+
+        async def receive() -> Dict[str, Any]:
+            if incoming:
+                return incoming.pop(0)
+            await asyncio.sleep(60)
+            raise Exception('Test took too long')
+
+        async def send(message: Dict[str, Any]) -> None:
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/api.v1/call/whoami',
+                 'headers': [(b'x-user', user)]}
+        await app(scope, receive, send)
+        assert sent[0]['status'] == 200
+        finished.append(user.decode())
+
+    async def _handleBoth() -> None:
+        slow = asyncio.ensure_future(_handle(b'slow'))
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(_handle(b'fast'), 0.3)
+        await slow
+
+    asyncio.run(_handleBoth())
+    assert finished == ['fast', 'slow']
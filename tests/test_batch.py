@@ -0,0 +1,182 @@
+import asyncio
+import io
+import json
+import threading
+from typing import Any, Dict, List, NewType, Tuple
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+from bifrostrpc import AuthFailure, BifrostRPCService
+from bifrostrpc.asgi import getHeader
+from bifrostrpc.wsgi import getEnviron
+
+UserID = NewType('UserID', int)
+
+
+def _makeService(authCalls: List[int]) -> BifrostRPCService:
+    service = BifrostRPCService(max_batch_size=5)
+
+    def get_user() -> UserID:
+        from flask import has_request_context, request
+
+        try:
+            environ = request.environ if has_request_context() else getEnviron()
+            header = environ.get('HTTP_X_USER')
+        except LookupError:
+            header = getHeader('X-User')
+        authCalls.append(1)
+        if header is None:
+            raise AuthFailure('Missing X-User header')
+        return UserID(int(header))
+
+    service.addAuthType(UserID, get_user)
+
+    @service.rpcmethod
+    def add(user: UserID, a: int, b: int) -> int:
+        return a + b
+
+    @service.rpcmethod
+    def whoami(user: UserID) -> str:
+        return f'user {user} on {threading.current_thread().name}'
+
+    @service.rpcmethod
+    async def double(user: UserID, a: int) -> int:
+        await asyncio.sleep(0)
+        return a * 2
+
+    return service
+
+
+def _callWSGI(
+    service: BifrostRPCService,
+    body: Any,
+    user: str = '5',
+    method: str = 'POST',
+) -> Tuple[int, Any]:
+    data = json.dumps(body).encode()
+    environ = {
+        'PATH_INFO': '/api.v1/batch',
+        'REQUEST_METHOD': method,
+        'CONTENT_LENGTH': str(len(data)),
+        'CONTENT_TYPE': 'application/json',
+        'wsgi.input': io.BytesIO(data),
+    }
+    if user:
+        environ['HTTP_X_USER'] = user
+    setup_testing_defaults(environ)
+
+    started: List[str] = []
+
+    def start_response(status: str, headers: List[Tuple[str, str]]) -> None:
+        started.append(status)
+
+    body = b''.join(service.get_wsgi_app()(environ, start_response))
+    status = int(started[0].split(' ')[0])
+    return status, json.loads(body) if status == 200 else body.decode()
+
+
+def _calls(*calls: Tuple[str, Dict[str, Any]], concurrent: bool = False) -> Dict[str, Any]:
+    return {
+        'calls': [{'method': method, 'params': params} for method, params in calls],
+        'concurrent': concurrent,
+    }
+
+
+def test_wsgi_batch() -> None:
+    authCalls: List[int] = []
+    service = _makeService(authCalls)
+
+    status, items = _callWSGI(service, _calls(
+        ('add', {'a': 1, 'b': 2}),
+        ('add', {'a': 1}),
+        ('nope', {}),
+        ('double', {'a': 4}),
+        ('add', {'a': 3, 'b': 4}),
+    ))
+    assert status == 200
+    assert items == [
+        {'status': 200, 'result': 3},
+        {'status': 400, 'error': "body['b'] is required."},
+        {'status': 501, 'error': "invalid method name 'nope'"},
+        {'status': 200, 'result': 8},
+        {'status': 200, 'result': 7},
+    ]
+    # the auth factory is only called once for the whole batch
+    assert len(authCalls) == 1
+
+    # auth failures are shared too
+    _, items = _callWSGI(service, _calls(('add', {'a': 1, 'b': 2}), ('whoami', {})), user='')
+    assert [item['status'] for item in items] == [401, 401]
+    assert len(authCalls) == 2
+
+
+def test_concurrent_batch() -> None:
+    service = _makeService([])
+    status, items = _callWSGI(service, _calls(('whoami', {}), ('whoami', {}), concurrent=True))
+    assert status == 200
+    threads = {item['result'] for item in items}
+    # each call ran in a worker thread, where it could still see the request's environ
+    assert all(t.startswith('user 5 on ') for t in threads)
+    assert threading.current_thread().name not in {t[len('user 5 on '):] for t in threads}
+
+
+@pytest.mark.parametrize('body,method,expected', [
+    ([], 'POST', 400),
+    ({'calls': [{'params': {}}]}, 'POST', 400),
+    (_calls(*[('whoami', {})] * 6), 'POST', 400),
+    ({'calls': []}, 'GET', 405),
+])
+def test_invalid_batch(body: Any, method: str, expected: int) -> None:
+    assert _callWSGI(_makeService([]), body, method=method)[0] == expected
+
+
+def test_flask_batch() -> None:
+    from flask import Flask
+
+    service = _makeService([])
+    flaskapp = Flask('test')
+    flaskapp.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+    response = flaskapp.test_client().post(
+        '/api.v1/batch',
+        json=_calls(('add', {'a': 1, 'b': 2}), ('whoami', {})),
+        environ_base={'HTTP_X_USER': '5'},
+    )
+    items = response.get_json()
+    assert items[0] == {'status': 200, 'result': 3}
+    assert items[1]['result'].startswith('user 5')
+
+
+@pytest.mark.parametrize('concurrent', [False, True])
+def test_asgi_batch(concurrent: bool) -> None:
+    authCalls: List[int] = []
+    service = _makeService(authCalls)
+    app = service.get_asgi_app()
+    scope = {
+        'type': 'http',
+        'method': 'POST',
+        'path': '/api.v1/batch',
+        'headers': [(b'x-user', b'5')],
+    }
+    body = _calls(('double', {'a': 4}), ('add', {'a': 1}), ('add', {'a': 1, 'b': 1}),
+                  concurrent=concurrent)
+    incoming = [{'type': 'http.request', 'body': json.dumps(body).encode()}]
+    sent: List[Dict[str, Any]] = []
+
+    async def receive() -> Dict[str, Any]:
+        if incoming:
+            return incoming.pop(0)
+        await asyncio.sleep(60)
+        raise Exception('Test took too long')
+
+    async def send(message: Dict[str, Any]) -> None:
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    assert sent[0]['status'] == 200
+    assert json.loads(sent[1]['body']) == [
+        {'status': 200, 'result': 8},
+        {'status': 400, 'error': "body['b'] is required."},
+        {'status': 200, 'result': 2},
+    ]
+    assert len(authCalls) == 1
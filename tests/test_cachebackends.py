@@ -0,0 +1,118 @@
+import multiprocessing
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+import pytest
+
+from bifrostrpc.cachebackends import (CacheBackend, MemoryBackend,
+                                      RedisBackend, SQLiteBackend)
+
+
+class FakeRedis:
+    """A local stand-in for the parts of a redis.Redis client which RedisBackend uses."""
+
+    def __init__(self) -> None:
+        self.values: Dict[str, Any] = {}
+        self.expires: Dict[str, float] = {}
+
+    def _expire(self, name: str) -> None:
+        if name in self.expires and self.expires[name] <= time.monotonic():
+            del self.values[name]
+            del self.expires[name]
+
+    def get(self, name: str) -> Optional[bytes]:
+        self._expire(name)
+        return self.values.get(name)
+
+    def set(self, name: str, value: bytes, px: int) -> None:
+        self.values[name] = value
+        self.pexpire(name, px)
+
+    def delete(self, *names: str) -> None:
+        for name in names:
+            self.values.pop(name, None)
+            self.expires.pop(name, None)
+
+    def sadd(self, name: str, *values: str) -> None:
+        self._expire(name)
+        self.values.setdefault(name, set()).update(values)
+
+    def smembers(self, name: str) -> Set[str]:
+        self._expire(name)
+        return set(self.values.get(name, set()))
+
+    def pttl(self, name: str) -> int:
+        self._expire(name)
+        if name not in self.values:
+            return -2
+        if name not in self.expires:
+            return -1
+        return int((self.expires[name] - time.monotonic()) * 1000)
+
+    def pexpire(self, name: str, ms: int) -> None:
+        self.expires[name] = time.monotonic() + ms / 1000
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def backend(request: Any, tmp_path: Path) -> CacheBackend:
+    if request.param == 'memory':
+        return MemoryBackend()
+    if request.param == 'sqlite':
+        return SQLiteBackend(tmp_path / 'cache.db')
+    return RedisBackend(FakeRedis())
+
+
+def test_backend(backend: CacheBackend) -> None:
+    backend.set('m1', 'a', b'A', ttl=60, tag='t1')
+    backend.set('m1', 'b', b'B', ttl=60, tag='t1')
+    backend.set('m1', 'c', b'C', ttl=60, tag='t2')
+    backend.set('m2', 'a', b'A2', ttl=60, tag='t1')
+    backend.set('m2', 'short', b'S', ttl=0.05, tag='t1')
+    assert backend.get('m1', 'a') == b'A'
+    assert backend.get('m2', 'a') == b'A2'
+    assert backend.get('m1', 'x') is None
+    time.sleep(0.1)
+    assert backend.get('m2', 'short') is None
+
+    backend.invalidate('m1', 't1')
+    assert [backend.get('m1', k) for k in 'abc'] == [None, None, b'C']
+    assert backend.get('m2', 'a') == b'A2'
+
+    backend.invalidate('m2')
+    assert backend.get('m2', 'a') is None
+    assert backend.get('m1', 'c') == b'C'
+
+    stats = backend.getStats()
+    assert (stats.hits, stats.misses, stats.sets) == (5, 5, 5)
+
+
+def test_sqlite_eviction(tmp_path: Path) -> None:
+    backend = SQLiteBackend(tmp_path / 'cache.db', maxEntries=3, evictEvery=5, touchInterval=0)
+    for i in range(4):
+        backend.set('m', str(i), b'x', ttl=60, tag='')
+        time.sleep(0.001)
+    # '0' becomes the most recently used
+    assert backend.get('m', '0') == b'x'
+    backend.set('m', '4', b'x', ttl=60, tag='')
+
+    assert [backend.get('m', str(i)) for i in range(5)] == [b'x', None, None, b'x', b'x']
+    stats = backend.getStats()
+    assert (stats.evictions, stats.entries) == (2, 3)
+
+
+def _setInChild(path: str) -> None:
+    SQLiteBackend(path).set('m', 'k', str(os.getpid()).encode(), ttl=60, tag='')
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork()')
+def test_sqlite_shared_between_processes(tmp_path: Path) -> None:
+    path = str(tmp_path / 'cache.db')
+    backend = SQLiteBackend(path)
+    assert backend.get('m', 'k') is None
+
+    child = multiprocessing.get_context('fork').Process(target=_setInChild, args=(path, ))
+    child.start()
+    child.join()
+    assert backend.get('m', 'k') == str(child.pid).encode()
@@ -0,0 +1,220 @@
+import asyncio
+from pathlib import Path
+from typing import Any, Dict, List, NewType, Optional
+
+import pytest
+
+from bifrostrpc import AuthFailure, BifrostRPCService
+from bifrostrpc.cachebackends import SQLiteBackend
+from bifrostrpc.caching import TTLCache
+from bifrostrpc.resultcache import ResultCachePolicy
+
+UserID = NewType('UserID', int)
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_cache() -> None:
+    clock = _Clock()
+    cache: TTLCache[str, int] = TTLCache(ttl=10, maxSize=2, clock=clock)
+
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    # 'b' is now the least recently used entry
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+    clock.now += 10
+    assert cache.get('a') is None
+    assert len(cache) == 1
+
+    cache.set('d', 4, ttl=30)
+    clock.now += 20
+    assert cache.get('d') == 4
+    assert cache.deleteWhere(lambda v: v > 3) == 1
+    assert cache.get('d') is None
+
+    with pytest.raises(Exception, match='maxSize must be 1 or more'):
+        TTLCache(ttl=1, maxSize=0)
+
+
+def _makeService(tokens: Dict[str, int], calls: List[str]) -> BifrostRPCService:
+    from flask import request
+
+    service = BifrostRPCService()
+
+    def get_token() -> Optional[str]:
+        return request.headers.get('Authorization')
+
+    def get_user() -> UserID:
+        token = get_token()
+        calls.append(token or '')
+        try:
+            return UserID(tokens[token or ''])
+        except KeyError:
+            raise AuthFailure('Invalid token')
+
+    service.addAuthType(UserID, get_user, cache_key=get_token, cache_ttl=60)
+
+    @service.rpcmethod
+    def whoami(user: UserID) -> int:
+        return user
+
+    return service
+
+
+def test_auth_cache() -> None:
+    from flask import Flask
+
+    tokens = {'t1': 1, 't2': 2}
+    calls: List[str] = []
+    service = _makeService(tokens, calls)
+
+    app = Flask('test')
+    app.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+    client = app.test_client()
+
+    def whoami(token: str) -> Any:
+        response = client.post('/api.v1/call/whoami', json={}, headers={'Authorization': token})
+        return response.status_code, response.get_data(as_text=True)
+
+    assert whoami('t1') == (200, '1')
+    assert whoami('t1') == (200, '1')
+    assert whoami('t2') == (200, '2')
+    assert calls == ['t1', 't2']
+
+    # failures aren't cached
+    assert whoami('bad') == (401, 'Invalid token')
+    assert whoami('bad') == (401, 'Invalid token')
+    assert calls == ['t1', 't2', 'bad', 'bad']
+
+    # revoking a token
+    del tokens['t1']
+    assert whoami('t1') == (200, '1')
+    service.invalidateAuth(UserID, 't1')
+    assert whoami('t1') == (401, 'Invalid token')
+    assert whoami('t2') == (200, '2')
+
+    # revoking everything for a user
+    tokens['t3'] = 2
+    assert whoami('t3') == (200, '2')
+    service.invalidateAuth(UserID, where=lambda user: user == 2)
+    del calls[:]
+    assert whoami('t2') == (200, '2')
+    assert whoami('t3') == (200, '2')
+    assert calls == ['t2', 't3']
+
+
+def test_auth_cache_async_factory() -> None:
+    service = BifrostRPCService()
+    calls: List[int] = []
+
+    async def get_user() -> UserID:
+        calls.append(1)
+        await asyncio.sleep(0)
+        return UserID(5)
+
+    service.addAuthType(UserID, get_user, cache_key=lambda: 'token')
+    factory = service._factory[UserID]  # pylint: disable=protected-access
+
+    async def getTwice() -> List[Any]:
+        return [await factory(), factory()]
+
+    assert asyncio.run(getTwice()) == [5, 5]
+    assert calls == [1]
+
+
+def test_ttl_cache_max_bytes() -> None:
+    cache: TTLCache[str, bytes] = TTLCache(ttl=10, maxSize=10, maxBytes=5, sizeOf=len)
+    cache.set('a', b'123')
+    cache.set('b', b'45')
+    assert cache.getBytes() == 5
+    cache.set('c', b'6')
+    assert cache.get('a') is None
+    assert cache.getBytes() == 3
+
+
+def _makeCachedService(calls: List[str], **kwargs: Any) -> BifrostRPCService:
+    from flask import request
+
+    service = BifrostRPCService(**kwargs)
+    service.addAuthType(UserID, lambda: UserID(int(request.headers['X-User'])))
+
+    @service.rpcmethod(cache=60)
+    def double(user: UserID, value: int) -> int:
+        calls.append('double')
+        return value * 2
+
+    @service.rpcmethod(cache=ResultCachePolicy(60, perIdentity=True))
+    def whoami(user: UserID) -> int:
+        calls.append('whoami')
+        return user
+
+    return service
+
+
+def test_result_cache() -> None:
+    from flask import Flask
+
+    calls: List[str] = []
+    service = _makeCachedService(calls)
+    app = Flask('test')
+    app.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+    client = app.test_client()
+
+    def call(method: str, body: Dict[str, Any], user: int = 1) -> Any:
+        response = client.post(f'/api.v1/call/{method}', json=body, headers={'X-User': user})
+        return response.status_code, response.get_json()
+
+    assert call('double', {'value': 2}) == (200, 4)
+    assert call('double', {'value': 2}, user=2) == (200, 4)
+    assert call('double', {'value': 3}) == (200, 6)
+    assert calls == ['double', 'double']
+
+    # invalid args are never cached
+    assert call('double', {'value': 'x'})[0] == 400
+    assert call('double', {'value': 'x'})[0] == 400
+
+    # entries are partitioned by auth values
+    del calls[:]
+    assert [call('whoami', {}, user=u)[1] for u in (1, 2, 1, 2)] == [1, 2, 1, 2]
+    assert calls == ['whoami', 'whoami']
+
+    del calls[:]
+    service.invalidateResultCache('double', {'value': 2})
+    assert call('double', {'value': 2}) == (200, 4)
+    assert call('double', {'value': 3}) == (200, 6)
+    service.invalidateResultCache('double')
+    assert call('double', {'value': 3}) == (200, 6)
+    assert calls == ['double', 'double']
+
+
+def test_result_cache_shared_backend(tmp_path: Path) -> None:
+    from flask import Flask
+
+    calls: List[str] = []
+    backend = SQLiteBackend(tmp_path / 'cache.db')
+    services = [_makeCachedService(calls, cache_backend=backend) for _ in range(2)]
+    clients = []
+    for service in services:
+        app = Flask('test')
+        app.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+        clients.append(app.test_client())
+
+    # the second service gets the response cached by the first
+    for client in clients:
+        response = client.post('/api.v1/call/double', json={'value': 5}, headers={'X-User': 1})
+        assert response.get_json() == 10
+    assert calls == ['double']
+
+    stats = [s.getResultCacheStats()['double'] for s in services]
+    assert [(s.hits, s.misses) for s in stats] == [(0, 1), (1, 0)]
+    assert stats[1].backend.entries == 1
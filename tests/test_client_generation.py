@@ -2,7 +2,7 @@ from pathlib import Path
 from typing import Union
 
 from paradox.expressions import (PanAwait, PanCall, PanDict, PanExpr, PanProp,
-                                 PanVar, pan)
+                                 PanVar, pan, panlist)
 from paradox.generate.statements import FunctionSpec, HardCodedStatement
 from paradox.interfaces import AcceptsStatements
 from paradox.output import Script
@@ -117,6 +117,23 @@ def test_generated_client(
         await_call(v_client.getprop('get_reversed'), pan("Hello world")),
         "dlrow olleH",
     )
+    ctx.remark('get_reversed is idempotent, so a repeated call is answered with a 304')
+    assert_eq(
+        ctx,
+        await_call(v_client.getprop('get_reversed'), pan("Hello world")),
+        "dlrow olleH",
+    )
+
+    ctx.remark('the first response of record_payment is lost, so the client sends the call again')
+    ctx.remark('with the same Idempotency-Key and the server replays the stored response')
+    assert_eq(ctx, await_call(v_client.getprop('record_payment'), pan(5)), 5)
+    v_counts = ctx.alsoDeclare(
+        'payment_counts',
+        'no_type',
+        await_call(v_client.getprop('get_payment_counts')),
+    )
+    assert_eq(ctx, v_counts.getindex(0), 1)
+    assert_eq(ctx, v_counts.getindex(1), 1)
 
     t_Pet = CrossCustomType(
         python='Pet',
@@ -130,7 +147,7 @@ def test_generated_client(
         phpdoc='ApiFailure',
         typescript='ApiFailure',
     )
-    s.alsoImportPy('generated_client', ['Pet', 'ApiFailure'])
+    s.alsoImportPy('generated_client', ['Pet', 'Event', 'Paint', 'Delivery', 'ApiFailure'])
     s.alsoImportTS('./generated_client', ['Pet', 'ApiFailure'])
 
     ctx.remark('method with a more complex return type')
@@ -145,20 +162,70 @@ def test_generated_client(
     assert_eq(ctx, v_pets.getindex(0).getprop('name'), 'Basil')
     assert_eq(ctx, v_pets.getindex(1).getprop('name'), 'Billy')
 
+    ctx.remark('a projected call returns only the selected fields, as plain dicts')
+    v_projected = ctx.alsoDeclare(
+        'projected',
+        'no_type',
+        await_call(v_client.getprop('get_pets_projected'), panlist(['name'], CrossStr())),
+    )
+    assert_islist(ctx, v_projected, size=2)
+    assert_eq(ctx, v_projected.getindex(0).getitem('name'), 'Basil')
+
     ctx.remark('Testing a method that *receives* a complex argument type')
-    if demo_runner.lang == 'python':
-        ctx.remark("XXX: this is not yet supported in python")
-        ctx.remark("TODO: we can't pass dataclasses as args yet in python because python")
-        ctx.remark("doesn't automatically json-encode dataclasses")
-    else:
-        v_check_arg = PanDict({}, CrossStr(), CrossAny())
-        v_check_arg.addPair(pan('basil'), v_pets.getindex(0))
-        v_check_arg.addPair(pan('billy'), v_pets.getindex(1))
-        v_check = ctx.alsoDeclare('check', 'no_type', await_call(
-            v_client.getprop('check_pets'),
-            v_check_arg,
-        ))
-        assert_eq(ctx, v_check, 'pets_ok!')
+    v_check_arg = PanDict({}, CrossStr(), CrossAny())
+    v_check_arg.addPair(pan('basil'), v_pets.getindex(0))
+    v_check_arg.addPair(pan('billy'), v_pets.getindex(1))
+    v_check = ctx.alsoDeclare('check', 'no_type', await_call(
+        v_client.getprop('check_pets'),
+        v_check_arg,
+    ))
+    assert_eq(ctx, v_check, 'pets_ok!')
+
+    ctx.remark('temporal values nested inside other types are sent in their wire format')
+    v_event = ctx.alsoDeclare('event', 'no_type', await_call(v_client.getprop('get_event')))
+    assert_isinstance(ctx, v_event, 'Event')
+    assert_eq(
+        ctx,
+        await_call(v_client.getprop('describe_event'), v_event),
+        'Launch starts 2020-01-02T03:04:05+00:00',
+    )
+    v_times = panlist(
+        [v_event.getprop('starts'), v_event.getprop('reminders').getindex(0)],
+        CrossAny(),
+    )
+    assert_eq(
+        ctx,
+        await_call(v_client.getprop('describe_times'), v_times),
+        '2020-01-02T03:04:05+00:00,2020-01-01T03:04:05+00:00',
+    )
+
+    ctx.remark('enums are received and sent as their wire values')
+    v_paint = ctx.alsoDeclare('paint', 'no_type', await_call(v_client.getprop('get_paint')))
+    assert_isinstance(ctx, v_paint, 'Paint')
+    assert_eq(ctx, v_paint.getprop('colour'), 'RED')
+    assert_eq(ctx, v_paint.getprop('finish'), 2)
+    assert_eq(ctx, v_paint.getprop('mixes').getindex(0), 'GREEN')
+    assert_eq(ctx, v_paint.getprop('rooms').getitem('kitchen'), 1)
+    assert_eq(
+        ctx,
+        await_call(v_client.getprop('describe_paint'), v_paint),
+        'RED with GLOSS finish',
+    )
+
+    ctx.remark('TypedDicts are received and sent without a __dataclass__ item')
+    v_delivery = ctx.alsoDeclare(
+        'delivery',
+        'no_type',
+        await_call(v_client.getprop('get_delivery')),
+    )
+    assert_isinstance(ctx, v_delivery, 'Delivery')
+    assert_eq(ctx, v_delivery.getprop('destination').getprop('street'), '2 High St')
+    assert_eq(ctx, v_delivery.getprop('recipient').getprop('contactName'), 'Billy')
+    assert_eq(
+        ctx,
+        await_call(v_client.getprop('describe_contact'), v_delivery.getprop('recipient')),
+        'Billy at nowhere with 0 phones',
+    )
 
     if ctx is not s:
         s.also(PanCall('test_body'))
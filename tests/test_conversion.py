@@ -13,9 +13,12 @@ from paradox.typing import CrossAny
 from bifrostrpc.typing import NullTypeSpec, TypeSpec, UnionTypeSpec
 
 from .scenarios import Scenario, json_obj_to_php, json_obj_to_python
+from .scenarios.contacts import CONTACT0, DELIVERY0
+from .scenarios.events import EVENT0, EVENT1
 from .scenarios.gadgets import (DEVICE0, DEVICE1, DEVICE2, GADGET0, GADGET1,
                                 GIZMO0, MACHINE0, MACHINE1, MACHINE2, WIDGET0,
                                 WIDGET1)
+from .scenarios.paints import PAINT0, PAINT1
 from .scenarios.pets import PET0, PET1
 from .scenarios.travellers import TRAVELLER0, TRAVELLER1
 from .scenarios.users import USER0, USER1
@@ -48,27 +51,57 @@ def _run_py(script: str, **kwargs: Any) -> None:
     MACHINE0(),
     MACHINE1(),
     MACHINE2(),
+    EVENT0(),
+    EVENT1(),
+    PAINT0(),
+    PAINT1(),
+    CONTACT0(),
+    DELIVERY0(),
 ])
 @pytest.mark.parametrize('lang', ['php', 'python'])
 def test_get_dataclass_spec(
     scenario: Scenario,
     lang: Literal['php', 'python'],
 ) -> None:
-    from bifrostrpc.generators.conversion import getDataclassSpec
-    from bifrostrpc.typing import Advanced
-
-    # load dataclasses
+    from bifrostrpc.generators.conversion import (findTemporalTypes,
+                                                  getDataclassSpec,
+                                                  getEnumSpec,
+                                                  getTemporalHelpers,
+                                                  getToWireHelpers,
+                                                  needsToWire)
+    from bifrostrpc.typing import Advanced, _istypeddict, getTypeSpec
+
+    # load dataclasses and TypedDicts
     adv = Advanced()
+    for enumClass, encoding in scenario.enums:
+        adv.addEnum(enumClass, encoding=encoding)
     for dc in scenario.dataclasses:
-        adv.addDataclass(dc)
+        if _istypeddict(dc):
+            adv.addTypedDict(dc)
+        else:
+            adv.addDataclass(dc)
 
     classname = scenario.dataclasses[0].__name__
 
     s = Script()
 
+    for enumClass, encoding in adv.getAllEnums():
+        s.alsoImportPy('enum')
+        s.also(getEnumSpec(enumClass, encoding, lang=lang))
+
+    temporalTypes = findTemporalTypes([], adv)
+    if temporalTypes:
+        s.alsoImportPy('datetime')
+        s.also(getTemporalHelpers(temporalTypes, adv.temporalEncoding, lang=lang))
+
     for dc in scenario.dataclasses:
         s.also(getDataclassSpec(dc, adv=adv, lang=lang, hoistcontext=s))
 
+    toWire = getToWireHelpers(adv, lang=lang)
+    if toWire is not None:
+        s.alsoImportPy('typing')
+        s.also(toWire)
+
     s.also(HardCodedStatement(
         php=f'$VAR = {classname}::fromDict({json_obj_to_php(scenario.obj)}, "\\$_");',
         python=f'VAR = {classname}.fromDict({json_obj_to_python(scenario.obj)}, "DATA")',
@@ -80,6 +113,21 @@ def test_get_dataclass_spec(
 
     scenario.add_assertions(s, PanVar('VAR', CrossAny()))
 
+    # the client can send the object back to the server
+    if needsToWire(getTypeSpec(scenario.dataclasses[0], adv), lang=lang):
+        s.alsoImportPy('json')
+        expected = _withoutDataclassKeys(scenario.obj)
+        s.also(HardCodedStatement(
+            php=f'assert(json_encode(_{classname}_to_wire($VAR)) !== false);',
+            # NOTE: scenarios may leave out fields which are None, but the client sends them all
+            python=(f'WIRE = json.loads(json.dumps(_{classname}_to_wire(VAR)),'
+                    ' object_hook=lambda d: {k: v for k, v in d.items() if v is not None})'),
+        ))
+        s.also(HardCodedStatement(
+            php=None,
+            python=f'assert WIRE == {json_obj_to_python(expected)}, WIRE',
+        ))
+
     with TemporaryDirectory() as tmpdir:
         if lang == 'php':
             s.write_to_path(Path(tmpdir) / 'dataclass.php', lang=lang)
@@ -91,6 +139,19 @@ def test_get_dataclass_spec(
             raise Exception(f"Unexpected lang {lang!r}")
 
 
+def _withoutDataclassKeys(obj: Any) -> Any:
+    """Return obj without any __dataclass__ items, or any dict items which are None."""
+    if isinstance(obj, list):
+        return [_withoutDataclassKeys(item) for item in obj]
+    if isinstance(obj, dict):
+        return {
+            k: _withoutDataclassKeys(v)
+            for k, v in obj.items()
+            if k != '__dataclass__' and v is not None
+        }
+    return obj
+
+
 # a filter block isn't possible for these input types using PHP
 @pytest.mark.parametrize('input_type', [
     Optional[List[str]],
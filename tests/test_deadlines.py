@@ -0,0 +1,122 @@
+import asyncio
+import io
+import json
+import threading
+import time
+from typing import Any, Dict, List, NewType, Optional, Tuple
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+from bifrostrpc import BifrostRPCService
+from bifrostrpc.deadlines import Deadline, DeadlineExceededError
+from bifrostrpc.execution import ExecutionPool
+
+UserID = NewType('UserID', int)
+
+
+def _makeService(state: Dict[str, Any]) -> BifrostRPCService:
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(1))
+
+    @service.rpcmethod
+    def remaining(user: UserID, deadline: Deadline) -> Optional[int]:
+        seconds = deadline.remaining()
+        return None if seconds is None else int(seconds * 1000)
+
+    @service.rpcmethod
+    async def slow(user: UserID) -> int:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state['cancelled'] = True
+            raise
+        return 1
+
+    return service
+
+
+class _UnreadableInput:
+    def read(self, *args: Any) -> bytes:
+        raise Exception('The request body should not have been read')
+
+
+def _callWSGI(
+    service: BifrostRPCService,
+    method: str,
+    body: Any,
+    deadline: Optional[float],
+) -> Tuple[int, str]:
+    data = json.dumps(body).encode()
+    environ = {
+        'PATH_INFO': f'/api.v1/call/{method}',
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_LENGTH': str(len(data)),
+        'CONTENT_TYPE': 'application/json',
+        'wsgi.input': io.BytesIO(data) if body is not None else _UnreadableInput(),
+    }
+    if deadline is not None:
+        environ['HTTP_X_BIFROST_DEADLINE'] = str(deadline)
+    setup_testing_defaults(environ)
+    started: List[str] = []
+
+    def start_response(status: str, headers: List[Tuple[str, str]]) -> None:
+        started.append(status)
+
+    chunks = service.get_wsgi_app()(environ, start_response)
+    return int(started[0].split(' ')[0]), b''.join(chunks).decode()
+
+
+def test_deadline_context_type() -> None:
+    service = _makeService({})
+    status, body = _callWSGI(service, 'remaining', {}, time.time() + 30)
+    assert status == 200 and 29000 < json.loads(body) <= 30000
+    assert _callWSGI(service, 'remaining', {}, None) == (200, 'null')
+    # clients which don't send the header may send their timeout in the body instead
+    status, body = _callWSGI(service, 'remaining', {'__timeout__': 5}, None)
+    assert status == 200 and 4000 < json.loads(body) <= 5000
+
+
+def test_expired_call_is_rejected() -> None:
+    service = _makeService({})
+    # the call is rejected without its body being read
+    assert _callWSGI(service, 'remaining', None, time.time() - 1) == (504, 'Deadline exceeded')
+
+
+def test_async_method_is_cancelled() -> None:
+    state = {'cancelled': False}
+    app = _makeService(state).get_asgi_app()
+    deadline = str(time.time() + 0.1).encode()
+    incoming = [{'type': 'http.request', 'body': b'{}', 'more_body': False}]
+    sent: List[Dict[str, Any]] = []
+
+    async def receive() -> Dict[str, Any]:
+        if incoming:
+            return incoming.pop(0)
+        await asyncio.sleep(60)
+        raise Exception('Test took too long')
+
+    async def send(message: Dict[str, Any]) -> None:
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/api.v1/call/slow',
+             'headers': [(b'x-bifrost-deadline', deadline)]}
+    started = time.monotonic()
+    asyncio.run(app(scope, receive, send))
+    assert time.monotonic() - started < 5
+    assert sent[0]['status'] == 504
+    assert state['cancelled']
+
+
+def test_queued_call_past_deadline_is_skipped() -> None:
+    pool = ExecutionPool('test', 'thread', workers=1, maxQueue=1)
+    release = threading.Event()
+    blocker = pool.submit(release.wait, {'timeout': 5})
+    skipped = pool.submit(lambda: 'ran', {}, 'normal', time.time() + 0.01)
+
+    time.sleep(0.02)
+    release.set()
+    blocker.result()
+    with pytest.raises(DeadlineExceededError):
+        skipped.result(timeout=5)
+    pool.shutdown()
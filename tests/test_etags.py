@@ -0,0 +1,170 @@
+import io
+import json
+from typing import Any, Dict, List, NewType, Optional, Tuple
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+from bifrostrpc import BifrostRPCService
+from bifrostrpc.etags import etagMatches
+
+UserID = NewType('UserID', int)
+
+
+@pytest.mark.parametrize('ifNoneMatch,expected', [
+    (None, False),
+    ('"abc"', True),
+    ('"abd"', False),
+    ('W/"abc"', True),
+    ('"x", "abc"', True),
+    ('*', True),
+])
+def test_etag_matches(ifNoneMatch: Optional[str], expected: bool) -> None:
+    assert etagMatches(ifNoneMatch, '"abc"') is expected
+
+
+def _makeService(calls: List[str]) -> BifrostRPCService:
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(1))
+    versions = {'a': 1}
+
+    @service.rpcmethod(idempotent=True)
+    def getItems(user: UserID, prefix: str) -> List[str]:
+        calls.append('getItems')
+        if prefix == 'bad':
+            raise Exception('Bad prefix')
+        return [prefix + 'x', prefix + 'y']
+
+    @service.rpcmethod(version=lambda user, key: f'{key}:{versions[key]}')
+    def getVersioned(user: UserID, key: str) -> int:
+        calls.append('getVersioned')
+        return versions[key]
+
+    @service.rpcmethod
+    def bump(user: UserID, key: str) -> int:
+        versions[key] += 1
+        return versions[key]
+
+    return service
+
+
+def _callWSGI(
+    service: BifrostRPCService,
+    method: str,
+    body: Any,
+    ifNoneMatch: str = None,
+) -> Tuple[int, Dict[str, str], bytes]:
+    data = json.dumps(body).encode()
+    environ = {
+        'PATH_INFO': '/api.v1/call/' + method,
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_LENGTH': str(len(data)),
+        'CONTENT_TYPE': 'application/json',
+        'wsgi.input': io.BytesIO(data),
+    }
+    if ifNoneMatch is not None:
+        environ['HTTP_IF_NONE_MATCH'] = ifNoneMatch
+    setup_testing_defaults(environ)
+
+    started: List[Tuple[str, List[Tuple[str, str]]]] = []
+
+    def start_response(status: str, headers: List[Tuple[str, str]]) -> None:
+        started.append((status, headers))
+
+    chunks = service.get_wsgi_app()(environ, start_response)
+    status, headers = started[0]
+    return int(status.split(' ')[0]), dict(headers), b''.join(chunks)
+
+
+def test_conditional_requests() -> None:
+    calls: List[str] = []
+    service = _makeService(calls)
+
+    status, headers, body = _callWSGI(service, 'getItems', {'prefix': 'p'})
+    assert (status, json.loads(body)) == (200, ['px', 'py'])
+    etag = headers['ETag']
+
+    status, headers, body = _callWSGI(service, 'getItems', {'prefix': 'p'}, etag)
+    assert (status, headers['ETag'], body) == (304, etag, b'')
+
+    # the ETag belongs to the response, so different args don't match it
+    status, headers, body = _callWSGI(service, 'getItems', {'prefix': 'q'}, etag)
+    assert status == 200
+    assert headers['ETag'] != etag
+    assert calls == ['getItems'] * 3
+
+    # methods aren't idempotent unless they say so
+    status, headers, _ = _callWSGI(service, 'bump', {'key': 'a'}, etag)
+    assert status == 200
+    assert 'ETag' not in headers
+
+    # error responses never get an ETag, even when any ETag would match
+    for ifNoneMatch in [None, '*']:
+        status, headers, _ = _callWSGI(service, 'getItems', {'prefix': 'bad'}, ifNoneMatch)
+        assert status == 500
+        assert 'ETag' not in headers
+
+
+def test_version_function() -> None:
+    calls: List[str] = []
+    service = _makeService(calls)
+
+    status, headers, body = _callWSGI(service, 'getVersioned', {'key': 'a'})
+    assert (status, json.loads(body)) == (200, 1)
+    etag = headers['ETag']
+
+    # a 304 doesn't need the method to be called
+    status, _, _ = _callWSGI(service, 'getVersioned', {'key': 'a'}, etag)
+    assert status == 304
+    assert calls == ['getVersioned']
+
+    _callWSGI(service, 'bump', {'key': 'a'})
+    status, headers, body = _callWSGI(service, 'getVersioned', {'key': 'a'}, etag)
+    assert (status, json.loads(body)) == (200, 2)
+    assert headers['ETag'] != etag
+
+
+def test_single_flight_version_function() -> None:
+    calls: List[str] = []
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(1))
+
+    @service.rpcmethod(version=lambda user, key: 'v1', single_flight=True)
+    def getShared(user: UserID, key: str) -> str:
+        calls.append(key)
+        return key
+
+    # the ETag still comes from the version function when the response may be shared
+    status, headers, _ = _callWSGI(service, 'getShared', {'key': 'a'})
+    assert status == 200
+    etag = headers['ETag']
+    status, headers, _ = _callWSGI(service, 'getShared', {'key': 'a'}, etag)
+    assert (status, headers['ETag']) == (304, etag)
+    assert calls == ['a']
+
+
+def test_flask_conditional_requests() -> None:
+    from flask import Flask
+
+    service = _makeService([])
+    flaskapp = Flask('test')
+    flaskapp.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+    client = flaskapp.test_client()
+
+    response = client.post('/api.v1/call/getItems', json={'prefix': 'p'})
+    etag = response.headers['ETag']
+    response = client.post(
+        '/api.v1/call/getItems',
+        json={'prefix': 'p'},
+        headers={'If-None-Match': etag},
+    )
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_version_and_cache_are_exclusive() -> None:
+    service = BifrostRPCService()
+    with pytest.raises(Exception, match="can't be combined"):
+        @service.rpcmethod(version=lambda: '1', cache=10)
+        def getThing() -> int:
+            return 1
@@ -0,0 +1,121 @@
+import io
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, List, NewType, Tuple
+
+import pytest
+
+from bifrostrpc import BifrostRPCService
+from bifrostrpc.deadlines import DeadlineExceededError
+from bifrostrpc.execution import ExecutionPool, PoolFullError
+
+UserID = NewType('UserID', int)
+
+
+def get_pid(user: UserID) -> int:
+    return os.getpid()
+
+
+def _call(service: BifrostRPCService, method: str) -> Tuple[int, Any]:
+    app = service.get_wsgi_app()
+    started: List[str] = []
+    body = b'{}'
+    chunks = app(
+        {
+            'PATH_INFO': f'/api.v1/call/{method}',
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+        },
+        lambda status, headers: started.append(status),
+    )
+    text = b''.join(chunks).decode()
+    status = int(started[0].split(' ')[0])
+    return status, json.loads(text) if status == 200 else text
+
+
+def test_process_pool() -> None:
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(1))
+    service.addExecutionPool('reports', 'process', workers=1)
+    service.rpcmethod(get_pid, execution='reports')
+
+    status, pid = _call(service, 'get_pid')
+    assert status == 200
+    assert pid != os.getpid()
+    assert service.getExecutionPoolStats()['reports'].completed == 1
+    service._pools['reports'].shutdown()
+
+
+def test_thread_pool_queue_limit() -> None:
+    release = threading.Event()
+
+    def block() -> int:
+        release.wait(5)
+        return 1
+
+    pool = ExecutionPool('slow', 'thread', workers=1, maxQueue=1)
+    futures = [pool.submit(block, {}), pool.submit(block, {})]
+    stats = pool.getStats()
+    assert (stats.running, stats.queued) == (1, 1)
+
+    with pytest.raises(PoolFullError):
+        pool.submit(block, {})
+
+    release.set()
+    assert [f.result() for f in futures] == [1, 1]
+    stats = pool.getStats()
+    assert (stats.running, stats.queued, stats.completed, stats.rejected) == (0, 0, 2, 1)
+    pool.shutdown()
+
+
+def test_skipping_many_queued_calls() -> None:
+    release = threading.Event()
+
+    def block() -> int:
+        release.wait(5)
+        return 1
+
+    count = sys.getrecursionlimit() * 2
+    pool = ExecutionPool('slow', 'thread', workers=1, maxQueue=count + 1)
+    first = pool.submit(block, {})
+    # a long run of queued calls which are cancelled or expire before a worker is free
+    skipped = [pool.submit(block, {}, deadline=time.time() - 1) for _ in range(count // 2)]
+    cancelled = [pool.submit(block, {}) for _ in range(count // 2)]
+    assert all(f.cancel() for f in cancelled)
+    last = pool.submit(block, {})
+
+    release.set()
+    assert (first.result(5), last.result(5)) == (1, 1)
+    assert all(isinstance(f.exception(), DeadlineExceededError) for f in skipped)
+    stats = pool.getStats()
+    assert (stats.running, stats.queued, stats.completed) == (0, 0, count + 2)
+    pool.shutdown()
+
+
+def test_pool_full_response() -> None:
+    release = threading.Event()
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(1))
+    service.addExecutionPool('slow', 'thread', workers=1)
+
+    @service.rpcmethod(execution='slow')
+    def wait(user: UserID) -> bool:
+        return release.wait(5)
+
+    # occupy the pool's only worker
+    busy = threading.Thread(target=_call, args=(service, 'wait'))
+    busy.start()
+    while service.getExecutionPoolStats()['slow'].running == 0:
+        pass
+
+    assert _call(service, 'wait') == (503, 'Server is too busy to handle this request')
+    release.set()
+    busy.join()
+    assert _call(service, 'wait') == (200, True)
+
+    with pytest.raises(Exception, match='already exists'):
+        service.addExecutionPool('slow', 'thread', workers=1)
@@ -1,7 +1,7 @@
 from typing import (Any, Callable, Dict, List, Literal, NewType, Optional,
                     Type, Union)
 
-from pytest import raises
+from pytest import mark, raises
 
 
 def test_get_int_type_spec() -> None:
@@ -349,3 +349,165 @@ def test_get_Literal_type_spec() -> None:
     assert isinstance(ts, LiteralTypeSpec)
     assert ts.expected == "hello"
     assert ts.expectedType is str
+
+
+def test_get_Enum_type_spec() -> None:
+    import enum
+
+    from bifrostrpc.typing import Advanced, EnumTypeSpec, getTypeSpec
+
+    class Colour(enum.Enum):
+        RED = 'r'
+        GREEN = 'g'
+
+    class Size(enum.IntEnum):
+        SMALL = 1
+        LARGE = 2
+
+    # unregistered enums are rejected
+    with raises(TypeError, match="unknown Enum"):
+        getTypeSpec(Colour, Advanced())
+
+    # int encoding is only possible when all values are ints
+    with raises(TypeError, match="non-int value"):
+        Advanced().addEnum(Colour, encoding='int')
+
+    adv = Advanced()
+    adv.addEnum(Colour)
+    adv.addEnum(Size, encoding='int')
+
+    errors: List[str] = []
+
+    # name encoding
+    ts = getTypeSpec(Colour, adv)
+    assert isinstance(ts, EnumTypeSpec)
+    assert ts.values == ['RED', 'GREEN']
+    assert ts.getImported('GREEN', 'c', onerr=errors.append) is Colour.GREEN
+    assert ts.getExported(Colour.RED, 'c', False, onerr=errors.append) == 'RED'
+    assert not errors
+    ts.getImported('g', 'c', onerr=errors.append)
+    ts.getImported(['RED'], 'c', onerr=errors.append)
+    ts.getExported('RED', 'c', False, onerr=errors.append)
+    assert len(errors) == 3
+
+    # int encoding
+    errors.clear()
+    ts = getTypeSpec(Size, adv)
+    assert isinstance(ts, EnumTypeSpec)
+    assert ts.values == [1, 2]
+    assert ts.getImported(2, 's', onerr=errors.append) is Size.LARGE
+    assert ts.getExported(Size.SMALL, 's', False, onerr=errors.append) == 1
+    assert type(ts.getExported(Size.SMALL, 's', False, onerr=errors.append)) is int
+    assert not errors
+    # bools and plain ints must not sneak through
+    ts.getImported(True, 's', onerr=errors.append)
+    ts.getImported('SMALL', 's', onerr=errors.append)
+    ts.getExported(1, 's', False, onerr=errors.append)
+    assert len(errors) == 3
+
+
+@mark.parametrize('encoding', ['iso', 'epoch_ms', 'epoch_us'])
+def test_get_temporal_type_spec(encoding: Any) -> None:
+    from datetime import date, datetime, timedelta, timezone
+
+    from bifrostrpc.typing import Advanced, TemporalTypeSpec, getTypeSpec
+
+    adv = Advanced(temporalEncoding=encoding)
+    errors: List[str] = []
+
+    values = [
+        datetime(2024, 3, 1, 12, 30, 5, 123000, tzinfo=timezone.utc),
+        date(2024, 3, 1),
+        timedelta(days=2, milliseconds=7),
+    ]
+    for value in values:
+        ts = getTypeSpec(type(value), adv)
+        assert isinstance(ts, TemporalTypeSpec)
+        assert ts.temporalType is type(value)
+
+        exported = ts.getExported(value, 'v', False, onerr=errors.append)
+        assert type(exported) is ts.wireType
+        assert ts.getImported(exported, 'v', onerr=errors.append) == value
+        assert not errors
+
+    if encoding == 'iso':
+        ts = getTypeSpec(datetime, adv)
+        assert ts.getExported(values[0], 'v', False, onerr=errors.append) == (
+            '2024-03-01T12:30:05.123000+00:00')
+        # javascript's Date.toISOString() uses a 'Z' suffix
+        assert ts.getImported('2024-03-01T12:30:05.123Z', 'v', onerr=errors.append) == values[0]
+        assert not errors
+    else:
+        # naive datetimes can't be converted to epoch timestamps
+        ts = getTypeSpec(datetime, adv)
+        ts.getExported(datetime(2024, 3, 1), 'v', False, onerr=errors.append)
+        assert len(errors) == 1
+        errors.clear()
+        # timestamps far from the epoch are imported without losing any precision
+        if encoding == 'epoch_us':
+            distant = datetime(2999, 12, 31, 23, 59, 59, 999999, tzinfo=timezone.utc)
+            exported = ts.getExported(distant, 'v', False, onerr=errors.append)
+            assert ts.getImported(exported, 'v', onerr=errors.append) == distant
+            assert not errors
+
+    # a datetime is not a valid date
+    getTypeSpec(date, adv).getExported(values[0], 'v', False, onerr=errors.append)
+    # wrong wire types
+    getTypeSpec(datetime, adv).getImported(True, 'v', onerr=errors.append)
+    getTypeSpec(timedelta, adv).getImported('5', 'v', onerr=errors.append)
+    assert len(errors) == 3
+
+
+def test_get_TypedDict_type_spec() -> None:
+    import enum
+    from typing import TypedDict
+
+    from bifrostrpc.typing import Advanced, TypedDictTypeSpec, getTypeSpec
+
+    class Colour(enum.Enum):
+        RED = 'r'
+
+    class Row(TypedDict):
+        rowId: int
+        name: str
+
+    class Patch(TypedDict, total=False):
+        name: str
+        colour: Colour
+
+    # unregistered TypedDicts are rejected
+    with raises(TypeError, match="unknown TypedDict"):
+        getTypeSpec(Row, Advanced())
+
+    adv = Advanced()
+    adv.addEnum(Colour)
+    adv.addTypedDict(Row)
+    adv.addTypedDict(Patch)
+
+    errors: List[str] = []
+
+    ts = getTypeSpec(Row, adv)
+    assert isinstance(ts, TypedDictTypeSpec)
+    assert ts.requiredKeys == {'rowId', 'name'}
+
+    # values that don't need converting are passed through without copying
+    row = {'rowId': 5, 'name': 'five'}
+    assert ts.getImported(row, 'r', onerr=errors.append) is row
+    assert ts.getExported(row, 'r', True, onerr=errors.append) is row
+    assert not errors
+
+    ts.getExported({'rowId': 5}, 'r', False, onerr=errors.append)
+    ts.getExported({'rowId': 5, 'name': 'five', 'extra': 1}, 'r', False, onerr=errors.append)
+    ts.getExported({'rowId': '5', 'name': 'five'}, 'r', False, onerr=errors.append)
+    assert len(errors) == 3
+
+    # total=False means no keys are required, and values needing conversion cause a copy
+    errors.clear()
+    ts = getTypeSpec(Patch, adv)
+    assert isinstance(ts, TypedDictTypeSpec)
+    assert ts.requiredKeys == frozenset()
+    assert ts.getImported({}, 'p', onerr=errors.append) == {}
+    patch = {'colour': 'RED'}
+    assert ts.getImported(patch, 'p', onerr=errors.append) == {'colour': Colour.RED}
+    assert patch == {'colour': 'RED'}
+    assert not errors
@@ -0,0 +1,129 @@
+import io
+import json
+import threading
+from typing import Any, Dict, List, NewType, Optional, Tuple
+from wsgiref.util import setup_testing_defaults
+
+from bifrostrpc import BifrostRPCService
+from bifrostrpc.idempotency import IdempotencyPolicy
+from bifrostrpc.wsgi import getEnviron
+
+UserID = NewType('UserID', int)
+
+
+def _makeService(state: Dict[str, Any]) -> BifrostRPCService:
+    service = BifrostRPCService(idempotency=IdempotencyPolicy(60))
+    service.addAuthType(UserID, lambda: UserID(int(getEnviron()['HTTP_X_USER'])))
+
+    @service.rpcmethod
+    def transfer(user: UserID, amount: int) -> int:
+        state['calls'] += 1
+        entered = state.get('entered')
+        if entered is not None:
+            entered.set()
+            state['release'].wait(5)
+        state['balance'] -= amount
+        return state['balance']
+
+    return service
+
+
+def _call(
+    app: Any,
+    body: Dict[str, Any],
+    key: Optional[str],
+    user: str = '1',
+) -> Tuple[int, Dict[str, str], str]:
+    data = json.dumps(body).encode()
+    environ = {
+        'PATH_INFO': '/api.v1/call/transfer',
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_LENGTH': str(len(data)),
+        'CONTENT_TYPE': 'application/json',
+        'HTTP_X_USER': user,
+        'wsgi.input': io.BytesIO(data),
+    }
+    if key is not None:
+        environ['HTTP_IDEMPOTENCY_KEY'] = key
+    setup_testing_defaults(environ)
+    started: List[Tuple[str, List[Tuple[str, str]]]] = []
+
+    def start_response(status: str, headers: List[Tuple[str, str]]) -> None:
+        started.append((status, headers))
+
+    chunks = app(environ, start_response)
+    status, headers = started[0]
+    return int(status.split(' ')[0]), dict(headers), b''.join(chunks).decode()
+
+
+def test_retries_are_replayed() -> None:
+    state = {'calls': 0, 'balance': 100}
+    service = _makeService(state)
+    app = service.get_wsgi_app()
+
+    assert _call(app, {'amount': 10}, 'a')[2] == '90'
+    # a retry (even with a different timeout) gets the first attempt's response
+    status, headers, body = _call(app, {'amount': 10, '__timeout__': 5}, 'a')
+    assert (status, headers['Idempotent-Replayed'], body) == (200, 'true', '90')
+    assert state['calls'] == 1
+
+    # keys are scoped to the caller, and calls without a key are never replayed
+    assert _call(app, {'amount': 10}, 'a', user='2')[2] == '80'
+    assert _call(app, {'amount': 10}, None)[2] == '70'
+    assert _call(app, {'amount': 10}, None)[2] == '60'
+    # clients which don't send the header may send their key in the body
+    assert _call(app, {'amount': 10, '__idempotency_key__': 'b'}, None)[2] == '50'
+    assert _call(app, {'amount': 10}, 'b')[2] == '50'
+
+    # a key can't be reused for a different call
+    status, _, body = _call(app, {'amount': 20}, 'a')
+    assert status == 422 and 'different request' in body
+    assert state['calls'] == 5
+
+    stats = service.getIdempotencyStats()
+    assert stats is not None
+    assert (stats.stored, stats.replayed, stats.conflicts) == (3, 2, 1)
+
+
+def test_header_is_ignored_unless_enabled() -> None:
+    state = {'calls': 0, 'balance': 100}
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(1))
+
+    @service.rpcmethod
+    def transfer(user: UserID, amount: int) -> int:
+        state['balance'] -= amount
+        return state['balance']
+
+    app = service.get_wsgi_app()
+    assert [_call(app, {'amount': 10}, 'a')[2] for _ in range(2)] == ['90', '80']
+    assert service.getIdempotencyStats() is None
+
+
+def test_concurrent_duplicates_wait() -> None:
+    state = {
+        'calls': 0,
+        'balance': 100,
+        'entered': threading.Event(),
+        'release': threading.Event(),
+    }
+    service = _makeService(state)
+    app = service.get_wsgi_app()
+    results: List[Tuple[int, Dict[str, str], str]] = []
+
+    first = threading.Thread(target=lambda: results.append(_call(app, {'amount': 10}, 'a')))
+    first.start()
+    assert state['entered'].wait(5)
+    # the retry arrives while the first attempt is still running
+    second = threading.Thread(target=lambda: results.append(_call(app, {'amount': 10}, 'a')))
+    second.start()
+    second.join(0.1)
+    assert second.is_alive()
+
+    state['release'].set()
+    first.join(5)
+    second.join(5)
+    assert [body for _, _, body in results] == ['90', '90']
+    assert state['calls'] == 1
+    stats = service.getIdempotencyStats()
+    assert stats is not None and stats.waited == 1
@@ -0,0 +1,206 @@
+import asyncio
+import threading
+from typing import Any, Dict, List, NewType
+
+import pytest
+
+from bifrostrpc import BifrostRPCService
+from bifrostrpc.lifetimes import ObjectPool, PoolTimeoutError
+
+UserID = NewType('UserID', int)
+
+
+class Counter:
+    created = 0
+
+    def __init__(self) -> None:
+        Counter.created += 1
+        self.id = Counter.created
+
+
+PerCall = NewType('PerCall', Counter)
+PerRequest = NewType('PerRequest', Counter)
+PerThread = NewType('PerThread', Counter)
+PerProcess = NewType('PerProcess', Counter)
+Pooled = NewType('Pooled', Counter)
+
+
+def _makeService() -> BifrostRPCService:
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(1))
+    service.addInternalType(PerCall, lambda: PerCall(Counter()))
+    service.addInternalType(PerRequest, lambda: PerRequest(Counter()), lifetime='request')
+    service.addInternalType(PerThread, lambda: PerThread(Counter()), lifetime='thread')
+    service.addInternalType(PerProcess, lambda: PerProcess(Counter()), lifetime='process')
+    service.addInternalType(
+        Pooled,
+        lambda: Pooled(Counter()),
+        lifetime='pooled',
+        pool_size=1,
+        pool_timeout=0.05,
+    )
+
+    @service.rpcmethod
+    def ids(
+        user: UserID,
+        c1: PerCall,
+        c2: PerCall,
+        r1: PerRequest,
+        r2: PerRequest,
+        t: PerThread,
+        p: PerProcess,
+    ) -> List[int]:
+        return [c1.id, c2.id, r1.id, r2.id, t.id, p.id]
+
+    @service.rpcmethod
+    def pooled(user: UserID, value: Pooled) -> int:
+        return value.id
+
+    @service.rpcmethod
+    async def pooled_async(user: UserID, value: Pooled) -> int:
+        await asyncio.sleep(0)
+        return value.id
+
+    return service
+
+
+def _post(service: BifrostRPCService, method: str) -> Any:
+    from flask import Flask
+
+    app = Flask('test')
+    app.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+    response = app.test_client().post(f'/api.v1/call/{method}', json={})
+    return response.status_code, response.get_json()
+
+
+def test_lifetimes() -> None:
+    service = _makeService()
+
+    status, first = _post(service, 'ids')
+    assert status == 200
+    c1, c2, r1, r2, t, p = first
+    assert len({c1, c2, r1}) == 3
+    assert r1 == r2
+
+    results: List[List[int]] = []
+    thread = threading.Thread(target=lambda: results.append(_post(service, 'ids')[1]))
+    thread.start()
+    thread.join()
+    c1b, c2b, r1b, r2b, tb, pb = results[0]
+    # only the per-process value is shared with the other thread
+    assert len({c1, c2, r1, t, c1b, c2b, r1b, tb}) == 8
+    assert pb == p
+    # the same thread gets its value again
+    assert _post(service, 'ids')[1][4:] == [t, p]
+
+
+def test_thread_lifetime_follows_method() -> None:
+    Ident = NewType('Ident', int)
+
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(1))
+    service.addInternalType(Ident, lambda: Ident(threading.get_ident()), lifetime='thread')
+    service.addExecutionPool('workers', 'thread', workers=1)
+
+    @service.rpcmethod
+    def inline(user: UserID, ident: Ident) -> bool:
+        return ident == threading.get_ident()
+
+    @service.rpcmethod(execution='workers')
+    def pooled(user: UserID, ident: Ident) -> bool:
+        return ident == threading.get_ident()
+
+    # the value belongs to the thread which runs the method, not the one handling the request
+    assert _post(service, 'inline') == (200, True)
+    assert _post(service, 'pooled') == (200, True)
+
+    app = service.get_asgi_app()
+
+    async def call(method: str) -> bytes:
+        sent: List[Dict[str, Any]] = []
+        incoming = [{'type': 'http.request', 'body': b'{}', 'more_body': False}]
+
+        async def receive() -> Dict[str, Any]:
+            if incoming:
+                return incoming.pop()
+            await asyncio.sleep(60)
+            raise Exception('Test took too long')
+
+        async def send(message: Dict[str, Any]) -> None:
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': f'/api.v1/call/{method}', 'headers': []}
+        await app(scope, receive, send)
+        return bytes(sent[1]['body'])
+
+    async def callAll() -> List[bytes]:
+        return [await call('inline'), await call('pooled')]
+
+    assert asyncio.run(callAll()) == [b'true', b'true']
+    service._pools['workers'].shutdown()
+
+
+def test_pooled() -> None:
+    service = _makeService()
+
+    # the pool's only value is returned after each call
+    assert _post(service, 'pooled') == _post(service, 'pooled')
+    stats = service.getContextPoolStats()['Pooled']
+    assert (stats.size, stats.inUse, stats.checkouts, stats.waits) == (1, 0, 2, 0)
+
+
+def test_pooled_asgi() -> None:
+    service = _makeService()
+    app = service.get_asgi_app()
+
+    async def call(method: str) -> int:
+        sent: List[Dict[str, Any]] = []
+        incoming = [{'type': 'http.request', 'body': b'{}', 'more_body': False}]
+
+        async def receive() -> Dict[str, Any]:
+            if incoming:
+                return incoming.pop()
+            await asyncio.sleep(60)
+            raise Exception('Test took too long')
+
+        async def send(message: Dict[str, Any]) -> None:
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': f'/api.v1/call/{method}', 'headers': []}
+        await app(scope, receive, send)
+        return int(sent[0]['status'])
+
+    async def callAll() -> List[int]:
+        return [await call('pooled'), await call('pooled_async'), await call('pooled')]
+
+    assert asyncio.run(callAll()) == [200, 200, 200]
+    stats = service.getContextPoolStats()['Pooled']
+    assert (stats.size, stats.inUse, stats.checkouts) == (1, 0, 3)
+
+
+def test_object_pool() -> None:
+    pool = ObjectPool('thing', object, maxSize=2, timeout=0.05)
+    a = pool.acquire()
+    b = pool.acquire()
+    assert a is not b
+
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+
+    timer = threading.Timer(0.01, pool.release, [a])
+    timer.start()
+    assert pool.acquire() is a
+    timer.join()
+
+    stats = pool.getStats()
+    assert (stats.size, stats.inUse, stats.checkouts) == (2, 2, 3)
+    assert (stats.waits, stats.timeouts) == (2, 1)
+    assert stats.waitTime >= stats.maxWaitTime >= 0.04
+
+
+def test_async_factory_lifetime() -> None:
+    async def factory() -> PerThread:
+        return PerThread(Counter())
+
+    with pytest.raises(TypeError, match="can't be async with lifetime='thread'"):
+        BifrostRPCService().addInternalType(PerThread, factory, lifetime='thread')
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+from typing import List, NewType
+
+import pytest
+
+from bifrostrpc import BifrostRPCService
+from bifrostrpc.limits import (ConcurrencyLimiter, ConcurrencyLimitPolicy,
+                               OverloadedError)
+
+UserID = NewType('UserID', int)
+
+
+def test_queue_limits() -> None:
+    limiter = ConcurrencyLimiter('test', ConcurrencyLimitPolicy(
+        initialLimit=1,
+        maxQueue=1,
+        queueTimeout=0.05,
+        retryAfter=3,
+    ))
+    started = limiter.acquire()
+
+    # one call can wait, but gives up after queueTimeout
+    with pytest.raises(OverloadedError, match='waited more than'):
+        limiter.acquire()
+
+    waiting = threading.Thread(target=lambda: pytest.raises(OverloadedError, limiter.acquire))
+    waiting.start()
+    time.sleep(0.01)
+    # and there's no room for another
+    with pytest.raises(OverloadedError, match='queue is full') as info:
+        limiter.acquire()
+    assert info.value.retryAfter == 3
+    waiting.join()
+
+    limiter.release(started)
+    stats = limiter.getStats()
+    assert (stats.inFlight, stats.queued, stats.accepted, stats.rejected) == (0, 0, 1, 3)
+
+
+def test_waiting_call_is_admitted() -> None:
+    limiter = ConcurrencyLimiter('test', ConcurrencyLimitPolicy(initialLimit=1, queueTimeout=5))
+
+    async def _main() -> List[str]:
+        events: List[str] = []
+        started = await limiter.acquireAsync()
+
+        async def _second() -> None:
+            limiter.release(await limiter.acquireAsync())
+            events.append('second')
+
+        task = asyncio.ensure_future(_second())
+        await asyncio.sleep(0.01)
+        assert limiter.getStats().queued == 1
+        events.append('first')
+        limiter.release(started)
+        await task
+        return events
+
+    assert asyncio.run(_main()) == ['first', 'second']
+
+
+def test_adaptive_limit() -> None:
+    limiter = ConcurrencyLimiter('test', ConcurrencyLimitPolicy(initialLimit=10, maxLimit=11))
+    # pylint: disable=protected-access
+    for _ in range(30):
+        limiter.acquire()
+        limiter._release(0.01)
+    # fast calls let the limit grow, up to maxLimit
+    assert limiter.getStats().limit == 11
+
+    limiter.acquire()
+    limiter._release(1.0)
+    # a slow call makes it back off
+    assert limiter.getStats().limit == 9
+
+
+def test_overloaded_response() -> None:
+    from flask import Flask
+
+    release = threading.Event()
+    service = BifrostRPCService(
+        concurrency_limit=ConcurrencyLimitPolicy(initialLimit=1, maxQueue=0),
+    )
+    service.addAuthType(UserID, lambda: UserID(1))
+
+    @service.rpcmethod
+    def slow(user: UserID) -> int:
+        release.wait(5)
+        return 1
+
+    @service.rpcmethod(concurrency_limit=ConcurrencyLimitPolicy(initialLimit=5))
+    def fast(user: UserID) -> int:
+        return 2
+
+    flaskapp = Flask('test')
+    flaskapp.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+
+    def _call(method: str) -> None:
+        responses.append(flaskapp.test_client().post(f'/api.v1/call/{method}', json={}))
+
+    responses: List[object] = []
+    first = threading.Thread(target=_call, args=('slow', ))
+    first.start()
+    for _ in range(100):
+        if service.getConcurrencyLimitStats()['*'].inFlight:
+            break
+        time.sleep(0.01)
+
+    response = flaskapp.test_client().post('/api.v1/call/slow', json={})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    # methods with their own limit aren't affected
+    assert flaskapp.test_client().post('/api.v1/call/fast', json={}).get_json() == 2
+
+    release.set()
+    first.join()
+    stats = service.getConcurrencyLimitStats()
+    assert (stats['*'].accepted, stats['*'].rejected, stats['fast'].accepted) == (1, 1, 1)
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import threading
+from typing import Any, Dict, List, NewType
+
+import pytest
+
+from bifrostrpc import ArgumentError, BifrostRPCService
+from bifrostrpc.loaders import BatchLoader
+
+UserID = NewType('UserID', int)
+
+ACTORS = {1: ['Alice', 'Bob'], 2: ['Carol']}
+
+
+def _makeService(batches: List[List[int]], isAsync: bool) -> BifrostRPCService:
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(1))
+
+    @service.rpcmethod
+    def get_actors(user: UserID, movie_id: int) -> List[str]:
+        raise Exception('Should have used the batch handler')
+
+    def getResults(calls: List[Dict[str, Any]]) -> List[Any]:
+        ids = [call['movie_id'] for call in calls]
+        batches.append(sorted(ids))
+        return [
+            ACTORS[i] if i in ACTORS else ArgumentError(f'No movie with id {i}')
+            for i in ids
+        ]
+
+    async def getResultsAsync(calls: List[Dict[str, Any]]) -> List[Any]:
+        await asyncio.sleep(0)
+        return getResults(calls)
+
+    service.addBatchHandler(
+        'get_actors',
+        getResultsAsync if isAsync else getResults,
+        max_size=3,
+        window=0.2,
+    )
+    return service
+
+
+def test_threaded_batch_handler() -> None:
+    from flask import Flask
+
+    batches: List[List[int]] = []
+    service = _makeService(batches, isAsync=False)
+    flaskapp = Flask('test')
+    flaskapp.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+    results: Dict[int, Any] = {}
+
+    def _call(movie_id: int) -> None:
+        response = flaskapp.test_client().post(
+            '/api.v1/call/get_actors',
+            json={'movie_id': movie_id},
+        )
+        results[movie_id] = (response.status_code, response.get_data(as_text=True))
+
+    threads = [threading.Thread(target=_call, args=(i, )) for i in (1, 2, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # max_size was reached, so the batch didn't wait for the rest of the window
+    assert batches == [[1, 2, 3]]
+    assert results[1][0] == 200 and json.loads(results[1][1]) == ['Alice', 'Bob']
+    assert results[2][0] == 200 and json.loads(results[2][1]) == ['Carol']
+    assert results[3] == (500, 'No movie with id 3.')
+    stats = service.getBatchHandlerStats()['get_actors']
+    assert (stats.batches, stats.calls, stats.largestBatch) == (1, 3, 3)
+
+
+def test_async_batch_handler() -> None:
+    batches: List[List[int]] = []
+    service = _makeService(batches, isAsync=True)
+    app = service.get_asgi_app()
+
+    async def _call(movie_id: int) -> Any:
+        scope = {'type': 'http', 'method': 'POST', 'path': '/api.v1/call/get_actors',
+                 'headers': []}
+        incoming = [{'type': 'http.request', 'body': json.dumps({'movie_id': movie_id}).encode()}]
+        sent: List[Dict[str, Any]] = []
+
+        async def receive() -> Dict[str, Any]:
+            if incoming:
+                return incoming.pop(0)
+            await asyncio.sleep(60)
+            raise Exception('Test took too long')
+
+        async def send(message: Dict[str, Any]) -> None:
+            sent.append(message)
+
+        await app(scope, receive, send)
+        return json.loads(sent[1]['body'])
+
+    async def _main() -> List[Any]:
+        return await asyncio.gather(_call(1), _call(2))
+
+    # the two calls are answered together once the window has passed
+    assert asyncio.run(_main()) == [['Alice', 'Bob'], ['Carol']]
+    assert batches == [[1, 2]]
+
+
+def test_batch_handler_result_count() -> None:
+    loader = BatchLoader('get', lambda calls: [], maxSize=10, window=0)
+    with pytest.raises(Exception, match='returned 0 results for 1 calls'):
+        loader.load(a=1)
@@ -0,0 +1,155 @@
+import threading
+import time
+from typing import List, NewType
+
+from bifrostrpc import BifrostRPCService
+from bifrostrpc.execution import ExecutionPool
+from bifrostrpc.limits import ConcurrencyLimiter, ConcurrencyLimitPolicy
+from bifrostrpc.priority import PriorityQueue, getPriority
+
+UserID = NewType('UserID', int)
+
+
+def test_priority_queue() -> None:
+    now = [0.0]
+    queue: PriorityQueue[str] = PriorityQueue(agingInterval=1.0, clock=lambda: now[0])
+    queue.push('low1', 'low')
+    queue.push('normal1', 'normal')
+    queue.push('high1', 'high')
+    queue.push('high2', 'high')
+    assert [queue.pop(), queue.pop(), queue.pop()] == ['high1', 'high2', 'normal1']
+
+    # low1 has waited long enough to be treated as 'high', and it was queued first
+    now[0] = 2.0
+    queue.push('high3', 'high')
+    assert [queue.pop(), queue.pop()] == ['low1', 'high3']
+    assert len(queue) == 0
+
+    stats = queue.getStats()
+    assert (stats['low'].dequeued, stats['low'].maxWait) == (1, 2.0)
+    assert (stats['high'].dequeued, stats['high'].totalWait) == (3, 0.0)
+
+
+def test_get_priority() -> None:
+    assert getPriority('normal', None) == 'normal'
+    assert getPriority('normal', 'Low') == 'low'
+    # callers can't raise the priority of a call
+    assert getPriority('normal', 'high') == 'normal'
+    assert getPriority('high', 'bogus') == 'high'
+
+
+def test_execution_pool_priority() -> None:
+    pool = ExecutionPool('test', 'thread', workers=1, maxQueue=5)
+    release = threading.Event()
+    started: List[str] = []
+
+    def _start(name: str) -> None:
+        started.append(name)
+
+    blocker = pool.submit(release.wait, {'timeout': 5})
+    futures = [
+        pool.submit(_start, {'name': name}, priority)
+        for name, priority in [('low', 'low'), ('normal', 'normal'), ('high', 'high')]
+    ]
+    assert pool.getStats().queued == 3
+
+    release.set()
+    blocker.result()
+    for future in futures:
+        future.result()
+    assert started == ['high', 'normal', 'low']
+
+    stats = pool.getStats()
+    assert (stats.running, stats.queued, stats.completed) == (0, 0, 4)
+    assert stats.queueTimes['low'].dequeued == 1
+    assert stats.queueTimes['low'].maxWait >= stats.queueTimes['high'].maxWait
+    pool.shutdown()
+
+
+def test_cancelled_call_is_skipped() -> None:
+    pool = ExecutionPool('test', 'thread', workers=1, maxQueue=5)
+    release = threading.Event()
+    blocker = pool.submit(release.wait, {'timeout': 5})
+    cancelled = pool.submit(time.sleep, {'secs': 5})
+    assert cancelled.cancel()
+    after = pool.submit(lambda: 'after', {})
+
+    release.set()
+    blocker.result()
+    assert after.result(timeout=5) == 'after'
+    pool.shutdown()
+
+
+def test_limiter_priority() -> None:
+    limiter = ConcurrencyLimiter('test', ConcurrencyLimitPolicy(
+        initialLimit=1,
+        maxLimit=1,
+        queueTimeout=5,
+    ))
+    started = limiter.acquire()
+    admitted: List[str] = []
+
+    def _call(name: str, priority: str) -> None:
+        started = limiter.acquire(priority)  # type: ignore
+        admitted.append(name)
+        limiter.release(started)
+
+    threads = []
+    for name, priority in [('low', 'low'), ('high', 'high')]:
+        threads.append(threading.Thread(target=_call, args=(name, priority)))
+        threads[-1].start()
+        # make sure the calls are queued in this order
+        while limiter.getStats().queued < len(threads):
+            time.sleep(0.001)
+
+    limiter.release(started)
+    for thread in threads:
+        thread.join()
+    assert admitted == ['high', 'low']
+    assert limiter.getStats().queueTimes['low'].dequeued == 1
+
+
+def test_priority_header() -> None:
+    from flask import Flask
+
+    release = threading.Event()
+    started: List[str] = []
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(1))
+    service.addExecutionPool('slow', 'thread', workers=1, max_queue=5)
+
+    @service.rpcmethod(execution='slow')
+    def block(user: UserID) -> int:
+        release.wait(5)
+        return 1
+
+    @service.rpcmethod(execution='slow', priority='high')
+    def record(user: UserID, name: str) -> int:
+        started.append(name)
+        return 1
+
+    flaskapp = Flask('test')
+    flaskapp.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+
+    def _call(method: str, name: str, header: str = None) -> None:
+        flaskapp.test_client().post(
+            f'/api.v1/call/{method}',
+            json={'name': name} if method == 'record' else {},
+            headers={'X-Bifrost-Priority': header} if header else {},
+        )
+
+    threads = [threading.Thread(target=_call, args=('block', ''))]
+    threads[0].start()
+    while service.getExecutionPoolStats()['slow'].running < 1:
+        time.sleep(0.001)
+    for name, header in [('background', 'low'), ('interactive', None)]:
+        threads.append(threading.Thread(target=_call, args=('record', name, header)))
+        threads[-1].start()
+        while service.getExecutionPoolStats()['slow'].queued < len(threads) - 1:
+            time.sleep(0.001)
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    # the background call was lowered from 'high' to 'low', so it started last
+    assert started == ['interactive', 'background']
@@ -0,0 +1,130 @@
+import io
+import json
+from pathlib import Path
+from typing import Any, Dict, List, NewType, Tuple
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+from bifrostrpc import BifrostRPCService
+from bifrostrpc.ratelimits import (MemoryRateLimitBackend, RateLimitedError,
+                                   RateLimiter, RateLimitPolicy,
+                                   SQLiteRateLimitBackend)
+from bifrostrpc.wsgi import getEnviron
+
+UserID = NewType('UserID', int)
+
+
+def test_memory_backend() -> None:
+    now = [0.0]
+    backend = MemoryRateLimitBackend(maxBuckets=2, clock=lambda: now[0])
+    # a full bucket allows a burst of 2 calls
+    assert [backend.take('a', 1.0, 2) for _ in range(3)] == [0, 0, 1.0]
+
+    now[0] = 0.5
+    assert backend.take('a', 1.0, 2) == 0.5
+    now[0] = 1.0
+    assert backend.take('a', 1.0, 2) == 0
+    # other keys have their own buckets
+    assert backend.take('b', 1.0, 2) == 0
+
+    # the least recently used bucket is dropped (refilled)
+    backend.take('c', 1.0, 2)
+    assert backend.take('a', 1.0, 2) == 0
+
+
+def test_sqlite_backend_is_shared(tmp_path: Path) -> None:
+    path = tmp_path / 'ratelimits.db'
+    # e.g. two server workers
+    first = RateLimiter('m', RateLimitPolicy(calls=2, period=60), SQLiteRateLimitBackend(path))
+    second = RateLimiter('m', RateLimitPolicy(calls=2, period=60), SQLiteRateLimitBackend(path))
+    first.take('1')
+    second.take('1')
+    with pytest.raises(RateLimitedError) as info:
+        first.take('1')
+    assert 29 < info.value.retryAfter <= 30
+    second.take('2')
+    assert (first.getStats().allowed, first.getStats().limited) == (1, 1)
+
+
+class _UnreadableInput:
+    def read(self, *args: Any) -> bytes:
+        raise Exception('The request body should not have been read')
+
+
+def _call(app: Any, method: str, user: str, readable: bool = True) -> Tuple[int, Dict[str, str]]:
+    data = json.dumps({}).encode()
+    environ = {
+        'PATH_INFO': f'/api.v1/call/{method}',
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_LENGTH': str(len(data)),
+        'CONTENT_TYPE': 'application/json',
+        'HTTP_X_USER': user,
+        'wsgi.input': io.BytesIO(data) if readable else _UnreadableInput(),
+    }
+    setup_testing_defaults(environ)
+    started: List[Tuple[str, List[Tuple[str, str]]]] = []
+
+    def start_response(status: str, headers: List[Tuple[str, str]]) -> None:
+        started.append((status, headers))
+
+    app(environ, start_response)
+    return int(started[0][0].split(' ')[0]), dict(started[0][1])
+
+
+def test_rate_limited_response() -> None:
+    service = BifrostRPCService(rate_limit=RateLimitPolicy(calls=1, period=10))
+    service.addAuthType(UserID, lambda: UserID(int(getEnviron()['HTTP_X_USER'])))
+
+    @service.rpcmethod
+    def ping(user: UserID) -> int:
+        return 1
+
+    @service.rpcmethod(rate_limit=RateLimitPolicy(calls=2, period=10))
+    def pong(user: UserID) -> int:
+        return 2
+
+    app = service.get_wsgi_app()
+    assert _call(app, 'ping', '1')[0] == 200
+    # the call is rejected before its body is read
+    status, headers = _call(app, 'ping', '1', readable=False)
+    assert (status, headers['Retry-After']) == (429, '10')
+    # other callers and methods with their own limit aren't affected
+    assert _call(app, 'ping', '2')[0] == 200
+    assert [_call(app, 'pong', '1')[0] for _ in range(3)] == [200, 200, 429]
+
+    stats = service.getRateLimitStats()
+    assert (stats['*'].allowed, stats['*'].limited) == (2, 1)
+    assert (stats['pong'].allowed, stats['pong'].limited) == (2, 1)
+
+
+class _User:
+    def __init__(self, userId: int) -> None:
+        self.userId = userId
+
+
+Session = NewType('Session', _User)
+
+
+def test_caller_identity() -> None:
+    def _makeService(**kwargs: Any) -> BifrostRPCService:
+        service = BifrostRPCService(rate_limit=RateLimitPolicy(calls=1, period=10))
+        # a new object for every request, whose repr() would differ each time
+        service.addAuthType(
+            Session,
+            lambda: Session(_User(int(getEnviron()['HTTP_X_USER']))),
+            **kwargs,
+        )
+
+        @service.rpcmethod
+        def ping(session: Session) -> int:
+            return 1
+
+        return service
+
+    # objects can't identify a caller by themselves
+    assert _call(_makeService().get_wsgi_app(), 'ping', '1')[0] == 500
+
+    app = _makeService(identity=lambda session: session.userId).get_wsgi_app()
+    assert [_call(app, 'ping', '1')[0] for _ in range(2)] == [200, 429]
+    assert _call(app, 'ping', '2')[0] == 200
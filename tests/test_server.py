@@ -0,0 +1,178 @@
+import http.client
+import io
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import textwrap
+import time
+from pathlib import Path
+from typing import Any, Tuple
+
+import pytest
+
+SCRIPT = '''
+import os
+from typing import NewType
+
+from bifrostrpc import BifrostRPCService
+
+UserID = NewType('UserID', int)
+
+service = BifrostRPCService()
+service.addAuthType(UserID, lambda: UserID(1))
+
+
+@service.rpcmethod
+def get_pid(user: UserID) -> int:
+    return os.getpid()
+
+
+service.serve(port={port}, workers=2)
+'''
+
+
+def _getFreePort() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return int(sock.getsockname()[1])
+
+
+def _call(conn: http.client.HTTPConnection) -> Tuple[int, Any]:
+    conn.request('POST', '/api.v1/call/get_pid', body=b'{}', headers={
+        'Content-Type': 'application/json',
+    })
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def _getExpectContinueHead(method: str) -> bytes:
+    return (
+        f'POST /api.v1/call/{method} HTTP/1.1\r\n'
+        'Host: localhost\r\n'
+        'Content-Type: application/json\r\n'
+        'Content-Length: 2\r\n'
+        'Expect: 100-continue\r\n'
+        '\r\n'
+    ).encode()
+
+
+def _isRunning(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def _waitForServer(port: int) -> None:
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork()')
+def test_serve(tmp_path: Path) -> None:
+    port = _getFreePort()
+    script = tmp_path / 'service.py'
+    script.write_text(textwrap.dedent(SCRIPT.format(port=port)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    proc = subprocess.Popen([sys.executable, str(script)], env=env)
+    try:
+        _waitForServer(port)
+
+        # two calls on the same keep-alive connection are handled by the same worker
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        status, pid1 = _call(conn)
+        assert status == 200
+        assert _call(conn) == (200, pid1)
+        assert pid1 != proc.pid
+        conn.close()
+
+        # with "Expect: 100-continue", the body is only requested once the call is accepted
+        with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+            sock.sendall(_getExpectContinueHead('nope'))
+            assert sock.recv(4096).startswith(b'HTTP/1.1 501 ')
+        with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+            sock.sendall(_getExpectContinueHead('get_pid'))
+            assert sock.recv(4096) == b'HTTP/1.1 100 Continue\r\n\r\n'
+            sock.sendall(b'{}')
+            assert sock.recv(4096).startswith(b'HTTP/1.1 200 ')
+
+        # a chunked body is decoded, and the connection stays usable afterwards
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        conn.request('POST', '/api.v1/call/get_pid', body=iter([b'{', b'}']), headers={
+            'Content-Type': 'application/json',
+        }, encode_chunked=True)
+        response = conn.getresponse()
+        status, pid = response.status, json.loads(response.read())
+        assert status == 200
+        assert _call(conn) == (200, pid)
+
+        # a SIGHUP sent to the whole process group (e.g. when the terminal closes) only reloads
+        # through the master, so it doesn't kill a worker in the middle of its requests
+        os.kill(pid, signal.SIGHUP)
+        time.sleep(0.2)
+        assert _call(conn) == (200, pid)
+        conn.close()
+
+        # after a reload, the old workers exit and requests are served by new workers
+        proc.send_signal(signal.SIGHUP)
+        deadline = time.monotonic() + 10
+        while _isRunning(pid1):
+            assert time.monotonic() < deadline
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            assert _call(conn)[0] == 200
+            conn.close()
+            time.sleep(0.05)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        status, pid2 = _call(conn)
+        conn.close()
+        assert status == 200
+        assert pid2 != pid1
+
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=15) == 0
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+
+
+def test_chunked_body_reader() -> None:
+    from bifrostrpc.server import _ChunkedBodyReader
+
+    rfile = io.BytesIO(b'4;ext=1\r\n{"a"\r\n3\r\n: 1\r\n1\r\n}\r\n0\r\nX-Trailer: 1\r\n\r\nNEXT')
+    reader = _ChunkedBodyReader(rfile, None)
+    assert reader.read(2) == b'{"'
+    assert not reader.exhausted
+    assert reader.read() == b'a": 1}'
+    assert reader.exhausted
+    assert reader.read() == b''
+    # nothing after the body was consumed
+    assert rfile.read() == b'NEXT'
+
+    for invalid in [b'x\r\n', b'2\r\n{}0\r\n\r\n', b'2\r\n{']:
+        with pytest.raises(Exception):
+            _ChunkedBodyReader(io.BytesIO(invalid), None).read()
+
+
+def test_respawn_backoff() -> None:
+    from bifrostrpc.server import RESPAWN_DELAY_MAX, RESPAWN_DELAY_MIN, _Master
+
+    master = _Master(lambda environ, start_response: [], '127.0.0.1', 0, 1, 5, 5)
+    # workers which keep crashing at startup are restarted less and less often
+    delays = [master._scheduleRespawn(0.0) for _ in range(12)]
+    assert delays[:3] == [RESPAWN_DELAY_MIN, RESPAWN_DELAY_MIN * 2, RESPAWN_DELAY_MIN * 4]
+    assert delays[-1] == RESPAWN_DELAY_MAX
+    # a worker which was healthy for a while is restarted immediately
+    assert master._scheduleRespawn(60.0) == 0
+    assert master._scheduleRespawn(0.0) == RESPAWN_DELAY_MIN
+    assert len(master.respawns) == 14
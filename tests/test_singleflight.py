@@ -0,0 +1,328 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, List, NewType
+
+from bifrostrpc import BifrostRPCService
+from bifrostrpc.asgi import getHeader
+
+UserID = NewType('UserID', int)
+
+
+def test_threaded_single_flight() -> None:
+    from flask import Flask, request
+
+    release = threading.Event()
+    calls: List[int] = []
+
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(int(request.headers['X-User'])))
+
+    @service.rpcmethod(single_flight=True)
+    def lookup(user: UserID, key: str) -> List[str]:
+        calls.append(user)
+        release.wait(5)
+        return [key, str(len(calls))]
+
+    flaskapp = Flask('test')
+    flaskapp.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+    results: List[Any] = []
+
+    def _call(user: str) -> None:
+        response = flaskapp.test_client().post(
+            '/api.v1/call/lookup',
+            json={'key': 'k'},
+            headers={'X-User': user},
+        )
+        results.append((user, response.get_json()))
+
+    threads = [threading.Thread(target=_call, args=(user, )) for user in '55552']
+    for thread in threads:
+        thread.start()
+    for _ in range(100):
+        if service.getSingleFlightStats()['lookup'].coalesced == 3:
+            break
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    # calls from different users are never coalesced
+    assert sorted(calls) == [2, 5]
+    stats = service.getSingleFlightStats()['lookup']
+    assert (stats.executions, stats.coalesced, stats.inFlight) == (2, 3, 0)
+    fives = [result for user, result in results if user == '5']
+    assert len(fives) == 4 and all(result == fives[0] for result in fives)
+
+
+def test_asyncio_single_flight() -> None:
+    calls: List[str] = []
+
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(int(getHeader('X-User') or 0)))
+
+    @service.rpcmethod(single_flight=True)
+    async def lookup(user: UserID, key: str) -> str:
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return key.upper()
+
+    app = service.get_asgi_app()
+
+    async def _call(key: str, disconnect: bool) -> Any:
+        scope = {
+            'type': 'http',
+            'method': 'POST',
+            'path': '/api.v1/call/lookup',
+            'headers': [(b'x-user', b'5')],
+        }
+        incoming = [{'type': 'http.request', 'body': json.dumps({'key': key}).encode()}]
+        sent: List[Dict[str, Any]] = []
+
+        async def receive() -> Dict[str, Any]:
+            if incoming:
+                return incoming.pop(0)
+            if disconnect:
+                return {'type': 'http.disconnect'}
+            await asyncio.sleep(60)
+            raise Exception('Test took too long')
+
+        async def send(message: Dict[str, Any]) -> None:
+            sent.append(message)
+
+        await app(scope, receive, send)
+        return json.loads(sent[1]['body']) if sent else None
+
+    async def _main() -> List[Any]:
+        # the first caller disconnecting doesn't stop the others getting the shared result
+        return await asyncio.gather(
+            _call('a', True),
+            _call('a', False),
+            _call('a', False),
+            _call('b', False),
+        )
+
+    assert asyncio.run(_main()) == [None, 'A', 'A', 'B']
+    assert sorted(calls) == ['a', 'b']
+    stats = service.getSingleFlightStats()['lookup']
+    assert (stats.executions, stats.coalesced) == (2, 2)
+
+
+def test_leader_deadline_is_not_shared() -> None:
+    from flask import Flask, request
+
+    calls: List[str] = []
+
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(int(request.headers['X-User'])))
+
+    @service.rpcmethod(single_flight=True)
+    async def lookup(user: UserID, key: str) -> str:
+        calls.append(key)
+        await asyncio.sleep(0.2)
+        return key.upper()
+
+    flaskapp = Flask('test')
+    flaskapp.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+    results: Dict[str, Any] = {}
+
+    def _call(name: str, headers: Dict[str, str]) -> None:
+        response = flaskapp.test_client().post(
+            '/api.v1/call/lookup',
+            json={'key': 'k'},
+            headers={'X-User': '5', **headers},
+        )
+        results[name] = (response.status_code, response.get_json())
+
+    # the leader gives up long before the method finishes
+    leader = threading.Thread(target=_call, args=(
+        'leader',
+        {'X-Bifrost-Deadline': str(time.time() + 0.05)},
+    ))
+    leader.start()
+    while service.getSingleFlightStats()['lookup'].inFlight == 0:
+        time.sleep(0.01)
+    followers = [threading.Thread(target=_call, args=(name, {})) for name in ('f1', 'f2')]
+    for thread in followers:
+        thread.start()
+    for thread in [leader, *followers]:
+        thread.join()
+
+    # the followers don't get the leader's 504, and one of them runs the method again for both
+    assert results == {'leader': (504, None), 'f1': (200, 'K'), 'f2': (200, 'K')}
+    assert calls == ['k', 'k']
+    stats = service.getSingleFlightStats()['lookup']
+    assert (stats.executions, stats.abandoned, stats.inFlight) == (2, 1, 0)
+
+
+def test_asyncio_leader_deadline_is_not_shared() -> None:
+    calls: List[str] = []
+
+    service = BifrostRPCService()
+    service.addAuthType(UserID, lambda: UserID(5))
+
+    @service.rpcmethod(single_flight=True)
+    async def lookup(user: UserID, key: str) -> str:
+        calls.append(key)
+        await asyncio.sleep(0.2)
+        return key.upper()
+
+    app = service.get_asgi_app()
+
+    async def _call(deadline: float = None) -> Any:
+        headers = []
+        if deadline is not None:
+            headers.append((b'x-bifrost-deadline', str(time.time() + deadline).encode()))
+        scope = {
+            'type': 'http',
+            'method': 'POST',
+            'path': '/api.v1/call/lookup',
+            'headers': headers,
+        }
+        incoming = [{'type': 'http.request', 'body': b'{"key": "k"}'}]
+        sent: List[Dict[str, Any]] = []
+
+        async def receive() -> Dict[str, Any]:
+            if incoming:
+                return incoming.pop(0)
+            await asyncio.sleep(60)
+            raise Exception('Test took too long')
+
+        async def send(message: Dict[str, Any]) -> None:
+            sent.append(message)
+
+        await app(scope, receive, send)
+        return sent[0]['status'], sent[1]['body']
+
+    async def _main() -> List[Any]:
+        return await asyncio.gather(_call(0.05), _call(), _call())
+
+    assert asyncio.run(_main()) == [(504, b'Deadline exceeded'), (200, b'"K"'), (200, b'"K"')]
+    assert calls == ['k', 'k']
+    stats = service.getSingleFlightStats()['lookup']
+    assert (stats.executions, stats.coalesced, stats.abandoned) == (2, 3, 1)
+
+
+def _makeLimitedService(release: threading.Event) -> BifrostRPCService:
+    from bifrostrpc.idempotency import IdempotencyPolicy
+    from bifrostrpc.limits import ConcurrencyLimitPolicy
+
+    Connection = NewType('Connection', str)
+
+    service = BifrostRPCService(idempotency=IdempotencyPolicy(60))
+    service.addAuthType(UserID, lambda: UserID(5))
+    service.addInternalType(
+        Connection,
+        lambda: Connection('db'),
+        lifetime='pooled',
+        pool_size=1,
+        pool_timeout=0.5,
+    )
+    limit = ConcurrencyLimitPolicy(initialLimit=1, maxLimit=1)
+
+    @service.rpcmethod(single_flight=True, concurrency_limit=limit)
+    def lookup(user: UserID, conn: Connection, key: str) -> str:
+        release.wait(5)
+        return key.upper()
+
+    @service.rpcmethod(concurrency_limit=limit)
+    def store(user: UserID, conn: Connection, key: str) -> str:
+        release.wait(5)
+        return key.upper()
+
+    return service
+
+
+def test_waiting_calls_hold_no_resources() -> None:
+    import io
+    from wsgiref.util import setup_testing_defaults
+
+    release = threading.Event()
+    service = _makeLimitedService(release)
+    app = service.get_wsgi_app()
+    results: List[Any] = []
+
+    def _call(method: str, idempotencyKey: str = None) -> None:
+        environ = {
+            'PATH_INFO': '/api.v1/call/' + method,
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_LENGTH': '12',
+            'CONTENT_TYPE': 'application/json',
+            'wsgi.input': io.BytesIO(b'{"key": "k"}'),
+        }
+        if idempotencyKey is not None:
+            environ['HTTP_IDEMPOTENCY_KEY'] = idempotencyKey
+        setup_testing_defaults(environ)
+        started: List[str] = []
+        body = b''.join(app(environ, lambda status, headers: started.append(status)))
+        results.append((method, started[0], body))
+
+    def _waitFor(condition: Any) -> None:
+        for _ in range(200):
+            if condition():
+                return
+            time.sleep(0.01)
+
+    # identical calls wait for the leader without taking a concurrency limit slot or a pooled
+    # context value, so they aren't rejected while it runs
+    threads = [threading.Thread(target=_call, args=('lookup', )) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    _waitFor(lambda: service.getSingleFlightStats()['lookup'].coalesced == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [('lookup', '200 OK', b'"K"')] * 4
+    stats = service.getSingleFlightStats()['lookup']
+    assert (stats.executions, stats.coalesced) == (1, 3)
+
+    # ... and the same goes for attempts of a call with the same Idempotency-Key
+    release.clear()
+    results.clear()
+    threads = [threading.Thread(target=_call, args=('store', 'a')) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    _waitFor(lambda: getattr(service.getIdempotencyStats(), 'waited', 0) == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [('store', '200 OK', b'"K"')] * 3
+    stats = service.getIdempotencyStats()
+    assert stats is not None and (stats.stored, stats.waited) == (1, 2)
+
+
+def test_asyncio_waiting_calls_hold_no_resources() -> None:
+    release = threading.Event()
+    service = _makeLimitedService(release)
+    app = service.get_asgi_app()
+
+    async def _call() -> Any:
+        scope = {'type': 'http', 'method': 'POST', 'path': '/api.v1/call/lookup', 'headers': []}
+        incoming = [{'type': 'http.request', 'body': b'{"key": "k"}'}]
+        sent: List[Dict[str, Any]] = []
+
+        async def receive() -> Dict[str, Any]:
+            if incoming:
+                return incoming.pop(0)
+            await asyncio.sleep(60)
+            raise Exception('Test took too long')
+
+        async def send(message: Dict[str, Any]) -> None:
+            sent.append(message)
+
+        await app(scope, receive, send)
+        return sent[0]['status'], sent[1]['body']
+
+    async def _main() -> List[Any]:
+        calls = asyncio.gather(*[_call() for _ in range(4)])
+        for _ in range(200):
+            if service.getSingleFlightStats()['lookup'].coalesced == 3:
+                break
+            await asyncio.sleep(0.01)
+        release.set()
+        return await calls
+
+    assert asyncio.run(_main()) == [(200, b'"K"')] * 4
+    stats = service.getSingleFlightStats()['lookup']
+    assert (stats.executions, stats.coalesced) == (1, 3)
@@ -115,3 +115,162 @@ def test_getNewTypeBaseCrossType() -> None:
     assert isinstance(_getNewTypeBaseCrossType(AdminID), CrossCustomType)
 
     # TODO: add tests/support for non-scalar NewTypes
+
+
+def test_structural_dataclass_export() -> None:
+    import sqlite3
+    from dataclasses import dataclass
+    from typing import NamedTuple
+
+    from bifrostrpc.typing import DataclassTypeSpec
+
+    @dataclass
+    class Item:
+        itemId: int
+        name: str
+
+    class ItemTuple(NamedTuple):
+        itemId: int
+        name: str
+
+    expected = {'itemId': 5, 'name': 'five'}
+
+    # without structural=True only real instances are accepted
+    adv = Advanced()
+    adv.addDataclass(Item)
+    spec = getTypeSpec(Item, adv=adv)
+    assert isinstance(spec, DataclassTypeSpec)
+    errors = []
+    spec.getExported({'itemId': 5, 'name': 'five'}, 'x', False, onerr=errors.append)
+    assert errors == ['x must be an instance of Item; got a dict instead']
+
+    adv = Advanced()
+    adv.addDataclass(Item, structural=True)
+    spec = getTypeSpec(Item, adv=adv)
+
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT 5 AS itemId, 'five' AS name").fetchone()
+
+    for source in [Item(5, 'five'), {'itemId': 5, 'name': 'five'}, ItemTuple(5, 'five'), row]:
+        errors = []
+        assert spec.getExported(source, 'x', False, onerr=errors.append) == expected
+        assert errors == []
+
+    # fields are still type-checked and must all be present
+    errors = []
+    spec.getExported({'itemId': 'five'}, 'x', False, onerr=errors.append)
+    assert errors == [
+        "x.itemId must be of type int; got a str instead",
+        "x is missing field 'name'",
+    ]
+
+    # a missing field is reported even when values are converted without type checks
+    errors = []
+    assert spec.getConverted(row, 'x', False, onerr=errors.append) == expected
+    assert spec.getConverted({'itemId': 6}, 'x', False, onerr=errors.append) == {'itemId': 6}
+    assert errors == ["x is missing field 'name'"]
+
+
+def test_memoized_dataclass_export() -> None:
+    import gc
+    from dataclasses import dataclass
+
+    @dataclass
+    class Mutable:
+        name: str
+
+    @dataclass(frozen=True)
+    class Entry:
+        name: str
+
+    with pytest.raises(TypeError, match='not a frozen dataclass'):
+        Advanced().addDataclass(Mutable, memoize=True)
+
+    adv = Advanced()
+    adv.addDataclass(Entry, memoize=True)
+    spec = getTypeSpec(Entry, adv=adv)
+
+    entry = Entry('one')
+    first = spec.getExported(entry, 'x', False, onerr=pytest.fail)
+    assert first == {'name': 'one'}
+    assert spec.getExported(entry, 'x', False, onerr=pytest.fail) is first
+    # showdc produces a different exported form
+    assert spec.getExported(entry, 'x', True, onerr=pytest.fail) == {
+        'name': 'one',
+        '__dataclass__': 'Entry',
+    }
+
+    # a distinct (even if equal) instance is exported separately
+    assert spec.getExported(Entry('one'), 'x', False, onerr=pytest.fail) is not first
+
+    # invalid instances are never cached
+    bad = Entry(5)  # type: ignore
+    for _ in range(2):
+        errors = []
+        spec.getExported(bad, 'x', False, onerr=errors.append)
+        assert len(errors) == 1
+
+    # the cache entries go away with the instance
+    del entry, bad
+    gc.collect()
+    assert spec._memo == {}
+
+
+def test_field_projection() -> None:
+    from dataclasses import dataclass
+    from typing import List
+
+    from bifrostrpc.typing import FieldProjection, FuncSpec
+
+    @dataclass
+    class Owner:
+        name: str
+        email: str
+
+    @dataclass
+    class Pet:
+        name: str
+        age: int
+        owner: Owner
+
+    adv = Advanced()
+    adv.addDataclass(Owner)
+    adv.addDataclass(Pet)
+
+    def get_pets(fields: FieldProjection) -> List[Pet]:
+        raise NotImplementedError()
+
+    spec = FuncSpec(get_pets, adv)
+    assert spec.fieldsvar == 'fields'
+    assert 'fields' not in spec.getArgSpecs()
+    assert spec.isProjectable()
+
+    pets = [Pet('Rex', 3, Owner('Joe', 'joe@example.com'))]
+
+    fields = spec.importProjection(['age', 'owner.email'], 'F', pytest.fail)
+    assert fields.includes('age')
+    assert not fields.includes('name')
+    assert fields.get('age') is None
+    assert fields.get('owner') is not None
+    expected = [{'age': 3, 'owner': {'email': 'joe@example.com'}}]
+    assert spec.exportRetval(pets, 'x', False, onerr=pytest.fail, fields=fields) == expected
+    assert spec.exportRetval(
+        pets, 'x', False, onerr=pytest.fail, fields=fields, validation='off') == expected
+
+    # selecting a whole field overrides selections inside it
+    fields = spec.importProjection(['owner.email', 'owner'], 'F', pytest.fail)
+    assert fields.get('owner') is None
+
+    # no projection selects everything
+    assert FieldProjection().includes('anything')
+
+    errors: List[str] = []
+    spec.importProjection(['nope', 'owner.age', 'name.first', '', 5], 'F', errors.append)
+    assert errors == [
+        "F[3] must be a dotted field path; got '' instead",
+        "F[4] must be a dotted field path; got 5 instead",
+        "F contains unknown field 'nope'",
+        "F.owner contains unknown field 'age'",
+        "F.name selects fields from a value which has no fields",
+    ]
@@ -0,0 +1,116 @@
+from dataclasses import dataclass
+from typing import List, NewType, Optional
+
+import pytest
+
+from bifrostrpc.typing import Advanced, FuncSpec
+from bifrostrpc.validation import ReturnValidationPolicy, ReturnValidator
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+def _getFuncSpec() -> FuncSpec:
+    def get_points() -> Optional[List[Point]]:
+        raise NotImplementedError()
+
+    adv = Advanced()
+    adv.addDataclass(Point)
+    return FuncSpec(get_points, adv)
+
+
+def test_exportRetval_validation_levels() -> None:
+    spec = _getFuncSpec()
+    good = [Point(1, 2)]
+    bad = [Point(1, 'two')]  # type: ignore
+
+    for validation in ['full', 'shallow', 'off']:
+        errors: List[str] = []
+        exported = spec.exportRetval(good, 'x', False, onerr=errors.append, validation=validation)
+        assert exported == [{'x': 1, 'y': 2}]
+        assert errors == []
+
+    errors = []
+    spec.exportRetval(bad, 'x', False, onerr=errors.append, validation='full')
+    assert len(errors) > 0
+
+    # shallow and off won't notice the bad list item
+    for validation in ['shallow', 'off']:
+        errors = []
+        exported = spec.exportRetval(bad, 'x', True, onerr=errors.append, validation=validation)
+        assert exported == [{'x': 1, 'y': 'two', '__dataclass__': 'Point'}]
+        assert errors == []
+
+    # ... but shallow will notice the wrong top-level type
+    errors = []
+    spec.exportRetval(Point(1, 2), 'x', False, onerr=errors.append, validation='shallow')
+    assert len(errors) > 0
+
+
+def test_ReturnValidator_sampled() -> None:
+    spec = _getFuncSpec()
+    bad = [Point(1, 'two')]  # type: ignore
+
+    validator = ReturnValidator('get_points', ReturnValidationPolicy('sampled', sampleEvery=3))
+    for _ in range(7):
+        validator.exportRetval(spec, bad, 'x', False, onerr=pytest.fail)
+    stats = validator.getStats()
+    assert (stats.calls, stats.sampled, stats.failures) == (7, 3, 3)
+
+    validator = ReturnValidator(
+        'get_points',
+        ReturnValidationPolicy('sampled', sampleEvery=2, onFailure='raise'),
+    )
+    errors: List[str] = []
+    for _ in range(4):
+        validator.exportRetval(spec, bad, 'x', False, onerr=errors.append)
+        # reading the stats doesn't change which calls are sampled
+        validator.getStats()
+    assert len(errors) == 2 * len(set(errors))
+    stats = validator.getStats()
+    assert (stats.calls, stats.sampled, stats.failures) == (4, 2, 2)
+
+    with pytest.raises(Exception, match='Unexpected return validation mode'):
+        ReturnValidationPolicy('sometimes')  # type: ignore
+
+
+def test_unencodable_unsampled_retval_is_validated() -> None:
+    import io
+    from wsgiref.util import setup_testing_defaults
+
+    from bifrostrpc import BifrostRPCService
+
+    UserID = NewType('UserID', int)
+    service = BifrostRPCService(
+        return_validation=ReturnValidationPolicy('sampled', sampleEvery=100),
+    )
+    service.addDataclass(Point)
+    service.addAuthType(UserID, lambda: UserID(1))
+    retvals = [[Point(1, 2)], [Point(1, object())]]  # type: ignore
+
+    @service.rpcmethod
+    def get_points(user: UserID) -> List[Point]:
+        return retvals.pop(0)
+
+    app = service.get_wsgi_app()
+    responses = []
+    for _ in range(2):
+        environ = {
+            'PATH_INFO': '/api.v1/call/get_points',
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_LENGTH': '2',
+            'CONTENT_TYPE': 'application/json',
+            'wsgi.input': io.BytesIO(b'{}'),
+        }
+        setup_testing_defaults(environ)
+        statuses: List[str] = []
+        body = b''.join(app(environ, lambda status, headers: statuses.append(status)))
+        responses.append((statuses[0], body.decode()))
+
+    # the first call was sampled, the second wasn't but still fails with a useful error
+    assert responses[0][0].startswith('200')
+    assert responses[1][0].startswith('500')
+    assert '<retval>[0].y must be of type int' in responses[1][1]
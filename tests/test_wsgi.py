@@ -0,0 +1,232 @@
+import io
+import json
+from typing import Any, List, NewType, Tuple
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+from bifrostrpc import ArgumentError, AuthFailure, BifrostRPCService
+from bifrostrpc.wsgi import getEnviron
+
+UserID = NewType('UserID', int)
+
+
+def _makeService() -> BifrostRPCService:
+    from flask import has_request_context, request
+
+    service = BifrostRPCService()
+
+    def get_user() -> UserID:
+        environ = request.environ if has_request_context() else getEnviron()
+        header = environ.get('HTTP_X_USER')
+        if header is None:
+            raise AuthFailure('Missing X-User header')
+        return UserID(int(header))
+
+    service.addAuthType(UserID, get_user)
+
+    @service.rpcmethod
+    def add(user: UserID, a: int, b: int) -> int:
+        if a < 0:
+            raise ArgumentError('a must not be negative')
+        return a + b
+
+    @service.rpcmethod
+    def broken(user: UserID) -> int:
+        return 'five'  # type: ignore
+
+    return service
+
+
+def _callWSGI(app: Any, path: str, method: str, body: Any, user: str) -> Tuple[int, str]:
+    data = json.dumps(body).encode() if body is not None else b''
+    environ = {
+        'PATH_INFO': path,
+        'REQUEST_METHOD': method,
+        'CONTENT_LENGTH': str(len(data)),
+        'CONTENT_TYPE': 'application/json',
+        'wsgi.input': io.BytesIO(data),
+    }
+    if user:
+        environ['HTTP_X_USER'] = user
+    setup_testing_defaults(environ)
+
+    started: List[str] = []
+
+    def start_response(status: str, headers: List[Tuple[str, str]]) -> None:
+        started.append(status)
+
+    chunks = app(environ, start_response)
+    return int(started[0].split(' ')[0]), b''.join(chunks).decode()
+
+
+@pytest.mark.parametrize('path,method,body,user', [
+    ('/api.v1/call/add', 'POST', {'a': 1, 'b': 2}, '5'),
+    ('/api.v1/call/add', 'POST', {'a': 1}, '5'),
+    ('/api.v1/call/add', 'POST', {'a': -1, 'b': 2}, '5'),
+    ('/api.v1/call/add', 'POST', [], '5'),
+    ('/api.v1/call/add', 'POST', {'a': 1, 'b': 2}, ''),
+    ('/api.v1/call/add', 'GET', None, '5'),
+    ('/api.v1/call/broken', 'POST', {}, '5'),
+    ('/api.v1/call/nope', 'POST', {}, '5'),
+])
+def test_wsgi_app_matches_flask(path: str, method: str, body: Any, user: str) -> None:
+    from flask import Flask
+
+    service = _makeService()
+
+    flaskapp = Flask('test')
+    flaskapp.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+    headers = {'X-User': user} if user else {}
+    if method == 'GET':
+        expected = flaskapp.test_client().get(path, headers=headers)
+    else:
+        expected = flaskapp.test_client().post(path, json=body, headers=headers)
+
+    status, text = _callWSGI(service.get_wsgi_app(), path, method, body, user)
+    assert status == expected.status_code
+    assert text == expected.get_data(as_text=True)
+
+
+class _UnreadableInput:
+    def read(self, size: int = -1) -> bytes:
+        raise Exception('The request body should not have been read')
+
+
+@pytest.mark.parametrize('path,length,user,expected', [
+    ('/api.v1/call/nope', 10, '5', 501),
+    ('/api.v1/call/add', 10, '', 401),
+    ('/api.v1/call/add', 1000, '5', 413),
+])
+def test_wsgi_app_rejects_without_reading_body(
+    path: str,
+    length: int,
+    user: str,
+    expected: int,
+) -> None:
+    service = _makeService()
+    service._maxBodySize = 100  # pylint: disable=protected-access
+
+    environ = {
+        'PATH_INFO': path,
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_LENGTH': str(length),
+        'CONTENT_TYPE': 'application/json',
+        'wsgi.input': _UnreadableInput(),
+    }
+    if user:
+        environ['HTTP_X_USER'] = user
+    setup_testing_defaults(environ)
+
+    started: List[str] = []
+
+    def start_response(status: str, headers: List[Tuple[str, str]]) -> None:
+        started.append(status)
+
+    service.get_wsgi_app()(environ, start_response)
+    assert int(started[0].split(' ')[0]) == expected
+
+
+def test_body_auth_factory() -> None:
+    from flask import Flask
+
+    Signed = NewType('Signed', bool)
+    calls: List[str] = []
+
+    service = _makeService()
+    service.addAuthType(Signed, lambda: calls.append('signed') or Signed(True), before_body=False)
+
+    @service.rpcmethod
+    def signed(user: UserID, sig: Signed, a: int) -> int:
+        return a
+
+    flaskapp = Flask('test')
+    flaskapp.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+    client = flaskapp.test_client()
+
+    # factories which need the body aren't called until the body has been imported
+    response = client.post('/api.v1/call/signed', json={}, headers={'X-User': '5'})
+    assert response.status_code == 400
+    assert calls == []
+
+    response = client.post('/api.v1/call/signed', json={'a': 3}, headers={'X-User': '5'})
+    assert response.get_json() == 3
+    assert calls == ['signed']
+
+
+@pytest.mark.parametrize('length,terminated,body,expected', [
+    # a chunked body which the server has decoded
+    (None, True, b'{"a": 1, "b": 2}', (200, '3')),
+    (None, True, b'{"a": 1, "b": 2, "c": "' + b'x' * 100 + b'"}', (413, None)),
+    # without a length or wsgi.input_terminated, the body can't be read safely
+    (None, False, b'{"a": 1, "b": 2}', (400, 'Request body must be a JSON object')),
+    ('x', False, b'{"a": 1, "b": 2}', (400, 'Request body must be a JSON object')),
+])
+def test_wsgi_app_body_without_length(
+    length: Any,
+    terminated: bool,
+    body: bytes,
+    expected: Tuple[int, Any],
+) -> None:
+    service = _makeService()
+    service._maxBodySize = 100  # pylint: disable=protected-access
+
+    environ = {
+        'PATH_INFO': '/api.v1/call/add',
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': 'application/json',
+        'HTTP_X_USER': '5',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.input_terminated': terminated,
+    }
+    if length is not None:
+        environ['CONTENT_LENGTH'] = length
+    setup_testing_defaults(environ)
+
+    started: List[str] = []
+
+    def start_response(status: str, headers: List[Tuple[str, str]]) -> None:
+        started.append(status)
+
+    text = b''.join(service.get_wsgi_app()(environ, start_response)).decode()
+    assert int(started[0].split(' ')[0]) == expected[0]
+    if expected[1] is not None:
+        assert text == expected[1]
+
+
+@pytest.mark.parametrize('data,contentType', [
+    (b'{"a": 1, "b": 2}', 'text/plain'),
+    (b'{"a": 1, "b": 2}', None),
+    (b'{"a": 1,', 'application/json'),
+])
+def test_flask_body_handling_matches_wsgi(data: bytes, contentType: Any) -> None:
+    from flask import Flask
+
+    service = _makeService()
+    flaskapp = Flask('test')
+    flaskapp.register_blueprint(service.get_flask_blueprint('rpc', 'rpc'))
+    headers = {'X-User': '5'}
+    if contentType:
+        headers['Content-Type'] = contentType
+    expected = flaskapp.test_client().post('/api.v1/call/add', data=data, headers=headers)
+
+    environ = {
+        'PATH_INFO': '/api.v1/call/add',
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_LENGTH': str(len(data)),
+        'HTTP_X_USER': '5',
+        'wsgi.input': io.BytesIO(data),
+    }
+    if contentType:
+        environ['CONTENT_TYPE'] = contentType
+    setup_testing_defaults(environ)
+
+    started: List[str] = []
+
+    def start_response(status: str, headers: List[Tuple[str, str]]) -> None:
+        started.append(status)
+
+    text = b''.join(service.get_wsgi_app()(environ, start_response)).decode()
+    assert int(started[0].split(' ')[0]) == expected.status_code
+    assert text == expected.get_data(as_text=True)
+    assert expected.status_code in (200, 400)